@@ -0,0 +1,116 @@
+"""
+Benchmark downloading query results as a DataFrame using the REST API (`RowIterator.to_dataframe()`)
+and the Arrow-native Storage Read API path (`download_dataframe()`), on synthetic tables.
+
+The REST API is simulated by serving JSON pages to the BigQuery library's `RowIterator`,
+and the Storage Read API by `FakeBigQueryReadClient`, so no network calls are made.
+Each case runs in a separate process so that peak RSS is measured independently.
+
+Usage: python -m api.benchmarks.bigquery_download [--rows 10000 100000 1000000]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+from google.cloud import bigquery
+from google.cloud.bigquery.table import RowIterator
+
+from api.connectors.bigquery_storage import download_dataframe
+from api.tests.fakes import FakeBigQueryReadClient, FakeQueryJob, create_synthetic_table
+
+REST_PAGE_SIZE = 10_000
+SCHEMA = [
+    bigquery.SchemaField("date", "TIMESTAMP"),
+    bigquery.SchemaField("protocol", "STRING"),
+    bigquery.SchemaField("loan_count", "INTEGER"),
+    bigquery.SchemaField("principal_usd", "FLOAT"),
+]
+
+
+def create_rest_pages(num_rows: int):
+    """Create `tabledata.list` style JSON pages, in which all values are strings."""
+    df = create_synthetic_table(num_rows).to_pandas()
+    # Timestamps are serialized as microseconds since the epoch
+    df["date"] = (df["date"].astype("int64") // 1000).astype(str)
+    rows = [
+        {"f": [{"v": str(value)} for value in row]}
+        for row in df.itertuples(index=False)
+    ]
+    return [
+        rows[index : index + REST_PAGE_SIZE]
+        for index in range(0, len(rows), REST_PAGE_SIZE)
+    ]
+
+
+def download_rest(num_rows: int):
+    pages = create_rest_pages(num_rows)
+
+    def api_request(method, path, query_params=None, **kwargs):
+        page_index = int((query_params or {}).get("pageToken", 0))
+        response = {"rows": pages[page_index], "totalRows": str(num_rows)}
+        if page_index + 1 < len(pages):
+            response["pageToken"] = str(page_index + 1)
+        return response
+
+    row_iterator = RowIterator(
+        client=None,
+        api_request=api_request,
+        path="/projects/test/datasets/dataset/tables/results/data",
+        schema=SCHEMA,
+        total_rows=num_rows,
+    )
+    return lambda: row_iterator.to_dataframe(create_bqstorage_client=False)
+
+
+def download_arrow(num_rows: int):
+    table = create_synthetic_table(num_rows)
+    query_job = FakeQueryJob("SELECT *", table=table)
+    bigquery_storage_client = FakeBigQueryReadClient(table)
+    # Drop the local reference so that only the fake Storage Read API holds the table
+    del table
+    return lambda: download_dataframe(
+        query_job,
+        bigquery_storage_client=bigquery_storage_client,
+        columns=[field.name for field in SCHEMA],
+    )
+
+
+def run_case(mode: str, num_rows: int, results: multiprocessing.Queue) -> None:
+    download = download_rest(num_rows) if mode == "rest" else download_arrow(num_rows)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    df = download()
+    duration = time.perf_counter() - start_time
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert len(df) == num_rows
+    # `ru_maxrss` is in kilobytes on Linux
+    results.put((duration, (rss_after - rss_before) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'rows':>10} {'mode':>6} {'seconds':>9} {'rows/sec':>12} {'peak RSS delta (MB)':>20}")
+    for num_rows in args.rows:
+        for mode in ("rest", "arrow"):
+            results = context.Queue()
+            process = context.Process(target=run_case, args=(mode, num_rows, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Benchmark case failed: {mode} with {num_rows} rows")
+            duration, peak_rss_mb = results.get()
+            print(
+                f"{num_rows:>10} {mode:>6} {duration:>9.3f} "
+                f"{num_rows / duration:>12,.0f} {peak_rss_mb:>20.1f}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
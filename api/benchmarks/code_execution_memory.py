@@ -0,0 +1,112 @@
+"""
+Benchmark the peak memory of executing generated code on a query's results, for a request
+whose code is executed a number of times, as when it is corrected after errors.
+
+Compares executing the code in the API's process, which copies the DataFrame for each
+execution, executing it in a sandbox worker with the DataFrame sent with each execution,
+and executing it in a sandbox worker with the DataFrame shared once in shared memory.
+Each case runs in a separate process so that peak RSS is measured independently, for the
+API's process and the worker's.
+
+Usage: python -m api.benchmarks.code_execution_memory [--rows 1000000 5000000] [--attempts 10]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import time
+
+from api.execution import execute_python_code
+from api.prompts.templates import CODE_GENERATION_IMPORTS
+from api.sandbox import CodeExecutionPool
+from api.shared_frames import SharedDataFrame
+from api.tests.fakes import create_synthetic_table
+from api.types import CodeGenerationConfig
+
+MODES = ("in_process", "sandbox", "shared")
+CODE = """
+def answer_question(df):
+    return float(df.groupby("protocol")["principal_usd"].sum().sum())
+"""
+
+
+def get_peak_rss_mb(pid: int) -> float:
+    """Peak RSS of a process, from its status on Linux."""
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def execute_attempts(mode: str, df, attempts: int, pool: CodeExecutionPool):
+    execute = execute_python_code if mode == "in_process" else pool.execute
+    shared_df = SharedDataFrame.create(df) if mode == "shared" else None
+    try:
+        for _ in range(attempts):
+            result = await execute(
+                code=CODE,
+                docstring="",
+                imports=CODE_GENERATION_IMPORTS,
+                local_variables={"df": shared_df or df},
+                config=CodeGenerationConfig(output_types=[float]),
+            )
+            assert result.error is None, result.error
+    finally:
+        if shared_df is not None:
+            shared_df.unlink()
+
+
+def run_case(mode: str, num_rows: int, attempts: int, results: multiprocessing.Queue) -> None:
+    pool = CodeExecutionPool(size=1, max_executions=attempts + 1)
+    worker_rss_before = 0.0
+    worker_pid = None
+    if mode != "in_process":
+        pool.start()
+        worker = pool._idle.get()
+        pool._idle.put(worker)
+        worker_pid = worker.process.pid
+        worker_rss_before = get_peak_rss_mb(worker_pid)
+
+    df = create_synthetic_table(num_rows).to_pandas()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    asyncio.run(execute_attempts(mode, df, attempts, pool))
+    duration = time.perf_counter() - start_time
+    # `ru_maxrss` is in kilobytes on Linux
+    api_rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    worker_rss = get_peak_rss_mb(worker_pid) - worker_rss_before if worker_pid else 0.0
+    pool.stop()
+    results.put((duration, df.memory_usage(deep=True).sum() / 1024**2, api_rss, worker_rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--attempts", type=int, default=10)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{'rows':>10} {'mode':>10} {'DataFrame (MB)':>15} {'seconds':>9} "
+        f"{'API peak RSS delta (MB)':>24} {'worker peak RSS delta (MB)':>27}"
+    )
+    for num_rows in args.rows:
+        for mode in MODES:
+            results = context.Queue()
+            process = context.Process(target=run_case, args=(mode, num_rows, args.attempts, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"Benchmark case failed: {mode} with {num_rows} rows")
+            duration, df_mb, api_rss, worker_rss = results.get()
+            print(
+                f"{num_rows:>10} {mode:>10} {df_mb:>15.1f} {duration:>9.3f} "
+                f"{api_rss:>24.1f} {worker_rss:>27.1f}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
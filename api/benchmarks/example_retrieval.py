@@ -0,0 +1,92 @@
+"""
+Benchmark retrieving the examples most relevant to a question by refitting a TF-IDF
+vectorizer per request, as before, and using a prebuilt `ExampleIndex`, on synthetic
+example libraries derived from `examples_generated.toml`.
+
+Usage: python -m api.benchmarks.example_retrieval [--examples 500 5000 50000]
+"""
+
+import argparse
+import random
+import time
+from typing import List
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from api.prompts.templates import Example, ExampleIndex, load_examples
+
+QUERIES = [
+    "Plot the average APR for each protocol",
+    "Which airports had the most delayed flights last month?",
+    "What is the average sale price of houses with 3 bedrooms in New York?",
+]
+
+
+def create_examples(num_examples: int) -> List[Example]:
+    """Create examples by recombining the words of the example questions, for 5 data sources."""
+    random_state = random.Random(0)
+    words = [word for example in load_examples() for word in example.query.split()]
+    return [
+        Example(
+            data_source_url=f"bigquery/project/dataset/table_{index % 5}",
+            query=" ".join(random_state.choices(words, k=12)),
+            sql="",
+            code="",
+        )
+        for index in range(num_examples)
+    ]
+
+
+def get_relevant_examples_with_refit(query: str, data_source_url: str, examples: List[Example]) -> List[Example]:
+    filtered_examples = [
+        example
+        for example in examples
+        if not example.data_source_url or example.data_source_url == data_source_url
+    ]
+    texts = [example.query for example in filtered_examples] + [query]
+    tfidf_matrix = TfidfVectorizer().fit_transform(texts)
+    cosine_similarities = cosine_similarity(tfidf_matrix[-1], tfidf_matrix[:-1])
+    relevant_indices = cosine_similarities.argsort()[0][-5:][::-1]
+    return [filtered_examples[i] for i in relevant_indices]
+
+
+def time_per_call(function, repeat: int) -> float:
+    start_time = time.perf_counter()
+    for index in range(repeat):
+        function(QUERIES[index % len(QUERIES)])
+    return (time.perf_counter() - start_time) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--examples", type=int, nargs="+", default=[500, 5_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data_source_url = "bigquery/project/dataset/table_0"
+    print(f"{'examples':>10} {'build (ms)':>11} {'refit (ms)':>11} {'index (ms)':>11} {'speedup':>8}")
+    for num_examples in args.examples:
+        examples = create_examples(num_examples)
+
+        start_time = time.perf_counter()
+        index = ExampleIndex(examples)
+        build_seconds = time.perf_counter() - start_time
+
+        refit_seconds = time_per_call(
+            lambda query: get_relevant_examples_with_refit(query, data_source_url, examples),
+            args.repeat,
+        )
+        index_seconds = time_per_call(
+            lambda query: index.get_relevant_examples(query, data_source_url),
+            args.repeat,
+        )
+        print(
+            f"{num_examples:>10} {build_seconds * 1000:>11.1f} {refit_seconds * 1000:>11.2f} "
+            f"{index_seconds * 1000:>11.3f} {refit_seconds / index_seconds:>7.0f}x",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
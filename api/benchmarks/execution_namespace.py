@@ -0,0 +1,38 @@
+"""
+Benchmark the overhead of setting up the namespace of each execution of generated code,
+by executing the code generation imports for each execution, as before, or layering the
+execution's variables over the base namespace, which is built once per process.
+
+Usage: python -m api.benchmarks.execution_namespace [--executions 10000]
+"""
+
+import argparse
+import timeit
+
+import pandas as pd
+
+from api.execution import execute_python_imports, get_base_namespace
+from api.prompts.templates import CODE_GENERATION_IMPORTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--executions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    local_variables = {"df": pd.DataFrame({"x": range(10)})}
+    # Import the modules first, so that only the setup of the namespace is measured
+    get_base_namespace(CODE_GENERATION_IMPORTS)
+
+    cases = {
+        "imports": lambda: {**local_variables, **execute_python_imports(CODE_GENERATION_IMPORTS)},
+        "base": lambda: {**get_base_namespace(CODE_GENERATION_IMPORTS), **local_variables},
+    }
+    print(f"{'namespace':>9} {'µs per execution':>17}")
+    for name, setup in cases.items():
+        seconds = min(timeit.repeat(setup, number=args.executions, repeat=5)) / args.executions
+        print(f"{name:>9} {seconds * 1e6:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
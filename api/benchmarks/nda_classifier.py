@@ -0,0 +1,88 @@
+"""
+Evaluate the local NDA classifier against the LLM guard's verdicts, using stratified
+cross-validation over the classifier's training data, so that each question is classified
+by a classifier that was not trained on it.
+
+Reports how many questions the classifier decides without the LLM guard at each threshold,
+and the precision and recall of its "broken" verdicts, and the accuracy of its decided
+verdicts, with the LLM guard's verdicts as the reference. By default the reference verdicts
+are the labels of the training data, i.e. the guard's few-shot examples and logged verdicts.
+Add `--llm` to get the reference verdicts from the LLM guard, which requires OpenAI credentials.
+
+Usage: python -m api.benchmarks.nda_classifier [--verdicts verdicts.jsonl] [--llm]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+
+from api.config import NDA_VERDICTS_PATH
+from api.security.classifier import NDAClassifier, load_training_data
+
+THRESHOLDS = [0.6, 0.7, 0.8, 0.9, 0.95, 0.99]
+
+
+async def get_llm_verdicts(questions: List[str]) -> List[bool]:
+    from api.security import guards
+
+    # Only the LLM guard, without the classifier or cached verdicts
+    guards.NDA_CLASSIFIER_MODE = "off"
+    guards.log_verdict = lambda question, nda_broken: None
+    verdicts = []
+    for question in questions:
+        guards.nda_verdict_cache = guards.NDAVerdictCache(max_size=1, ttl=1)
+        verdicts.append(await guards.is_nda_broken(question))
+    return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--verdicts", default=NDA_VERDICTS_PATH, help="JSON lines of logged verdicts")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--llm", action="store_true")
+    args = parser.parse_args()
+
+    questions, labels = map(list, zip(*load_training_data(verdicts_path=args.verdicts)))
+    if args.llm:
+        labels = asyncio.run(get_llm_verdicts(questions))
+    labels = np.array(labels)
+    folds = min(args.folds, int(labels.sum()), int((~labels).sum()))
+    if folds < 2:
+        raise SystemExit("At least 2 questions with each verdict are needed to evaluate the classifier")
+
+    # Probability of breaking the NDA predicted for each question by the fold that left it out
+    probabilities = np.zeros(len(questions))
+    seconds = []
+    for train_index, test_index in StratifiedKFold(folds, shuffle=True, random_state=0).split(
+        questions, labels
+    ):
+        classifier = NDAClassifier().fit(
+            [questions[index] for index in train_index], labels[train_index].tolist()
+        )
+        for index in test_index:
+            start_time = time.perf_counter()
+            probabilities[index] = classifier.predict_proba(questions[index])
+            seconds.append(time.perf_counter() - start_time)
+
+    print(f"Questions: {len(questions)}, broken: {labels.sum()}, folds: {folds}")
+    print(f"Classification latency (median): {np.median(seconds) * 1e6:,.0f} µs")
+    print(f"{'Threshold':>9} {'Decided':>8} {'Precision':>9} {'Recall':>7} {'Accuracy':>8}")
+    for threshold in THRESHOLDS:
+        broken = probabilities >= threshold
+        decided = broken | (probabilities <= 1 - threshold)
+        true_positives = (broken & labels).sum()
+        precision = true_positives / broken.sum() if broken.any() else float("nan")
+        # Recall of the broken questions, which are otherwise caught by the LLM guard if undecided
+        recall = true_positives / labels.sum()
+        accuracy = (broken[decided] == labels[decided]).mean() if decided.any() else float("nan")
+        print(
+            f"{threshold:>9.2f} {decided.mean():>8.1%} {precision:>9.1%} {recall:>7.1%} {accuracy:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Benchmark schema pruning over the examples in `examples_generated.toml`, measuring the
+reduction in schema prompt tokens, and how often the pruned schema keeps every table
+and column referenced by the example's SQL query, which a valid first attempt requires.
+
+By default the schemas are synthetic: each example data source is a table with the
+columns referenced by its examples, widened with distractor columns, in a dataset with
+distractor tables, so no network calls are made. Use `--schemas` with a JSON export of the
+`schema_catalog` MongoDB collection to benchmark real schemas, and add `--validate` to also
+generate the first SQL query with the full and pruned schemas, and validate it using a
+BigQuery dry run, which requires OpenAI and BigQuery credentials.
+
+Usage: python -m api.benchmarks.schema_pruning [--schemas schemas.json] [--validate]
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import random
+import statistics
+from collections import defaultdict
+from typing import Dict, List, Set
+
+import sqlparse
+import toml
+from sqlparse import tokens as T
+
+from api.prompts.templates import Example
+from api.schema_pruning import SchemaIndex, count_tokens
+from api.types import TableField, TableSummary
+from api.utils import format_tables_summary, parse_data_source_url
+
+EXAMPLES_PATH = "api/prompts/examples/examples_generated.toml"
+WORDS = [
+    "account", "address", "amount", "balance", "category", "channel", "city", "code",
+    "count", "country", "created", "currency", "customer", "device", "discount", "event",
+    "fee", "flag", "group", "id", "item", "level", "name", "order", "owner", "payment",
+    "product", "rate", "region", "score", "segment", "session", "source", "status",
+    "store", "tag", "tier", "total", "type", "updated", "user", "value", "vendor", "weight",
+]
+
+
+def get_referenced_columns(sql: str) -> Set[str]:
+    """Returns the names of the columns referenced by a SQL query, excluding aliases and functions."""
+    tokens = [token for token in sqlparse.parse(sql)[0].flatten() if not token.is_whitespace]
+    names, aliases = set(), set()
+    for index, token in enumerate(tokens):
+        if token.ttype not in (T.Name, T.Name.Builtin):
+            continue
+        name = token.value.strip("`")
+        next_token = tokens[index + 1] if index + 1 < len(tokens) else None
+        previous_token = tokens[index - 1] if index > 0 else None
+        if "." in name or (next_token is not None and next_token.value == "("):
+            continue
+        if previous_token is not None and previous_token.normalized == "AS":
+            aliases.add(name.lower())
+        elif token.ttype == T.Name:
+            names.add(name)
+    return {name for name in names if name.lower() not in aliases}
+
+
+def create_distractor_field(random_state: random.Random, index: int) -> TableField:
+    name = "_".join(random_state.sample(WORDS, 2)) + f"_{index}"
+    field_type = random_state.choice(["STRING", "INTEGER", "FLOAT", "BOOLEAN"])
+    return TableField(name=name, field_type=field_type, mode="NULLABLE")
+
+
+def create_synthetic_schemas(
+    examples: List[Example], distractor_tables: int, distractor_columns: int
+) -> Dict[str, List[TableSummary]]:
+    """Creates a schema for the dataset of each example data source."""
+    random_state = random.Random(0)
+    columns_by_table = defaultdict(set)
+    for example in examples:
+        if example.data_source_url:
+            columns_by_table[example.data_source_url] |= get_referenced_columns(example.sql)
+
+    schemas = {}
+    for data_source_url, columns in columns_by_table.items():
+        _, project, dataset_id, table_id = parse_data_source_url(data_source_url)
+        fields = [
+            TableField(
+                name=column,
+                field_type="TIMESTAMP" if "date" in column or "timestamp" in column else "STRING",
+            )
+            for column in sorted(columns)
+        ] + [create_distractor_field(random_state, index) for index in range(distractor_columns)]
+        random_state.shuffle(fields)
+        tables = [
+            TableSummary(
+                project=project,
+                dataset_id=dataset_id,
+                table_id=f"{'_'.join(random_state.sample(WORDS, 2))}_{index}",
+                table_type="TABLE",
+                fields=[
+                    create_distractor_field(random_state, column_index)
+                    for column_index in range(distractor_columns)
+                ],
+            )
+            for index in range(distractor_tables)
+        ]
+        tables.insert(
+            random_state.randrange(len(tables) + 1),
+            TableSummary(
+                project=project,
+                dataset_id=dataset_id,
+                table_id=table_id,
+                table_type="TABLE",
+                fields=fields,
+                samples={field.name: ["N/A"] for field in fields},
+            ),
+        )
+        schemas[data_source_url] = tables
+    return schemas
+
+
+def load_schemas(path: str) -> Dict[str, List[TableSummary]]:
+    with open(path) as file:
+        entries = json.load(file)
+    return {
+        entry["data_source_url"]: [TableSummary.from_dict(table) for table in entry["tables"]]
+        for entry in entries
+    }
+
+
+async def is_first_query_valid(tables_summary: str, example: Example) -> bool:
+    from api import chartgpt
+    from api.prompts.templates import SQL_QUERY_GENERATION_PROMPT_TEMPLATE
+
+    prompt = SQL_QUERY_GENERATION_PROMPT_TEMPLATE.format(
+        sql_query_instruction="Write a GoogleSQL query compatible with BigQuery to answer the question.",
+        python_code_instruction="",
+        database_schema=tables_summary,
+    )
+    messages = [
+        {"role": "system", "content": inspect.cleandoc(prompt)},
+        {"role": "user", "content": example.query},
+    ]
+    _, query = await chartgpt.get_initial_sql_query(messages)
+    return not await chartgpt.validate_sql_query(query)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--examples", default=EXAMPLES_PATH)
+    parser.add_argument("--schemas", help="JSON list of schema catalog entries")
+    parser.add_argument("--distractor-tables", type=int, default=30)
+    parser.add_argument("--distractor-columns", type=int, default=40)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=3000)
+    parser.add_argument("--validate", action="store_true")
+    args = parser.parse_args()
+
+    examples = [Example(**item) for item in toml.load(args.examples)["examples"]]
+    schemas = (
+        load_schemas(args.schemas)
+        if args.schemas
+        else create_synthetic_schemas(examples, args.distractor_tables, args.distractor_columns)
+    )
+    indexes = {data_source_url: SchemaIndex(tables) for data_source_url, tables in schemas.items()}
+
+    reductions, recalls = [], []
+    valid = {"full": 0, "pruned": 0}
+    examples = [example for example in examples if example.data_source_url in indexes]
+    for example in examples:
+        index = indexes[example.data_source_url]
+        full_summary = format_tables_summary(index.tables)
+        pruned_summary = index.get_tables_summary(
+            example.query, top_k=args.top_k, max_tokens=args.max_tokens
+        )
+        reductions.append(1 - count_tokens(pruned_summary) / count_tokens(full_summary))
+
+        columns = get_referenced_columns(example.sql)
+        table_id = parse_data_source_url(example.data_source_url)[3]
+        recalls.append(
+            f".{table_id}`" in pruned_summary
+            and all(f'"{column}"' in pruned_summary for column in columns)
+        )
+
+        if args.validate:
+            valid["full"] += asyncio.run(is_first_query_valid(full_summary, example))
+            valid["pruned"] += asyncio.run(is_first_query_valid(pruned_summary, example))
+
+    full_tokens = [index.total_tokens for index in indexes.values()]
+    print(f"Examples: {len(examples)}, data sources: {len(indexes)}")
+    print(f"Full schema tokens (median): {statistics.median(full_tokens):,.0f}")
+    print(f"Prompt token reduction (median): {statistics.median(reductions):.1%}")
+    print(f"Examples with all referenced tables and columns kept: {sum(recalls) / len(recalls):.1%}")
+    if args.validate:
+        for schema, count in valid.items():
+            print(f"First-try valid SQL with {schema} schema: {count / len(examples):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark the memory of idle server-sent event streams, for many concurrent connections
+that wait for their request's work, e.g. while a BigQuery job runs.
+
+Compares streams sent keep-alive events by the shared timer wheel, as the API does, with
+streams sent them by a task per connection, with an unbounded queue, as the API did. The
+server runs in a separate process, whose RSS is measured before and after the connections
+are opened, and each connection is checked to have been sent a keep-alive event.
+
+Usage: python -m api.benchmarks.sse_connections [--connections 5000] [--keep-alive-seconds 5]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from api import streaming
+from api.streaming import KEEP_ALIVE_EVENT, EventChannel, KeepAliveWheel, ResponseEventEncoder
+
+MODES = ("wheel", "task")
+REQUEST = b"GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+app = FastAPI()
+mode = "wheel"
+keep_alive_seconds = 15.0
+
+
+async def iter_events_with_keep_alive_task():
+    """Events of a stream as the API sent them, with a keep-alive task per stream."""
+    queue = asyncio.Queue()
+
+    async def keep_alive():
+        while True:
+            await asyncio.sleep(keep_alive_seconds)
+            await queue.put(KEEP_ALIVE_EVENT)
+
+    task = asyncio.create_task(keep_alive())
+    try:
+        while True:
+            yield await queue.get()
+    finally:
+        task.cancel()
+
+
+@app.get("/stream")
+async def stream():
+    if mode == "wheel":
+        events = streaming.iter_events(EventChannel(ResponseEventEncoder("session")))
+    else:
+        events = iter_events_with_keep_alive_task()
+    return StreamingResponse(events, media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return {"tasks": len(asyncio.all_tasks()), "keep_alive_channels": len(streaming.keep_alive_wheel)}
+
+
+def serve(server_mode: str, port: int, interval: float) -> None:
+    global mode, keep_alive_seconds
+    mode, keep_alive_seconds = server_mode, interval
+    streaming.keep_alive_wheel = KeepAliveWheel(interval=interval)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False, backlog=4096)
+
+
+def get_rss_mb(pid: int) -> float:
+    """Current RSS of a process, from its status on Linux."""
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def get_stats(port: int) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /stats HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+    data = await reader.read()
+    writer.close()
+    return json.loads(data.split(b"\r\n\r\n", 1)[1])
+
+
+async def open_stream(port: int):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(REQUEST)
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def wait_for_keep_alive(reader: asyncio.StreamReader, timeout: float) -> bool:
+    data = b""
+    try:
+        while b"keep-alive" not in data:
+            data += await asyncio.wait_for(reader.read(1024), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def measure(pid: int, port: int, connections: int, interval: float, batch_size: int = 250):
+    # Warm the server up with a connection, so that its RSS excludes lazily imported modules
+    _, writer = await open_stream(port)
+    writer.close()
+    await asyncio.sleep(0.5)
+    rss_before = get_rss_mb(pid)
+
+    start_time = time.perf_counter()
+    streams = []
+    for start in range(0, connections, batch_size):
+        streams += await asyncio.gather(*(
+            open_stream(port) for _ in range(min(batch_size, connections - start))
+        ))
+    duration = time.perf_counter() - start_time
+    await asyncio.sleep(0.5)
+    rss_after = get_rss_mb(pid)
+    stats = await get_stats(port)
+
+    received = await asyncio.gather(*(
+        wait_for_keep_alive(reader, timeout=2 * interval + 1) for reader, _ in streams
+    ))
+    for _, writer in streams:
+        writer.close()
+    return duration, rss_after - rss_before, stats, sum(received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--keep-alive-seconds", type=float, default=5.0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{'mode':>6} {'connections':>12} {'connect (s)':>12} {'RSS delta (MB)':>15} "
+        f"{'KB per connection':>18} {'server tasks':>13} {'keep-alives':>12}"
+    )
+    for server_mode in args.modes:
+        port = get_free_port()
+        process = context.Process(target=serve, args=(server_mode, port, args.keep_alive_seconds))
+        process.start()
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port)).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            duration, rss_delta, stats, keep_alives = asyncio.run(
+                measure(process.pid, port, args.connections, args.keep_alive_seconds)
+            )
+        finally:
+            process.terminate()
+            process.join()
+        print(
+            f"{server_mode:>6} {args.connections:>12} {duration:>12.2f} {rss_delta:>15.1f} "
+            f"{rss_delta * 1024 / args.connections:>18.1f} {stats['tasks']:>13} {keep_alives:>12}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
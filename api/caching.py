@@ -1,25 +1,787 @@
-# TODO Investigate LLM semantic caching techniques
-
-# from gptcache import cache
-# from gptcache.adapter import openai
-# from gptcache.embedding import Onnx
-# from gptcache.processor.pre import all_content
-# from gptcache.manager import CacheBase, VectorBase, get_data_manager
-# from gptcache.similarity_evaluation.distance import SearchDistanceEvaluation
-# from gptcache.processor.context.summarization_context import SummarizationContextProcess
-
-# print("Cache loading.....")
-
-# onnx = Onnx()
-# data_manager = get_data_manager(CacheBase("sqlite"), VectorBase("faiss", dimension=onnx.dimension))
-# context_process = SummarizationContextProcess()
-# cache.init(
-#     pre_embedding_func=context_process.pre_process,
-#     embedding_func=onnx.to_embeddings,
-#     data_manager=data_manager,
-#     similarity_evaluation=SearchDistanceEvaluation(),
-# )
-# cache.set_openai_key()
-
-# cache.init(pre_embedding_func=get_prompt)
-# cache.set_openai_key()
+"""Caches with pluggable storage backends, used to avoid repeating expensive work."""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import openai
+import pandas as pd
+import pyarrow as pa
+from cachetools import TTLCache
+
+from api.log import logger
+from api.metrics import registry
+from api.utils import normalize_sql_query
+
+cache_hits = registry.counter("chartgpt_cache_hits_total", "Cache hits, by cache.")
+cache_misses = registry.counter("chartgpt_cache_misses_total", "Cache misses, by cache.")
+cache_evictions = registry.counter(
+    "chartgpt_cache_evictions_total", "Cache entries evicted to stay within the maximum size, by cache."
+)
+
+
+class CacheBackend:
+    """
+    Stores values of bytes by key, with an optional time-to-live (TTL) in seconds per entry.
+
+    Backends are bounded to `max_size` bytes and evict the least recently used entries first.
+    """
+
+    name = "cache"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache, local to each API worker."""
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.size = 0
+        # Key to tuple of value and expiry timestamp, from least to most recently used
+        self._entries: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.time():
+            await self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if len(value) > self.max_size:
+            return
+        await self.delete(key)
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._entries[key] = (value, expires_at)
+        self.size += len(value)
+        while self.size > self.max_size:
+            evicted_key = next(iter(self._entries))
+            await self.delete(evicted_key)
+            cache_evictions.inc(cache=self.name)
+
+    async def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    Cache of one file per entry in a local directory, shared by the API workers on a host.
+
+    Each file starts with the entry's expiry timestamp, and the file's modification
+    time is updated when the entry is read, to evict the least recently used entries.
+
+    The directory is scanned for entries to evict once the entries written by this worker
+    since the last scan could exceed the maximum size, or `evict_interval` seconds after
+    the last scan, to account for the entries written by other workers.
+    """
+
+    _header = struct.Struct("<d")
+    evict_interval = 60.0
+
+    def __init__(self, name: str, max_size: int, directory: str):
+        self.name = name
+        self.max_size = max_size
+        self.directory = Path(directory) / name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Size of the entries as of the last scan, plus those written since, or `None` before the first scan
+        self._size: Optional[int] = None
+        self._evicted_at = 0.0
+        self._evict_lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = self._header.unpack_from(data)
+        if expires_at and expires_at < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return data[self._header.size :]
+
+    def _set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if len(value) > self.max_size:
+            return
+        expires_at = time.time() + ttl if ttl is not None else 0.0
+        path = self._path(key)
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        data = self._header.pack(expires_at) + value
+        temporary_path.write_bytes(data)
+        # Atomic, so concurrent readers never see a partially written entry
+        temporary_path.replace(path)
+        with self._evict_lock:
+            if self._size is not None:
+                self._size += len(data)
+            if (
+                self._size is None
+                or self._size > self.max_size
+                or time.monotonic() - self._evicted_at > self.evict_interval
+            ):
+                self._size = self._evict()
+                self._evicted_at = time.monotonic()
+
+    def _evict(self) -> int:
+        """Evict the least recently used entries while they exceed the maximum size, returning their size."""
+        entries = []
+        for path in self.directory.iterdir():
+            # Entries being written by this or other workers
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            cache_evictions.inc(cache=self.name)
+        return size
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
+
+
+class MongoGridFSCacheBackend(CacheBackend):
+    """
+    Cache stored in MongoDB GridFS, shared by all API workers and instances.
+
+    Entries are evicted in the order they were stored, rather than least recently used,
+    to avoid a write to MongoDB on every read.
+    """
+
+    def __init__(self, name: str, max_size: int, mongodb_url: str, database: str = "api"):
+        self.name = name
+        self.max_size = max_size
+        self.mongodb_url = mongodb_url
+        self.database = database
+        self._bucket = None
+        self._files = None
+
+    @property
+    def bucket(self):
+        # Created on first use, so that the client is bound to the running event loop
+        if self._bucket is None:
+            import motor.motor_asyncio
+
+            client = motor.motor_asyncio.AsyncIOMotorClient(self.mongodb_url)
+            self._bucket = motor.motor_asyncio.AsyncIOMotorGridFSBucket(
+                client[self.database], bucket_name=f"cache_{self.name}"
+            )
+            self._files = client[self.database][f"cache_{self.name}.files"]
+        return self._bucket
+
+    @property
+    def files(self):
+        """The collection of the bucket's files, with their lengths and upload dates."""
+        if self._files is None:
+            self.bucket
+        return self._files
+
+    async def get(self, key: str) -> Optional[bytes]:
+        cursor = self.bucket.find({"filename": key}).sort("uploadDate", -1).limit(1)
+        async for grid_out in cursor:
+            expires_at = (grid_out.metadata or {}).get("expires_at")
+            if expires_at is not None and expires_at < time.time():
+                await self.delete(key)
+                return None
+            stream = await self.bucket.open_download_stream(grid_out._id)
+            return await stream.read()
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if len(value) > self.max_size:
+            return
+        await self.delete(key)
+        expires_at = time.time() + ttl if ttl is not None else None
+        await self.bucket.upload_from_stream(
+            key, value, metadata={"expires_at": expires_at}
+        )
+        await self._evict()
+
+    async def _evict(self) -> None:
+        # Summed by MongoDB, rather than by listing every file
+        totals = await self.files.aggregate(
+            [{"$group": {"_id": None, "size": {"$sum": "$length"}}}]
+        ).to_list(1)
+        excess = (totals[0]["size"] if totals else 0) - self.max_size
+        if excess <= 0:
+            return
+        async for document in self.files.find({}, {"length": 1}).sort("uploadDate", 1):
+            if excess <= 0:
+                break
+            await self.bucket.delete(document["_id"])
+            excess -= document["length"]
+            cache_evictions.inc(cache=self.name)
+
+    async def delete(self, key: str) -> None:
+        async for grid_out in self.bucket.find({"filename": key}):
+            await self.bucket.delete(grid_out._id)
+
+
+def create_cache_backend(
+    backend: str,
+    name: str,
+    max_size: int,
+    directory: Optional[str] = None,
+    mongodb_url: Optional[str] = None,
+) -> Optional[CacheBackend]:
+    """Create a cache backend by name: "memory", "disk", "mongo", or "none" to disable caching."""
+    if backend == "memory":
+        return MemoryCacheBackend(name, max_size=max_size)
+    elif backend == "disk":
+        return DiskCacheBackend(name, max_size=max_size, directory=directory)
+    elif backend == "mongo":
+        return MongoGridFSCacheBackend(name, max_size=max_size, mongodb_url=mongodb_url)
+    elif backend == "none":
+        return None
+    else:
+        raise ValueError(f"Invalid cache backend: {backend}")
+
+
+def serialize_dataframe(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame using the compressed Arrow IPC format, preserving dtypes."""
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_dataframe(data: bytes) -> pd.DataFrame:
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all().to_pandas()
+
+
+class QueryResultCache:
+    """
+    Content-addressed cache of SQL query results.
+
+    Results are keyed on the normalized SQL query, the data source URL, and a freshness
+    token that changes when the data source's tables are modified, so results are
+    invalidated when the underlying data changes, or when their TTL expires.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: Optional[float] = None):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def key(query: str, data_source_url: str, freshness_token: Optional[str]) -> str:
+        content = "\n".join(
+            [normalize_sql_query(query), data_source_url or "", freshness_token or ""]
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    async def get(
+        self, query: str, data_source_url: str, freshness_token: Optional[str]
+    ) -> Optional[pd.DataFrame]:
+        if self.backend is None:
+            return None
+        key = self.key(query, data_source_url, freshness_token)
+        df = None
+        try:
+            data = await self.backend.get(key)
+            if data is not None:
+                # In a thread, as large results take long enough to block other requests
+                df = await asyncio.to_thread(deserialize_dataframe, data)
+        except Exception:
+            logger.exception("Failed to get query result from cache")
+            # E.g. a corrupt entry, or one stored by an incompatible version
+            try:
+                await self.backend.delete(key)
+            except Exception:
+                logger.exception("Failed to delete query result from cache")
+        if df is None:
+            cache_misses.inc(cache=self.backend.name)
+            return None
+        cache_hits.inc(cache=self.backend.name)
+        return df
+
+    async def set(
+        self,
+        query: str,
+        data_source_url: str,
+        freshness_token: Optional[str],
+        df: pd.DataFrame,
+    ) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(
+                self.key(query, data_source_url, freshness_token),
+                await asyncio.to_thread(serialize_dataframe, df),
+                ttl=self.ttl,
+            )
+        except Exception:
+            logger.exception("Failed to store query result in cache")
+
+
+@dataclass
+class DryRunOutcome:
+    """The outcome of validating a SQL query, e.g. using a BigQuery dry run."""
+
+    errors: List[str] = field(default_factory=list)
+    total_bytes_processed: Optional[int] = None
+
+
+class DryRunCache:
+    """
+    In-process LRU cache of recent SQL query validation outcomes, keyed on the
+    normalized SQL query and the data source URL, so that repeated dry runs can be skipped.
+    """
+
+    name = "dry_runs"
+
+    def __init__(self, max_size: int, ttl: float):
+        self._outcomes: TTLCache = TTLCache(maxsize=max_size, ttl=ttl)
+
+    @staticmethod
+    def key(query: str, data_source_url: str) -> tuple:
+        return (normalize_sql_query(query), data_source_url or "")
+
+    def get(self, query: str, data_source_url: str) -> Optional[DryRunOutcome]:
+        outcome = self._outcomes.get(self.key(query, data_source_url))
+        if outcome is None:
+            cache_misses.inc(cache=self.name)
+        else:
+            cache_hits.inc(cache=self.name)
+        return outcome
+
+    def set(self, query: str, data_source_url: str, outcome: DryRunOutcome) -> None:
+        self._outcomes[self.key(query, data_source_url)] = outcome
+
+
+class NDAVerdictCache:
+    """
+    In-process LRU cache of recent NDA guard verdicts, keyed on the normalized question,
+    so that repeated questions do not wait for the guard's LLM completion.
+    """
+
+    name = "nda_verdicts"
+
+    def __init__(self, max_size: int, ttl: float):
+        self._verdicts: TTLCache = TTLCache(maxsize=max_size, ttl=ttl)
+
+    @staticmethod
+    def key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    def get(self, question: str) -> Optional[bool]:
+        verdict = self._verdicts.get(self.key(question))
+        if verdict is None:
+            cache_misses.inc(cache=self.name)
+        else:
+            cache_hits.inc(cache=self.name)
+        return verdict
+
+    def set(self, question: str, verdict: bool) -> None:
+        self._verdicts[self.key(question)] = verdict
+
+
+class CompletionStore:
+    """
+    Stores LLM completions by key, with an optional time-to-live (TTL) in seconds per entry.
+
+    Unlike `CacheBackend`, stores are synchronous, so that they can be used by both the
+    synchronous and asynchronous completion functions. Stores that block on I/O are called
+    from a thread by the asynchronous functions.
+    """
+
+    blocking = True
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+
+class MemoryCompletionStore(CompletionStore):
+    """In-process LRU store of at most `max_entries` completions, local to each API worker."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # Key to tuple of value and expiry timestamp, from least to most recently used
+        self._entries: OrderedDict[str, tuple[bytes, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                cache_evictions.inc(cache="llm_completions")
+
+
+class SQLiteCompletionStore(CompletionStore):
+    """Store in a local SQLite database, shared by the API workers on a host and kept across restarts."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            self._connection.execute(
+                "UPDATE completions SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time()),
+            )
+            # Evict the least recently used entries
+            evicted = self._connection.execute(
+                "DELETE FROM completions WHERE key IN (SELECT key FROM completions "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        if evicted > 0:
+            cache_evictions.inc(evicted, cache="llm_completions")
+
+
+class MongoCompletionStore(CompletionStore):
+    """
+    Store in a MongoDB collection, shared by all API workers and instances.
+
+    Expired entries are deleted by a MongoDB TTL index, so the store is bounded by its TTL
+    rather than a maximum number of entries.
+    """
+
+    def __init__(self, mongodb_url: str, database: str = "api", collection: str = "cache_llm_completions"):
+        self.mongodb_url = mongodb_url
+        self.database = database
+        self.collection_name = collection
+        self._collection = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            import pymongo
+
+            collection = pymongo.MongoClient(self.mongodb_url)[self.database][self.collection_name]
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._collection = collection
+        return self._collection
+
+    def get(self, key: str) -> Optional[bytes]:
+        document = self.collection.find_one({"_id": key})
+        if document is None:
+            return None
+        # The TTL index deletes expired entries periodically, rather than as they expire
+        expires_at = document.get("expires_at")
+        if expires_at is not None and expires_at.timestamp() < time.time():
+            return None
+        return document["value"]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = (
+            datetime.datetime.fromtimestamp(time.time() + ttl, tz=datetime.timezone.utc)
+            if ttl is not None
+            else None
+        )
+        self.collection.replace_one(
+            {"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True
+        )
+
+
+def create_completion_store(
+    backend: str,
+    max_entries: int,
+    path: Optional[str] = None,
+    mongodb_url: Optional[str] = None,
+) -> Optional[CompletionStore]:
+    """Create a completion store by name: "memory", "sqlite", "mongo", or "none" to disable caching."""
+    if backend == "memory":
+        return MemoryCompletionStore(max_entries=max_entries)
+    elif backend == "sqlite":
+        return SQLiteCompletionStore(path, max_entries=max_entries)
+    elif backend == "mongo":
+        return MongoCompletionStore(mongodb_url)
+    elif backend == "none":
+        return None
+    else:
+        raise ValueError(f"Invalid completion cache backend: {backend}")
+
+
+# The tenant that LLM completions are cached for, so that completions are not shared between tenants
+completion_cache_tenant: ContextVar[str] = ContextVar("completion_cache_tenant", default="")
+
+llm_cache_requests = registry.counter(
+    "chartgpt_llm_cache_requests_total", "LLM completion cache lookups, by mode and result."
+)
+llm_cache_seconds_saved = registry.counter(
+    "chartgpt_llm_cache_seconds_saved_total",
+    "LLM completion latency saved by cache hits, in seconds.",
+)
+
+
+class SemanticIndex:
+    """
+    In-process index of the embeddings of cached prompts, partitioned by the rest of the
+    request, with at most `max_entries` embeddings, evicting the oldest first.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # Partition key to embeddings matrix and completion keys
+        self._partitions: OrderedDict[str, tuple[np.ndarray, List[str]]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def search(self, partition: str, embedding: np.ndarray, threshold: float) -> Optional[str]:
+        with self._lock:
+            entry = self._partitions.get(partition)
+        if entry is None:
+            return None
+        embeddings, keys = entry
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        similarities = embeddings @ embedding
+        index = int(np.argmax(similarities))
+        return keys[index] if similarities[index] >= threshold else None
+
+    def add(self, partition: str, embedding: np.ndarray, key: str) -> None:
+        with self._lock:
+            embeddings, keys = self._partitions.pop(partition, (np.empty((0, len(embedding))), []))
+            self._partitions[partition] = (np.vstack([embeddings, embedding]), keys + [key])
+            self._size += 1
+            while self._size > self.max_entries:
+                _, (_, evicted_keys) = self._partitions.popitem(last=False)
+                self._size -= len(evicted_keys)
+
+
+class LLMCompletionCache:
+    """
+    Cache of deterministic (temperature 0) LLM chat completions, per tenant.
+
+    In exact mode, completions are keyed on the model, messages, functions, and other
+    request parameters. In semantic mode, a request whose last message is similar to that
+    of a cached request, with an otherwise identical request, is also served from the cache,
+    using the embeddings of the last messages in a local vector index.
+    """
+
+    def __init__(
+        self,
+        store: Optional[CompletionStore],
+        ttl: Optional[float] = None,
+        semantic: bool = False,
+        similarity_threshold: float = 0.95,
+        embedding_model: str = "text-embedding-ada-002",
+        max_semantic_entries: int = 10_000,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model
+        self.semantic_index = SemanticIndex(max_semantic_entries)
+        # Embeddings of the last messages of requests that missed the cache, by key, reused
+        # to index their completions
+        self._pending_embeddings = TTLCache(maxsize=1_000, ttl=600)
+        self._pending_embeddings_lock = threading.Lock()
+
+    @staticmethod
+    def _hash(obj) -> str:
+        content = json.dumps(obj, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, kwargs: dict) -> bool:
+        return self.store is not None and kwargs.get("temperature") == 0
+
+    def key(self, kwargs: dict) -> str:
+        return self._hash([completion_cache_tenant.get(), kwargs])
+
+    def partition(self, kwargs: dict) -> str:
+        """The key of a request without the content of its last message."""
+        messages = kwargs["messages"]
+        return self._hash(
+            [
+                completion_cache_tenant.get(),
+                {**kwargs, "messages": messages[:-1] + [{**messages[-1], "content": None}]},
+            ]
+        )
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def embed(self, text: str) -> np.ndarray:
+        response = openai.Embedding.create(model=self.embedding_model, input=text)
+        return self._normalize(response["data"][0]["embedding"])
+
+    async def aembed(self, text: str) -> np.ndarray:
+        response = await openai.Embedding.acreate(model=self.embedding_model, input=text)
+        return self._normalize(response["data"][0]["embedding"])
+
+    def _remember_embedding(self, key: str, embedding: np.ndarray) -> None:
+        with self._pending_embeddings_lock:
+            self._pending_embeddings[key] = embedding
+
+    def _pop_embedding(self, key: str) -> Optional[np.ndarray]:
+        with self._pending_embeddings_lock:
+            return self._pending_embeddings.pop(key, None)
+
+    def _load(self, value: Optional[bytes], mode: str):
+        if value is None:
+            llm_cache_requests.inc(mode=mode, result="miss")
+            return None
+        entry = json.loads(value)
+        llm_cache_requests.inc(mode=mode, result="hit")
+        llm_cache_seconds_saved.inc(entry["seconds"])
+        return openai.openai_object.OpenAIObject.construct_from(entry["response"])
+
+    def _dump(self, response, seconds: float) -> bytes:
+        return json.dumps({"response": response, "seconds": seconds}).encode("utf-8")
+
+    def get(self, kwargs: dict):
+        """Returns the cached completion of a request, or `None`."""
+        if not self.is_cacheable(kwargs):
+            return None
+        try:
+            response = self._load(self.store.get(self.key(kwargs)), mode="exact")
+            if response is None and self.semantic:
+                embedding = self.embed(kwargs["messages"][-1]["content"])
+                key = self.semantic_index.search(
+                    self.partition(kwargs), embedding, self.similarity_threshold
+                )
+                response = self._load(self.store.get(key) if key else None, mode="semantic")
+                if response is None:
+                    self._remember_embedding(self.key(kwargs), embedding)
+            return response
+        except Exception:
+            logger.exception("Failed to get LLM completion from cache")
+            return None
+
+    def set(self, kwargs: dict, response, seconds: float) -> None:
+        """Caches the completion of a request, which took `seconds` to complete."""
+        if not self.is_cacheable(kwargs):
+            return
+        try:
+            key = self.key(kwargs)
+            self.store.set(key, self._dump(response, seconds), ttl=self.ttl)
+            if self.semantic:
+                embedding = self._pop_embedding(key)
+                if embedding is None:
+                    embedding = self.embed(kwargs["messages"][-1]["content"])
+                self.semantic_index.add(self.partition(kwargs), embedding, key)
+        except Exception:
+            logger.exception("Failed to store LLM completion in cache")
+
+    async def _store_call(self, method, *args, **kwargs):
+        if self.store.blocking:
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return method(*args, **kwargs)
+
+    async def aget(self, kwargs: dict):
+        if not self.is_cacheable(kwargs):
+            return None
+        try:
+            value = await self._store_call(self.store.get, self.key(kwargs))
+            response = self._load(value, mode="exact")
+            if response is None and self.semantic:
+                embedding = await self.aembed(kwargs["messages"][-1]["content"])
+                key = self.semantic_index.search(
+                    self.partition(kwargs), embedding, self.similarity_threshold
+                )
+                value = await self._store_call(self.store.get, key) if key else None
+                response = self._load(value, mode="semantic")
+                if response is None:
+                    self._remember_embedding(self.key(kwargs), embedding)
+            return response
+        except Exception:
+            logger.exception("Failed to get LLM completion from cache")
+            return None
+
+    async def aset(self, kwargs: dict, response, seconds: float) -> None:
+        if not self.is_cacheable(kwargs):
+            return
+        try:
+            key = self.key(kwargs)
+            await self._store_call(self.store.set, key, self._dump(response, seconds), ttl=self.ttl)
+            if self.semantic:
+                embedding = self._pop_embedding(key)
+                if embedding is None:
+                    embedding = await self.aembed(kwargs["messages"][-1]["content"])
+                self.semantic_index.add(self.partition(kwargs), embedding, key)
+        except Exception:
+            logger.exception("Failed to store LLM completion in cache")
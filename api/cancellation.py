@@ -0,0 +1,53 @@
+"""
+Cancellation of the work of a request when its client disconnects.
+
+The work of a request is awaited while listening for the client's disconnection, and
+cancelled as soon as the client disconnects. The cancellation propagates through
+`answer_user_query` to the stages of its pipeline, whose LLM completions close their HTTP
+requests, whose BigQuery jobs are cancelled by the executor, and whose code executions are
+aborted by the sandbox pool, each of which counts what it saved.
+
+Streams detect disconnections themselves, while they are sent, so this only covers the
+work done before a response is sent.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from api.errors import ClientDisconnectedError
+from api.metrics import registry
+
+requests_disconnected = registry.counter(
+    "chartgpt_requests_disconnected_total",
+    "Requests whose work was cancelled because their client disconnected, by endpoint.",
+)
+
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+async def wait_for_disconnect(receive: Receive) -> None:
+    """Wait for the client to disconnect, once the request's body was received."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnected(receive: Receive, work: Awaitable, endpoint: str) -> Any:
+    """
+    Await work, cancelling it as soon as the client disconnects, in which case a
+    `ClientDisconnectedError` is raised once the work is cancelled.
+    """
+    work = asyncio.ensure_future(work)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not work.done():
+            work.cancel()
+            requests_disconnected.inc(endpoint=endpoint)
+            await asyncio.gather(work, return_exceptions=True)
+            raise ClientDisconnectedError("The client disconnected.")
+        return work.result()
+    finally:
+        disconnected.cancel()
+        work.cancel()
@@ -3,7 +3,6 @@
 
 import asyncio
 import base64
-import contextlib
 import enum
 import functools
 import inspect
@@ -11,11 +10,7 @@ import json
 import pickle
 import re
 import time
-import traceback
-from contextlib import redirect_stdout
-from io import StringIO
 from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple, Union
-from fastapi.concurrency import run_in_threadpool
 import concurrent.futures
 
 import openai
@@ -25,13 +20,9 @@ import plotly
 import plotly.graph_objs as go
 # Override Streamlit styling
 import plotly.io as pio
-from google.api_core.exceptions import InternalServerError
+from google.api_core.exceptions import BadRequest, GoogleAPICallError, InternalServerError
 from google.cloud import bigquery
-from IPython.core.interactiveshell import ExecutionResult, InteractiveShell
-from IPython.utils import io
-from plotly.graph_objs import Figure
 import tenacity
-from typeguard import TypeCheckError, check_type, typechecked
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -41,16 +32,43 @@ from tenacity import (
 from api.models import Attempt, Error, Output, OutputType, Request
 import api.utils
 from api import log, utils
+from api.caching import (DryRunCache, DryRunOutcome, LLMCompletionCache,
+                         QueryResultCache, create_cache_backend,
+                         create_completion_store)
 from api.config import (
     SQL_INITIAL_GPT_MODEL,
     SQL_CORRECTION_GPT_MODEL,
     CODE_INITIAL_GPT_MODEL,
     CODE_CORRECTION_GPT_MODEL,
+    CODE_EXECUTION_BACKEND,
     DEFAULT_GPT_TEMPERATURE,   
+    DATA_SOURCE_FRESHNESS_TTL,
+    DRY_RUN_CACHE_MAX_SIZE,
+    DRY_RUN_CACHE_TTL,
+    LLM_CACHE_BACKEND,
+    LLM_CACHE_EMBEDDING_MODEL,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_SEMANTIC,
+    LLM_CACHE_SIMILARITY_THRESHOLD,
+    LLM_CACHE_TTL,
+    MONGODB_URL,
+    QUERY_RESULT_CACHE_BACKEND,
+    QUERY_RESULT_CACHE_DIRECTORY,
+    QUERY_RESULT_CACHE_MAX_SIZE,
+    QUERY_RESULT_CACHE_TTL,
+    SCHEMA_PRUNING_ENABLED,
+    SCHEMA_PRUNING_MAX_TOKENS,
+    SCHEMA_PRUNING_TOP_K,
+    SQL_QUERY_GENERATION_TIMEOUT,
+    SQL_VALIDATION_MODE,
 )
-from api.connectors.bigquery import bigquery_client
-from api.errors import ContextLengthError, PythonExecutionError, SQLValidationError
+from api.connectors.bigquery import bigquery_executor
+from api.errors import (ContextLengthError, InsecureRequestError,
+                        PythonExecutionError, SQLValidationError)
+from api.execution import execute_python_code
 from api.log import logger
+from api.metrics import registry
 from api.prompts.templates import (
     CODE_GENERATION_ERROR_PROMPT_TEMPLATE,
     CODE_GENERATION_IMPORTS,
@@ -60,16 +78,70 @@ from api.prompts.templates import (
     get_relevant_examples,
     convert_examples_to_llm_messages,
 )
-from api.security.secure_ast import assert_secure_code
+from api.pipeline import Pipeline
+from api.sandbox import code_execution_pool
+from api.shared_frames import share_dataframe
+from api.streaming import FunctionCallStream, stream_function_call
+from api.schema_catalog import schema_catalog
+from api.schema_pruning import count_tokens
 from api.types import (  # Request,; Attempt,; Output,; AnyOutputType,
     CodeGenerationConfig, Message, PythonExecutionResult, QueryResult, Role,
-    SQLExecutionResult, SQLQueryGenerationConfig, accepted_output_types,
-    assert_matches_accepted_type, map_type_to_output_type)
-from api.utils import (apply_lower_to_where, clean_jupyter_shell_output,
-                       get_tables_summary)
+    SQLAttemptStats, SQLExecutionResult, SQLExecutionStats,
+    SQLQueryGenerationConfig, SQLQueryGenerationStage, accepted_output_types,
+    map_type_to_output_type)
+from api.usage import record_attempt, record_bigquery_job, record_llm_usage
+from api.utils import apply_lower_to_where
 
 pio.templates.default = "plotly"
 
+query_result_cache = QueryResultCache(
+    create_cache_backend(
+        QUERY_RESULT_CACHE_BACKEND,
+        name="query_results",
+        max_size=QUERY_RESULT_CACHE_MAX_SIZE,
+        directory=QUERY_RESULT_CACHE_DIRECTORY,
+        mongodb_url=MONGODB_URL,
+    ),
+    ttl=QUERY_RESULT_CACHE_TTL,
+)
+dry_run_cache = DryRunCache(max_size=DRY_RUN_CACHE_MAX_SIZE, ttl=DRY_RUN_CACHE_TTL)
+llm_completion_cache = LLMCompletionCache(
+    create_completion_store(
+        LLM_CACHE_BACKEND,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+        path=LLM_CACHE_PATH,
+        mongodb_url=MONGODB_URL,
+    ),
+    ttl=LLM_CACHE_TTL,
+    semantic=LLM_CACHE_SEMANTIC,
+    similarity_threshold=LLM_CACHE_SIMILARITY_THRESHOLD,
+    embedding_model=LLM_CACHE_EMBEDDING_MODEL,
+    max_semantic_entries=LLM_CACHE_MAX_ENTRIES,
+)
+bigquery_jobs_saved = registry.counter(
+    "chartgpt_bigquery_jobs_saved_total", "BigQuery jobs skipped, by job type and reason."
+)
+bigquery_seconds_saved = registry.counter(
+    "chartgpt_bigquery_seconds_saved_total",
+    "Estimated BigQuery job seconds saved by skipping jobs, by job type and reason.",
+)
+bigquery_bytes_saved = registry.counter(
+    "chartgpt_bigquery_bytes_saved_total",
+    "Estimated bytes not processed by BigQuery jobs, by job type and reason.",
+)
+llm_requests_cancelled = registry.counter(
+    "chartgpt_llm_requests_cancelled_total",
+    "LLM completions aborted before they completed, because their request was cancelled.",
+)
+llm_time_to_first_token = registry.histogram(
+    "chartgpt_llm_time_to_first_token_seconds",
+    "Seconds until the first chunk of streamed LLM completions is received.",
+)
+# Data source URL to tuple of expiry timestamp and freshness token
+data_source_freshness_tokens: Dict[str, Tuple[float, Optional[str]]] = {}
+# Project and dataset IDs, which are interpolated into the table names of queries
+BIGQUERY_IDENTIFIER_PATTERN = re.compile(r"[a-zA-Z0-9_-]+")
+
 
 function_respond_to_user = {
     "name": "respond_to_user",
@@ -177,24 +249,36 @@ async def execute_in_process(func, *args, **kwargs) -> Any:
         return await asyncio.get_running_loop().run_in_executor(executor, partial_func)
 
 
+def get_query_errors(exc: Exception) -> List[str]:
+    """Returns the error messages of a failed BigQuery job, or of any other exception."""
+    job_errors = getattr(exc, "errors", None)
+    if isinstance(exc, GoogleAPICallError) and job_errors:
+        return [str(err.get("message", err)) for err in job_errors]
+    return [str(exc)]
+
+
+async def dry_run_sql_query(query: str, session_id: Optional[str] = None) -> DryRunOutcome:
+    """Takes a BigQuery SQL query, executes it using a dry run, and returns the outcome"""
+    query_job = await bigquery_executor.dry_run(query, key=session_id)
+    record_bigquery_job("dry_run", bytes_processed=query_job.total_bytes_processed)
+    errors = (
+        [str(err["message"]) for err in query_job.errors]
+        if query_job.errors
+        else []
+    )
+    logger.debug(f"BigQuery dry-run job errors: {errors}")
+    logger.debug(
+        f"BigQuery dry-run job bytes processed: {query_job.total_bytes_processed}"
+    )
+    return DryRunOutcome(errors=errors, total_bytes_processed=query_job.total_bytes_processed)
+
+
 @log.wrap(log.entering, log.exiting)
-async def validate_sql_query(query: str) -> List[str]:
+async def validate_sql_query(query: str, session_id: Optional[str] = None) -> List[str]:
     """Takes a BigQuery SQL query, executes it using a dry run, and returns a list of errors, if any"""
     try:
-        query_job = await run_in_threadpool(
-            bigquery_client.query,
-            query,
-            job_config=bigquery.QueryJobConfig(dry_run=True)
-        )
-        errors = (
-            [str(err["message"]) for err in query_job.errors]
-            if query_job.errors
-            else []
-        )
-        logger.debug(f"BigQuery dry-run job errors: {errors}")
-        logger.debug(
-            f"BigQuery dry-run job bytes processed: {query_job.total_bytes_processed}"
-        )
+        outcome = await dry_run_sql_query(query, session_id=session_id)
+        errors = outcome.errors
     except Exception as e:
         errors = [str(e)]
     return errors
@@ -223,15 +307,76 @@ def openai_chat_completion_sync(
             kwargs["functions"] = functions
         if function_call:
             kwargs["function_call"] = function_call
+        response = llm_completion_cache.get(kwargs)
+        if response is not None:
+            logger.debug("OpenAI ChatCompletion response served from cache")
+            record_llm_usage(model, response, cached=True)
+            return response
+        start_time = time.perf_counter()
         response = openai.ChatCompletion.create(*args, **kwargs)
+        llm_completion_cache.set(kwargs, response, seconds=time.perf_counter() - start_time)
         logger.debug("OpenAI ChatCompletion temperature: %s", temperature)
         logger.debug("OpenAI ChatCompletion response usage: %s", response.get('usage'))
+        record_llm_usage(model, response)
         return response
     except openai.InvalidRequestError as exc:
         logger.exception(f"{exc}.\nMessages with length {len(messages)}: {messages}")
         raise exc
 
 
+async def replay_function_call(response, function_call_stream: FunctionCallStream) -> None:
+    """Send the arguments of a complete response's function call to a stream, at once."""
+    function_call = response["choices"][0]["message"].get("function_call") or {}
+    function_call_stream.reset()
+    await function_call_stream.feed(function_call.get("arguments") or "")
+    await function_call_stream.close()
+
+
+async def create_streamed_chat_completion(kwargs: dict, function_call_stream: FunctionCallStream):
+    """
+    Create a chat completion streamed in chunks, sending the arguments of its function call to
+    the stream while they are generated, and assemble the chunks into a complete response.
+    """
+    function_call_stream.reset()
+    start_time = time.perf_counter()
+    chunks = await openai.ChatCompletion.acreate(**kwargs, stream=True)
+    response = {"object": "chat.completion"}
+    content, name, arguments = [], [], []
+    finish_reason = None
+    async for chunk in chunks:
+        if "id" not in response:
+            llm_time_to_first_token.observe(time.perf_counter() - start_time, model=kwargs["model"])
+        response.update(id=chunk.get("id"), created=chunk.get("created"), model=chunk.get("model"))
+        if not chunk["choices"]:
+            continue
+        choice = chunk["choices"][0]
+        delta = choice.get("delta") or {}
+        content.append(delta.get("content") or "")
+        function_call = delta.get("function_call")
+        if function_call:
+            name.append(function_call.get("name") or "")
+            arguments.append(function_call.get("arguments") or "")
+            await function_call_stream.feed(arguments[-1])
+        finish_reason = choice.get("finish_reason") or finish_reason
+    await function_call_stream.close()
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if name:
+        message["function_call"] = {"name": "".join(name), "arguments": "".join(arguments)}
+    # Streamed completions do not report their usage, so it is counted from the request and response
+    prompt_tokens = count_tokens(json.dumps([kwargs["messages"], kwargs.get("functions")]))
+    completion_tokens = count_tokens(json.dumps(message))
+    response.update(
+        choices=[{"index": 0, "message": message, "finish_reason": finish_reason}],
+        usage={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    )
+    return openai.openai_object.OpenAIObject.construct_from(response)
+
+
 @log.wrap(log.entering, log.exiting)
 @retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(5))
 async def openai_chat_completion(
@@ -241,7 +386,12 @@ async def openai_chat_completion(
     functions: Optional[List] = None,
     function_call: Optional[Dict] = None,
     temperature: float = DEFAULT_GPT_TEMPERATURE,
+    function_call_stream: Optional[FunctionCallStream] = None,
 ):
+    """
+    Create a chat completion, streaming the arguments of its function call to
+    `function_call_stream`, if any, while they are generated.
+    """
     try:
         args = []
         kwargs = {
@@ -255,9 +405,27 @@ async def openai_chat_completion(
             kwargs["functions"] = functions
         if function_call:
             kwargs["function_call"] = function_call
-        response = await openai.ChatCompletion.acreate(*args, **kwargs)
+        response = await llm_completion_cache.aget(kwargs)
+        if response is not None:
+            logger.debug("OpenAI ChatCompletion response served from cache")
+            record_llm_usage(model, response, cached=True)
+            if function_call_stream is not None:
+                await replay_function_call(response, function_call_stream)
+            return response
+        start_time = time.perf_counter()
+        try:
+            if function_call_stream is not None:
+                response = await create_streamed_chat_completion(kwargs, function_call_stream)
+            else:
+                response = await openai.ChatCompletion.acreate(*args, **kwargs)
+        except asyncio.CancelledError:
+            # The HTTP request is closed, so that the completion stops being generated
+            llm_requests_cancelled.inc(model=model)
+            raise
+        await llm_completion_cache.aset(kwargs, response, seconds=time.perf_counter() - start_time)
         logger.debug("OpenAI ChatCompletion temperature: %s", temperature)
         logger.debug("OpenAI ChatCompletion response usage: %s", response.get('usage'))
+        record_llm_usage(model, response)
         return response
     except openai.InvalidRequestError as exc:
         logger.exception(f"{exc}.\nMessages with length {len(messages)}: {messages}")
@@ -300,121 +468,357 @@ async def get_initial_sql_query(messages) -> Tuple[str, str]:
             function_validate_sql_query,
         ],
         function_call={"name": "validate_sql_query"},
+        function_call_stream=stream_function_call("sql"),
     )
     _, description, query = extract_sql_query_generation_response_data(response)
     return description, query
 
 
+def get_exhausted_budget(
+    config: SQLQueryGenerationConfig,
+    attempt_index: int,
+    tokens_used: int,
+    deadline: Optional[float],
+) -> Optional[str]:
+    """Returns the name of the first SQL query generation budget that is exhausted, if any."""
+    if attempt_index >= config.max_attempts:
+        return "attempts"
+    if config.max_tokens is not None and tokens_used >= config.max_tokens:
+        return "tokens"
+    if deadline is not None and time.monotonic() >= deadline:
+        return "time"
+    return None
+
+
+def get_remaining_seconds(deadline: Optional[float]) -> Optional[float]:
+    return max(deadline - time.monotonic(), 0) if deadline is not None else None
+
+
 @log.wrap(log.entering, log.exiting)
 async def generate_valid_sql_query(
     query: str,
     description: str,
     messages: List[dict],
-    attempts: List[Attempt] = [],
     config: SQLQueryGenerationConfig = SQLQueryGenerationConfig(),
 ) -> AsyncGenerator[Union[Attempt, SQLExecutionResult], None]:
-    query = apply_lower_to_where(query)
-    errors = await validate_sql_query(query=query)
+    """
+    Executes a SQL query and, while it fails, asks the LLM to correct it, yielding each failed
+    attempt, followed by the result of the last query executed.
+
+    Corrections stop when a query succeeds, or when the attempts, token, or wall-clock budget
+    of `config` is exhausted. The state is local to each call, and only the current query
+    and its errors are kept between attempts, so memory is flat per request.
+    """
+    stats = SQLExecutionStats()
+    deadline = time.monotonic() + config.timeout if config.timeout is not None else None
+    attempt_index = 0
+    tokens_used = 0
+    errors: List[str] = []
     df = pd.DataFrame()
+    stage = SQLQueryGenerationStage.EXECUTE
+
+    while stage != SQLQueryGenerationStage.DONE:
+        if stage == SQLQueryGenerationStage.EXECUTE:
+            attempt_stats = SQLAttemptStats(index=attempt_index)
+            stats.attempts.append(attempt_stats)
+            query = apply_lower_to_where(query)
+            start_time = time.perf_counter()
+            try:
+                errors, df = await asyncio.wait_for(
+                    run_sql_query(query=query, config=config, stats=stats),
+                    timeout=get_remaining_seconds(deadline),
+                )
+            except asyncio.TimeoutError:
+                errors, df = ["The query timed out."], pd.DataFrame()
+            attempt_stats.execution_seconds = time.perf_counter() - start_time
 
-    if not errors:
-        try:
-            df = await execute_sql_query(query=query)
-            if config.assert_results_not_empty and df.dropna(how="all").empty:
+            if not errors and config.assert_results_not_empty and df.dropna(how="all").empty:
                 errors.append("The query returned no results, please fix the query and try again.")
-        except Exception as e:
-            errors.append(str(e))
 
-    # TODO If attempts > max_attempts, return an error to the user
-    if errors and len(attempts) <= config.max_attempts:
-        log_errors_and_attempts(query, errors, attempts, config.max_attempts)
-
-        error_prompt = SQL_QUERY_GENERATION_ERROR_PROMPT_TEMPLATE.format(
-            description=description,
-            sql_query=query,
-            error_messages=errors
-        )
-        error_correction_messages = [
-            # Include system message,
-            # exclude extensive examples to improve performance
-            messages[0],
-            {"role": Role.USER.value, "content": inspect.cleandoc(error_prompt)}
-        ]
-
-        corrected_response = await openai_chat_completion(
-            SQL_CORRECTION_GPT_MODEL,
-            error_correction_messages,
-            functions=[
-                # function_respond_to_user,
-                # function_validate_sql_query,
-                function_validate_sql_query_without_description,
-            ],
-            function_call={"name": "validate_sql_query"},
-            # Increase temperature from 0.1 to 0.5 with each attempt
-            temperature=0.1 + (len(attempts) / config.max_attempts) * 0.4,
-        )
-        (
-            _,
-            _,
-            updated_query,
-        ) = extract_sql_query_generation_response_data(corrected_response)
-
-        created_at = int(time.time())
-        attempt = Attempt(
-            index=len(attempts),
-            created_at=created_at,
-            outputs=[
-                Output(
-                    index=0,
-                    created_at=created_at,
-                    description=description,
-                    type=OutputType.SQL_QUERY.value,
-                    value=query,
+            if errors:
+                stats.budget_exhausted = get_exhausted_budget(
+                    config, attempt_index, tokens_used, deadline
                 )
-            ],
-            errors=[
-                Error(
-                    index=index,
-                    created_at=created_at,
-                    type=SQLValidationError.__name__,
-                    value=error,
+            stage = (
+                SQLQueryGenerationStage.CORRECT
+                if errors and not stats.budget_exhausted
+                else SQLQueryGenerationStage.DONE
+            )
+
+        elif stage == SQLQueryGenerationStage.CORRECT:
+            log_errors_and_attempts(query, errors, attempt_index, config.max_attempts)
+
+            error_prompt = SQL_QUERY_GENERATION_ERROR_PROMPT_TEMPLATE.format(
+                description=description,
+                sql_query=query,
+                error_messages=errors
+            )
+            error_correction_messages = [
+                # Include system message,
+                # exclude extensive examples to improve performance
+                messages[0],
+                {"role": Role.USER.value, "content": inspect.cleandoc(error_prompt)}
+            ]
+
+            start_time = time.perf_counter()
+            try:
+                corrected_response = await asyncio.wait_for(
+                    openai_chat_completion(
+                        SQL_CORRECTION_GPT_MODEL,
+                        error_correction_messages,
+                        functions=[
+                            # function_respond_to_user,
+                            # function_validate_sql_query,
+                            function_validate_sql_query_without_description,
+                        ],
+                        function_call={"name": "validate_sql_query"},
+                        # Increase temperature from 0.1 to 0.5 with each attempt
+                        temperature=0.1 + (attempt_index / config.max_attempts) * 0.4,
+                        function_call_stream=stream_function_call("sql", attempt=attempt_index + 1),
+                    ),
+                    timeout=get_remaining_seconds(deadline),
                 )
-                for index, error in enumerate(errors)
-            ],
-        )
-        attempts.append(attempt)
-        yield attempt
-        async for result in generate_valid_sql_query(
-            query=updated_query,
-            description=description,
-            messages=messages,
-            attempts=attempts,
-            config=config,
-        ):
-            yield result
-    else:
-        yield SQLExecutionResult(
-            description=description, query=query, dataframe=df, messages=messages
-        )
+            except asyncio.TimeoutError:
+                stats.budget_exhausted = "time"
+                stage = SQLQueryGenerationStage.DONE
+                continue
+            finally:
+                attempt_stats.correction_seconds = time.perf_counter() - start_time
+            tokens_used += 1
+            attempt_stats.llm_tokens = (corrected_response.get("usage") or {}).get("total_tokens", 0)
+            (
+                _,
+                _,
+                updated_query,
+            ) = extract_sql_query_generation_response_data(corrected_response)
+
+            created_at = int(time.time())
+            yield Attempt(
+                index=attempt_index,
+                created_at=created_at,
+                outputs=[
+                    Output(
+                        index=0,
+                        created_at=created_at,
+                        description=description,
+                        type=OutputType.SQL_QUERY.value,
+                        value=query,
+                    )
+                ],
+                errors=[
+                    Error(
+                        index=index,
+                        created_at=created_at,
+                        type=SQLValidationError.__name__,
+                        value=error,
+                    )
+                    for index, error in enumerate(errors)
+                ],
+            )
+            query = updated_query
+            attempt_index += 1
+            stage = SQLQueryGenerationStage.EXECUTE
+
+    log_sql_execution_stats(stats)
+    yield SQLExecutionResult(
+        description=description,
+        query=query,
+        dataframe=df,
+        messages=messages,
+        stats=stats,
+    )
 
 
-def log_errors_and_attempts(query, errors, attempts, max_attempts):
+def log_errors_and_attempts(query, errors, attempt_index, max_attempts):
     logger.debug(f"Query: {query}")
     logger.debug(f"Errors in query: {errors}")
-    logger.debug(f"Attempt: {len(attempts)} of {max_attempts}")
+    logger.debug(f"Attempt: {attempt_index} of {max_attempts}")
+
+
+def log_sql_execution_stats(stats: SQLExecutionStats):
+    if stats.budget_exhausted:
+        logger.warning("SQL query generation stopped, %s budget exhausted", stats.budget_exhausted)
+    logger.info(
+        "BigQuery jobs for SQL query generation: %d run, %d saved, %.2f seconds saved",
+        stats.jobs,
+        stats.jobs_saved,
+        stats.seconds_saved,
+    )
+    for attempt_stats in stats.attempts:
+        logger.debug(
+            "SQL query attempt %d: %.2fs executing, %.2fs correcting, %d LLM tokens",
+            attempt_stats.index,
+            attempt_stats.execution_seconds,
+            attempt_stats.correction_seconds,
+            attempt_stats.llm_tokens,
+        )
+
+
+@log.wrap(log.entering, log.exiting)
+async def get_data_source_freshness_token(
+    data_source_url: str, session_id: Optional[str] = None
+) -> Optional[str]:
+    """
+    Returns a token that changes when any table of the data source is modified,
+    or `None` if it could not be determined, e.g. for the default data source.
+
+    Uses the dataset's `__TABLES__` metadata, which does not scan any table data.
+    Changes to the tables underlying a view in another dataset are not detected.
+    """
+    if not data_source_url:
+        return None
+
+    expires_at, freshness_token = data_source_freshness_tokens.get(data_source_url, (0, None))
+    if expires_at > time.time():
+        return freshness_token
+
+    _, project, dataset_id, table_id = utils.parse_data_source_url(data_source_url)
+    if not all(
+        identifier and BIGQUERY_IDENTIFIER_PATTERN.fullmatch(identifier)
+        for identifier in (project, dataset_id)
+    ):
+        logger.error("Invalid project or dataset of data source %s", data_source_url)
+        return None
+    query = f"SELECT MAX(last_modified_time) AS last_modified_time FROM `{project}.{dataset_id}.__TABLES__`"
+    job_config = None
+    if table_id:
+        query += " WHERE table_id = @table_id"
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("table_id", "STRING", table_id)]
+        )
+    try:
+        _, df = await bigquery_executor.execute(query, job_config=job_config, key=session_id)
+        freshness_token = str(df["last_modified_time"].iloc[0])
+    except Exception:
+        logger.exception("Failed to get freshness token for data source %s", data_source_url)
+        return None
+
+    data_source_freshness_tokens[data_source_url] = (
+        time.time() + DATA_SOURCE_FRESHNESS_TTL,
+        freshness_token,
+    )
+    return freshness_token
+
+
+def record_jobs_saved(stats: SQLExecutionStats, job_types: List[str], reason: str) -> None:
+    """Records BigQuery jobs that were skipped, estimating the time saved from recent job durations."""
+    for job_type in job_types:
+        seconds = bigquery_executor.average_seconds(job_type)
+        stats.jobs_saved += 1
+        stats.seconds_saved += seconds
+        bigquery_jobs_saved.inc(job_type=job_type, reason=reason)
+        bigquery_seconds_saved.inc(seconds, job_type=job_type, reason=reason)
+
+
+def record_job_cancelled(outcome: Optional[DryRunOutcome], seconds: float) -> None:
+    """
+    Records a query job cancelled with its request after running for a number of seconds,
+    estimating the bytes saved from its dry run, if any, and the time saved from recent job durations.
+    """
+    bigquery_jobs_saved.inc(job_type="query", reason="cancelled")
+    bigquery_seconds_saved.inc(
+        max(0.0, bigquery_executor.average_seconds("query") - seconds), job_type="query", reason="cancelled"
+    )
+    if outcome is not None and outcome.total_bytes_processed:
+        bigquery_bytes_saved.inc(outcome.total_bytes_processed, job_type="query", reason="cancelled")
+
+
+async def run_sql_query(
+    query: str,
+    config: SQLQueryGenerationConfig,
+    stats: Optional[SQLExecutionStats] = None,
+) -> Tuple[List[str], pd.DataFrame]:
+    """
+    Validates and executes a SQL query, returning a list of errors, if any, and the results.
+
+    Results are served from the query result cache when the same query was executed
+    against the unmodified data source before, skipping validation and execution.
+
+    The dry run used to validate the query is skipped when the outcome of validating the
+    same normalized query is cached, or when `config.validation_mode` is "execute", in which
+    case the query is executed directly with the client's maximum bytes billed as the guard,
+    and any execution errors are returned to the correction loop in the same way.
+    """
+    stats = stats if stats is not None else SQLExecutionStats()
+    df = pd.DataFrame()
+
+    freshness_token = await get_data_source_freshness_token(
+        config.data_source_url, session_id=config.session_id
+    )
+    if freshness_token:
+        cached_df = await query_result_cache.get(query, config.data_source_url, freshness_token)
+        if cached_df is not None:
+            logger.debug("Query result cache hit for query: %s", query)
+            record_jobs_saved(stats, ["dry_run", "query"], reason="query_result_cache")
+            return [], cached_df
+
+    outcome = dry_run_cache.get(query, config.data_source_url)
+    if outcome is not None:
+        logger.debug("Dry run cache hit for query: %s", query)
+        record_jobs_saved(stats, ["dry_run"], reason="dry_run_cache")
+        if outcome.errors:
+            return list(outcome.errors), df
+    elif config.validation_mode == "execute":
+        record_jobs_saved(stats, ["dry_run"], reason="single_pass")
+    else:
+        stats.jobs += 1
+        try:
+            outcome = await dry_run_sql_query(query, session_id=config.session_id)
+            dry_run_cache.set(query, config.data_source_url, outcome)
+        except BadRequest as e:
+            # Invalid queries fail deterministically, so the errors are cached too
+            dry_run_cache.set(
+                query, config.data_source_url, DryRunOutcome(errors=get_query_errors(e))
+            )
+            return get_query_errors(e), df
+        except Exception as e:
+            return [str(e)], df
+        if outcome.errors:
+            return list(outcome.errors), df
+
+    stats.jobs += 1
+    start_time = time.perf_counter()
+    try:
+        query_job, df = await execute_sql_query(query=query, session_id=config.session_id)
+    except asyncio.CancelledError:
+        # The job is cancelled by the executor
+        record_job_cancelled(outcome, time.perf_counter() - start_time)
+        raise
+    except BadRequest as e:
+        dry_run_cache.set(
+            query, config.data_source_url, DryRunOutcome(errors=get_query_errors(e))
+        )
+        return get_query_errors(e), pd.DataFrame()
+    except Exception as e:
+        return get_query_errors(e), pd.DataFrame()
+
+    dry_run_cache.set(
+        query,
+        config.data_source_url,
+        DryRunOutcome(total_bytes_processed=query_job.total_bytes_processed),
+    )
+    if freshness_token:
+        await query_result_cache.set(query, config.data_source_url, freshness_token, df)
+    return [], df
 
 
 @log.wrap(log.entering, log.exiting)
-async def execute_sql_query(query: str) -> pd.DataFrame:
+async def execute_sql_query(
+    query: str, session_id: Optional[str] = None
+) -> Tuple[bigquery.QueryJob, pd.DataFrame]:
     try:
-        query_job = await run_in_threadpool(bigquery_client.query, query)
-        results = await run_in_threadpool(query_job.result)
+        query_job, df = await bigquery_executor.execute(query, key=session_id)
         logger.debug(f"BigQuery job bytes billed: {query_job.total_bytes_billed}")
+        record_bigquery_job(
+            "query",
+            bytes_processed=query_job.total_bytes_processed,
+            bytes_billed=query_job.total_bytes_billed,
+        )
     except InternalServerError as exc:
         # Typically raised when maximum bytes processed limit is exceeded
         logger.error(f"BigQuery InternalServerError for query {query}")
         raise exc
-    return results.to_dataframe()
+    return query_job, df
 
 
 @log.wrap(log.entering, log.exiting)
@@ -424,6 +828,9 @@ async def get_valid_sql_query(
     initial_description, initial_query = await get_initial_sql_query(messages)
     log_initial_queries(initial_description, initial_query)
 
+    if config.guard is not None and await config.guard:
+        raise InsecureRequestError("The request is insecure.")
+
     if not config.assert_results_not_empty and not initial_query:
         yield SQLExecutionResult(
             description=initial_description,
@@ -490,129 +897,6 @@ def extract_code_generation_response_data(response):
         raise PythonExecutionError("Failed to extract code generation response data") from exc
 
 
-def execute_python_imports(imports: str) -> dict:
-    try:
-        global_variables = {}
-        exec(imports, global_variables)
-        return global_variables
-    except Exception as e:
-        logger.error(e)
-        return {}
-
-
-@log.wrap(log.entering, log.exiting)
-async def execute_python_code(
-    code: str,
-    docstring: str,
-    imports=None,
-    local_variables=None,
-    config: CodeGenerationConfig = CodeGenerationConfig(),
-) -> PythonExecutionResult:
-    if not code:
-        error_msg = "No code provided"
-        logger.warning(error_msg)
-        return PythonExecutionResult(
-            description=docstring,
-            code=code,
-            result=None,
-            local_variables=local_variables,
-            error=error_msg,
-        )
-
-    df = local_variables.get("df", pd.DataFrame())
-    local_variables = local_variables or {}
-    result = None
-    output = ""
-
-    if imports:
-        local_variables.update(execute_python_imports(imports))
-
-    shell = InteractiveShell.instance()
-    try:
-        try:
-            # TODO For now we just log the error to Sentry,
-            # but once the app is deployed publicly, we should lock this down
-            assert_secure_code(code)
-        except Exception:
-            pass
-
-        # with io.capture_output() as captured:
-        with contextlib.redirect_stdout(StringIO()) as captured_stdout:
-            logger.debug("Executing code")
-            # Make a copy of the DataFrame to ensure the original is not modified
-            shell.push({**local_variables, "df": df.copy()})
-            execution_result: ExecutionResult = await shell.run_cell_async(code, store_history=True)
-            execution_result.raise_error()
-
-        answer_fn = shell.user_ns.get("answer_question")
-        function_result = None
-        if callable(answer_fn):
-            logger.debug("Found function `answer_question`")
-            # with io.capture_output() as captured:
-            with contextlib.redirect_stdout(StringIO()) as captured_stdout:
-                logger.debug("Calling function `answer_question`")
-                # Make a copy of the DataFrame to ensure the original is not modified
-                shell.push({**local_variables, "df": df.copy()})
-                function_result: ExecutionResult = await shell.run_cell_async("answer_question(df)", store_history=True)
-                function_result.raise_error()
-
-        output = clean_jupyter_shell_output(
-            captured_stdout.getvalue(), remove_final_result=True
-        )
-
-        if function_result and function_result.result is not None:
-            result = function_result.result
-        elif execution_result.result is not None:
-            result = execution_result.result
-        elif (
-            config.output_variable in shell.user_ns
-            and shell.user_ns[config.output_variable] is not None
-        ):
-            result = shell.user_ns[config.output_variable]
-        else:
-            result = None
-
-        if result is not None:
-            logger.debug("Result: %s", str(result)[:100])
-            try:
-                # check_type(result, config.output_type)
-                assert_matches_accepted_type(result, config.output_types)
-            except TypeCheckError as exc:
-                message = (
-                    f"The code must return a variable of type `{config.output_types}`."
-                )
-                logger.warning(message)
-                raise TypeError(message) from exc
-        else:
-            message = f"The variable `{config.output_variable}` was not defined, or the function `answer_question` does not exist or does not return a value."
-            logger.warning(message)
-            raise ValueError(message)
-        return PythonExecutionResult(
-            description=docstring,
-            code=code,
-            result=result,
-            local_variables=local_variables,
-            io=output,
-            error=None,
-        )
-    except Exception as e:
-        tb = traceback.extract_tb(e.__traceback__)
-        _, line_number, function_name, line_data = tb[-1]
-        error_msg = f"{type(e).__name__}: {str(e)}" #, in code `{line_data}`"
-        error_msg_trace = f"{type(e).__name__}: {str(e)}\nOn line {line_number}, function `{function_name}`, with code `{line_data}`"
-        logger.warning(error_msg_trace)
-        return PythonExecutionResult(
-            description=docstring,
-            code=code,
-            result=None,
-            local_variables=local_variables,
-            io=output,
-            error=error_msg,
-        )
-    finally:
-        shell.clear_instance()
-
-
 @log.wrap(log.entering, log.exiting)
 async def get_initial_python_code(messages) -> Tuple[str, str]:
     response = await openai_chat_completion(
@@ -624,6 +908,7 @@ async def get_initial_python_code(messages) -> Tuple[str, str]:
             function_execute_python_code
         ],
         function_call={"name": "execute_python_code"},
+        function_call_stream=stream_function_call("code", replace_triple_quotes=True),
     )
     _, docstring, code = extract_code_generation_response_data(response)
     return docstring, code
@@ -639,114 +924,150 @@ async def generate_valid_python_code(
     logger.debug("Initial Python code docstring:\n%s", docstring)
     logger.debug("Initial Python code:\n%s", code)
 
-    result: PythonExecutionResult = PythonExecutionResult()
-    for attempt_index in range(config.max_attempts):
-        local_variables["df"] = local_variables["df"].copy()
-
-        result: PythonExecutionResult = await execute_python_code(
-            code=code,
-            docstring=docstring,
-            imports=CODE_GENERATION_IMPORTS,
-            local_variables=local_variables,
-            config=config,
-        )
+    # Execute the code in a warm worker process, unless configured to execute it in the API's process
+    execute = code_execution_pool.execute if CODE_EXECUTION_BACKEND == "sandbox" else execute_python_code
+    execution_variables = local_variables
+    shared_df = None
+    if CODE_EXECUTION_BACKEND == "sandbox":
+        # Write the DataFrame once for all attempts, instead of sending a copy to the worker with each
+        shared_df = await asyncio.to_thread(share_dataframe, local_variables["df"])
+        if shared_df is not None:
+            execution_variables = {**local_variables, "df": shared_df}
+    try:
+        result: PythonExecutionResult = PythonExecutionResult()
+        for attempt_index in range(config.max_attempts):
+            result: PythonExecutionResult = await execute(
+                code=code,
+                docstring=docstring,
+                imports=CODE_GENERATION_IMPORTS,
+                local_variables=execution_variables,
+                config=config,
+            )
 
-        if result.error:
-            logger.warning(f"Attempt: {attempt_index + 1} of {config.max_attempts}")
-            logger.warning(f"Error in code: {result.error}")
-            logger.warning(f"Code:\n{result.code}")
+            if result.error:
+                logger.warning(f"Attempt: {attempt_index + 1} of {config.max_attempts}")
+                logger.warning(f"Error in code: {result.error}")
+                logger.warning(f"Code:\n{result.code}")
+
+                yield Attempt(
+                    index=attempt_index,
+                    created_at=int(time.time()),
+                    outputs=[
+                        Output(
+                            index=0,
+                            created_at=int(time.time()),
+                            description=docstring,
+                            type=OutputType.PYTHON_CODE.value,
+                            value=result.code,
+                        )
+                    ],
+                    errors=[
+                        Error(
+                            index=0,
+                            created_at=int(time.time()),
+                            type=PythonExecutionError.__name__,
+                            value=result.error,
+                        )
+                    ],
+                )
 
-            yield Attempt(
-                index=attempt_index,
-                created_at=int(time.time()),
-                outputs=[
-                    Output(
-                        index=0,
-                        created_at=int(time.time()),
-                        description=docstring,
-                        type=OutputType.PYTHON_CODE.value,
-                        value=result.code,
-                    )
-                ],
-                errors=[
-                    Error(
-                        index=0,
-                        created_at=int(time.time()),
-                        type=PythonExecutionError.__name__,
-                        value=result.error,
-                    )
-                ],
-            )
+                error_prompt = CODE_GENERATION_ERROR_PROMPT_TEMPLATE.format(
+                    description=docstring,
+                    code=result.code,
+                    error_message=result.error
+                )
 
-            error_prompt = CODE_GENERATION_ERROR_PROMPT_TEMPLATE.format(
-                description=docstring,
-                code=result.code,
-                error_message=result.error
-            )
+                error_correction_messages = messages + [
+                    {"role": Role.USER.value, "content": inspect.cleandoc(error_prompt)}
+                ]
+
+                response = await openai_chat_completion(
+                    CODE_CORRECTION_GPT_MODEL,
+                    error_correction_messages,
+                    # max_tokens=8000,
+                    functions=[
+                        # TODO Enable agent to respond to user directly
+                        # function_respond_to_user,
+                        # function_execute_python_code,
+                        function_execute_python_code_without_docstring,
+                    ],
+                    function_call={"name": "execute_python_code"},
+                    # Increase temperature from 0.1 to 0.5 with each attempt
+                    temperature=0.1 + (attempt_index / config.max_attempts) * 0.4,
+                    function_call_stream=stream_function_call(
+                        "code", attempt=attempt_index + 1, replace_triple_quotes=True
+                    ),
+                )
+                _, _, updated_code = extract_code_generation_response_data(
+                    response
+                )
 
-            error_correction_messages = messages + [
-                {"role": Role.USER.value, "content": inspect.cleandoc(error_prompt)}
-            ]
+                code_diff = log.get_unified_diff_changes(result.code, updated_code)
+                logger.debug("Corrected code diff:\n%s", code_diff)
 
-            response = await openai_chat_completion(
-                CODE_CORRECTION_GPT_MODEL,
-                error_correction_messages,
-                # max_tokens=8000,
-                functions=[
-                    # TODO Enable agent to respond to user directly
-                    # function_respond_to_user,
-                    # function_execute_python_code,
-                    function_execute_python_code_without_docstring,
-                ],
-                function_call={"name": "execute_python_code"},
-                # Increase temperature from 0.1 to 0.5 with each attempt
-                temperature=0.1 + (attempt_index / config.max_attempts) * 0.4,
-            )
-            _, _, updated_code = extract_code_generation_response_data(
-                response
-            )
+                # Update code with corrected code
+                code = updated_code
+            else:
+                result.messages = messages
+                yield result
+                break
+        result.messages = messages
+        yield result
+    finally:
+        if shared_df is not None:
+            shared_df.unlink()
+
+
+def get_code_generation_config(output_type: str) -> Dict:
+    """Get the static parts of the code generation prompt for an output type."""
+    if output_type == OutputType.ANY.value:
+        return {
+            "function_parameters": "df: pd.DataFrame",
+            "function_description": "Function to analyze the data and optionally return a list of results `result_list` or `None`.",
+            "output_types": accepted_output_types,
+            "output_description": "A list of any type of object or `None`.",
+            "output_variable": "result_list",
+        }
+    elif output_type == OutputType.PLOTLY_CHART.value:
+        return {
+            "function_parameters": "df: pd.DataFrame",
+            "function_description": "Function to analyze the data and return a Plotly chart.",
+            "output_types": [plotly.graph_objs.Figure],
+            "output_description": "A Plotly figure object.",
+            "output_variable": "fig",
+        }
+    elif output_type == "optional_chart":
+        return {
+            "function_parameters": "df: pd.DataFrame",
+            "function_description": "Function to analyze the data and optionally return a Plotly chart.",
+            "output_types": [Optional[plotly.graph_objs.Figure]],
+            "output_description": "A Plotly figure object or None.",
+            "output_variable": "fig",
+        }
+    else:
+        raise ValueError("Invalid output type requested")
 
-            code_diff = log.get_unified_diff_changes(result.code, updated_code)
-            logger.debug("Corrected code diff:\n%s", code_diff)
 
-            # Update code with corrected code
-            code = updated_code
-        else:
-            result.messages = messages
-            yield result
-            break
-    result.messages = messages
-    yield result
+def get_dataframe_summary(df: pd.DataFrame):
+    try:
+        return utils.get_dataframe_summary(df)
+    except IndexError:
+        return "DataFrame is empty"
 
 
 @log.wrap(log.entering, log.exiting)
 async def answer_user_query(
     request: Request,
     stream=False,
+    guard: Optional[asyncio.Future] = None,
 ) -> AsyncGenerator[Union[Attempt, Output, QueryResult], None]:
-    tables_summary = await run_in_threadpool(
-        get_tables_summary,
-        client=bigquery_client,
-        data_source_url=request.data_source_url
-    )
-    if not tables_summary:
-        logger.error(
-            "Could not find any tables for data source: %s", request.data_source_url
-        )
-    else:
-        logger.debug("Tables summary: %s", tables_summary.replace("\n", " "))
-
-    sql_query_generation_prompt = SQL_QUERY_GENERATION_PROMPT_TEMPLATE.format(
-        sql_query_instruction=(
-            "Develop a step-by-step plan and write a GoogleSQL query compatible with BigQuery",
-            "to fetch the data necessary for your analysis and visualization.",
-        ),
-        python_code_instruction=(
-            "Implement Python code to analyze the data using Pandas and visualize the findings using Plotly."
-        ),
-        database_schema=str(tables_summary),
-    )
+    """
+    Answer a user query, running its stages as a DAG so that independent stages overlap:
 
+    - The schema summary, example retrieval, and the static parts of the code generation prompt
+    - The dataframe summary for code generation, and the sample rows output
+    - Code generation, and streaming the SQL query and sample rows outputs
+    """
     # user_query = request.messages[-1].content
     # Get all user messages and convert to dict for OpenAI API
     _user_messages = [message.to_dict() for message in request.messages if message.role == Role.USER.value]
@@ -761,161 +1082,214 @@ async def answer_user_query(
         # Limit to last 3 user messages
         for message in _user_messages[-3:]
     ]
-    
-    examples = get_relevant_examples(
-        query=user_messages[-1]["content"],
-        data_source_url=request.data_source_url,
-    )
-    example_messages_without_sql = convert_examples_to_llm_messages(
-        examples,
-        include_sql_query=False
-    )
-    example_messages_without_code = convert_examples_to_llm_messages(
-        examples,
-        include_code=False
-    )
 
-    messages = (
-        [{"role": Role.SYSTEM.value, "content": inspect.cleandoc(sql_query_generation_prompt)}]
-        + example_messages_without_code
-        + user_messages
-    )
+    async def get_tables_summary() -> str:
+        schema = await schema_catalog.get_entry(request.data_source_url)
+        if SCHEMA_PRUNING_ENABLED:
+            # Include the previous user messages, which may be needed to answer follow-up questions
+            question = " ".join(
+                message.content for message in request.messages if message.role == Role.USER.value
+            )
+            # The index is built on first use, counting the tokens of each column, so off the event loop
+            tables_summary = await asyncio.to_thread(
+                lambda: schema.index.get_tables_summary(
+                    question,
+                    top_k=SCHEMA_PRUNING_TOP_K,
+                    max_tokens=SCHEMA_PRUNING_MAX_TOKENS,
+                )
+            )
+            logger.info(
+                "Schema summary pruned from %d to %d tokens",
+                schema.index.total_tokens,
+                count_tokens(tables_summary),
+            )
+        else:
+            tables_summary = schema.summary
+        if not tables_summary:
+            logger.error(
+                "Could not find any tables for data source: %s", request.data_source_url
+            )
+        else:
+            logger.debug("Tables summary: %s", tables_summary.replace("\n", " "))
+        return tables_summary
 
-    sql_query_attempts = []
-    async for result in get_valid_sql_query(
-        messages=messages,
-        config=SQLQueryGenerationConfig(
+    def get_example_messages() -> Tuple[List[Dict], List[Dict]]:
+        examples = get_relevant_examples(
+            query=user_messages[-1]["content"],
             data_source_url=request.data_source_url,
-            assert_results_not_empty=True,
-        ),
-    ):
-        if isinstance(result, Attempt):
-            sql_query_attempts.append(result)
-            if stream:
-                yield result
-        elif isinstance(result, SQLExecutionResult):
-            sql_generation_result: SQLExecutionResult = result
-        else:
-            raise ValueError("Invalid SQL execution result type")
-
-    df = sql_generation_result.dataframe
-    log_final_queries(sql_generation_result.description, sql_generation_result.query)
-
-    # Convert Period dtype to timestamp to ensure DataFrame is JSON serializable
-    # NOTE: This is now handled by the `to_json` method's `default_handler` argument
-    # df = utils.convert_period_dtype_to_timestamp(df)
-    # Sort DataFrame by date column if it exists
-    df = utils.sort_dataframe(df)
-
-    outputs = []
-    output_0 = Output(
-        index=0,
-        created_at=int(time.time()),
-        description=sql_generation_result.description,
-        type=OutputType.SQL_QUERY.value,
-        value=str(sql_generation_result.query),
-    )
-    output_1 = Output(
-        index=1,
-        created_at=int(time.time()),
-        description="Table sample rows",
-        type=OutputType.PANDAS_DATAFRAME.value,
-        value=pd.concat([df.head(5), df.tail(5)]).to_json(
-            orient="records", default_handler=str
-        ),
-    )
+        )
+        example_messages_without_sql = convert_examples_to_llm_messages(
+            examples,
+            include_sql_query=False
+        )
+        example_messages_without_code = convert_examples_to_llm_messages(
+            examples,
+            include_code=False
+        )
+        return example_messages_without_sql, example_messages_without_code
+
+    async def generate_sql_query(tables_summary: str, example_messages):
+        _, example_messages_without_code = example_messages
+        sql_query_generation_prompt = SQL_QUERY_GENERATION_PROMPT_TEMPLATE.format(
+            sql_query_instruction=(
+                "Develop a step-by-step plan and write a GoogleSQL query compatible with BigQuery",
+                "to fetch the data necessary for your analysis and visualization.",
+            ),
+            python_code_instruction=(
+                "Implement Python code to analyze the data using Pandas and visualize the findings using Plotly."
+            ),
+            database_schema=str(tables_summary),
+        )
+        messages = (
+            [{"role": Role.SYSTEM.value, "content": inspect.cleandoc(sql_query_generation_prompt)}]
+            + example_messages_without_code
+            + user_messages
+        )
+        async for result in get_valid_sql_query(
+            messages=messages,
+            config=SQLQueryGenerationConfig(
+                data_source_url=request.data_source_url,
+                session_id=request.session_id,
+                max_attempts=request.max_attempts,
+                max_tokens=request.max_tokens,
+                timeout=SQL_QUERY_GENERATION_TIMEOUT,
+                assert_results_not_empty=True,
+                validation_mode=SQL_VALIDATION_MODE,
+                guard=guard,
+            ),
+        ):
+            yield result
 
-    if stream:
-        yield QueryResult(
-            data_source=request.data_source_url,
-            output_type=request.output_type,
-            attempts=sql_query_attempts,
-            errors=[],
-            outputs=[output_0],
+    async def generate_python_code(
+        sql_generation_result: SQLExecutionResult, df, df_summary, code_config, example_messages
+    ):
+        example_messages_without_sql, _ = example_messages
+        code_generation_prompt = CODE_GENERATION_PROMPT_TEMPLATE.format(
+            sql_description=sql_generation_result.description,
+            sql_query=sql_generation_result.query,
+            dataframe_columns=json.dumps(list(df.columns), indent=4, sort_keys=True),
+            dataframe_schema=json.dumps(df_summary, indent=4, sort_keys=True),
+            imports=CODE_GENERATION_IMPORTS,
+            function_parameters=code_config["function_parameters"],
+            function_description=code_config["function_description"],
+            output_type=utils.create_type_string(code_config["output_types"]),
+            output_description=code_config["output_description"],
+            output_variable=code_config["output_variable"],
         )
-        yield output_1
-    else:
-        outputs += [output_0, output_1]
+        code_generation_messages = (
+            [{"role": Role.SYSTEM.value, "content": inspect.cleandoc(code_generation_prompt)}]
+            + example_messages_without_sql
+            + user_messages
+        )
+        async for result in generate_valid_python_code(
+            messages=code_generation_messages,
+            local_variables={"df": df},
+            config=CodeGenerationConfig(
+                output_types=code_config["output_types"],
+                output_variable=code_config["output_variable"],
+            ),
+        ):
+            yield result
 
+    pipeline = Pipeline()
     try:
-        df_summary = utils.get_dataframe_summary(df)
-    except IndexError:
-        df_summary = "DataFrame is empty"
-
-    if request.output_type == OutputType.ANY.value:
-        function_parameters = "df: pd.DataFrame"
-        function_description = "Function to analyze the data and optionally return a list of results `result_list` or `None`."
-        output_types = accepted_output_types
-        output_description = "A list of any type of object or `None`."
-        output_variable = "result_list"
-    elif request.output_type == OutputType.PLOTLY_CHART.value:
-        function_parameters = "df: pd.DataFrame"
-        function_description = (
-            "Function to analyze the data and return a Plotly chart."
+        pipeline.run("schema", get_tables_summary)
+        pipeline.run("examples", get_example_messages)
+        pipeline.run("code_generation_config", lambda: get_code_generation_config(request.output_type))
+
+        sql_query_attempts = []
+        async for result in pipeline.stream(
+            "sql_generation", generate_sql_query, "schema", "examples"
+        ):
+            if isinstance(result, Attempt):
+                sql_query_attempts.append(result)
+                record_attempt("sql")
+                if stream:
+                    yield result
+            elif isinstance(result, SQLExecutionResult):
+                sql_generation_result: SQLExecutionResult = result
+            else:
+                raise ValueError("Invalid SQL execution result type")
+
+        log_final_queries(sql_generation_result.description, sql_generation_result.query)
+
+        # Convert Period dtype to timestamp to ensure DataFrame is JSON serializable
+        # NOTE: This is now handled by the `to_json` method's `default_handler` argument
+        # df = utils.convert_period_dtype_to_timestamp(df)
+        # Sort DataFrame by date column if it exists
+        pipeline.run(
+            "dataframe", lambda result: utils.sort_dataframe(result.dataframe), "sql_generation"
         )
-        output_types = [plotly.graph_objs.Figure]
-        output_description = "A Plotly figure object."
-        output_variable = "fig"
-    elif request.output_type == "optional_chart":
-        function_parameters = "df: pd.DataFrame"
-        function_description = (
-            "Function to analyze the data and optionally return a Plotly chart."
+        pipeline.run("dataframe_summary", get_dataframe_summary, "dataframe")
+        sample_rows = pipeline.run(
+            "sample_rows",
+            lambda df: pd.concat([df.head(5), df.tail(5)]).to_json(
+                orient="records", default_handler=str
+            ),
+            "dataframe",
         )
-        output_types = [Optional[plotly.graph_objs.Figure]]
-        output_description = "A Plotly figure object or None."
-        output_variable = "fig"
-    else:
-        raise ValueError("Invalid output type requested")
-
-    def no_show(*args, **kwargs):
-        pass
-
-    original_show_method = Figure.show
-    Figure.show = no_show
-
-    code_generation_prompt = CODE_GENERATION_PROMPT_TEMPLATE.format(
-        sql_description=sql_generation_result.description,
-        sql_query=sql_generation_result.query,
-        dataframe_columns=json.dumps(list(df.columns), indent=4, sort_keys=True),
-        dataframe_schema=json.dumps(df_summary, indent=4, sort_keys=True),
-        imports=CODE_GENERATION_IMPORTS,
-        function_parameters=function_parameters,
-        function_description=function_description,
-        output_type=utils.create_type_string(output_types),
-        output_description=output_description,
-        output_variable=output_variable,
-    )
 
-    code_generation_messages = (
-        [{"role": Role.SYSTEM.value, "content": inspect.cleandoc(code_generation_prompt)}]
-        + example_messages_without_sql
-        + user_messages
-    )
+        # Generate code while the SQL query and sample rows outputs are streamed
+        code_generation_stream = pipeline.stream(
+            "code_generation",
+            generate_python_code,
+            "sql_generation",
+            "dataframe",
+            "dataframe_summary",
+            "code_generation_config",
+            "examples",
+        )
+        code_config = await pipeline.result("code_generation_config")
+        output_description = code_config["output_description"]
+
+        outputs = []
+        output_0 = Output(
+            index=0,
+            created_at=int(time.time()),
+            description=sql_generation_result.description,
+            type=OutputType.SQL_QUERY.value,
+            value=str(sql_generation_result.query),
+        )
+        output_1 = Output(
+            index=1,
+            created_at=int(time.time()),
+            description="Table sample rows",
+            type=OutputType.PANDAS_DATAFRAME.value,
+            value=await sample_rows,
+        )
 
-    python_execution_attempts = []
-    async for result in generate_valid_python_code(
-        messages=code_generation_messages,
-        local_variables={"df": df},
-        config=CodeGenerationConfig(
-            output_types=output_types,
-            output_variable=output_variable,
-        ),
-    ):
-        if isinstance(result, Attempt):
-            python_execution_attempts.append(result)
-            if stream:
-                yield result
-        elif isinstance(result, PythonExecutionResult):
-            code_generation_result: PythonExecutionResult = result
-            if code_generation_result.error:
-                logger.error("Failed to generate valid Python code: %s", code_generation_result.error)
-                raise PythonExecutionError(code_generation_result.error)
+        if stream:
+            yield QueryResult(
+                data_source=request.data_source_url,
+                output_type=request.output_type,
+                attempts=sql_query_attempts,
+                errors=[],
+                outputs=[output_0],
+            )
+            yield output_1
         else:
-            raise ValueError("Invalid Python execution result type")
+            outputs += [output_0, output_1]
+
+        python_execution_attempts = []
+        async for result in code_generation_stream:
+            if isinstance(result, Attempt):
+                python_execution_attempts.append(result)
+                record_attempt("code")
+                if stream:
+                    yield result
+            elif isinstance(result, PythonExecutionResult):
+                code_generation_result: PythonExecutionResult = result
+                if code_generation_result.error:
+                    logger.error("Failed to generate valid Python code: %s", code_generation_result.error)
+                    raise PythonExecutionError(code_generation_result.error)
+            else:
+                raise ValueError("Invalid Python execution result type")
 
-    logger.debug("Valid Python code:\n%s", code_generation_result.code)
+        logger.debug("Valid Python code:\n%s", code_generation_result.code)
+    finally:
+        pipeline.close()
 
-    Figure.show = original_show_method
+    pipeline.log_timings()
 
     created_at = int(time.time())
 
@@ -941,6 +1315,7 @@ async def answer_user_query(
             attempts=python_execution_attempts,
             errors=[],
             outputs=[output_2],
+            stages=pipeline.get_timings(),
         )
         yield output_3
     else:
@@ -1016,4 +1391,5 @@ async def answer_user_query(
             attempts=sql_query_attempts + python_execution_attempts,
             errors=final_errors,
             outputs=outputs,
+            stages=pipeline.get_timings(),
         )
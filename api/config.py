@@ -10,6 +10,7 @@ openai.api_key = os.environ["OPENAI_API_KEY"]
 
 ENV = os.environ.get("ENV", "LOCAL")
 PROJECT = os.environ.get("PROJECT", "LOCAL")
+MONGODB_URL = os.environ.get("MONGODB_URL")
 
 SQL_INITIAL_GPT_MODEL = "gpt-4"
 SQL_CORRECTION_GPT_MODEL = "gpt-4"
@@ -18,6 +19,116 @@ CODE_CORRECTION_GPT_MODEL = "gpt-4"
 # "gpt-3.5-turbo-16k"
 # "gpt-3.5-turbo-0613"
 DEFAULT_GPT_TEMPERATURE = 0.0
+# Wall-clock budget in seconds for generating a valid SQL query, including corrections
+SQL_QUERY_GENERATION_TIMEOUT = float(os.environ.get("SQL_QUERY_GENERATION_TIMEOUT", 300))
+
+# BigQuery job execution
+BIGQUERY_MAX_CONCURRENT_JOBS = int(os.environ.get("BIGQUERY_MAX_CONCURRENT_JOBS", 32))
+BIGQUERY_MAX_CONCURRENT_JOBS_PER_REQUEST = int(os.environ.get("BIGQUERY_MAX_CONCURRENT_JOBS_PER_REQUEST", 2))
+# Threads for short job submission and polling API calls
+BIGQUERY_CONTROL_WORKERS = int(os.environ.get("BIGQUERY_CONTROL_WORKERS", 8))
+# Threads for result downloads
+BIGQUERY_DOWNLOAD_WORKERS = int(os.environ.get("BIGQUERY_DOWNLOAD_WORKERS", 4))
+# "arrow" to stream results using the BigQuery Storage Read API, or "rest" for `RowIterator.to_dataframe()`
+BIGQUERY_DOWNLOAD_MODE = os.environ.get("BIGQUERY_DOWNLOAD_MODE", "arrow")
+
+# Query result caching
+# "memory", "disk", "mongo", or "none" to disable caching
+QUERY_RESULT_CACHE_BACKEND = os.environ.get("QUERY_RESULT_CACHE_BACKEND", "memory")
+QUERY_RESULT_CACHE_DIRECTORY = os.environ.get("QUERY_RESULT_CACHE_DIRECTORY", "outputs/cache")
+QUERY_RESULT_CACHE_MAX_SIZE = int(os.environ.get("QUERY_RESULT_CACHE_MAX_SIZE", 512 * 1024 * 1024))
+QUERY_RESULT_CACHE_TTL = int(os.environ.get("QUERY_RESULT_CACHE_TTL", 60 * 60))
+# "dry_run" to validate queries using a dry run before executing them,
+# or "execute" to execute queries directly, using the maximum bytes billed as the guard
+SQL_VALIDATION_MODE = os.environ.get("SQL_VALIDATION_MODE", "dry_run")
+DRY_RUN_CACHE_MAX_SIZE = int(os.environ.get("DRY_RUN_CACHE_MAX_SIZE", 10_000))
+DRY_RUN_CACHE_TTL = int(os.environ.get("DRY_RUN_CACHE_TTL", 10 * 60))
+# LLM completion cache, for requests with a temperature of 0
+# "memory", "sqlite", "mongo", or "none" to disable caching
+LLM_CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "outputs/cache/llm_completions.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10_000))
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", 24 * 60 * 60))
+# Also reuse completions of requests whose last message is similar, using embeddings
+LLM_CACHE_SEMANTIC = os.environ.get("LLM_CACHE_SEMANTIC", "false").lower() == "true"
+LLM_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("LLM_CACHE_SIMILARITY_THRESHOLD", 0.95))
+LLM_CACHE_EMBEDDING_MODEL = os.environ.get("LLM_CACHE_EMBEDDING_MODEL", "text-embedding-ada-002")
+# How many NDA guard verdicts to reuse for repeated questions, and for how long
+NDA_VERDICT_CACHE_MAX_SIZE = int(os.environ.get("NDA_VERDICT_CACHE_MAX_SIZE", 10_000))
+NDA_VERDICT_CACHE_TTL = int(os.environ.get("NDA_VERDICT_CACHE_TTL", 24 * 60 * 60))
+# "enabled" to decide clear-cut questions with a local classifier before the LLM NDA guard,
+# "shadow" to only log the classifier's disagreements with the LLM guard, or "off"
+NDA_CLASSIFIER_MODE = os.environ.get("NDA_CLASSIFIER_MODE", "shadow")
+# Minimum probability of a verdict for the classifier to decide it without the LLM guard
+NDA_CLASSIFIER_THRESHOLD = float(os.environ.get("NDA_CLASSIFIER_THRESHOLD", 0.9))
+# JSON lines of the LLM guard's verdicts, which the classifier is trained on, or "" to not log them
+NDA_VERDICTS_PATH = os.environ.get("NDA_VERDICTS_PATH", "outputs/nda_verdicts.jsonl")
+# Most recent logged verdicts that the classifier is trained on, to bound the time to fit it
+NDA_CLASSIFIER_MAX_VERDICTS = int(os.environ.get("NDA_CLASSIFIER_MAX_VERDICTS", 10_000))
+# Schema catalog
+# "mongo" to share schema summaries between API workers and instances, or "memory"
+SCHEMA_CATALOG_BACKEND = os.environ.get("SCHEMA_CATALOG_BACKEND", "mongo")
+# How long to serve a schema summary before refreshing it in the background
+SCHEMA_CATALOG_REFRESH_INTERVAL = int(os.environ.get("SCHEMA_CATALOG_REFRESH_INTERVAL", 24 * 60 * 60))
+# How often to check whether the tables of each data source were modified
+SCHEMA_CATALOG_CHECK_INTERVAL = int(os.environ.get("SCHEMA_CATALOG_CHECK_INTERVAL", 5 * 60))
+# Tables fetched concurrently, and seconds to fetch each table before leaving out its sample values
+SCHEMA_CATALOG_MAX_WORKERS = int(os.environ.get("SCHEMA_CATALOG_MAX_WORKERS", 8))
+SCHEMA_CATALOG_TABLE_TIMEOUT = float(os.environ.get("SCHEMA_CATALOG_TABLE_TIMEOUT", 10))
+# Schema pruning
+# Include only the tables and columns relevant to the question in SQL generation prompts
+SCHEMA_PRUNING_ENABLED = os.environ.get("SCHEMA_PRUNING_ENABLED", "true").lower() == "true"
+SCHEMA_PRUNING_TOP_K = int(os.environ.get("SCHEMA_PRUNING_TOP_K", 5))
+# Schemas within the token budget are included in full
+SCHEMA_PRUNING_MAX_TOKENS = int(os.environ.get("SCHEMA_PRUNING_MAX_TOKENS", 3000))
+# How long to reuse a data source's last modified time before checking it again
+DATA_SOURCE_FRESHNESS_TTL = int(os.environ.get("DATA_SOURCE_FRESHNESS_TTL", 60))
+# Code execution
+# "sandbox" to execute generated code in a pool of worker processes, or "in_process"
+CODE_EXECUTION_BACKEND = os.environ.get("CODE_EXECUTION_BACKEND", "sandbox")
+# "ipython" to execute generated code in an IPython shell, or "compile" to compile and execute it directly
+CODE_EXECUTION_ENGINE = os.environ.get("CODE_EXECUTION_ENGINE", "ipython")
+# Worker processes, kept warm with the code generation imports, and executions before recycling each
+CODE_EXECUTION_WORKERS = int(os.environ.get("CODE_EXECUTION_WORKERS", 2))
+CODE_EXECUTION_MAX_EXECUTIONS = int(os.environ.get("CODE_EXECUTION_MAX_EXECUTIONS", 100))
+# Executions waiting for a worker before further executions are rejected
+CODE_EXECUTION_QUEUE_SIZE = int(os.environ.get("CODE_EXECUTION_QUEUE_SIZE", 16))
+# Limits of each execution: CPU and wall time in seconds, and the worker's memory in bytes, or 0
+CODE_EXECUTION_CPU_SECONDS = int(os.environ.get("CODE_EXECUTION_CPU_SECONDS", 30))
+CODE_EXECUTION_TIMEOUT = float(os.environ.get("CODE_EXECUTION_TIMEOUT", 60))
+CODE_EXECUTION_MEMORY_LIMIT = int(os.environ.get("CODE_EXECUTION_MEMORY_LIMIT", 4 * 1024 ** 3))
+# Directory of the query results shared with the workers, by default in shared memory
+CODE_EXECUTION_SHARED_DIRECTORY = os.environ.get("CODE_EXECUTION_SHARED_DIRECTORY", "")
+# Instrumentation of functions wrapped with `log.wrap`
+# Fraction of traces whose function calls are logged and exported as spans, decided at the root
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", 1.0))
+# "file" to export spans as OpenTelemetry JSON lines to the tracing path, or "none"
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none")
+TRACING_PATH = os.environ.get("TRACING_PATH", "outputs/traces/spans.jsonl")
+# Stream the SQL queries and code generated by the LLM to streaming requests, while generated
+LLM_STREAMING_ENABLED = os.environ.get("LLM_STREAMING_ENABLED", "true").lower() == "true"
+# Events buffered per stream before the request's work waits for the client to read them
+STREAM_QUEUE_SIZE = int(os.environ.get("STREAM_QUEUE_SIZE", 64))
+# Seconds without events after which a keep-alive event is sent to a stream
+STREAM_KEEP_ALIVE_SECONDS = float(os.environ.get("STREAM_KEEP_ALIVE_SECONDS", 15))
+# Jobs answered in the background, by workers in each API process
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Queued jobs before further jobs are rejected
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 100))
+# Runs of a job, e.g. when interrupted by a restart, before it fails
+JOB_MAX_RUNS = int(os.environ.get("JOB_MAX_RUNS", 2))
+# Seconds after which a running job, whose worker stopped renewing its lease, is run again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60))
+# Seconds between checks for jobs queued by other processes
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 5))
+# Key of the HMAC-SHA256 signature of webhook requests, or empty to not sign them
+JOB_WEBHOOK_SECRET = os.environ.get("JOB_WEBHOOK_SECRET", "")
+# Comma-separated hosts that webhooks may be posted to, e.g. internal ones, or empty to allow
+# any host, as long as it resolves to public addresses only
+JOB_WEBHOOK_ALLOWED_HOSTS = [
+    host.strip() for host in os.environ.get("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+JOB_WEBHOOK_TIMEOUT = float(os.environ.get("JOB_WEBHOOK_TIMEOUT", 10))
 
 if ENV != "LOCAL":
     import sentry_sdk
@@ -1,10 +1,22 @@
+import asyncio
+import contextlib
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
+import pandas as pd
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
 from api import config
+from api.connectors.bigquery_storage import (
+    create_bigquery_storage_client,
+    download_dataframe,
+)
+from api.log import logger
+from api.metrics import registry
 
 scopes = [
     "https://www.googleapis.com/auth/drive",
@@ -83,8 +95,276 @@ if config.ENV == "LOCAL":
     )
 else:
     # If deployed using Google Cloud, use default credentials
+    credentials = None
     bigquery_client = CustomBigQueryClient(
         default_query_job_config=bigquery.QueryJobConfig(
             maximum_bytes_billed=maxium_usd_to_maximum_bytes_billed(MAX_USD_COST),
         )
     )
+
+
+jobs_queued = registry.gauge(
+    "chartgpt_bigquery_jobs_queued",
+    "BigQuery jobs waiting for a concurrency slot.",
+)
+jobs_running = registry.gauge(
+    "chartgpt_bigquery_jobs_running",
+    "BigQuery jobs holding a concurrency slot.",
+)
+jobs_polling = registry.gauge(
+    "chartgpt_bigquery_jobs_polling",
+    "BigQuery jobs submitted and waiting to complete.",
+)
+jobs_downloading = registry.gauge(
+    "chartgpt_bigquery_jobs_downloading",
+    "BigQuery jobs downloading results.",
+)
+jobs_total = registry.counter(
+    "chartgpt_bigquery_jobs_total",
+    "BigQuery jobs completed, by job type and status.",
+)
+jobs_cancelled = registry.counter(
+    "chartgpt_bigquery_jobs_cancelled_total",
+    "BigQuery jobs cancelled while running, because their request was cancelled.",
+)
+
+
+class AsyncBigQueryExecutor:
+    """
+    Executes BigQuery jobs without holding a thread for the lifetime of each job.
+
+    Job submission and job state polling are short API calls made on a small
+    dedicated thread pool, the waits between polls are non-blocking backoffs on the
+    event loop, and only result downloads use the separately sized download pool.
+    The Starlette threadpool is never used, so long-running jobs cannot starve
+    unrelated requests.
+
+    Concurrency is limited globally (`max_concurrent_jobs`) and per key
+    (`max_concurrent_jobs_per_key`), where the key is typically the request's session ID.
+
+    When the task executing a query is cancelled, e.g. because the client disconnected,
+    its job is cancelled too, including a job whose submission is still in flight, so that
+    it stops being billed.
+
+    With the "arrow" download mode, results are streamed as Arrow record batches using
+    a shared BigQuery Storage Read API client, instead of `RowIterator.to_dataframe()`
+    ("rest" download mode), which creates a new Storage Read API client for every download.
+    """
+
+    def __init__(
+        self,
+        client: bigquery.Client,
+        bigquery_storage_client=None,
+        download_mode: str = "arrow",
+        max_concurrent_jobs: int = 32,
+        max_concurrent_jobs_per_key: int = 2,
+        control_workers: int = 8,
+        download_workers: int = 4,
+        poll_initial_delay: float = 0.1,
+        poll_max_delay: float = 2.0,
+        poll_multiplier: float = 1.5,
+    ):
+        if download_mode not in ("arrow", "rest"):
+            raise ValueError(f"Invalid BigQuery download mode: {download_mode}")
+        self.client = client
+        self.bigquery_storage_client = bigquery_storage_client
+        self.download_mode = download_mode
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_concurrent_jobs_per_key = max_concurrent_jobs_per_key
+        self.poll_initial_delay = poll_initial_delay
+        self.poll_max_delay = poll_max_delay
+        self.poll_multiplier = poll_multiplier
+        self._control_pool = ThreadPoolExecutor(
+            max_workers=control_workers, thread_name_prefix="bigquery-control"
+        )
+        self._download_pool = ThreadPoolExecutor(
+            max_workers=download_workers, thread_name_prefix="bigquery-download"
+        )
+        # Exponential moving average of the wall time of each job type, in seconds
+        self._average_seconds: Dict[str, float] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Semaphores per key, with the number of jobs currently using each one
+        self._key_semaphores: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+
+    async def _run_control(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._control_pool, lambda: func(*args, **kwargs)
+        )
+
+    async def _run_download(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._download_pool, lambda: func(*args, **kwargs)
+        )
+
+    async def _submit(
+        self, query: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> bigquery.QueryJob:
+        """Submit a query job, which is cancelled once submitted if the submission is cancelled."""
+        submission = self._control_pool.submit(self.client.query, query, job_config=job_config)
+        try:
+            return await asyncio.wrap_future(submission)
+        except asyncio.CancelledError:
+            if not submission.cancel():
+                def cancel_submitted_job(future):
+                    if future.exception() is None:
+                        self._cancel_job(future.result())
+
+                submission.add_done_callback(cancel_submitted_job)
+            raise
+
+    def _cancel_job(self, query_job: bigquery.QueryJob) -> None:
+        """Cancel a running job in the background, without waiting for BigQuery to stop it."""
+        if query_job.state == "DONE":
+            return
+        jobs_cancelled.inc()
+
+        def log_failure(future):
+            if future.exception() is not None:
+                logger.error("Failed to cancel BigQuery job: %s", future.exception())
+
+        self._control_pool.submit(query_job.cancel).add_done_callback(log_failure)
+
+    def _record_duration(self, job_type: str, seconds: float, weight: float = 0.1) -> None:
+        average = self._average_seconds.get(job_type)
+        self._average_seconds[job_type] = (
+            seconds if average is None else (1 - weight) * average + weight * seconds
+        )
+
+    def average_seconds(self, job_type: str) -> float:
+        """The average wall time of recent jobs of a type ("dry_run" or "query"), or 0 if unknown."""
+        return self._average_seconds.get(job_type, 0.0)
+
+    def _acquire_key_semaphore(self, key: str) -> asyncio.Semaphore:
+        semaphore, users = self._key_semaphores.get(
+            key, (asyncio.Semaphore(self.max_concurrent_jobs_per_key), 0)
+        )
+        self._key_semaphores[key] = (semaphore, users + 1)
+        return semaphore
+
+    def _release_key_semaphore(self, key: str) -> None:
+        semaphore, users = self._key_semaphores[key]
+        if users <= 1:
+            del self._key_semaphores[key]
+        else:
+            self._key_semaphores[key] = (semaphore, users - 1)
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, key: Optional[str] = None):
+        """Wait for a concurrency slot for the given key, then hold it for a job."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        semaphores = [self._semaphore]
+        if key:
+            semaphores.insert(0, self._acquire_key_semaphore(key))
+
+        acquired = []
+        jobs_queued.inc()
+        try:
+            try:
+                for semaphore in semaphores:
+                    await semaphore.acquire()
+                    acquired.append(semaphore)
+            finally:
+                jobs_queued.dec()
+            jobs_running.inc()
+            try:
+                yield
+            finally:
+                jobs_running.dec()
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            if key:
+                self._release_key_semaphore(key)
+
+    async def _wait_for_job(self, query_job: bigquery.QueryJob) -> None:
+        """Poll the job state with exponential backoff until the job is done."""
+        delay = self.poll_initial_delay
+        jobs_polling.inc()
+        try:
+            while query_job.state != "DONE":
+                await asyncio.sleep(delay)
+                delay = min(delay * self.poll_multiplier, self.poll_max_delay)
+                await self._run_control(query_job.reload)
+        finally:
+            jobs_polling.dec()
+
+    def _download(
+        self, query_job: bigquery.QueryJob, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        if self.download_mode == "arrow":
+            return download_dataframe(
+                query_job,
+                bigquery_storage_client=self.bigquery_storage_client,
+                columns=columns,
+            )
+        df = query_job.result().to_dataframe()
+        return df[columns] if columns else df
+
+    async def dry_run(self, query: str, key: Optional[str] = None) -> bigquery.QueryJob:
+        """Validate a query using a dry run, which completes as soon as it is submitted."""
+        async with self._slot(key):
+            start_time = time.perf_counter()
+            try:
+                query_job = await self._run_control(
+                    self.client.query,
+                    query,
+                    job_config=bigquery.QueryJobConfig(dry_run=True),
+                )
+            except Exception:
+                jobs_total.inc(job_type="dry_run", status="failed")
+                raise
+            finally:
+                self._record_duration("dry_run", time.perf_counter() - start_time)
+            jobs_total.inc(job_type="dry_run", status="succeeded")
+            return query_job
+
+    async def execute(
+        self,
+        query: str,
+        job_config: Optional[bigquery.QueryJobConfig] = None,
+        key: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Tuple[bigquery.QueryJob, pd.DataFrame]:
+        """
+        Submit a query, wait for it to complete, and download the results as a DataFrame.
+
+        If `columns` are specified, only those columns of the results are downloaded.
+        """
+        async with self._slot(key):
+            start_time = time.perf_counter()
+            try:
+                query_job = await self._submit(query, job_config)
+                try:
+                    await self._wait_for_job(query_job)
+                    jobs_downloading.inc()
+                    try:
+                        # Raises the job's error, if any, as the blocking `result()` call would have
+                        df = await self._run_download(self._download, query_job, columns)
+                    finally:
+                        jobs_downloading.dec()
+                except asyncio.CancelledError:
+                    self._cancel_job(query_job)
+                    raise
+            except asyncio.CancelledError:
+                # Cancelled jobs are left out of the average duration, which they would shorten
+                jobs_total.inc(job_type="query", status="cancelled")
+                raise
+            except Exception:
+                jobs_total.inc(job_type="query", status="failed")
+                self._record_duration("query", time.perf_counter() - start_time)
+                raise
+            self._record_duration("query", time.perf_counter() - start_time)
+            jobs_total.inc(job_type="query", status="succeeded")
+            return query_job, df
+
+
+bigquery_executor = AsyncBigQueryExecutor(
+    bigquery_client,
+    bigquery_storage_client=create_bigquery_storage_client(credentials=credentials),
+    download_mode=config.BIGQUERY_DOWNLOAD_MODE,
+    max_concurrent_jobs=config.BIGQUERY_MAX_CONCURRENT_JOBS,
+    max_concurrent_jobs_per_key=config.BIGQUERY_MAX_CONCURRENT_JOBS_PER_REQUEST,
+    control_workers=config.BIGQUERY_CONTROL_WORKERS,
+    download_workers=config.BIGQUERY_DOWNLOAD_WORKERS,
+)
@@ -0,0 +1,135 @@
+"""Arrow-native download of BigQuery query results using the BigQuery Storage Read API."""
+
+from typing import Iterator, List, Optional, Sequence
+
+import db_dtypes
+import pandas as pd
+import pyarrow as pa
+import pyarrow.types
+from google.cloud import bigquery
+
+try:
+    from google.cloud import bigquery_storage
+    from google.cloud.bigquery_storage import types as bigquery_storage_types
+except ImportError:  # pragma: no cover
+    bigquery_storage = None
+    bigquery_storage_types = None
+
+
+def create_bigquery_storage_client(credentials=None):
+    """Create a BigQuery Storage Read API client, or `None` if the library is not installed."""
+    if bigquery_storage is None:
+        return None
+    return bigquery_storage.BigQueryReadClient(credentials=credentials)
+
+
+def read_arrow_batches(
+    query_job: bigquery.QueryJob,
+    bigquery_storage_client=None,
+    columns: Optional[Sequence[str]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the results of a completed query job as Arrow record batches.
+
+    When `columns` are specified and a Storage Read API client is available, the
+    read session is created with `selected_fields` so that only those columns are
+    downloaded. Otherwise the results are streamed using the row iterator, which uses
+    the Storage Read API client for large results and the first REST page for small ones.
+    """
+    results = query_job.result()
+    destination = query_job.destination
+
+    if columns and bigquery_storage_client is not None and destination is not None:
+        read_session = bigquery_storage_types.ReadSession(
+            table=destination.to_bqstorage(),
+            data_format=bigquery_storage_types.DataFormat.ARROW,
+            read_options=bigquery_storage_types.ReadSession.TableReadOptions(
+                selected_fields=list(columns),
+            ),
+        )
+        # A single stream preserves the order of rows, e.g. for `ORDER BY` queries
+        session = bigquery_storage_client.create_read_session(
+            parent=f"projects/{query_job.project}",
+            read_session=read_session,
+            max_stream_count=1,
+        )
+        for stream in session.streams:
+            reader = bigquery_storage_client.read_rows(stream.name)
+            for page in reader.rows(session).pages:
+                yield page.to_arrow()
+        return
+
+    for record_batch in results.to_arrow_iterable(bqstorage_client=bigquery_storage_client):
+        if columns:
+            record_batch = record_batch.select(list(columns))
+        yield record_batch
+
+
+def _fits_in_timestamp_ns(column: pa.ChunkedArray) -> bool:
+    try:
+        column.cast(pa.timestamp("ns"))
+        return True
+    except pa.ArrowInvalid:
+        return False
+
+
+def arrow_table_to_dataframe(table: pa.Table) -> pd.DataFrame:
+    """
+    Convert an Arrow table to a DataFrame with the same dtypes as `RowIterator.to_dataframe()`.
+
+    Columns are converted into separate blocks without consolidation, so that
+    compatible columns are converted without copying, and the Arrow buffers are
+    released as each column is converted, which limits peak memory usage.
+    """
+    if table.num_rows == 0:
+        return pd.DataFrame([], columns=table.schema.names)
+
+    # Dates and timestamps outside of the nanosecond timestamp range are kept as objects
+    date_as_object = not all(
+        _fits_in_timestamp_ns(column)
+        for column in table.columns
+        if pyarrow.types.is_date(column.type)
+    )
+    timestamp_as_object = not all(
+        _fits_in_timestamp_ns(column)
+        for column in table.columns
+        if pyarrow.types.is_timestamp(column.type)
+    )
+
+    types_mapping = {
+        pa.bool_(): pd.BooleanDtype(),
+        pa.int64(): pd.Int64Dtype(),
+        pa.time64("us"): db_dtypes.TimeDtype(),
+    }
+    if not date_as_object:
+        types_mapping[pa.date32()] = db_dtypes.DateDtype()
+
+    return table.to_pandas(
+        date_as_object=date_as_object,
+        timestamp_as_object=timestamp_as_object,
+        integer_object_nulls=True,
+        types_mapper=types_mapping.get,
+        split_blocks=True,
+        self_destruct=True,
+    )
+
+
+def download_dataframe(
+    query_job: bigquery.QueryJob,
+    bigquery_storage_client=None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Download the results of a completed query job as a DataFrame using Arrow record batches."""
+    record_batches = list(
+        read_arrow_batches(
+            query_job,
+            bigquery_storage_client=bigquery_storage_client,
+            columns=columns,
+        )
+    )
+    if not record_batches:
+        return pd.DataFrame([], columns=columns)
+    table = pa.Table.from_batches(record_batches)
+    # Release the references to the record batches so that `self_destruct` can free them
+    del record_batches
+    return arrow_table_to_dataframe(table)
@@ -18,5 +18,20 @@ class SQLValidationError(Exception):
 class PythonExecutionError(Exception):
     """Raised when there is an error executing Python code returned from LLM."""
 
+class CodeExecutionBusyError(Exception):
+    """Raised when too many code executions are waiting for a worker."""
+
 class InsecureRequestError(Exception):
     """Raised when a user's request is considered insecure."""
+
+class ClientDisconnectedError(Exception):
+    """Raised when the client of a request disconnects before it is answered."""
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are queued."""
+
+class JobLeaseLostError(Exception):
+    """Raised when the lease of a worker on a job expired, and the job was claimed by another worker."""
+
+class InsecureWebhookError(Exception):
+    """Raised when a webhook URL is not allowed, e.g. as it points at a private address."""
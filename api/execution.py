@@ -0,0 +1,354 @@
+"""
+Execution of the Python code generated to answer a question, with the results of its SQL
+query in the DataFrame `df`.
+
+Kept apart from `api.chartgpt`, so that code execution workers can import it without the
+LLM and data source clients.
+"""
+
+import ast
+import asyncio
+import atexit
+import contextlib
+import inspect
+import sys
+import threading
+import traceback
+from contextvars import ContextVar
+from io import StringIO
+from types import CodeType, MappingProxyType
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Mapping, Optional, Tuple
+
+import pandas as pd
+from IPython.core.interactiveshell import ExecutionResult, InteractiveShell
+from plotly.graph_objs import Figure
+from traitlets.config import Config
+from typeguard import TypeCheckError
+
+from api import log
+from api.config import CODE_EXECUTION_ENGINE
+from api.log import logger
+from api.security.secure_ast import assert_secure_code
+from api.types import CodeGenerationConfig, PythonExecutionResult, assert_matches_accepted_type
+from api.utils import clean_jupyter_shell_output
+
+
+def execute_python_imports(imports: str) -> dict:
+    try:
+        global_variables = {}
+        exec(imports, global_variables)
+        return global_variables
+    except Exception as e:
+        logger.error(e)
+        return {}
+
+
+# File name of the compiled code in tracebacks
+CODE_FILENAME = "<answer_question>"
+
+# Names defined by the imports of generated code, by imports, executed once per process
+_base_namespaces: Dict[str, Mapping[str, Any]] = {}
+
+
+def get_base_namespace(imports: str) -> Mapping[str, Any]:
+    """
+    Returns the names defined by imports, executed on first use, as a read-only mapping
+    that each execution layers its own variables over, so that code cannot modify it.
+    """
+    namespace = _base_namespaces.get(imports)
+    if namespace is None:
+        variables = execute_python_imports(imports)
+        # The shell provides its own builtins
+        variables.pop("__builtins__", None)
+        namespace = MappingProxyType(variables)
+        if variables:
+            # Failed imports are executed again, and logged, on next use
+            _base_namespaces[imports] = namespace
+    return namespace
+
+
+class StdoutRouter:
+    """
+    Replaces `sys.stdout`, writing to the buffer capturing the current context's output, if
+    any, otherwise to the original stdout, so that concurrent executions capture their own.
+
+    Not an `io.TextIOBase`, whose defaults, e.g. of `encoding` and `fileno()`, would hide
+    those of the original stdout from libraries that inspect it.
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, text: str) -> int:
+        return (captured_stdout.get() or self.stdout).write(text)
+
+    def flush(self) -> None:
+        (captured_stdout.get() or self.stdout).flush()
+
+    def __getattr__(self, name):
+        # E.g. `encoding`, `fileno()`, `isatty()` and `buffer` of the original stdout
+        return getattr(self.stdout, name)
+
+
+captured_stdout: ContextVar[Optional[StringIO]] = ContextVar("captured_stdout", default=None)
+
+
+@contextlib.contextmanager
+def capture_stdout() -> Iterator[StringIO]:
+    """Capture what is printed in the current context, unlike `contextlib.redirect_stdout`."""
+    if not isinstance(sys.stdout, StdoutRouter):
+        sys.stdout = StdoutRouter(sys.stdout)
+    buffer = StringIO()
+    token = captured_stdout.set(buffer)
+    try:
+        yield buffer
+    finally:
+        captured_stdout.reset(token)
+
+
+# Whether `Figure.show` does nothing in the current context, e.g. while executing code
+figure_show_suppressed: ContextVar[bool] = ContextVar("figure_show_suppressed", default=False)
+_figure_show = Figure.show
+
+
+def _show_figure(self, *args, **kwargs):
+    if figure_show_suppressed.get():
+        return None
+    return _figure_show(self, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def suppress_figure_show() -> Iterator[None]:
+    """Make `Figure.show` do nothing in the current context, unlike patching it globally."""
+    Figure.show = _show_figure
+    token = figure_show_suppressed.set(True)
+    try:
+        yield
+    finally:
+        figure_show_suppressed.reset(token)
+
+
+IPYTHON_CONFIG = Config()
+# The history of executions is not used, and would be saved to a database by a thread of each shell
+IPYTHON_CONFIG.HistoryManager.enabled = False
+
+# The IPython shell is a singleton, so executions using it run one at a time, across the
+# event loops and threads of the process
+_ipython_shell_lock = threading.Lock()
+
+
+@contextlib.asynccontextmanager
+async def lock_ipython_shell() -> AsyncIterator[None]:
+    if not _ipython_shell_lock.acquire(blocking=False):
+        acquired = asyncio.get_running_loop().run_in_executor(None, _ipython_shell_lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # Release the lock once acquired, as the execution will not run
+            acquired.add_done_callback(lambda _: _ipython_shell_lock.release())
+            raise
+    try:
+        yield
+    finally:
+        _ipython_shell_lock.release()
+
+
+# Function result, result of the code's last expression, namespace, and output of the code
+EngineResult = Tuple[Any, Any, Mapping[str, Any], str]
+
+
+async def run_with_ipython(code: str, create_namespace: Callable[[], dict]) -> EngineResult:
+    """Run the code, and then `answer_question(df)` if defined, as cells of an IPython shell."""
+    async with lock_ipython_shell():
+        shell = InteractiveShell.instance(config=IPYTHON_CONFIG)
+        try:
+            try:
+                # TODO For now we just log the error to Sentry,
+                # but once the app is deployed publicly, we should lock this down
+                assert_secure_code(code)
+            except Exception:
+                pass
+
+            # with io.capture_output() as captured:
+            with capture_stdout() as captured_stdout:
+                logger.debug("Executing code")
+                shell.push(create_namespace())
+                execution_result: ExecutionResult = await shell.run_cell_async(code, store_history=True)
+                execution_result.raise_error()
+
+            answer_fn = shell.user_ns.get("answer_question")
+            function_result = None
+            if callable(answer_fn):
+                logger.debug("Found function `answer_question`")
+                # with io.capture_output() as captured:
+                with capture_stdout() as captured_stdout:
+                    logger.debug("Calling function `answer_question`")
+                    shell.push(create_namespace())
+                    function_result: ExecutionResult = await shell.run_cell_async("answer_question(df)", store_history=True)
+                    function_result.raise_error()
+
+            output = clean_jupyter_shell_output(
+                captured_stdout.getvalue(), remove_final_result=True
+            )
+            return (
+                function_result.result if function_result else None,
+                execution_result.result,
+                dict(shell.user_ns),
+                output,
+            )
+        finally:
+            shell.clear_instance()
+            # The shell replaces `__main__` with its namespace, which is cleared below, and
+            # `sys.stdout` is not restored, as it may be routing the output of other executions
+            if shell._orig_sys_modules_main_mod is not None:
+                sys.modules[shell._orig_sys_modules_main_name] = shell._orig_sys_modules_main_mod
+            # Release the DataFrames and results referenced by the shell, which is otherwise
+            # kept by its exit handler until the process exits
+            atexit.unregister(shell.atexit_operations)
+            shell.user_ns.clear()
+            shell.user_ns_hidden.clear()
+            shell.history_manager.output_hist.clear()
+            for name in ("_", "__", "___"):
+                setattr(shell.displayhook, name, None)
+            shell.last_execution_result = None
+
+
+async def run_compiled(code: str, create_namespace: Callable[[], dict]) -> EngineResult:
+    """
+    Compile the code once, run it in its own namespace, and then call `answer_question(df)`
+    if defined, without the overhead of an IPython shell.
+    """
+    tree = ast.parse(code, filename=CODE_FILENAME)
+    try:
+        # TODO For now we just log the error to Sentry,
+        # but once the app is deployed publicly, we should lock this down
+        assert_secure_code(tree)
+    except Exception:
+        pass
+
+    # Like a shell, the value of the last expression is the code's result
+    last_expression = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last_expression = ast.Expression(tree.body.pop().value)
+    flags = ast.PyCF_ALLOW_TOP_LEVEL_AWAIT
+    module = compile(tree, CODE_FILENAME, "exec", flags=flags)
+
+    namespace = {"__name__": "__main__", **create_namespace()}
+    with capture_stdout() as output:
+        logger.debug("Executing code")
+        await _evaluate(module, namespace)
+        execution_result = None
+        if last_expression is not None:
+            execution_result = await _evaluate(
+                compile(last_expression, CODE_FILENAME, "eval", flags=flags), namespace
+            )
+
+    answer_fn = namespace.get("answer_question")
+    function_result = None
+    if callable(answer_fn):
+        logger.debug("Calling function `answer_question`")
+        with capture_stdout() as output:
+            function_result = answer_fn(create_namespace()["df"])
+    return function_result, execution_result, namespace, output.getvalue().rstrip()
+
+
+async def _evaluate(code: CodeType, namespace: dict) -> Any:
+    result = eval(code, namespace)
+    if code.co_flags & inspect.CO_COROUTINE:
+        # The code has top-level `await` expressions
+        result = await result
+    return result
+
+
+ENGINES = {"ipython": run_with_ipython, "compile": run_compiled}
+
+
+@log.wrap(log.entering, log.exiting)
+async def execute_python_code(
+    code: str,
+    docstring: str,
+    imports=None,
+    local_variables=None,
+    config: CodeGenerationConfig = CodeGenerationConfig(),
+    engine: str = CODE_EXECUTION_ENGINE,
+) -> PythonExecutionResult:
+    if not code:
+        error_msg = "No code provided"
+        logger.warning(error_msg)
+        return PythonExecutionResult(
+            description=docstring,
+            code=code,
+            result=None,
+            local_variables=local_variables,
+            error=error_msg,
+        )
+
+    df = local_variables.get("df", pd.DataFrame())
+    local_variables = local_variables or {}
+    result = None
+    output = ""
+
+    base_namespace = get_base_namespace(imports) if imports else {}
+    # Copies of the DataFrame are only copied when modified if copy-on-write is enabled,
+    # e.g. in the sandbox workers
+    deep_copy = not pd.get_option("mode.copy_on_write")
+
+    def create_namespace() -> dict:
+        # Make a copy of the DataFrame to ensure the original is not modified
+        return {**base_namespace, **local_variables, "df": df.copy(deep=deep_copy)}
+
+    try:
+        with suppress_figure_show():
+            function_result, execution_result, namespace, output = await ENGINES[engine](
+                code, create_namespace
+            )
+
+        if function_result is not None:
+            result = function_result
+        elif execution_result is not None:
+            result = execution_result
+        elif (
+            config.output_variable in namespace
+            and namespace[config.output_variable] is not None
+        ):
+            result = namespace[config.output_variable]
+        else:
+            result = None
+
+        if result is not None:
+            logger.debug("Result: %s", str(result)[:100])
+            try:
+                # check_type(result, config.output_type)
+                assert_matches_accepted_type(result, config.output_types)
+            except TypeCheckError as exc:
+                message = (
+                    f"The code must return a variable of type `{config.output_types}`."
+                )
+                logger.warning(message)
+                raise TypeError(message) from exc
+        else:
+            message = f"The variable `{config.output_variable}` was not defined, or the function `answer_question` does not exist or does not return a value."
+            logger.warning(message)
+            raise ValueError(message)
+        return PythonExecutionResult(
+            description=docstring,
+            code=code,
+            result=result,
+            local_variables=local_variables,
+            io=output,
+            error=None,
+        )
+    except Exception as e:
+        tb = traceback.extract_tb(e.__traceback__)
+        _, line_number, function_name, line_data = tb[-1]
+        error_msg = f"{type(e).__name__}: {str(e)}" #, in code `{line_data}`"
+        error_msg_trace = f"{type(e).__name__}: {str(e)}\nOn line {line_number}, function `{function_name}`, with code `{line_data}`"
+        logger.warning(error_msg_trace)
+        return PythonExecutionResult(
+            description=docstring,
+            code=code,
+            result=None,
+            local_variables=local_variables,
+            io=output,
+            error=error_msg,
+        )
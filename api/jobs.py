@@ -0,0 +1,435 @@
+"""
+Jobs: requests answered in the background, so that callers poll for a job's response, or
+are posted it to a webhook, rather than holding a connection open while it is answered.
+
+Jobs are persisted in MongoDB, which also serves as their queue, so that workers in every
+API process share them: a worker claims the oldest queued job, and holds a lease on it that
+it renews while it runs the job. The response accumulated so far is stored after each of
+the job's responses, so that its partial outputs are available while it runs.
+
+A job whose worker stopped, e.g. when its process was restarted, is left running with an
+expired lease, and is claimed again and run from the start, until it has run `max_runs`
+times, after which it fails. Jobs interrupted by a graceful shutdown are queued again.
+
+The number of runs of a job, counted when it is claimed, fences its workers: a worker only
+updates a job while it has run the job as many times as when the worker claimed it, and
+stops running a job once it was claimed again, e.g. when the worker failed to renew its lease.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import socket
+import time
+from typing import AsyncIterator, Callable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+from pymongo import ReturnDocument
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from api import utils
+from api.config import (JOB_LEASE_SECONDS, JOB_MAX_RUNS, JOB_POLL_SECONDS, JOB_QUEUE_SIZE,
+                        JOB_WEBHOOK_ALLOWED_HOSTS, JOB_WEBHOOK_SECRET, JOB_WEBHOOK_TIMEOUT,
+                        JOB_WORKERS)
+from api.errors import (CodeExecutionBusyError, ContextLengthError, InsecureRequestError,
+                        InsecureWebhookError, JobLeaseLostError, JobQueueFullError)
+from api.log import logger
+from api.metrics import registry
+from api.models import Job, JobStatus, Request, Response
+
+jobs_total = registry.counter("chartgpt_jobs_total", "Jobs finished, by status.")
+jobs_running = registry.gauge("chartgpt_jobs_running", "Jobs running in this process.")
+job_webhooks = registry.counter(
+    "chartgpt_job_webhooks_total", "Webhook requests of finished jobs, by outcome: delivered or failed."
+)
+
+# Reasons of the failures of jobs, like `ask_chartgpt` responds with them
+ERROR_MESSAGES = {
+    InsecureRequestError: "Could not complete analysis: insecure request",
+    CodeExecutionBusyError: "Could not complete analysis: too many requests",
+    ContextLengthError: "Could not complete analysis: ran out of context",
+}
+
+# Answers the request of a job, created by a tenant, with its responses
+JobHandler = Callable[[Job, str], AsyncIterator[Response]]
+
+
+def accumulate_response(accumulated: Optional[Response], response: Response) -> Response:
+    """Accumulate a response of a job into the response of the whole job, as a client of its stream would."""
+    if accumulated is None:
+        return response.copy(deep=True)
+    for name in ("attempts", "outputs", "errors"):
+        items = getattr(response, name)
+        if items:
+            setattr(accumulated, name, (getattr(accumulated, name) or []) + items)
+    accumulated.status = response.status
+    if response.finished_at is not None:
+        accumulated.finished_at = response.finished_at
+    if response.usage is not None:
+        accumulated.usage = response.usage
+    return accumulated
+
+
+def sign_webhook(body: bytes, secret: str) -> str:
+    """The signature of a webhook request's body, which its receiver verifies with the same secret."""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is reachable on the internet, i.e. not private, loopback, link-local, or reserved."""
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (ip.is_multicast or ip.is_reserved)
+
+
+def get_webhook_host(url: str, allowed_hosts: Sequence[str]) -> str:
+    """
+    The host of a webhook URL, which must be one of the allowed hosts, if any, or otherwise
+    not a private IP address. Raises an `InsecureWebhookError` if the URL is not allowed.
+    """
+    parsed = urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise InsecureWebhookError("webhook_url must be an HTTP(S) URL")
+    host = parsed.hostname
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise InsecureWebhookError(f"webhook_url host {host} is not allowed")
+        return host
+    try:
+        ipaddress.ip_address(host.split("%")[0])
+    except ValueError:
+        # A host name, whose addresses are checked once resolved
+        return host
+    if not is_public_address(host):
+        raise InsecureWebhookError(f"webhook_url host {host} is not a public address")
+    return host
+
+
+class PublicResolver(AbstractResolver):
+    """
+    Resolves the hosts of webhook requests, rejecting those with private addresses, unless they
+    are allowed hosts. The addresses are checked as the request connects, so that a host cannot
+    resolve to a public address when the URL is checked, and to a private one when posted to.
+    """
+
+    def __init__(self, allowed_hosts: Sequence[str] = ()):
+        self.allowed_hosts = allowed_hosts
+        self._resolver = aiohttp.ThreadedResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[dict]:
+        addresses = await self._resolver.resolve(host, port, family)
+        if host not in self.allowed_hosts:
+            for address in addresses:
+                if not is_public_address(address["host"]):
+                    # Not an `OSError`, which would be retried as a connection error
+                    raise InsecureWebhookError(f"webhook_url host {host} resolves to a private address")
+        return addresses
+
+    async def close(self) -> None:
+        await self._resolver.close()
+
+
+async def check_webhook_url(url: str, allowed_hosts: Sequence[str] = JOB_WEBHOOK_ALLOWED_HOSTS) -> None:
+    """Raises an `InsecureWebhookError` if a webhook URL is not allowed, or its host does not resolve."""
+    host = get_webhook_host(url, allowed_hosts)
+    try:
+        await PublicResolver(allowed_hosts).resolve(host)
+    except OSError:
+        raise InsecureWebhookError(f"webhook_url host {host} could not be resolved")
+
+
+def is_retryable_webhook_error(e: BaseException) -> bool:
+    """Whether a webhook request may succeed when sent again, i.e. it failed to connect, or with a server error."""
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500
+    return isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+@retry(
+    retry=retry_if_exception(is_retryable_webhook_error),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+async def post_webhook(
+    url: str,
+    body: bytes,
+    headers: dict,
+    timeout: float,
+    allowed_hosts: Sequence[str] = JOB_WEBHOOK_ALLOWED_HOSTS,
+) -> None:
+    get_webhook_host(url, allowed_hosts)
+    connector = aiohttp.TCPConnector(resolver=PublicResolver(allowed_hosts))
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        # Redirects are not followed, as they could point at a private address
+        async with session.post(url, data=body, headers=headers, allow_redirects=False) as response:
+            if response.status >= 300:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=response.reason or "",
+                    headers=response.headers,
+                )
+
+
+class JobStore:
+    """
+    Jobs in a MongoDB collection, each with the tenant that created it, i.e. the hash of its
+    API key, the number of times it was run, and the expiry of the lease of its worker.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def setup(self) -> None:
+        await self.collection.create_index([("status", 1), ("created_at", 1)])
+
+    @staticmethod
+    def _to_job(document: dict) -> Job:
+        return Job.from_dict({**document, "id": document["_id"]})
+
+    async def create(self, job: Job, tenant: str) -> None:
+        document = job.to_dict()
+        await self.collection.insert_one({
+            **document, "_id": document.pop("id"), "tenant": tenant, "runs": 0, "lease_expires_at": None,
+        })
+
+    async def get(self, job_id: str, tenant: str) -> Optional[Job]:
+        """The job, if it exists and was created by the tenant."""
+        document = await self.collection.find_one({"_id": job_id, "tenant": tenant})
+        return self._to_job(document) if document else None
+
+    async def count_queued(self) -> int:
+        return await self.collection.count_documents({"status": JobStatus.QUEUED.value})
+
+    async def claim(self, lease_seconds: float) -> Optional[Tuple[Job, str, int]]:
+        """Claim the oldest queued job, or running job with an expired lease, with its tenant and runs."""
+        now = time.time()
+        document = await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": JobStatus.QUEUED.value},
+                {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": JobStatus.RUNNING.value,
+                    "started_at": int(now),
+                    "lease_expires_at": now + lease_seconds,
+                    # A job run again starts from scratch
+                    "response": None,
+                    "error": None,
+                },
+                "$inc": {"runs": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            return None
+        return self._to_job(document), document["tenant"], document["runs"]
+
+    async def renew(self, job_id: str, runs: int, lease_seconds: float) -> bool:
+        return await self.update(job_id, runs, lease_expires_at=time.time() + lease_seconds)
+
+    async def release(self, job_id: str, runs: int) -> None:
+        """Queue a job again, without counting its interrupted run."""
+        await self.collection.update_one(
+            {"_id": job_id, "runs": runs},
+            {"$set": {"status": JobStatus.QUEUED.value, "lease_expires_at": None}, "$inc": {"runs": -1}},
+        )
+
+    async def update(self, job_id: str, runs: int, **fields) -> bool:
+        """Update the run of a job, returning whether it is still the job's run, i.e. it was not claimed again."""
+        result = await self.collection.update_one({"_id": job_id, "runs": runs}, {"$set": fields})
+        return result.matched_count > 0
+
+
+class JobQueue:
+    """
+    Runs the jobs of a store with a number of workers, each of which runs a job at a time
+    with the handler. New jobs are rejected with a `JobQueueFullError` once `max_queued`
+    jobs are queued.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: JobHandler,
+        workers: int = 2,
+        max_queued: int = 100,
+        max_runs: int = 2,
+        lease_seconds: float = 60,
+        poll_seconds: float = 5,
+        webhook_secret: str = "",
+        webhook_timeout: float = 10,
+    ):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_runs = max_runs
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.webhook_secret = webhook_secret
+        self.webhook_timeout = webhook_timeout
+        self._tasks: Set[asyncio.Task] = set()
+        # Webhook requests being sent, which are not awaited by the workers
+        self._webhooks: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        await self.store.setup()
+        self._wakeup = asyncio.Event()
+        self._tasks = {asyncio.create_task(self._work()) for _ in range(self.workers)}
+
+    async def stop(self) -> None:
+        tasks = self._tasks | self._webhooks
+        self._tasks, self._webhooks = set(), set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(self, request: Request, tenant: str, webhook_url: Optional[str] = None) -> Job:
+        """Queue a job for a request, returning it immediately."""
+        if await self.store.count_queued() >= self.max_queued:
+            raise JobQueueFullError("Too many jobs are queued")
+        job = Job(
+            id=utils.generate_session_id(),
+            status=JobStatus.QUEUED,
+            created_at=int(time.time()),
+            request=request,
+            webhook_url=webhook_url,
+        )
+        await self.store.create(job, tenant)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            # Errors of the store, e.g. while a job is finished, must not stop the worker; the
+            # job is left running, and run again once its lease expires
+            try:
+                # Cleared before claiming, so that jobs submitted meanwhile are not missed
+                self._wakeup.clear()
+                claimed = await self.store.claim(self.lease_seconds)
+                if claimed is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                # Each job runs in a task of its own, with its own copy of the context
+                await asyncio.create_task(self._run(*claimed))
+            except Exception:
+                logger.exception("Job worker failed")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _renew_lease(self, job_id: str, runs: int, run: asyncio.Task) -> None:
+        """Renew the lease of a job while it is run, cancelling the run once the job was claimed again."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self.store.renew(job_id, runs, self.lease_seconds)
+            except Exception:
+                logger.exception("Failed to renew the lease of job %s", job_id)
+                continue
+            if not renewed:
+                run.cancel()
+                return
+
+    async def _run(self, job: Job, tenant: str, runs: int) -> None:
+        jobs_running.inc()
+        lease = asyncio.create_task(self._renew_lease(job.id, runs, asyncio.current_task()))
+        try:
+            if runs > self.max_runs:
+                job.error = "Could not complete analysis: the job was interrupted too many times"
+            else:
+                async for response in self.handler(job, tenant):
+                    job.response = accumulate_response(job.response, response)
+                    if not await self.store.update(job.id, runs, response=job.response.to_dict()):
+                        raise JobLeaseLostError(f"Job {job.id} was claimed by another worker")
+                if job.response is None or job.response.status != "succeeded":
+                    errors = job.response.errors if job.response is not None else None
+                    job.error = (
+                        f"Could not complete analysis: {errors[-1].value}" if errors
+                        else "Could not complete analysis: no result"
+                    )
+        except asyncio.CancelledError:
+            # Only cancelled as the lease was lost, which the other worker's run takes over
+            if lease.done() and not lease.cancelled() and asyncio.current_task().uncancel() == 0:
+                logger.warning("Stopped job %s, which was claimed by another worker", job.id)
+                return
+            # E.g. the API is shutting down, so the job is run again by the next worker
+            await self.store.release(job.id, runs)
+            raise
+        except JobLeaseLostError:
+            logger.warning("Stopped job %s, which was claimed by another worker", job.id)
+            return
+        except Exception as e:
+            job.error = next(
+                (message for error, message in ERROR_MESSAGES.items() if isinstance(e, error)),
+                None,
+            )
+            if job.error is None:
+                logger.exception("Job %s failed", job.id)
+                job.error = "Could not complete analysis"
+        finally:
+            lease.cancel()
+            jobs_running.dec()
+
+        job.status = JobStatus.FAILED if job.error else JobStatus.SUCCEEDED
+        job.finished_at = int(time.time())
+        finished = await self.store.update(
+            job.id,
+            runs,
+            status=job.status.value,
+            finished_at=job.finished_at,
+            error=job.error,
+            lease_expires_at=None,
+        )
+        if not finished:
+            logger.warning("Stopped job %s, which was claimed by another worker", job.id)
+            return
+        jobs_total.inc(status=job.status.value)
+        if job.webhook_url:
+            task = asyncio.create_task(self._send_webhook(job))
+            self._webhooks.add(task)
+            task.add_done_callback(self._webhooks.discard)
+
+    async def _send_webhook(self, job: Job) -> None:
+        body = job.to_json().encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-ChartGPT-Signature"] = sign_webhook(body, self.webhook_secret)
+        try:
+            await post_webhook(job.webhook_url, body, headers, self.webhook_timeout)
+        except Exception as e:
+            logger.error("Failed to send webhook of job %s: %s", job.id, e)
+            job_webhooks.inc(outcome="failed")
+            return
+        job_webhooks.inc(outcome="delivered")
+
+
+def create_job_queue(collection, handler: JobHandler) -> JobQueue:
+    """The queue of the API's jobs, stored in a collection and run with a handler, as configured."""
+    return JobQueue(
+        JobStore(collection),
+        handler,
+        workers=JOB_WORKERS,
+        max_queued=JOB_QUEUE_SIZE,
+        max_runs=JOB_MAX_RUNS,
+        lease_seconds=JOB_LEASE_SECONDS,
+        poll_seconds=JOB_POLL_SECONDS,
+        webhook_secret=JOB_WEBHOOK_SECRET,
+        webhook_timeout=JOB_WEBHOOK_TIMEOUT,
+    )
@@ -1,12 +1,22 @@
 import difflib
+import functools
+import inspect
 import logging
 import time
 
 import flask
 from chartgpt_client import Response
 
+from api import tracing
+from api.metrics import registry
+
 logger = logging.getLogger("chartgpt")
 
+function_seconds = registry.histogram(
+    "chartgpt_function_seconds",
+    "Duration of instrumented function calls, by kind: total, or first_item of async generators.",
+)
+
 
 def log_response(response: Response) -> None:
     logger.info(
@@ -88,18 +98,105 @@ def session_id():
 
 
 def wrap(pre, post):
-    """Wrapper"""
+    """
+    Instrument a function, which may be synchronous, a coroutine function, or an async
+    generator function, calling `pre` before and `post` after each call, with its duration.
+
+    The duration of every call, and of async generators, the time to their first item, are
+    recorded in the `chartgpt_function_seconds` histogram. Only sampled calls are passed to
+    `pre` and `post`, and recorded as spans.
+    """
 
     def decorate(func):
         """Decorator"""
-
-        def call(*args, **kwargs):
-            """Actual wrapping"""
-            pre(func)
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            post(func, duration=time.time() - start_time)
-            return result
+        name = func.__qualname__
+
+        def finish(span, start_time, first_item=None, error=None):
+            duration = time.perf_counter() - start_time
+            function_seconds.observe(duration, function=name, kind="total")
+            if first_item is not None:
+                function_seconds.observe(first_item, function=name, kind="first_item")
+            if not span.sampled:
+                return
+            if error is not None:
+                span.set_error(error)
+            tracing.tracer.end_span(span)
+            if first_item is None:
+                post(func, duration=duration)
+            else:
+                post(func, duration=duration, first_item=first_item)
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def call(*args, **kwargs):
+                """Times each step of the generator, in the context of its consumer"""
+                span = tracing.tracer.start_span(name)
+                if span.sampled:
+                    pre(func)
+                start_time = time.perf_counter()
+                first_item = None
+                error = None
+                generator = func(*args, **kwargs)
+                try:
+                    while True:
+                        token = tracing.current_span.set(span)
+                        try:
+                            item = await generator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            tracing.current_span.reset(token)
+                        if first_item is None:
+                            first_item = time.perf_counter() - start_time
+                        yield item
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    # Also if the consumer stopped iterating early
+                    await generator.aclose()
+                    finish(span, start_time, first_item=first_item, error=error)
+
+        elif inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def call(*args, **kwargs):
+                """Times the coroutine until it returns"""
+                span = tracing.tracer.start_span(name)
+                if span.sampled:
+                    pre(func)
+                token = tracing.current_span.set(span)
+                start_time = time.perf_counter()
+                error = None
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    tracing.current_span.reset(token)
+                    finish(span, start_time, error=error)
+
+        else:
+
+            @functools.wraps(func)
+            def call(*args, **kwargs):
+                """Actual wrapping"""
+                span = tracing.tracer.start_span(name)
+                if span.sampled:
+                    pre(func)
+                token = tracing.current_span.set(span)
+                start_time = time.perf_counter()
+                error = None
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    tracing.current_span.reset(token)
+                    finish(span, start_time, error=error)
 
         return call
 
@@ -108,9 +205,17 @@ def wrap(pre, post):
 
 def entering(func):
     """Pre function logging"""
-    logger.debug("Entered %s", func.__name__)
+    logger.debug("Entered %s", func.__qualname__)
 
 
-def exiting(func, duration=None):
+def exiting(func, duration=None, first_item=None):
     """Post function logging"""
-    logger.debug("Exited  %s after %.2f seconds", func.__name__, duration)
+    if first_item is None:
+        logger.debug("Exited  %s after %.3f seconds", func.__qualname__, duration)
+    else:
+        logger.debug(
+            "Exited  %s after %.3f seconds, with its first item after %.3f seconds",
+            func.__qualname__,
+            duration,
+            first_item,
+        )
@@ -0,0 +1,167 @@
+"""In-process metrics registry, exported using the Prometheus text format."""
+
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+
+def _label_values(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_values: LabelValues) -> str:
+    if not label_values:
+        return ""
+    labels = ",".join(f'{key}="{value}"' for key, value in label_values)
+    return f"{{{labels}}}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_values(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(label_values)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    """A monotonically increasing value, e.g. the number of jobs completed."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value that can go up and down, e.g. the number of jobs running."""
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_values(labels)] = value
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, e.g. request durations, counted in cumulative
+    buckets by upper bound, with their sum and count.
+    """
+
+    type = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values, the count of each bucket (not cumulative, plus +Inf), sum, and count
+        self._histograms: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = ([0] * (len(self.buckets) + 1), [0.0, 0])
+                self._histograms[key] = histogram
+            counts, totals = histogram
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, **labels) -> int:
+        histogram = self._histograms.get(_label_values(labels))
+        return histogram[1][1] if histogram else 0
+
+    def sum(self, **labels) -> float:
+        histogram = self._histograms.get(_label_values(labels))
+        return histogram[1][0] if histogram else 0.0
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        with self._lock:
+            histograms = [
+                (label_values, list(counts), list(totals))
+                for label_values, (counts, totals) in self._histograms.items()
+            ]
+        for label_values, counts, (total, count) in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels((*label_values, ("le", str(bound))))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(label_values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(label_values)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, description: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, description, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter, name, description)
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._register(Gauge, name, description)
+
+    def histogram(
+        self, name: str, description: str, buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
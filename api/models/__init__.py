@@ -1,5 +1,8 @@
 from api.models.attempt import Attempt
 from api.models.error import Error
+from api.models.job import Job
+from api.models.job_request import JobRequest
+from api.models.job_status import JobStatus
 from api.models.output import Output
 from api.models.output_type import OutputType
 from api.models.request import Request
@@ -7,5 +10,6 @@ from api.models.message import Message
 from api.models.response import Response
 from api.models.response_usage import ResponseUsage
 from api.models.role import Role
+from api.models.stage_timing import StageTiming
 from api.models.status import Status
 from api.models.usage import Usage
@@ -1,19 +1,81 @@
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+import json
+
+
 from typing import Optional
-import motor
-import motor.motor_asyncio
-import os
+from pydantic import BaseModel, Field, StrictInt, StrictStr
+from api.models.job_status import JobStatus
+from api.models.request import Request
+from api.models.response import Response
 
-from pydantic import BaseModel, Field, conlist
-from api.models.message import Message
 
-from api.models.object_id import PyObjectId
+class Job(BaseModel):
+    """
+    A request answered in the background, whose response is polled or posted to a webhook.
+    """
+    id: Optional[StrictStr] = Field(None, description="The ID of the job, which is also the session ID of its response.")
+    status: Optional[JobStatus] = None
+    created_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job was created.")
+    started_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job last started running.")
+    finished_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job was finished.")
+    request: Optional[Request] = None
+    webhook_url: Optional[StrictStr] = Field(None, description="The URL to which the job is posted once it is finished, if any.")
+    response: Optional[Response] = None
+    error: Optional[StrictStr] = Field(None, description="The reason why the job failed, if it did.")
+    __properties = ["id", "status", "created_at", "started_at", "finished_at", "request", "webhook_url", "response", "error"]
 
+    class Config:
+        """Pydantic configuration"""
+        allow_population_by_field_name = True
+        validate_assignment = True
 
-client = motor.motor_asyncio.AsyncIOMotorClient(os.environ["MONGODB_URL"])
-db = client.api
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.dict(by_alias=True))
 
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return json.dumps(self.to_dict())
 
-class Job(BaseModel):
-    id: Optional[PyObjectId] = Field(alias="_id", default=None)
-    api_key: Optional[str] = Field(None, description="The API key of the user who created this job.")
-    messages: Optional[conlist(Message)] = Field(None, description="The message history of this job.")
+    @classmethod
+    def from_json(cls, json_str: str) -> Job:
+        """Create an instance of Job from a JSON string"""
+        return cls.from_dict(json.loads(json_str))
+
+    def to_dict(self):
+        """Returns the dictionary representation of the model using alias"""
+        _dict = self.dict(by_alias=True,
+                          exclude={
+                          },
+                          exclude_none=True)
+        # override the default output from pydantic by calling `to_dict()` of request
+        if self.request:
+            _dict['request'] = self.request.to_dict()
+        # override the default output from pydantic by calling `to_dict()` of response
+        if self.response:
+            _dict['response'] = self.response.to_dict()
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> Job:
+        """Create an instance of Job from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return Job.parse_obj(obj)
+
+        _obj = Job.parse_obj({
+            "id": obj.get("id"),
+            "status": obj.get("status"),
+            "created_at": obj.get("created_at"),
+            "started_at": obj.get("started_at"),
+            "finished_at": obj.get("finished_at"),
+            "request": Request.from_dict(obj.get("request")) if obj.get("request") is not None else None,
+            "webhook_url": obj.get("webhook_url"),
+            "response": Response.from_dict(obj.get("response")) if obj.get("response") is not None else None,
+            "error": obj.get("error")
+        })
+        return _obj
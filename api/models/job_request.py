@@ -0,0 +1,62 @@
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+import json
+
+
+from typing import Optional
+from pydantic import BaseModel, Field, StrictStr
+from api.models.request import Request
+
+
+class JobRequest(BaseModel):
+    """
+    The request of a job, and where to send the job once it is finished.
+    """
+    request: Request = Field(...)
+    webhook_url: Optional[StrictStr] = Field(None, description="The URL to which the job is posted once it is finished, if any.")
+    __properties = ["request", "webhook_url"]
+
+    class Config:
+        """Pydantic configuration"""
+        allow_population_by_field_name = True
+        validate_assignment = True
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.dict(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, json_str: str) -> JobRequest:
+        """Create an instance of JobRequest from a JSON string"""
+        return cls.from_dict(json.loads(json_str))
+
+    def to_dict(self):
+        """Returns the dictionary representation of the model using alias"""
+        _dict = self.dict(by_alias=True,
+                          exclude={
+                          },
+                          exclude_none=True)
+        # override the default output from pydantic by calling `to_dict()` of request
+        if self.request:
+            _dict['request'] = self.request.to_dict()
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> JobRequest:
+        """Create an instance of JobRequest from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return JobRequest.parse_obj(obj)
+
+        _obj = JobRequest.parse_obj({
+            "request": Request.from_dict(obj.get("request")) if obj.get("request") is not None else None,
+            "webhook_url": obj.get("webhook_url")
+        })
+        return _obj
@@ -0,0 +1,23 @@
+import json
+import pprint
+import re  # noqa: F401
+from aenum import Enum, no_arg
+
+
+class JobStatus(str, Enum):
+    """
+    The status of the job.
+    """
+
+    """
+    allowed enum values
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    @classmethod
+    def from_json(cls, json_str: str) -> JobStatus:
+        """Create an instance of JobStatus from a JSON string"""
+        return JobStatus(json.loads(json_str))
@@ -4,16 +4,28 @@ import re  # noqa: F401
 import json
 
 
-from typing import Optional
-from pydantic import BaseModel, Field, StrictInt
+from typing import List, Optional, Union
+from pydantic import BaseModel, Field, StrictFloat, StrictInt, conlist
+from api.models.stage_timing import StageTiming
 
 
 class ResponseUsage(BaseModel):
     """
     The usage of the request.
     """
-    tokens: Optional[StrictInt] = Field(None, description="The number of tokens used for the request.")
-    __properties = ["tokens"]
+    tokens: Optional[StrictInt] = Field(None, description="The number of LLM tokens used for the request.")
+    stages: Optional[conlist(StageTiming)] = Field(None, description="The timings of the stages of the request.")
+    prompt_tokens: Optional[StrictInt] = Field(None, description="The number of LLM prompt tokens used for the request.")
+    completion_tokens: Optional[StrictInt] = Field(None, description="The number of LLM completion tokens used for the request.")
+    llm_requests: Optional[StrictInt] = Field(None, description="The number of LLM completion requests made for the request.")
+    cached_llm_requests: Optional[StrictInt] = Field(None, description="The number of LLM completion requests served from cache.")
+    bigquery_jobs: Optional[StrictInt] = Field(None, description="The number of BigQuery jobs run for the request.")
+    bytes_processed: Optional[StrictInt] = Field(None, description="The number of bytes processed by BigQuery queries for the request.")
+    bytes_billed: Optional[StrictInt] = Field(None, description="The number of bytes billed for BigQuery queries for the request.")
+    sql_attempts: Optional[StrictInt] = Field(None, description="The number of attempts to generate a valid SQL query.")
+    code_attempts: Optional[StrictInt] = Field(None, description="The number of attempts to generate valid Python code.")
+    seconds: Optional[Union[StrictFloat, StrictInt]] = Field(None, description="The number of seconds taken to answer the request.")
+    __properties = ["tokens", "stages", "prompt_tokens", "completion_tokens", "llm_requests", "cached_llm_requests", "bigquery_jobs", "bytes_processed", "bytes_billed", "sql_attempts", "code_attempts", "seconds"]
 
     class Config:
         """Pydantic configuration"""
@@ -39,6 +51,13 @@ class ResponseUsage(BaseModel):
                           exclude={
                           },
                           exclude_none=True)
+        # override the default output from pydantic by calling `to_dict()` of each item in stages (list)
+        _items = []
+        if self.stages:
+            for _item in self.stages:
+                if _item:
+                    _items.append(_item.to_dict())
+            _dict['stages'] = _items
         return _dict
 
     @classmethod
@@ -51,6 +70,17 @@ class ResponseUsage(BaseModel):
             return ResponseUsage.parse_obj(obj)
 
         _obj = ResponseUsage.parse_obj({
-            "tokens": obj.get("tokens")
+            "tokens": obj.get("tokens"),
+            "stages": [StageTiming.from_dict(_item) for _item in obj.get("stages")] if obj.get("stages") is not None else None,
+            "prompt_tokens": obj.get("prompt_tokens"),
+            "completion_tokens": obj.get("completion_tokens"),
+            "llm_requests": obj.get("llm_requests"),
+            "cached_llm_requests": obj.get("cached_llm_requests"),
+            "bigquery_jobs": obj.get("bigquery_jobs"),
+            "bytes_processed": obj.get("bytes_processed"),
+            "bytes_billed": obj.get("bytes_billed"),
+            "sql_attempts": obj.get("sql_attempts"),
+            "code_attempts": obj.get("code_attempts"),
+            "seconds": obj.get("seconds")
         })
         return _obj
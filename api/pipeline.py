@@ -0,0 +1,131 @@
+"""
+Runs the stages of answering a user query as a DAG of async tasks, so that stages start as
+soon as their dependencies complete and independent stages overlap.
+"""
+
+import asyncio
+import inspect
+import time
+from typing import AsyncIterator, Callable, Dict, List
+
+from api.log import logger
+from api.types import StageTiming
+from api.usage import current_stage, record_stage
+
+# Marks the end of a streamed stage's items
+_END = object()
+
+
+class StageStream:
+    """Iterates over the items of a streamed stage as they are produced."""
+
+    def __init__(self, task: asyncio.Task, queue: asyncio.Queue):
+        self.task = task
+        self._queue = queue
+
+    def __aiter__(self) -> AsyncIterator:
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            item = await self._queue.get()
+            if item is _END:
+                break
+            yield item
+        # Raise the stage's exception, if any
+        await self.task
+
+
+class Pipeline:
+    """
+    DAG of async stages with explicit dependencies, recording when each stage started and
+    how long it ran, relative to the start of the pipeline.
+
+    A stage's function is called with the results of its dependencies, in order, once
+    they complete. Synchronous functions, which are CPU-bound, are run in a thread. The
+    resources used by a stage are attributed to it in the request's usage tracker.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.timings: List[StageTiming] = []
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _record(self, name: str, started: float) -> None:
+        seconds = time.perf_counter() - started
+        self.timings.append(StageTiming(name=name, started=started - self.start_time, seconds=seconds))
+        record_stage(name, seconds)
+
+    async def _dependencies(self, dependencies: tuple) -> list:
+        return list(await asyncio.gather(*(self._tasks[name] for name in dependencies)))
+
+    def run(self, name: str, function: Callable, *dependencies: str) -> asyncio.Task:
+        """Start a stage, returning the task of its result."""
+
+        async def run_stage():
+            # Each stage runs in its own task, so its usage is attributed to it
+            current_stage.set(name)
+            args = await self._dependencies(dependencies)
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(function):
+                    return await function(*args)
+                return await asyncio.to_thread(function, *args)
+            finally:
+                self._record(name, started)
+
+        task = asyncio.create_task(run_stage(), name=name)
+        self._tasks[name] = task
+        return task
+
+    def stream(self, name: str, function: Callable, *dependencies: str) -> StageStream:
+        """
+        Start a stage whose function is an async generator, returning a stream of its items.
+        The stage's result, for the stages that depend on it, is its last item.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run_stage():
+            current_stage.set(name)
+            try:
+                args = await self._dependencies(dependencies)
+                started = time.perf_counter()
+                item = None
+                try:
+                    async for item in function(*args):
+                        queue.put_nowait(item)
+                    return item
+                finally:
+                    self._record(name, started)
+            finally:
+                # Also if a dependency failed, so that the stream's consumer does not wait forever
+                queue.put_nowait(_END)
+
+        task = asyncio.create_task(run_stage(), name=name)
+        self._tasks[name] = task
+        return StageStream(task, queue)
+
+    def result(self, name: str) -> asyncio.Task:
+        return self._tasks[name]
+
+    def get_timings(self) -> List[StageTiming]:
+        return sorted(self.timings, key=lambda timing: timing.started)
+
+    def log_timings(self) -> None:
+        for timing in self.get_timings():
+            logger.info(
+                "Stage %s started at %.3f seconds and took %.3f seconds",
+                timing.name,
+                timing.started,
+                timing.seconds,
+            )
+
+    def close(self) -> None:
+        """Cancel the stages that are still running, e.g. when the request fails or is cancelled."""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Retrieve the exceptions of failed stages that were not awaited, so that
+                # they are not logged as never retrieved
+                task.exception()
@@ -1,14 +1,17 @@
 # flake8: noqa
 
+import os
+import threading
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, List, Optional
+import numpy as np
+import scipy.sparse
 import toml
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 import inspect
 from api.types import Role
-import toml
 
 
 @dataclass
@@ -19,43 +22,157 @@ class Example:
     code: str
 
 
-examples_generated = [
-    Example(**item)
-    for item in toml.load("api/prompts/examples/examples_generated.toml")['examples']
-]
+EXAMPLES_PATH = "api/prompts/examples/examples_generated.toml"
+
+
+def load_examples(path: str = EXAMPLES_PATH) -> List[Example]:
+    return [Example(**item) for item in toml.load(path)['examples']]
+
+
+class ExamplePartition:
+    """
+    TF-IDF vectors of the questions of a set of examples.
+
+    Partitions are immutable, so that they can be read while examples are added. Added
+    examples are transformed using the fitted vocabulary, and the vectorizer is refitted
+    once the examples added since it was fitted exceed `refit_ratio` of the examples.
+    """
+
+    def __init__(
+        self,
+        examples: List[Example],
+        vectorizer: Optional[TfidfVectorizer] = None,
+        matrix: Optional[scipy.sparse.csr_matrix] = None,
+        fitted_size: Optional[int] = None,
+        refit_ratio: float = 0.25,
+    ):
+        self.examples = examples
+        self.refit_ratio = refit_ratio
+        if vectorizer is None:
+            vectorizer = TfidfVectorizer()
+            matrix = vectorizer.fit_transform(example.query for example in examples)
+            fitted_size = len(examples)
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.fitted_size = fitted_size
+
+    def add_examples(self, examples: List[Example]) -> "ExamplePartition":
+        """Returns a new partition, including the added examples."""
+        all_examples = self.examples + examples
+        if len(all_examples) - self.fitted_size > self.refit_ratio * self.fitted_size:
+            return ExamplePartition(all_examples, refit_ratio=self.refit_ratio)
+        matrix = scipy.sparse.vstack(
+            [self.matrix, self.vectorizer.transform(example.query for example in examples)],
+            format="csr",
+        )
+        return ExamplePartition(
+            all_examples,
+            vectorizer=self.vectorizer,
+            matrix=matrix,
+            fitted_size=self.fitted_size,
+            refit_ratio=self.refit_ratio,
+        )
+
+    def get_relevant_examples(self, query: str, k: int = 5) -> List[Example]:
+        # Rows are L2-normalized, so the dot product is the cosine similarity
+        scores = (self.matrix @ self.vectorizer.transform([query]).T).toarray().ravel()
+        k = min(k, len(scores))
+        top_indices = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-scores[top_indices], kind="stable")]
+        return [self.examples[index] for index in top_indices]
+
+
+class ExampleIndex:
+    """
+    Index of examples for retrieving the examples most relevant to a question.
+
+    Examples are partitioned by data source URL, and each data source's partition also
+    includes the default examples without a data source URL. The partitions are built once,
+    and rebuilt when the examples file changes, so that only the question is vectorized
+    per request.
+    """
+
+    def __init__(self, examples: Optional[List[Example]] = None, path: Optional[str] = None):
+        self.path = path
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._examples: List[Example] = []
+        self._partitions: Dict[Optional[str], ExamplePartition] = {}
+        if path:
+            self.reload_if_changed()
+        else:
+            self.add_examples(examples or [])
+
+    def reload_if_changed(self) -> None:
+        """Rebuild the index if the examples file was modified since it was loaded."""
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._examples = []
+                self._partitions = {}
+                self._add_examples(load_examples(self.path))
+                self._mtime = mtime
+
+    def add_examples(self, examples: List[Example]) -> None:
+        with self._lock:
+            self._add_examples(examples)
+
+    def _add_examples(self, examples: List[Example]) -> None:
+        self._examples += examples
+        default_examples = [example for example in examples if not example.data_source_url]
+        examples_by_data_source = defaultdict(list)
+        for example in examples:
+            if example.data_source_url:
+                examples_by_data_source[example.data_source_url].append(example)
+
+        # The partition of all examples, the default examples, and each data source
+        updates = {None: examples, "": default_examples}
+        for data_source_url in set(self._partitions) - {None, ""}:
+            updates[data_source_url] = default_examples + examples_by_data_source.pop(data_source_url, [])
+        for data_source_url, data_source_examples in examples_by_data_source.items():
+            updates[data_source_url] = (
+                [example for example in self._examples if not example.data_source_url]
+                + data_source_examples
+            )
+
+        partitions = dict(self._partitions)
+        for data_source_url, partition_examples in updates.items():
+            if not partition_examples:
+                continue
+            if data_source_url in partitions:
+                partitions[data_source_url] = partitions[data_source_url].add_examples(partition_examples)
+            else:
+                partitions[data_source_url] = ExamplePartition(partition_examples)
+        self._partitions = partitions
+
+    def get_relevant_examples(self, query: str, data_source_url: Optional[str] = None, k: int = 5) -> List[Example]:
+        if self.path:
+            self.reload_if_changed()
+        partitions = self._partitions
+        # Use the default examples for an unknown data source, or all examples if there are none
+        partition = (
+            partitions.get(data_source_url or None)
+            or partitions.get("")
+            or partitions.get(None)
+        )
+        if partition is None:
+            return []
+        return partition.get_relevant_examples(query, k=k)
+
+
+example_index = ExampleIndex(path=EXAMPLES_PATH)
 
 
-def get_relevant_examples(query, data_source_url=None, examples=examples_generated) -> List[Example]:
+def get_relevant_examples(query, data_source_url=None, examples=None) -> List[Example]:
     """
     Get top 5 relevant examples for a specific data source,
     or from all examples if no data source is specified,
     using cosine similarity of question.
     """
-    # If data source is specified, filter examples by it
-    if data_source_url:
-        filtered_examples = [example for example in examples if not example.data_source_url or example.data_source_url == data_source_url]
-    
-    # If examples are empty after filtering, use all examples
-    if not filtered_examples:
-        filtered_examples = examples
-
-    # Extract queries from examples
-    example_queries = [example.query for example in filtered_examples]
-    
-    # Combine the new query with example queries
-    texts = example_queries + [query]
-    
-    # Convert the queries to TF-IDF vectors
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(texts)
-    
-    # Compute cosine similarity between the new query and each example
-    cosine_similarities = cosine_similarity(tfidf_matrix[-1], tfidf_matrix[:-1])
-    
-    # Get indices of the top 5 most similar examples
-    relevant_indices = cosine_similarities.argsort()[0][-5:][::-1]
-    
-    return [filtered_examples[i] for i in relevant_indices]
+    index = example_index if examples is None else ExampleIndex(examples)
+    return index.get_relevant_examples(query, data_source_url=data_source_url)
 
 
 def convert_examples_to_llm_messages(
@@ -1,12 +1,15 @@
 import asyncio
+import hashlib
 import time
+from dataclasses import asdict
 from logging.config import dictConfig
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, List, Literal, Optional, Tuple
 
-from api.models import (Attempt, Error, Output, OutputType, Request,
-                             Response, Usage)
-from fastapi import FastAPI, HTTPException, Security, status
-from fastapi.responses import JSONResponse, StreamingResponse
+from api.models import (Attempt, Error, Job, JobRequest, Output, OutputType, Request,
+                             Response, ResponseUsage, StageTiming)
+from fastapi import FastAPI, HTTPException, Query, Security, status
+from fastapi import Request as HTTPRequest
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.openapi.utils import get_openapi
@@ -16,11 +19,25 @@ import motor.motor_asyncio
 import os
 
 from api import auth, utils
+from api.caching import completion_cache_tenant
+from api.cancellation import requests_disconnected, run_until_disconnected
 from api.chartgpt import answer_user_query
-from api.errors import ContextLengthError, PythonExecutionError
-from api.security.guards import is_nda_broken
+from api.config import CODE_EXECUTION_BACKEND
+from api.errors import (ClientDisconnectedError, CodeExecutionBusyError, ContextLengthError,
+                        InsecureRequestError, InsecureWebhookError, JobQueueFullError,
+                        PythonExecutionError)
+from api.jobs import check_webhook_url, create_job_queue
+from api.security.guards import is_nda_broken, load_nda_classifier
 from api.log import log_response, logger
+from api.metrics import registry
+from api.sandbox import code_execution_pool
+from api.schema_catalog import schema_catalog
+from api.streaming import (SNAPSHOT_PROTOCOL, EventChannel, ResponseEventEncoder, iter_events,
+                           output_delta_handler)
+from api import types
 from api.types import QueryResult
+from api.usage import (ResourceUsage, UsageTracker, run_in_stage, track_usage,
+                       usage_tracker)
 
 
 # MongoDB client
@@ -59,6 +76,29 @@ dictConfig(
 
 app = FastAPI()
 
+stream_time_to_first_event = registry.histogram(
+    "chartgpt_stream_time_to_first_event_seconds",
+    "Seconds from a stream request to its first event of each type, e.g. stream_start for the time to first byte.",
+)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    schema_catalog.start()
+    if CODE_EXECUTION_BACKEND == "sandbox":
+        # Warm the code execution workers before the first request
+        code_execution_pool.start()
+    await load_nda_classifier()
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    # Jobs interrupted by the shutdown are queued again, before the workers they use are stopped
+    await job_queue.stop()
+    await schema_catalog.stop()
+    await asyncio.to_thread(code_execution_pool.stop)
+
 
 def openapi_config():
     if app.openapi_schema:
@@ -92,6 +132,11 @@ def get_api_key(api_key: str = Security(api_key_header)) -> str:
     )
 
 
+def get_tenant(api_key: str) -> str:
+    """The tenant of an API key, i.e. its hash, which is stored rather than the key itself."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
 # Enable GZip compression for responses larger than 5 MB
 # app.add_middleware(GZipMiddleware, minimum_size=5_000_000)
 
@@ -114,11 +159,6 @@ async def uncaught_exception_handler(_: Request, exc: Exception):
     )
 
 
-def format_response_event(response: Response) -> str:
-    """Format the response for event stream."""
-    return f"data: {response.to_json()}\n\n"
-
-
 @app.get("/health", tags=["health"])
 async def ping():
     """Ping the API to check if it is running."""
@@ -126,29 +166,71 @@ async def ping():
     return "ok"
 
 
-async def keep_alive_generator(queue: asyncio.Queue, stop_event: asyncio.Event) -> AsyncGenerator[str, None]:
+@app.get("/metrics", response_class=PlainTextResponse, tags=["health"])
+async def metrics(api_key: str = Security(get_api_key)):
+    """Export the API's in-process metrics in the Prometheus text format."""
+    return registry.render()
+
+
+def create_usage(stages: List[types.StageTiming]) -> ResponseUsage:
+    """Create the usage of the current request so far, including the timings of its stages."""
+    tracker = usage_tracker.get() or UsageTracker()
+    stage_usages = {
+        timing.name: tracker.stages.get(timing.name, ResourceUsage()) for timing in stages
+    }
+    return ResponseUsage(
+        tokens=tracker.total.tokens,
+        prompt_tokens=tracker.total.prompt_tokens,
+        completion_tokens=tracker.total.completion_tokens,
+        llm_requests=tracker.total.llm_requests,
+        cached_llm_requests=tracker.total.cached_llm_requests,
+        bigquery_jobs=tracker.total.bigquery_jobs,
+        bytes_processed=tracker.total.bytes_processed,
+        bytes_billed=tracker.total.bytes_billed,
+        sql_attempts=tracker.attempts.get("sql", 0),
+        code_attempts=tracker.attempts.get("code", 0),
+        seconds=tracker.seconds,
+        stages=[
+            StageTiming(
+                **asdict(timing),
+                tokens=stage_usages[timing.name].tokens,
+                bytes_processed=stage_usages[timing.name].bytes_processed,
+            )
+            for timing in stages
+        ] or None,
+    )
+
+
+async def persist_usage(response: Response) -> None:
+    """Store the usage of a request separately from its outputs, for capacity planning."""
     try:
-        while not stop_event.is_set():
-            await asyncio.sleep(15)
-            await queue.put("event: keep-alive\n")
-            await queue.put("data: {}\n\n")
-    except asyncio.CancelledError:
-        pass
+        await db["usage"].insert_one({
+            "session_id": response.session_id,
+            "created_at": response.created_at,
+            "finished_at": response.finished_at,
+            "data_source_url": response.data_source_url,
+            **response.usage.dict(),
+        })
+    except Exception:
+        logger.exception("Failed to store usage of session %s", response.session_id)
 
 
-async def handle_response(response: Response, queue: asyncio.Queue) -> None:
+async def handle_response(response: Response, channel: EventChannel, event: str) -> None:
     log_response(response)
-    await queue.put(format_response_event(response=response))
+    await channel.send_response(event, response)
     await db["responses"].insert_one(response.dict())
 
 
-async def data_generator(
+async def generate_responses(
         request: Request,
         session_id: str,
         created_at: int,
-        queue: asyncio.Queue,
-        stop_event: asyncio.Event,
-) -> AsyncGenerator[Response, None]:
+        guard: Optional[asyncio.Future] = None,
+) -> AsyncGenerator[Tuple[str, Response], None]:
+    """
+    Answer a request with its responses, each with the type of its event: from the start of
+    the request, to its usage, or to the error that failed it.
+    """
     try:
         # Respond with the job ID to indicate that the job has started
         response = Response(
@@ -162,9 +244,9 @@ async def data_generator(
             outputs=[],
             errors=[],
         )
-        await queue.put("event: stream_start\n")
-        await handle_response(response=response, queue=queue)
-        async for result in answer_user_query(request=request, stream=True):
+        yield "stream_start", response
+        stages = []
+        async for result in answer_user_query(request=request, stream=True, guard=guard):
             finished_at = int(time.time())
             if isinstance(result, Attempt):
                 attempt = result
@@ -182,8 +264,7 @@ async def data_generator(
                     errors=[],
                     # usage=Usage(tokens=len(result.attempts)),
                 )
-                await queue.put("event: attempt\n")
-                await handle_response(response=response, queue=queue)
+                yield "attempt", response
             elif isinstance(result, Output):
                 output = result
                 response = Response(
@@ -200,8 +281,7 @@ async def data_generator(
                     errors=[],
                     # usage=Usage(tokens=len(result.attempts)),
                 )
-                await queue.put("event: output\n")
-                await handle_response(response=response, queue=queue)
+                yield "output", response
             elif isinstance(result, QueryResult):
                 query_result = result
                 response = Response(
@@ -216,17 +296,28 @@ async def data_generator(
                     output_type=request.output_type,
                     outputs=query_result.outputs,
                     errors=query_result.errors,
-                    usage=Usage(tokens=len(query_result.attempts)),
+                    usage=create_usage(query_result.stages),
                 )
-                await queue.put("event: output\n")
-                await handle_response(response=response, queue=queue)
+                stages = query_result.stages or stages
+                yield "output", response
             else:
                 logger.error("Unhandled result type: %s", type(result))
-            # Sleep briefly so concurrent tasks can run
-            # 1 ms (0.001 s) limits max throughput to 1,000 requests per second
-            # See https://github.com/openai/openai-cookbook/blob/main/examples/api_request_parallel_processor.py
-            await asyncio.sleep(0.01)
-        stop_event.set()
+        # Respond with the usage of the request, once all outputs are sent
+        response = Response(
+            session_id=session_id,
+            created_at=created_at,
+            finished_at=int(time.time()),
+            status="succeeded",
+            messages=request.messages,
+            data_source_url=request.data_source_url,
+            attempts=[],
+            output_type=request.output_type,
+            outputs=[],
+            errors=[],
+            usage=create_usage(stages),
+        )
+        yield "usage", response
+        await persist_usage(response)
     except PythonExecutionError as ex:
         # TODO Return user friendly errors
         logger.error("Stream PythonExecutionError: %s", ex)
@@ -247,12 +338,77 @@ async def data_generator(
                 value=str(ex),
             )],
         )
-        await queue.put("event: error\n")
-        await handle_response(response=response, queue=queue)
-    except asyncio.CancelledError:
+        yield "error", response
+
+
+async def data_generator(
+        request: Request,
+        session_id: str,
+        created_at: int,
+        channel: EventChannel,
+        guard: Optional[asyncio.Future] = None,
+) -> None:
+    try:
+        # Stream the SQL queries and code while they are generated, before their outputs
+        output_delta_handler.set(channel.send_output_delta)
+        async for event, response in generate_responses(request, session_id, created_at, guard=guard):
+            await handle_response(response=response, channel=channel, event=event)
+    except (asyncio.CancelledError, InsecureRequestError):
+        # Insecure requests are rejected by `ask_chartgpt` before any events are sent
         pass
     finally:
-        stop_event.set()
+        channel.close()
+
+
+async def run_job(job: Job, tenant: str) -> AsyncGenerator[Response, None]:
+    """Answer the request of a job, in the background, like `ask_chartgpt` answers a request."""
+    request = job.request
+    request.session_id = job.id
+    completion_cache_tenant.set(tenant)
+    track_usage()
+    guard = asyncio.create_task(run_in_stage("nda_guard", is_nda_broken(request.messages[-1].content)))
+    try:
+        async for _, response in generate_responses(request, job.id, job.created_at, guard=guard):
+            # The responses are stored, and so readable, only once the guard finds the request secure
+            if await guard:
+                raise InsecureRequestError("The request is insecure.")
+            log_response(response)
+            await db["responses"].insert_one(response.dict())
+            yield response
+    finally:
+        guard.cancel()
+
+
+job_queue = create_job_queue(db["jobs"], run_job)
+
+
+async def get_first_result(request: Request, guard: asyncio.Future) -> Optional[QueryResult]:
+    async for result in answer_user_query(request=request, guard=guard):
+        return result
+    return None
+
+
+async def run_guarded(guard: asyncio.Future, work: asyncio.Future):
+    """
+    Wait for work started speculatively while the NDA guard runs, cancelling it as soon as
+    the guard finds the request insecure.
+    """
+    try:
+        await asyncio.wait({guard, work}, return_when=asyncio.FIRST_COMPLETED)
+        if await guard:
+            raise InsecureRequestError("The request is insecure.")
+        return await work
+    finally:
+        work.cancel()
+        # E.g. when the client disconnected before the guard finished
+        guard.cancel()
+
+
+STREAM_PROTOCOL_DESCRIPTION = (
+    "The protocol of the stream: \"snapshot\" sends each response in full, and \"delta\" sends "
+    "the first response in full, and then only the fields of each response that differ from it, "
+    "with a sequence number."
+)
 
 
 # TODO Complete get_data_source_sample_rows endpoint
@@ -262,18 +418,27 @@ async def data_generator(
 
 @app.post("/v1/ask_chartgpt", response_model=Response, tags=["chat"])
 async def ask_chartgpt(
-    request: Request, api_key: str = Security(get_api_key), stream=False
+    request: Request,
+    http_request: HTTPRequest,
+    api_key: str = Security(get_api_key),
+    stream=False,
+    protocol: Literal["snapshot", "delta"] = Query(SNAPSHOT_PROTOCOL, description=STREAM_PROTOCOL_DESCRIPTION),
 ) -> Response:
     """Answer a user query using the ChartGPT API."""
+    endpoint = "ask_chartgpt/stream" if stream else "ask_chartgpt"
     try:
         session_id = utils.generate_session_id()
         request.session_id = session_id
+        # Cache LLM completions per API key, so that tenants never share completions
+        completion_cache_tenant.set(get_tenant(api_key))
+        track_usage()
         logger.info("Request: %s", request)
         await db["requests"].insert_one({
             **request.dict(),
             "api_key": api_key
         })
         created_at = int(time.time())
+        start_time = time.perf_counter()
 
         if not request.messages:
             message = "Could not complete analysis: messages is empty"
@@ -285,17 +450,14 @@ async def ask_chartgpt(
         else:
             query = request.messages[-1].content
 
-        if await is_nda_broken(query):
-            message = "Could not complete analysis: insecure request"
-            logger.error(message)
-            return JSONResponse(
-                status_code=status.HTTP_403_FORBIDDEN,
-                content={"error": message},
-            )
+        # Start the NDA guard, which runs concurrently with schema loading and the initial
+        # SQL query generation, and is awaited before any SQL query is run or result is sent
+        guard = asyncio.create_task(run_in_stage("nda_guard", is_nda_broken(query)))
 
         data_source, _, _, _ = utils.parse_data_source_url(request.data_source_url)
 
         if data_source != "bigquery":
+            guard.cancel()
             message = "Could not complete analysis: data source not supported"
             logger.error(message)
             return JSONResponse(
@@ -304,32 +466,44 @@ async def ask_chartgpt(
             )
 
         if stream:
+            channel = EventChannel(ResponseEventEncoder(session_id, protocol=protocol))
+            # Events are queued, but only sent once the guard finds the request secure, and
+            # the work waits for them to be sent once the channel is full
+            data_task = asyncio.create_task(data_generator(
+                request=request,
+                session_id=session_id,
+                created_at=created_at,
+                channel=channel,
+                guard=guard,
+            ))
+            try:
+                insecure = await run_until_disconnected(http_request.receive, guard, endpoint=endpoint)
+            except BaseException:
+                data_task.cancel()
+                raise
+            if insecure:
+                data_task.cancel()
+                raise InsecureRequestError("The request is insecure.")
+
             async def generate_response(request: Request) -> AsyncGenerator[str, None]:
-                queue = asyncio.Queue()
-                stop_event = asyncio.Event()
-
-                keep_alive_task = asyncio.create_task(keep_alive_generator(
-                    queue=queue,
-                    stop_event=stop_event
-                ))
-                
-                data_task = asyncio.create_task(data_generator(
-                    request=request,
-                    session_id=session_id,
-                    created_at=created_at,
-                    queue=queue,
-                    stop_event=stop_event,
-                ))
+                first_events = set()
+                finished = False
                 try:
-                    while not stop_event.is_set():
-                        event = await queue.get()
+                    async for event in iter_events(channel):
+                        if not event.startswith("event: keep-alive"):
+                            event_type = event.split("\n", 1)[0][len("event: "):]
+                            if event_type not in first_events:
+                                first_events.add(event_type)
+                                stream_time_to_first_event.observe(
+                                    time.perf_counter() - start_time, event=event_type
+                                )
                         yield event
+                    finished = True
                 finally:
-                    yield "event: stream_end\n"
-                    yield "data: [DONE]\n\n"
-                    keep_alive_task.cancel()
+                    # Cancel the work as soon as the stream stops, e.g. when the client disconnects
+                    if not finished:
+                        requests_disconnected.inc(endpoint=endpoint)
                     data_task.cancel()
-                    await asyncio.gather(keep_alive_task, data_task, return_exceptions=True)
 
             return StreamingResponse(
                 generate_response(request=request),
@@ -338,15 +512,17 @@ async def ask_chartgpt(
                     "Content-type": "text/event-stream",
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
+                    "X-Stream-Protocol": protocol,
                     # TODO Investigate compression techniques
                     # "Content-Encoding": "deflate",
                 }
             )
         else:
-            result: Optional[QueryResult] = None
-            async for temp_result in answer_user_query(request=request):
-                result = temp_result
-                break
+            result = await run_until_disconnected(
+                http_request.receive,
+                run_guarded(guard, asyncio.create_task(get_first_result(request=request, guard=guard))),
+                endpoint=endpoint,
+            )
             finished_at = int(time.time())
             if not result:
                 message = "Could not complete analysis: no result"
@@ -366,11 +542,16 @@ async def ask_chartgpt(
                 output_type=request.output_type,
                 outputs=result.outputs,
                 errors=result.errors,
-                usage=Usage(tokens=len(result.attempts)),
+                usage=create_usage(result.stages),
             )
             log_response(response)
             await db["responses"].insert_one(response.dict())
+            await persist_usage(response)
             return response
+    except ClientDisconnectedError:
+        logger.info("Request cancelled: the client disconnected")
+        # Client Closed Request, as logged by nginx, which the client never receives
+        return JSONResponse(status_code=499, content={"error": "Client disconnected"})
     except asyncio.exceptions.CancelledError:
         message = "Could not complete analysis: request cancelled"
         logger.error(message)
@@ -378,6 +559,20 @@ async def ask_chartgpt(
             status_code=status.HTTP_400_BAD_REQUEST,
             content={"error": message},
         )
+    except InsecureRequestError:
+        message = "Could not complete analysis: insecure request"
+        logger.error(message)
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content={"error": message},
+        )
+    except CodeExecutionBusyError:
+        message = "Could not complete analysis: too many requests, please retry later"
+        logger.error(message)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": message},
+        )
     except ContextLengthError:
         message = "Could not complete analysis: ran out of context"
         logger.error(message)
@@ -396,7 +591,65 @@ async def ask_chartgpt(
 
 @app.post("/v1/ask_chartgpt/stream", response_model=Response, tags=["chat"])
 async def ask_chartgpt_stream(
-    request: Request, api_key: str = Security(get_api_key)
+    request: Request,
+    http_request: HTTPRequest,
+    api_key: str = Security(get_api_key),
+    protocol: Literal["snapshot", "delta"] = Query(SNAPSHOT_PROTOCOL, description=STREAM_PROTOCOL_DESCRIPTION),
 ) -> Response:
     """Stream the response from the ChartGPT API."""
-    return await ask_chartgpt(request, api_key=api_key, stream=True)
+    return await ask_chartgpt(request, http_request, api_key=api_key, stream=True, protocol=protocol)
+
+
+@app.post("/v1/jobs", response_model=Job, status_code=status.HTTP_202_ACCEPTED, tags=["jobs"])
+async def create_job(
+    job_request: JobRequest,
+    api_key: str = Security(get_api_key),
+) -> Job:
+    """Queue a job that answers a user query in the background, and return it immediately."""
+    request = job_request.request
+    logger.info("Job request: %s", request)
+    if not request.messages:
+        message = "Could not complete analysis: messages is empty"
+    elif utils.parse_data_source_url(request.data_source_url)[0] != "bigquery":
+        message = "Could not complete analysis: data source not supported"
+    else:
+        message = None
+    if message is None and job_request.webhook_url:
+        try:
+            await check_webhook_url(job_request.webhook_url)
+        except InsecureWebhookError as e:
+            message = f"Could not queue job: {e}"
+    if message:
+        logger.error(message)
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": message},
+        )
+    await db["requests"].insert_one({
+        **request.dict(),
+        "api_key": api_key
+    })
+    try:
+        return await job_queue.submit(request, get_tenant(api_key), webhook_url=job_request.webhook_url)
+    except JobQueueFullError:
+        message = "Could not queue job: too many jobs, please retry later"
+        logger.error(message)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": message},
+        )
+
+
+@app.get("/v1/jobs/{job_id}", response_model=Job, tags=["jobs"])
+async def get_job(
+    job_id: str,
+    api_key: str = Security(get_api_key),
+) -> Job:
+    """Get the status of a job, with the outputs of its response so far."""
+    job = await job_queue.store.get(job_id, get_tenant(api_key))
+    if job is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"error": "Job not found"},
+        )
+    return job
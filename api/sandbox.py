@@ -0,0 +1,402 @@
+"""
+Pool of warm worker processes that execute the Python code generated to answer questions,
+so that executions neither block the API's event loop nor share its process state.
+
+Each worker imports the code generation imports once, when it starts, and executes one
+request at a time, within limits of CPU time, wall time and memory. Workers are recycled
+after a number of executions, or when an execution exceeds a limit, and replaced in the
+background. Executions wait for a free worker in a bounded queue, and are rejected with a
+`CodeExecutionBusyError` when it is full. Cancelled executions are removed from the queue,
+or aborted by killing their worker, which is replaced.
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import resource
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from api import log
+from api.config import (CODE_EXECUTION_CPU_SECONDS, CODE_EXECUTION_MAX_EXECUTIONS,
+                        CODE_EXECUTION_MEMORY_LIMIT, CODE_EXECUTION_QUEUE_SIZE,
+                        CODE_EXECUTION_TIMEOUT, CODE_EXECUTION_WORKERS)
+from api.errors import CodeExecutionBusyError
+from api.execution import execute_python_code, get_base_namespace
+from api.log import logger
+from api.metrics import registry
+from api.prompts.templates import CODE_GENERATION_IMPORTS
+from api.shared_frames import SharedDataFrame
+from api.types import CodeGenerationConfig, PythonExecutionResult
+
+code_executions = registry.counter(
+    "chartgpt_code_executions_total",
+    "Code executions in worker processes, by outcome: succeeded, failed, timeout, crashed, or cancelled.",
+)
+code_executions_pending = registry.gauge(
+    "chartgpt_code_executions_pending", "Code executions running or waiting for a worker."
+)
+code_execution_workers_started = registry.counter(
+    "chartgpt_code_execution_workers_started_total", "Code execution worker processes started."
+)
+
+# Seconds for a worker to import the code generation imports and be ready
+WORKER_START_TIMEOUT = 60
+_READY = "ready"
+
+
+@dataclass
+class ExecutionLimits:
+    cpu_seconds: int = 30
+    timeout: float = 60
+    # Address space of the worker in bytes, or 0 for no limit
+    memory: int = 0
+
+
+class CPUTimeLimitError(Exception):
+    """Raised in a worker when an execution exceeds its CPU time limit."""
+
+
+def _raise_cpu_time_limit_error(signum, frame):
+    raise CPUTimeLimitError("The code exceeded its CPU time limit")
+
+
+def _load_shared_frames(local_variables: Optional[dict], loaded: Dict[str, pd.DataFrame]) -> Optional[dict]:
+    """Load the shared DataFrames of a request, reusing those loaded for its previous attempts."""
+    if not local_variables:
+        return local_variables
+    variables = {}
+    for name, value in local_variables.items():
+        if isinstance(value, SharedDataFrame):
+            if value.path not in loaded:
+                # Release the DataFrames of the previous request
+                loaded.clear()
+                loaded[value.path] = value.load()
+            value = loaded[value.path]
+        variables[name] = value
+    return variables
+
+
+def _execute_in_worker(
+    loop: asyncio.AbstractEventLoop, request: dict, limits: ExecutionLimits
+) -> Tuple[PythonExecutionResult, bool]:
+    """Execute a request within the CPU time limit, returning the result and whether to recycle the worker."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
+    # The limit is on the CPU time of the process, so it is set relative to the time used so far
+    soft_limit = int(usage.ru_utime + usage.ru_stime) + limits.cpu_seconds
+    resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, hard_limit))
+    try:
+        result = loop.run_until_complete(execute_python_code(**request))
+    except (CPUTimeLimitError, MemoryError) as e:
+        # Raised outside of the code's execution, e.g. in the event loop
+        result = PythonExecutionResult(
+            description=request["docstring"], code=request["code"], error=f"{type(e).__name__}: {e}"
+        )
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, hard_limit))
+    # The local variables are the caller's own
+    result.local_variables = None
+    recycle = bool(result.error) and result.error.startswith(
+        (CPUTimeLimitError.__name__, MemoryError.__name__)
+    )
+    return result, recycle
+
+
+def _run_worker(connection, limits: ExecutionLimits) -> None:
+    """Main loop of a worker process, which executes requests received from the pool."""
+    # Interrupts are sent to the API's whole process group, and the pool stops its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, _raise_cpu_time_limit_error)
+    get_base_namespace(CODE_GENERATION_IMPORTS)
+    if limits.memory:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory, limits.memory))
+    # The code gets a lazy copy of the shared DataFrame, which is read-only
+    pd.set_option("mode.copy_on_write", True)
+    loop = asyncio.new_event_loop()
+    loaded_frames: Dict[str, pd.DataFrame] = {}
+    connection.send(_READY)
+
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            request["local_variables"] = _load_shared_frames(request["local_variables"], loaded_frames)
+        except (OSError, ValueError) as e:
+            # E.g. the request was cancelled, and its DataFrame removed
+            result = PythonExecutionResult(
+                description=request["docstring"], code=request["code"], error=f"{type(e).__name__}: {e}"
+            )
+            connection.send((result, False))
+            continue
+        result, recycle = _execute_in_worker(loop, request, limits)
+        try:
+            connection.send((result, recycle))
+        except Exception as e:
+            # The result could not be pickled, e.g. a function or a generator
+            result.result = None
+            result.error = f"TypeError: The result cannot be returned to the API: {e}"
+            connection.send((result, recycle))
+
+
+class SandboxWorker:
+    def __init__(self, limits: ExecutionLimits):
+        # Forking would copy the API's threads and event loop into the worker
+        context = multiprocessing.get_context("spawn")
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(
+            target=_run_worker,
+            args=(worker_connection, limits),
+            name="chartgpt-code-execution",
+            daemon=True,
+        )
+        self.process.start()
+        worker_connection.close()
+        self.executions = 0
+        code_execution_workers_started.inc()
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        try:
+            return self.connection.poll(timeout) and self.connection.recv() == _READY
+        except (EOFError, OSError):
+            return False
+
+    def execute(self, request: dict, timeout: float) -> Optional[Tuple[PythonExecutionResult, bool]]:
+        """Returns the result and whether to recycle the worker, or `None` if timed out."""
+        self.executions += 1
+        self.connection.send(request)
+        if not self.connection.poll(timeout):
+            return None
+        return self.connection.recv()
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+            self.process.join(timeout=1)
+        except (BrokenPipeError, OSError):
+            pass
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _cancelled_result(request: dict) -> PythonExecutionResult:
+    # The caller has stopped waiting for the result, which is discarded
+    return PythonExecutionResult(
+        description=request["docstring"], code=request["code"], error="CancelledError: The execution was cancelled"
+    )
+
+
+@dataclass
+class _Execution:
+    request: dict
+    # Worker executing the request, once it has one
+    worker: Optional[SandboxWorker] = None
+    cancelled: bool = False
+
+
+class CodeExecutionPool:
+    """
+    Executes code in warm worker processes, each driven by a thread of the pool, so that
+    executions are independent of the event loop that waits for them.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_executions: int = 100,
+        queue_size: int = 16,
+        limits: ExecutionLimits = ExecutionLimits(),
+    ):
+        self.size = size
+        self.max_executions = max_executions
+        self.queue_size = queue_size
+        self.limits = limits
+        # Idle workers, or `None` in place of a worker that failed to start
+        self._idle: queue.Queue = queue.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Threads starting workers in the background
+        self._starting: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the workers in the background, if not started already."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(self.size, thread_name_prefix="code-execution")
+        for _ in range(self.size):
+            self._replace_worker()
+
+    def stop(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Workers being started would otherwise be left in the queue, until the process exits
+        with self._lock:
+            starting, self._starting = self._starting, []
+        for thread in starting:
+            thread.join()
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is not None:
+                worker.stop()
+
+    def _start_worker(self) -> Optional[SandboxWorker]:
+        try:
+            worker = SandboxWorker(self.limits)
+        except Exception:
+            logger.exception("Failed to start code execution worker")
+            return None
+        if not worker.wait_until_ready(WORKER_START_TIMEOUT):
+            logger.error("Code execution worker failed to start")
+            worker.kill()
+            return None
+        return worker
+
+    def _replace_worker(self) -> None:
+        """Start a worker in the background, so that executions do not wait for its imports."""
+        thread = threading.Thread(
+            target=lambda: self._idle.put(self._start_worker()), name="code-execution-start", daemon=True
+        )
+        with self._lock:
+            self._starting = [thread for thread in self._starting if thread.is_alive()]
+            self._starting.append(thread)
+        thread.start()
+
+    def _cancel(self, execution: _Execution) -> None:
+        """Abort an execution that started, killing its worker if it is executing the request."""
+        with self._lock:
+            execution.cancelled = True
+            worker = execution.worker
+        if worker is not None:
+            worker.process.kill()
+
+    def _execute(self, execution: _Execution) -> PythonExecutionResult:
+        request = execution.request
+        worker = self._idle.get()
+        replace = False
+        try:
+            if worker is None or not worker.process.is_alive():
+                worker = self._start_worker()
+                if worker is None:
+                    raise RuntimeError("No code execution worker is available")
+            with self._lock:
+                if not execution.cancelled:
+                    execution.worker = worker
+            if execution.worker is None:
+                code_executions.inc(outcome="cancelled")
+                return _cancelled_result(request)
+            try:
+                response = worker.execute(request, self.limits.timeout)
+            except (EOFError, OSError):
+                replace = True
+                if execution.cancelled:
+                    code_executions.inc(outcome="cancelled")
+                    return _cancelled_result(request)
+                # E.g. killed by the operating system when out of memory
+                code_executions.inc(outcome="crashed")
+                return PythonExecutionResult(
+                    description=request["docstring"],
+                    code=request["code"],
+                    error="MemoryError: The code execution worker exited unexpectedly",
+                )
+            if response is None:
+                replace = True
+                code_executions.inc(outcome="timeout")
+                return PythonExecutionResult(
+                    description=request["docstring"],
+                    code=request["code"],
+                    error=f"TimeoutError: The code did not finish within {self.limits.timeout:g} seconds",
+                )
+            result, recycle = response
+            replace = recycle or worker.executions >= self.max_executions
+            code_executions.inc(outcome="failed" if result.error else "succeeded")
+            return result
+        finally:
+            with self._lock:
+                # A worker that was killed by the cancellation of its execution is replaced
+                replace = replace or (execution.cancelled and execution.worker is not None)
+                execution.worker = None
+            if replace and worker is not None:
+                worker.kill()
+                self._replace_worker()
+            else:
+                self._idle.put(worker)
+            with self._lock:
+                self._pending -= 1
+            code_executions_pending.dec()
+
+    @log.wrap(log.entering, log.exiting)
+    async def execute(
+        self,
+        code: str,
+        docstring: str,
+        imports=None,
+        local_variables=None,
+        config: CodeGenerationConfig = CodeGenerationConfig(),
+    ) -> PythonExecutionResult:
+        """Execute code like `execute_python_code`, in a worker process."""
+        self.start()
+        with self._lock:
+            if self._pending >= self.size + self.queue_size:
+                raise CodeExecutionBusyError("Too many code executions are waiting for a worker")
+            self._pending += 1
+        code_executions_pending.inc()
+        request = {
+            "code": code,
+            "docstring": docstring,
+            "imports": imports,
+            "local_variables": local_variables,
+            "config": config,
+        }
+        execution = _Execution(request)
+        try:
+            future = self._executor.submit(self._execute, execution)
+        except RuntimeError:
+            # The pool was stopped
+            with self._lock:
+                self._pending -= 1
+            code_executions_pending.dec()
+            raise
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                # The execution was waiting for a thread, and is removed from the queue
+                with self._lock:
+                    self._pending -= 1
+                code_executions_pending.dec()
+            else:
+                self._cancel(execution)
+            raise
+        result.local_variables = local_variables
+        return result
+
+
+code_execution_pool = CodeExecutionPool(
+    size=CODE_EXECUTION_WORKERS,
+    max_executions=CODE_EXECUTION_MAX_EXECUTIONS,
+    queue_size=CODE_EXECUTION_QUEUE_SIZE,
+    limits=ExecutionLimits(
+        cpu_seconds=CODE_EXECUTION_CPU_SECONDS,
+        timeout=CODE_EXECUTION_TIMEOUT,
+        memory=CODE_EXECUTION_MEMORY_LIMIT,
+    ),
+)
@@ -0,0 +1,313 @@
+"""
+Catalog of data source schema summaries used in LLM prompts, persisted to a shared store
+and refreshed in the background, so that requests do not wait for schema discovery.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from google.cloud import bigquery
+
+from api import config
+from api.connectors.bigquery import bigquery_client
+from api.log import logger
+from api.metrics import registry
+from api.schema_pruning import SchemaIndex
+from api.types import TableSummary
+from api.utils import (format_tables_summary, get_table_summaries, get_tables_last_modified,
+                       parse_data_source_url)
+
+schema_catalog_requests = registry.counter(
+    "chartgpt_schema_catalog_requests_total",
+    "Schema summary requests, by result: fresh, stale, or miss.",
+)
+schema_catalog_refreshes = registry.counter(
+    "chartgpt_schema_catalog_refreshes_total", "Schema summary refreshes, by status."
+)
+
+
+@dataclass
+class SchemaCatalogEntry:
+    data_source_url: str
+    tables: List[TableSummary] = field(default_factory=list)
+    refreshed_at: float = 0.0
+
+    @cached_property
+    def summary(self) -> str:
+        return format_tables_summary(self.tables)
+
+    @cached_property
+    def index(self) -> SchemaIndex:
+        return SchemaIndex(self.tables)
+
+    def to_dict(self) -> dict:
+        return {
+            "data_source_url": self.data_source_url,
+            "tables": [asdict(table) for table in self.tables],
+            "refreshed_at": self.refreshed_at,
+        }
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> "SchemaCatalogEntry":
+        return cls(
+            data_source_url=obj["data_source_url"],
+            tables=[TableSummary.from_dict(table) for table in obj.get("tables", [])],
+            refreshed_at=obj.get("refreshed_at", 0.0),
+        )
+
+
+class SchemaCatalogStore:
+    """Stores schema catalog entries by data source URL."""
+
+    async def get(self, data_source_url: str) -> Optional[SchemaCatalogEntry]:
+        raise NotImplementedError
+
+    async def set(self, entry: SchemaCatalogEntry) -> None:
+        raise NotImplementedError
+
+    async def list(self) -> List[SchemaCatalogEntry]:
+        raise NotImplementedError
+
+
+class MemorySchemaCatalogStore(SchemaCatalogStore):
+    """In-process store, local to each API worker."""
+
+    def __init__(self):
+        self._entries: Dict[str, dict] = {}
+
+    async def get(self, data_source_url: str) -> Optional[SchemaCatalogEntry]:
+        obj = self._entries.get(data_source_url)
+        return SchemaCatalogEntry.from_dict(obj) if obj else None
+
+    async def set(self, entry: SchemaCatalogEntry) -> None:
+        self._entries[entry.data_source_url] = entry.to_dict()
+
+    async def list(self) -> List[SchemaCatalogEntry]:
+        return [SchemaCatalogEntry.from_dict(obj) for obj in self._entries.values()]
+
+
+class MongoSchemaCatalogStore(SchemaCatalogStore):
+    """Store in a MongoDB collection, shared by all API workers and instances."""
+
+    def __init__(self, mongodb_url: str, database: str = "api", collection: str = "schema_catalog"):
+        self.mongodb_url = mongodb_url
+        self.database = database
+        self.collection_name = collection
+        self._collection = None
+
+    @property
+    def collection(self):
+        # Created on first use, so that the client is bound to the running event loop
+        if self._collection is None:
+            import motor.motor_asyncio
+
+            client = motor.motor_asyncio.AsyncIOMotorClient(self.mongodb_url)
+            self._collection = client[self.database][self.collection_name]
+        return self._collection
+
+    async def get(self, data_source_url: str) -> Optional[SchemaCatalogEntry]:
+        obj = await self.collection.find_one({"_id": data_source_url})
+        return SchemaCatalogEntry.from_dict(obj) if obj else None
+
+    async def set(self, entry: SchemaCatalogEntry) -> None:
+        await self.collection.replace_one(
+            {"_id": entry.data_source_url},
+            {"_id": entry.data_source_url, **entry.to_dict()},
+            upsert=True,
+        )
+
+    async def list(self) -> List[SchemaCatalogEntry]:
+        return [SchemaCatalogEntry.from_dict(obj) async for obj in self.collection.find({})]
+
+
+def create_schema_catalog_store(backend: str, mongodb_url: Optional[str] = None) -> SchemaCatalogStore:
+    """Create a schema catalog store by name: "memory" or "mongo"."""
+    if backend == "memory":
+        return MemorySchemaCatalogStore()
+    elif backend == "mongo":
+        return MongoSchemaCatalogStore(mongodb_url)
+    else:
+        raise ValueError(f"Invalid schema catalog backend: {backend}")
+
+
+class SchemaCatalog:
+    """
+    Serves the schema summaries of data sources using stale-while-revalidate.
+
+    Summaries are served from memory, or from the shared store, and refreshed in the
+    background when they are older than `refresh_interval` seconds. The background task
+    also checks every `check_interval` seconds whether any of the tables were modified.
+    Only the first request for a data source not in the store waits for its tables to be
+    fetched, which is done concurrently. Concurrent refreshes of a data source are deduplicated.
+    """
+
+    def __init__(
+        self,
+        client: bigquery.Client,
+        store: SchemaCatalogStore,
+        refresh_interval: float = 24 * 60 * 60,
+        check_interval: float = 5 * 60,
+        max_workers: int = 8,
+        table_timeout: Optional[float] = None,
+    ):
+        self.client = client
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.max_workers = max_workers
+        self.table_timeout = table_timeout
+        self._entries: Dict[str, SchemaCatalogEntry] = {}
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_tables_summary(self, data_source_url: str = "") -> str:
+        entry = await self.get_entry(data_source_url)
+        return entry.summary
+
+    async def get_entry(self, data_source_url: str = "") -> SchemaCatalogEntry:
+        entry = self._entries.get(data_source_url)
+        if entry is None:
+            entry = await self._load(data_source_url)
+        if entry is None:
+            schema_catalog_requests.inc(result="miss")
+            entry = await self.refresh(data_source_url)
+        elif time.time() - entry.refreshed_at > self.refresh_interval:
+            schema_catalog_requests.inc(result="stale")
+            self.refresh_in_background(data_source_url)
+        else:
+            schema_catalog_requests.inc(result="fresh")
+        return entry
+
+    async def _load(self, data_source_url: str) -> Optional[SchemaCatalogEntry]:
+        try:
+            entry = await self.store.get(data_source_url)
+        except Exception:
+            logger.exception("Failed to load schema summary of data source %s", data_source_url)
+            return None
+        if entry is not None:
+            self._entries[data_source_url] = entry
+        return entry
+
+    def refresh(self, data_source_url: str) -> "asyncio.Future[SchemaCatalogEntry]":
+        """Fetch the summaries of the tables in a data source, and store them."""
+        task = self._refreshes.get(data_source_url)
+        if task is None:
+            task = asyncio.create_task(self._refresh(data_source_url))
+            self._refreshes[data_source_url] = task
+            task.add_done_callback(lambda _: self._refreshes.pop(data_source_url, None))
+        # Shielded, so that a cancelled request does not cancel a refresh shared with others
+        return asyncio.shield(task)
+
+    def refresh_in_background(self, data_source_url: str) -> None:
+        def log_exception(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception():
+                logger.error(
+                    "Failed to refresh schema summary of data source %s: %s",
+                    data_source_url,
+                    future.exception(),
+                )
+
+        self.refresh(data_source_url).add_done_callback(log_exception)
+
+    async def _refresh(self, data_source_url: str) -> SchemaCatalogEntry:
+        start_time = time.perf_counter()
+        try:
+            tables = await asyncio.to_thread(
+                get_table_summaries,
+                self.client,
+                data_source_url,
+                max_workers=self.max_workers,
+                timeout=self.table_timeout,
+            )
+        except Exception:
+            schema_catalog_refreshes.inc(status="failed")
+            raise
+        schema_catalog_refreshes.inc(status="succeeded")
+        logger.info(
+            "Refreshed schema summary of data source %s with %d tables in %.2f seconds",
+            data_source_url,
+            len(tables),
+            time.perf_counter() - start_time,
+        )
+
+        entry = SchemaCatalogEntry(data_source_url, tables=tables, refreshed_at=time.time())
+        self._entries[data_source_url] = entry
+        try:
+            await self.store.set(entry)
+        except Exception:
+            logger.exception("Failed to store schema summary of data source %s", data_source_url)
+        return entry
+
+    def _is_modified(self, entry: SchemaCatalogEntry) -> bool:
+        """Whether tables of an entry's data source were modified, added, or removed since it was refreshed."""
+        _data_source, project, dataset_id, table_id = parse_data_source_url(entry.data_source_url)
+        project = project or self.client.project
+        # Table ID to last modified time, by project and dataset ID
+        tables_by_dataset = defaultdict(dict)
+        for table in entry.tables:
+            tables_by_dataset[(table.project, table.dataset_id)][table.table_id] = table.modified
+        if dataset_id:
+            datasets = [(project, dataset_id)]
+        else:
+            # Including the datasets added since the entry was refreshed
+            datasets = [(project, dataset.dataset_id) for dataset in self.client.list_datasets(project)]
+            if not set(tables_by_dataset) <= set(datasets):
+                return True
+        for project, dataset_id in datasets:
+            last_modified = get_tables_last_modified(self.client, project, dataset_id)
+            if table_id:
+                last_modified = {key: value for key, value in last_modified.items() if key == table_id}
+            if last_modified != tables_by_dataset.get((project, dataset_id), {}):
+                return True
+        return False
+
+    async def check(self) -> None:
+        """Refresh the summaries that are older than the refresh interval, or whose tables were modified."""
+        # Include the entries stored by other API workers and instances, and the newer
+        # summaries they refreshed, rather than refreshing them again
+        for entry in await self.store.list():
+            current = self._entries.get(entry.data_source_url)
+            if current is None or entry.refreshed_at > current.refreshed_at:
+                self._entries[entry.data_source_url] = entry
+
+        for data_source_url, entry in list(self._entries.items()):
+            try:
+                if (
+                    time.time() - entry.refreshed_at > self.refresh_interval
+                    or await asyncio.to_thread(self._is_modified, entry)
+                ):
+                    await self.refresh(data_source_url)
+            except Exception:
+                logger.exception("Failed to refresh schema summary of data source %s", data_source_url)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Failed to check schema summaries")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+schema_catalog = SchemaCatalog(
+    bigquery_client,
+    create_schema_catalog_store(config.SCHEMA_CATALOG_BACKEND, mongodb_url=config.MONGODB_URL),
+    refresh_interval=config.SCHEMA_CATALOG_REFRESH_INTERVAL,
+    check_interval=config.SCHEMA_CATALOG_CHECK_INTERVAL,
+    max_workers=config.SCHEMA_CATALOG_MAX_WORKERS,
+    table_timeout=config.SCHEMA_CATALOG_TABLE_TIMEOUT,
+)
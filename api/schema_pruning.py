@@ -0,0 +1,175 @@
+"""
+Selects the tables and columns of a data source's schema that are relevant to a question,
+so that SQL generation prompts for wide data sources stay within a token budget.
+"""
+
+import dataclasses
+import functools
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from api.config import SQL_INITIAL_GPT_MODEL
+from api.log import logger
+from api.types import TableSummary
+from api.utils import format_tables_summary
+
+# Columns that are kept in pruned tables, because queries usually filter by date
+TIME_FIELD_TYPES = {"DATE", "DATETIME", "TIMESTAMP"}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # E.g. the encoding could not be downloaded
+        logger.warning("Tokenizer for model %s is unavailable, estimating token counts", model)
+        return None
+
+
+def count_tokens(text: str, model: str = SQL_INITIAL_GPT_MODEL) -> int:
+    """Count the LLM tokens of a text, or estimate them if the tokenizer is unavailable."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Roughly 4 characters per token for English text and code
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text, including snake_case and camelCase identifiers, into lowercase words."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    words = re.findall(r"[a-z]+|\d+", text.lower())
+    return [stem(word) for word in words]
+
+
+def stem(word: str) -> str:
+    """Naive plural stemming, e.g. so that "visits" matches the "visit" column."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+class SchemaIndex:
+    """
+    TF-IDF index of the tables and columns of a data source.
+
+    Each column is indexed with its table's name, its own name and description, and its
+    sample values. The index is built once per schema, and only the question is vectorized
+    when selecting the relevant tables and columns.
+    """
+
+    def __init__(self, tables: List[TableSummary]):
+        self.tables = tables
+        # Including the dataset heading, so that the budget is not exceeded
+        self.table_tokens = [count_tokens(format_tables_summary([table])) for table in tables]
+        self.empty_table_tokens = [
+            count_tokens(format_tables_summary([dataclasses.replace(table, fields=[])]))
+            for table in tables
+        ]
+        self.total_tokens = count_tokens(format_tables_summary(tables))
+
+        documents = []
+        # Table index, and the tokens added to the table's summary, of each column
+        column_tables = []
+        column_tokens = []
+        for table_index, table in enumerate(tables):
+            table_name = f"{table.dataset_id} {table.table_id}"
+            for field in table.fields:
+                samples = " ".join(table.samples.get(field.name, []))
+                documents.append(
+                    f"{table_name} {field.name} {field.name} {field.description or ''} {samples}"
+                )
+                column_tables.append(table_index)
+                column_tokens.append(
+                    count_tokens(format_tables_summary([dataclasses.replace(table, fields=[field])]))
+                    - self.empty_table_tokens[table_index]
+                )
+        self.column_tables = np.array(column_tables, dtype=np.int64)
+        self.column_tokens = np.array(column_tokens, dtype=np.int64)
+
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        if documents:
+            self.vectorizer = TfidfVectorizer(analyzer=tokenize, sublinear_tf=True)
+            try:
+                self.column_matrix = self.vectorizer.fit_transform(documents)
+            except ValueError:
+                # No words in any of the documents
+                self.vectorizer = None
+
+    def score(self, question: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the relevance of each table and each column to the question."""
+        if self.vectorizer is None:
+            return np.zeros(len(self.tables)), np.zeros(len(self.column_tables))
+        question_vector = self.vectorizer.transform([question])
+        # Rows are L2-normalized, so the dot product is the cosine similarity
+        column_scores = (self.column_matrix @ question_vector.T).toarray().ravel()
+        table_scores = np.zeros(len(self.tables))
+        np.maximum.at(table_scores, self.column_tables, column_scores)
+        return table_scores, column_scores
+
+    def get_tables_summary(self, question: str, top_k: int = 5, max_tokens: int = 3000) -> str:
+        """
+        Returns the schema summary of the `top_k` tables most relevant to the question,
+        within `max_tokens`, or the full schema summary if it fits within `max_tokens`
+        or no table is relevant.
+
+        Tables are included whole in order of relevance while they fit. A table that
+        does not fit is included with its date columns and its most relevant columns
+        that fit in the remaining budget.
+        """
+        if self.total_tokens <= max_tokens:
+            return format_tables_summary(self.tables)
+
+        table_scores, column_scores = self.score(question)
+        ranked_tables = [
+            table_index
+            for table_index in np.argsort(-table_scores, kind="stable")[:top_k]
+            if table_scores[table_index] > 0
+        ]
+
+        selected = {}
+        tokens = 0
+        for table_index in ranked_tables:
+            table = self.tables[table_index]
+            if tokens + self.table_tokens[table_index] <= max_tokens:
+                selected[table_index] = table
+                tokens += self.table_tokens[table_index]
+                continue
+
+            column_indices = np.flatnonzero(self.column_tables == table_index)
+            # Date columns first, then by relevance, keeping the schema order for ties
+            column_order = sorted(
+                range(len(column_indices)),
+                key=lambda field_index: (
+                    table.fields[field_index].field_type not in TIME_FIELD_TYPES,
+                    -column_scores[column_indices[field_index]],
+                ),
+            )
+            pruned_tokens = self.empty_table_tokens[table_index]
+            field_indices = []
+            for field_index in column_order:
+                field_tokens = self.column_tokens[column_indices[field_index]]
+                if tokens + pruned_tokens + field_tokens > max_tokens:
+                    break
+                field_indices.append(field_index)
+                pruned_tokens += field_tokens
+            if field_indices:
+                selected[table_index] = dataclasses.replace(
+                    table, fields=[table.fields[field_index] for field_index in sorted(field_indices)]
+                )
+                tokens += pruned_tokens
+
+        if not selected:
+            logger.debug("No relevant tables found, using the full schema summary")
+            return format_tables_summary(self.tables)
+
+        # Keep the tables in schema order, so that tables are grouped by dataset
+        return format_tables_summary([selected[index] for index in sorted(selected)])
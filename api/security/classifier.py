@@ -0,0 +1,154 @@
+"""
+Local first-stage classifier for the NDA guard, which decides clear-cut questions on the
+CPU and escalates uncertain ones to the LLM guard.
+"""
+
+import functools
+import json
+import math
+import os
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+import toml
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline, make_union
+
+from api.config import NDA_CLASSIFIER_MAX_VERDICTS, NDA_VERDICTS_PATH
+from api.log import logger
+from api.prompts.templates import EXAMPLES_PATH, load_examples
+
+NDA_RESPONSES_PATH = "api/prompts/example_nda_responses.toml"
+
+
+def load_nda_responses(path: str = NDA_RESPONSES_PATH) -> List[Tuple[str, bool]]:
+    return [(item["query"], bool(item["response"])) for item in toml.load(path)["nda_responses"]]
+
+
+def load_logged_verdicts(
+    path: str = NDA_VERDICTS_PATH, max_verdicts: int = NDA_CLASSIFIER_MAX_VERDICTS
+) -> List[Tuple[str, bool]]:
+    """Load the most recent verdicts of the LLM guard, logged as JSON lines."""
+    if not path or not os.path.exists(path):
+        return []
+    verdicts = deque(maxlen=max_verdicts)
+    with open(path) as file:
+        for line in file:
+            try:
+                item = json.loads(line)
+                verdicts.append((item["question"], bool(item["nda_broken"])))
+            except (ValueError, KeyError):
+                # E.g. a line partially written by another worker
+                continue
+    return list(verdicts)
+
+
+def log_verdict(question: str, nda_broken: bool, path: str = NDA_VERDICTS_PATH) -> None:
+    """Log a verdict of the LLM guard, to train the classifier on."""
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as file:
+            file.write(json.dumps({"question": question, "nda_broken": nda_broken}) + "\n")
+    except OSError:
+        logger.exception("Failed to log NDA guard verdict")
+
+
+def load_training_data(
+    nda_responses_path: str = NDA_RESPONSES_PATH,
+    examples_path: str = EXAMPLES_PATH,
+    verdicts_path: str = NDA_VERDICTS_PATH,
+    max_verdicts: int = NDA_CLASSIFIER_MAX_VERDICTS,
+) -> List[Tuple[str, bool]]:
+    """
+    Labelled questions from the NDA guard's few-shot examples, the SQL generation examples,
+    which are all benign, and the logged verdicts of the LLM guard, which take precedence.
+    """
+    data = {example.query: False for example in load_examples(examples_path)}
+    data.update(load_nda_responses(nda_responses_path))
+    data.update(load_logged_verdicts(verdicts_path, max_verdicts))
+    return list(data.items())
+
+
+class NDAClassifier:
+    """
+    Logistic regression over word and character n-grams of a question, predicting the
+    probability that the question breaks the NDA.
+
+    Questions are only classified if the prediction's confidence is at least `threshold`,
+    otherwise they are left to the LLM guard. After fitting, predictions are computed from
+    the weight of each n-gram, without the overhead of scikit-learn's transformers.
+    """
+
+    def __init__(self, threshold: float = 0.9):
+        self.threshold = threshold
+        self.pipeline = make_pipeline(
+            make_union(
+                TfidfVectorizer(analyzer="word", ngram_range=(1, 2), sublinear_tf=True),
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True),
+            ),
+            LogisticRegression(class_weight="balanced", C=10.0, max_iter=1000),
+        )
+        self.fitted = False
+        # Analyzer, and IDF and coefficient of each n-gram, of each vectorizer
+        self._vectorizers: List[Tuple[object, Dict[str, Tuple[float, float]]]] = []
+        self._intercept = 0.0
+
+    def fit(self, questions: List[str], labels: List[bool]) -> "NDAClassifier":
+        if len(set(labels)) < 2:
+            # Both verdicts are needed to fit, so every question is left to the LLM guard
+            logger.warning("NDA classifier needs both verdicts to fit, escalating all questions")
+            return self
+        self.pipeline.fit(questions, labels)
+
+        union, model = self.pipeline.steps[0][1], self.pipeline.steps[1][1]
+        # The coefficients are of the "broken" class, which is `True`, the last class
+        coefficients = model.coef_[0]
+        self._intercept = float(model.intercept_[0])
+        self._vectorizers = []
+        offset = 0
+        for _, vectorizer in union.transformer_list:
+            weights = {
+                term: (float(vectorizer.idf_[index]), float(coefficients[offset + index]))
+                for term, index in vectorizer.vocabulary_.items()
+            }
+            self._vectorizers.append((vectorizer.build_analyzer(), weights))
+            offset += len(vectorizer.vocabulary_)
+        self.fitted = True
+        return self
+
+    def predict_proba(self, question: str) -> Optional[float]:
+        """Returns the probability that the question breaks the NDA, or `None` if not fitted."""
+        if not self.fitted:
+            return None
+        score = self._intercept
+        for analyze, weights in self._vectorizers:
+            # Sublinear TF-IDF of the known n-grams, normalized to unit length
+            values = [
+                ((1 + math.log(count)) * weights[term][0], weights[term][1])
+                for term, count in Counter(analyze(question)).items()
+                if term in weights
+            ]
+            norm = math.sqrt(sum(value * value for value, _ in values)) or 1.0
+            score += sum(value * coefficient for value, coefficient in values) / norm
+        return 1 / (1 + math.exp(-score))
+
+    def classify(self, question: str) -> Optional[bool]:
+        """Returns whether the question breaks the NDA, or `None` if uncertain."""
+        probability = self.predict_proba(question)
+        if probability is None:
+            return None
+        if probability >= self.threshold:
+            return True
+        if probability <= 1 - self.threshold:
+            return False
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_nda_classifier(threshold: float) -> NDAClassifier:
+    """Fit the classifier on first use, in each API worker, which `load_nda_classifier` does at startup."""
+    questions, labels = zip(*load_training_data())
+    return NDAClassifier(threshold=threshold).fit(list(questions), list(labels))
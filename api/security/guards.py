@@ -1,10 +1,34 @@
 # flake8: noqa
+import asyncio
 import inspect
-from typing import List
+import time
+from typing import List, Optional
 import toml
+from api.caching import NDAVerdictCache
 from api.chartgpt import openai_chat_completion, openai_chat_completion_sync
+from api.config import (NDA_CLASSIFIER_MODE, NDA_CLASSIFIER_THRESHOLD,
+                        NDA_VERDICT_CACHE_MAX_SIZE, NDA_VERDICT_CACHE_TTL)
 from api.types import Role
 from api.log import logger
+from api.metrics import registry
+from api.security.classifier import get_nda_classifier, log_verdict
+
+nda_guard_checks = registry.counter(
+    "chartgpt_nda_guard_checks_total",
+    "NDA guard checks, by stage: classifier or llm, and verdict: broken, not_broken, or failed.",
+)
+nda_classifier_predictions = registry.counter(
+    "chartgpt_nda_classifier_predictions_total",
+    "NDA classifier predictions, by verdict: broken, not_broken, or uncertain.",
+)
+nda_classifier_disagreements = registry.counter(
+    "chartgpt_nda_classifier_disagreements_total",
+    "Confident NDA classifier predictions that the LLM guard disagreed with.",
+)
+nda_guard_seconds = registry.counter(
+    "chartgpt_nda_guard_seconds_total", "Time spent waiting for NDA guard LLM completions, in seconds."
+)
+nda_verdict_cache = NDAVerdictCache(max_size=NDA_VERDICT_CACHE_MAX_SIZE, ttl=NDA_VERDICT_CACHE_TTL)
 
 
 SYSTEM_PROMPT = """
@@ -56,8 +80,65 @@ def get_nda_prompt_messages(question: str) -> List[str]:
     ]
 
 
+def parse_nda_response(response) -> bool:
+    return response["choices"][0]["message"]["content"].lower() == "true"
+
+
+def format_verdict(nda_broken: Optional[bool]) -> str:
+    return {True: "broken", False: "not_broken", None: "uncertain"}[nda_broken]
+
+
+# Whether the classifier was fitted, after which it classifies questions on the event loop
+nda_classifier_loaded = False
+
+
+async def load_nda_classifier() -> None:
+    """Fit the classifier at startup, off the event loop, so that requests do not wait for it."""
+    global nda_classifier_loaded
+    if NDA_CLASSIFIER_MODE != "off":
+        await asyncio.to_thread(get_nda_classifier, NDA_CLASSIFIER_THRESHOLD)
+    nda_classifier_loaded = True
+
+
+def classify_nda_question(question: str) -> Optional[bool]:
+    """Returns the local classifier's verdict, or `None` to escalate to the LLM guard."""
+    if NDA_CLASSIFIER_MODE == "off":
+        return None
+    try:
+        nda_broken = get_nda_classifier(NDA_CLASSIFIER_THRESHOLD).classify(question)
+    except Exception:
+        logger.exception("Failed to classify question locally, escalating to the LLM guard")
+        return None
+    nda_classifier_predictions.inc(verdict=format_verdict(nda_broken))
+    return nda_broken
+
+
+def record_nda_verdict(
+    question: str, nda_broken: bool, start_time: float, local_verdict: Optional[bool]
+) -> None:
+    nda_guard_seconds.inc(time.perf_counter() - start_time)
+    nda_guard_checks.inc(stage="llm", verdict=format_verdict(nda_broken))
+    nda_verdict_cache.set(question, nda_broken)
+    if local_verdict is not None and local_verdict != nda_broken:
+        nda_classifier_disagreements.inc()
+        logger.warning(
+            "NDA classifier verdict %s disagrees with LLM guard verdict %s for question: %s",
+            local_verdict,
+            nda_broken,
+            question,
+        )
+
+
 def is_nda_broken_sync(question) -> bool:
     """Check if the NDA is broken for a given question."""
+    nda_broken = nda_verdict_cache.get(question)
+    if nda_broken is not None:
+        return nda_broken
+    local_verdict = classify_nda_question(question)
+    if local_verdict is not None and NDA_CLASSIFIER_MODE == "enabled":
+        nda_guard_checks.inc(stage="classifier", verdict=format_verdict(local_verdict))
+        return local_verdict
+    start_time = time.perf_counter()
     try:
         messages = get_nda_prompt_messages(question=question)
         response = openai_chat_completion_sync(
@@ -65,16 +146,32 @@ def is_nda_broken_sync(question) -> bool:
             messages,
             temperature=0,
         )
-        nda_broken = response["choices"][0]["message"]["content"].lower() == "true"
+        nda_broken = parse_nda_response(response)
+        record_nda_verdict(question, nda_broken, start_time, local_verdict)
+        log_verdict(question, nda_broken)
         return nda_broken
     except: # pylint: disable=bare-except
-        # Fail safe to prevent NDA from being broken
+        # Fail safe to prevent NDA from being broken, without caching the verdict
+        nda_guard_checks.inc(stage="llm", verdict="failed")
         logger.exception("Failed to check if NDA is broken, assuming it is broken")
         return True
 
 
 async def is_nda_broken(question) -> bool:
     """Check if the NDA is broken for a given question."""
+    nda_broken = nda_verdict_cache.get(question)
+    if nda_broken is not None:
+        return nda_broken
+    # In "shadow" mode, the classifier's verdict is only compared with the LLM guard's
+    if nda_classifier_loaded:
+        local_verdict = classify_nda_question(question)
+    else:
+        # Fitted on first use otherwise, which would block the event loop
+        local_verdict = await asyncio.to_thread(classify_nda_question, question)
+    if local_verdict is not None and NDA_CLASSIFIER_MODE == "enabled":
+        nda_guard_checks.inc(stage="classifier", verdict=format_verdict(local_verdict))
+        return local_verdict
+    start_time = time.perf_counter()
     try:
         messages = get_nda_prompt_messages(question=question)
         response = await openai_chat_completion(
@@ -82,9 +179,15 @@ async def is_nda_broken(question) -> bool:
             messages,
             temperature=0,
         )
-        nda_broken = response["choices"][0]["message"]["content"].lower() == "true"
+        nda_broken = parse_nda_response(response)
+        record_nda_verdict(question, nda_broken, start_time, local_verdict)
+        # Logged in the background, without the guard waiting for the file
+        asyncio.get_running_loop().run_in_executor(None, log_verdict, question, nda_broken)
         return nda_broken
+    except asyncio.CancelledError:
+        raise
     except: # pylint: disable=bare-except
-        # Fail safe to prevent NDA from being broken
+        # Fail safe to prevent NDA from being broken, without caching the verdict
+        nda_guard_checks.inc(stage="llm", verdict="failed")
         logger.exception("Failed to check if NDA is broken, assuming it is broken")
         return True
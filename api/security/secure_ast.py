@@ -206,8 +206,8 @@ def analyze_ast(node, max_depth=float("inf"), current_depth=0):
 
 
 def assert_secure_code(code, mode="exec", max_depth=float("inf")):
-    """Assert that the code is secure. If not, raise an exception."""
-    tree = ast.parse(code, mode=mode)
+    """Assert that the code, or its syntax tree, is secure. If not, raise an exception."""
+    tree = code if isinstance(code, ast.AST) else ast.parse(code, mode=mode)
     analyze_ast(tree, max_depth)
 
 
@@ -0,0 +1,80 @@
+"""
+DataFrames shared with code execution workers without copying them for each execution.
+
+The results of a request's SQL query are written once, as an Arrow IPC file in shared
+memory, and memory-mapped read-only by the workers, which load the numeric and temporal
+columns without copying them. The workers enable pandas' copy-on-write mode, so that the
+generated code gets a lazy copy of the DataFrame, which is only copied when modified.
+"""
+
+import os
+import tempfile
+import uuid
+from typing import Optional
+
+# Registers the dtypes of BigQuery's DATE and TIME columns, to load them from Arrow
+import db_dtypes  # noqa: F401
+import pandas as pd
+import pyarrow as pa
+
+from api.config import CODE_EXECUTION_SHARED_DIRECTORY
+from api.log import logger
+
+
+def get_shared_directory() -> str:
+    if CODE_EXECUTION_SHARED_DIRECTORY:
+        return CODE_EXECUTION_SHARED_DIRECTORY
+    # Backed by memory on Linux
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedDataFrame:
+    """Handle to a DataFrame written to a shared Arrow IPC file, pickled as its path."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+
+    @classmethod
+    def create(cls, df: pd.DataFrame, directory: Optional[str] = None) -> "SharedDataFrame":
+        # Range indexes are stored as metadata, other indexes as columns
+        table = pa.Table.from_pandas(df)
+        if any(pa.types.is_nested(field.type) for field in table.schema):
+            # Lists and structs would be loaded as NumPy arrays and dictionaries of them
+            raise TypeError("DataFrames with nested columns are not shared")
+        path = os.path.join(directory or get_shared_directory(), f"chartgpt-{uuid.uuid4().hex}.arrow")
+        try:
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        except BaseException:
+            # E.g. the shared memory is full, which a partial file would only fill further
+            cls(path, 0).unlink()
+            raise
+        return cls(path, os.path.getsize(path))
+
+    def load(self) -> pd.DataFrame:
+        """Memory-map the DataFrame, whose columns are read-only views of the file where possible."""
+        with pa.memory_map(self.path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        # Not consolidating columns of the same dtype, which would copy them
+        return table.to_pandas(split_blocks=True)
+
+    def unlink(self) -> None:
+        """Remove the file, which stays mapped by the workers that loaded it until they release it."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self) -> str:
+        return f"SharedDataFrame(path={self.path!r}, size={self.size})"
+
+
+def share_dataframe(df: pd.DataFrame) -> Optional[SharedDataFrame]:
+    """Share a DataFrame with the workers, or return `None` if it cannot be shared, to send it instead."""
+    try:
+        return SharedDataFrame.create(df)
+    except (pa.ArrowException, TypeError, ValueError, OSError) as e:
+        logger.warning("DataFrame cannot be shared with code execution workers: %s", e)
+        return None
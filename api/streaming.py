@@ -0,0 +1,402 @@
+"""
+Streaming of the SQL queries and Python code generated by the LLM, while they are generated.
+
+The arguments of a streamed function call are decoded incrementally, and the new fragment
+of each of their string values, e.g. the SQL query, is sent to the output delta handler of
+the current request, which sends it as a server-sent event. The handler is held in a
+context variable, so that it is shared by the tasks started for the request.
+
+Each fragment has the offset of its value at which it starts, so that a client assembles a
+value by replacing everything from the offset with the fragment, which also restarts the
+value when a completion is retried.
+
+The responses of a stream are sent as events in one of two protocols, negotiated by the
+request: "snapshot", where each event is a complete `Response`, and "delta", where the first
+event is a complete `Response`, the envelope of the stream, and the others only carry the
+fields that differ from it, with a sequence number, so that a client reassembles each
+`Response` without the request's messages being sent with every event.
+
+The events of a stream are sent through a bounded channel, whose producers wait while it is
+full, so that a slow client slows down its request's work rather than buffering its events
+without bound. Idle streams are sent keep-alive events by a single timer wheel shared by
+all streams, rather than by a task per stream.
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from api.config import LLM_STREAMING_ENABLED, STREAM_KEEP_ALIVE_SECONDS, STREAM_QUEUE_SIZE
+from api.models import Response
+
+SNAPSHOT_PROTOCOL = "snapshot"
+DELTA_PROTOCOL = "delta"
+
+
+@dataclass
+class OutputDelta:
+    # Type of the output being generated: "sql" or "code"
+    type: str
+    # Index of the attempt that the output is generated for, 0 for the initial output
+    attempt: int
+    # Name of the function call's argument, e.g. "query" or "code"
+    field: str
+    # Offset of the argument's value at which the fragment starts
+    offset: int
+    value: str
+
+
+output_delta_handler: ContextVar[Optional[Callable[[OutputDelta], Awaitable[None]]]] = ContextVar(
+    "output_delta_handler", default=None
+)
+
+
+class FunctionArgumentsDecoder:
+    """
+    Incremental decoder of the top-level string values of a JSON object streamed in chunks,
+    such as the arguments of a function call, which returns the new fragments of the values.
+
+    With `replace_triple_quotes`, `\"\"\"` is replaced with `"` before decoding, like the arguments
+    of code generation are before they are parsed.
+    """
+
+    def __init__(self, replace_triple_quotes: bool = False):
+        self.replace_triple_quotes = replace_triple_quotes
+        # Values decoded so far, by name
+        self.values: Dict[str, str] = {}
+        # Trailing quotes, held until the end of their run is known
+        self._quotes = ""
+        self._depth = 0
+        self._in_string = False
+        self._expect_key = True
+        self._key_chars: Optional[List[str]] = None
+        self._key: Optional[str] = None
+        # Name of the value being decoded, if any
+        self._field: Optional[str] = None
+        self._escape: Optional[str] = None
+        self._high_surrogate = ""
+
+    def feed(self, text: str) -> List[Tuple[str, int, str]]:
+        """Decode a chunk, returning the name, offset and new fragment of each value it continues."""
+        if self.replace_triple_quotes:
+            text = self._quotes + text
+            stripped = text.rstrip('"')
+            self._quotes = text[len(stripped):]
+            text = stripped.replace('"""', '"')
+        return self._decode(text)
+
+    def close(self) -> List[Tuple[str, int, str]]:
+        """Decode the quotes held at the end of the arguments."""
+        text, self._quotes = self._quotes, ""
+        return self._decode(text.replace('"""', '"'))
+
+    def _decode(self, text: str) -> List[Tuple[str, int, str]]:
+        fragments: Dict[str, List[str]] = {}
+        for char in text:
+            if self._in_string:
+                decoded = self._decode_string_char(char)
+                if decoded is None:
+                    self._end_string()
+                elif self._field is not None:
+                    fragments.setdefault(self._field, []).append(decoded)
+                elif self._key_chars is not None:
+                    self._key_chars.append(decoded)
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_chars = []
+                elif self._depth == 1 and self._key is not None:
+                    self._field = self._key
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and char == ":":
+                self._expect_key = False
+            elif self._depth == 1 and char == ",":
+                self._expect_key = True
+                self._key = None
+
+        deltas = []
+        for field, chars in fragments.items():
+            fragment = "".join(chars)
+            if not fragment:
+                continue
+            value = self.values.get(field, "")
+            deltas.append((field, len(value), fragment))
+            self.values[field] = value + fragment
+        return deltas
+
+    def _end_string(self) -> None:
+        self._in_string = False
+        if self._key_chars is not None:
+            self._key = "".join(self._key_chars)
+            self._key_chars = None
+        self._field = None
+
+    def _decode_string_char(self, char: str) -> Optional[str]:
+        """The decoded characters of a string's character, if any, or `None` at the end of the string."""
+        if self._escape is None:
+            if char == "\\":
+                self._escape = char
+                return ""
+            if char == '"':
+                return None
+            return char
+        self._escape += char
+        if self._escape[1] == "u" and len(self._escape) < 6:
+            return ""
+        escape, self._escape = self._escape, None
+        if escape[1] == "u" and "d800" <= escape[2:].lower() < "dc00":
+            # Characters outside of the Basic Multilingual Plane are escaped as surrogate pairs
+            self._high_surrogate = escape
+            return ""
+        escape, self._high_surrogate = self._high_surrogate + escape, ""
+        try:
+            return json.loads(f'"{escape}"')
+        except ValueError:
+            return escape
+
+
+class FunctionCallStream:
+    """Sends the fragments of the arguments of a function call to a handler, while it is generated."""
+
+    def __init__(
+        self,
+        handler: Callable[[OutputDelta], Awaitable[None]],
+        output_type: str,
+        attempt: int = 0,
+        replace_triple_quotes: bool = False,
+    ):
+        self.handler = handler
+        self.output_type = output_type
+        self.attempt = attempt
+        self.replace_triple_quotes = replace_triple_quotes
+        self.reset()
+
+    def reset(self) -> None:
+        """Start decoding the arguments again, e.g. when the completion is retried."""
+        self.decoder = FunctionArgumentsDecoder(self.replace_triple_quotes)
+
+    async def feed(self, arguments: str) -> None:
+        await self._send(self.decoder.feed(arguments))
+
+    async def close(self) -> None:
+        await self._send(self.decoder.close())
+
+    async def _send(self, fragments: List[Tuple[str, int, str]]) -> None:
+        for field, offset, value in fragments:
+            await self.handler(OutputDelta(
+                type=self.output_type, attempt=self.attempt, field=field, offset=offset, value=value
+            ))
+
+
+def stream_function_call(
+    output_type: str, attempt: int = 0, replace_triple_quotes: bool = False
+) -> Optional[FunctionCallStream]:
+    """The stream of a function call to the current request's handler, or `None` if it does not stream."""
+    handler = output_delta_handler.get()
+    if handler is None or not LLM_STREAMING_ENABLED:
+        return None
+    return FunctionCallStream(handler, output_type, attempt, replace_triple_quotes)
+
+
+class ResponseEventEncoder:
+    """Encodes the responses and output deltas of a stream as events, in the stream's protocol."""
+
+    def __init__(self, session_id: str, protocol: str = SNAPSHOT_PROTOCOL):
+        if protocol not in (SNAPSHOT_PROTOCOL, DELTA_PROTOCOL):
+            raise ValueError(f"Invalid stream protocol: {protocol}")
+        self.session_id = session_id
+        self.protocol = protocol
+        # Sequence number of the next event, in the delta protocol
+        self.seq = 0
+
+    def _next_seq(self) -> int:
+        seq, self.seq = self.seq, self.seq + 1
+        return seq
+
+    def encode_response(self, event: str, response: Response) -> str:
+        if self.protocol == SNAPSHOT_PROTOCOL:
+            data = response.to_json()
+        elif self.seq == 0:
+            data = json.dumps({"seq": self._next_seq(), **response.to_dict()})
+        else:
+            # Only the fields that differ from the envelope, without serializing the messages
+            delta = {"seq": self._next_seq(), "status": response.status}
+            if response.finished_at is not None:
+                delta["finished_at"] = response.finished_at
+            for name in ("attempts", "outputs", "errors"):
+                items = getattr(response, name)
+                if items:
+                    delta[name] = [item.to_dict() for item in items]
+            if response.usage is not None:
+                delta["usage"] = response.usage.to_dict()
+            data = json.dumps(delta)
+        return f"event: {event}\ndata: {data}\n\n"
+
+    def encode_output_delta(self, delta: OutputDelta) -> str:
+        """Encode a fragment of an output being generated, e.g. as a `sql_delta` event."""
+        if self.protocol == SNAPSHOT_PROTOCOL:
+            data = {"session_id": self.session_id, **asdict(delta)}
+        else:
+            data = {"seq": self._next_seq(), **asdict(delta)}
+        return f"event: {delta.type}_delta\ndata: {json.dumps(data)}\n\n"
+
+
+KEEP_ALIVE_EVENT = "event: keep-alive\ndata: {}\n\n"
+STREAM_END_EVENT = "event: stream_end\ndata: [DONE]\n\n"
+
+
+class EventChannel:
+    """
+    Bounded channel of the encoded events of a stream, from the request's work to the client.
+
+    Producers wait while the channel is full, and events are encoded when they are enqueued,
+    in order, so that their sequence numbers match the order in which they are sent. Once the
+    channel is closed, the events left are still received, and further events are dropped.
+    """
+
+    def __init__(self, encoder: ResponseEventEncoder, maxsize: int = STREAM_QUEUE_SIZE):
+        self.encoder = encoder
+        self.maxsize = maxsize
+        self.closed = False
+        # Time of the last event, to send keep-alive events when the stream is idle
+        self.last_event_time = time.monotonic()
+        self._events: Deque[str] = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        # Producers enqueue their events in the order in which they start waiting
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    async def _put(self, encode: Callable[[], str]) -> None:
+        async with self._lock:
+            while len(self._events) >= self.maxsize and not self.closed:
+                self._writable.clear()
+                await self._writable.wait()
+            if not self.closed:
+                self._append(encode())
+
+    def _append(self, event: str) -> None:
+        self._events.append(event)
+        self.last_event_time = time.monotonic()
+        self._readable.set()
+
+    async def send_response(self, event: str, response: Response) -> None:
+        await self._put(lambda: self.encoder.encode_response(event, response))
+
+    async def send_output_delta(self, delta: OutputDelta) -> None:
+        await self._put(lambda: self.encoder.encode_output_delta(delta))
+
+    def send_keep_alive(self) -> bool:
+        """Send a keep-alive event, unless events are waiting to be received, returning whether it was sent."""
+        if self.closed or self._events:
+            return False
+        self._append(KEEP_ALIVE_EVENT)
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        self._readable.set()
+        self._writable.set()
+
+    async def get(self) -> Optional[str]:
+        """Receive the next event, or `None` once the channel is closed and has no events left."""
+        while not self._events:
+            if self.closed:
+                return None
+            self._readable.clear()
+            await self._readable.wait()
+        event = self._events.popleft()
+        self._writable.set()
+        return event
+
+
+class KeepAliveWheel:
+    """
+    Timer wheel that sends keep-alive events to the channels of idle streams, from a single
+    task that runs while there are channels.
+
+    The wheel has a slot per tick of the keep-alive interval, and turns a slot per tick. Each
+    channel is held in the slot of the tick at which it is due a keep-alive event, and when
+    its slot comes up, it is sent one if it was idle for the interval, or moved to the slot
+    of the tick at which it will be.
+    """
+
+    def __init__(self, interval: float = STREAM_KEEP_ALIVE_SECONDS, slots: int = 15):
+        self.interval = interval
+        self.tick = interval / slots
+        self._slots: List[Set[EventChannel]] = [set() for _ in range(slots)]
+        # Slot of each channel
+        self._channels: Dict[EventChannel, int] = {}
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def add(self, channel: EventChannel) -> None:
+        self._schedule(channel, self.interval)
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def remove(self, channel: EventChannel) -> None:
+        self._unschedule(channel)
+        if not self._channels and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _unschedule(self, channel: EventChannel) -> None:
+        slot = self._channels.pop(channel, None)
+        if slot is not None:
+            self._slots[slot].discard(channel)
+
+    def _schedule(self, channel: EventChannel, delay: float) -> None:
+        self._unschedule(channel)
+        ticks = min(max(1, -int(-delay // self.tick)), len(self._slots))
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot].add(channel)
+        self._channels[channel] = slot
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            now = time.monotonic()
+            for channel in list(self._slots[self._cursor]):
+                idle = now - channel.last_event_time
+                if idle >= self.interval - self.tick / 2:
+                    channel.send_keep_alive()
+                    idle = 0
+                self._schedule(channel, self.interval - idle)
+
+
+keep_alive_wheel = KeepAliveWheel()
+
+
+async def iter_events(channel: EventChannel) -> AsyncIterator[str]:
+    """
+    Receive the events of a channel until it is closed, followed by the end of the stream,
+    with keep-alive events while it is idle. The channel is closed when the iteration stops,
+    e.g. when the client disconnects, so that its producers stop waiting.
+    """
+    keep_alive_wheel.add(channel)
+    try:
+        while True:
+            event = await channel.get()
+            if event is None:
+                break
+            yield event
+        yield STREAM_END_EVENT
+    finally:
+        keep_alive_wheel.remove(channel)
+        channel.close()
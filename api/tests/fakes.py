@@ -0,0 +1,277 @@
+"""Local fakes of the BigQuery and MongoDB APIs used by the tests and benchmarks."""
+
+import concurrent.futures
+import copy
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+from google.cloud import bigquery
+
+
+class FakeRowIterator:
+    def __init__(self, table: pa.Table, batch_size: int = 1000):
+        self.table = table
+        self.batch_size = batch_size
+
+    def to_dataframe(self):
+        return self.table.to_pandas()
+
+    def to_arrow_iterable(self, bqstorage_client=None):
+        if bqstorage_client is not None:
+            session = bqstorage_client.create_read_session(
+                parent="projects/test",
+                read_session=SimpleNamespace(table="test", read_options=None),
+                max_stream_count=1,
+            )
+            reader = bqstorage_client.read_rows(session.streams[0].name)
+            for page in reader.rows(session).pages:
+                yield page.to_arrow()
+        else:
+            yield from self.table.to_batches(max_chunksize=self.batch_size)
+
+
+class FakeQueryJob:
+    def __init__(
+        self,
+        query: str,
+        table: Optional[pa.Table] = None,
+        polls_until_done: int = 2,
+        error: Optional[Exception] = None,
+    ):
+        self.query = query
+        self.table = table if table is not None else pa.table({"query": [query]})
+        self.project = "test"
+        self.destination = bigquery.TableReference.from_string("test.dataset.results")
+        self.state = "RUNNING"
+        self.polls_until_done = polls_until_done
+        self.error = error
+        self.reloads = 0
+        self.errors = None
+        self.cancelled = False
+        self.total_bytes_billed = 0
+        self.total_bytes_processed = self.table.nbytes
+
+    def reload(self):
+        self.reloads += 1
+        if self.reloads >= self.polls_until_done:
+            self.state = "DONE"
+
+    def result(self):
+        if self.error:
+            raise self.error
+        return FakeRowIterator(self.table)
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+class FakeClient:
+    def __init__(self, table: Optional[pa.Table] = None, submit_seconds: float = 0, **job_kwargs):
+        self.table = table
+        self.submit_seconds = submit_seconds
+        self.job_kwargs = job_kwargs
+        self.jobs = []
+
+    def query(self, query, job_config=None):
+        time.sleep(self.submit_seconds)
+        query_job = FakeQueryJob(query, table=self.table, **self.job_kwargs)
+        self.jobs.append(query_job)
+        return query_job
+
+
+class FakeReadRowsPage:
+    def __init__(self, record_batch: pa.RecordBatch):
+        self.record_batch = record_batch
+
+    def to_arrow(self) -> pa.RecordBatch:
+        return self.record_batch
+
+
+class FakeBigQueryReadClient:
+    """Serves a table from memory like the BigQuery Storage Read API, in record batches."""
+
+    def __init__(self, table: pa.Table, batch_size: int = 10_000):
+        self.table = table
+        self.batch_size = batch_size
+        self.sessions = []
+
+    def create_read_session(self, parent, read_session, max_stream_count=0):
+        read_options = read_session.read_options
+        selected_fields = list(read_options.selected_fields) if read_options else []
+        session = SimpleNamespace(
+            table=read_session.table,
+            selected_fields=selected_fields,
+            streams=[SimpleNamespace(name=f"{read_session.table}/streams/0")],
+        )
+        self.sessions.append(session)
+        return session
+
+    def read_rows(self, name):
+        table = self.table
+        return SimpleNamespace(
+            rows=lambda session: SimpleNamespace(
+                pages=(
+                    FakeReadRowsPage(record_batch)
+                    for record_batch in (
+                        table.select(session.selected_fields)
+                        if session.selected_fields
+                        else table
+                    ).to_batches(max_chunksize=self.batch_size)
+                )
+            )
+        )
+
+
+def create_synthetic_table(num_rows: int) -> pa.Table:
+    """Create a table of typical query results: timestamps, strings, integers and floats."""
+    df = pd.DataFrame(
+        {
+            "date": pd.date_range("2020-01-01", periods=num_rows, freq="min", tz="UTC"),
+            "protocol": pd.Series(["nftfi", "arcade", "x2y2", "bend"]).sample(
+                num_rows, replace=True, random_state=0
+            ).to_numpy(),
+            "loan_count": pd.RangeIndex(num_rows).to_numpy(),
+            "principal_usd": pd.Series(range(num_rows), dtype="float64").to_numpy() * 1.5,
+        }
+    )
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+class FakeMetadataClient:
+    """Fake of the BigQuery client's dataset and table metadata APIs, with one dataset."""
+
+    def __init__(
+        self,
+        table_ids,
+        project: str = "test",
+        dataset_id: str = "dataset",
+        sample_query_seconds: Optional[Dict[str, float]] = None,
+        get_table_seconds: Optional[Dict[str, float]] = None,
+    ):
+        self.project = project
+        self.dataset_id = dataset_id
+        self.table_ids = list(table_ids)
+        self.modified = {table_id: 1_700_000_000_000 for table_id in self.table_ids}
+        self.sample_query_seconds = sample_query_seconds or {}
+        self.get_table_seconds = get_table_seconds or {}
+        self.get_table_calls = 0
+        self.sample_jobs = []
+
+    def list_datasets(self, project=None):
+        return [SimpleNamespace(dataset_id=self.dataset_id)]
+
+    def list_tables(self, dataset):
+        return [SimpleNamespace(table_id=table_id) for table_id in self.table_ids]
+
+    def get_table(self, table_ref, timeout=None):
+        self.get_table_calls += 1
+        table_id = str(table_ref).split(".")[-1]
+        seconds = self.get_table_seconds.get(table_id, 0)
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError()
+        time.sleep(seconds)
+        return SimpleNamespace(
+            table_type="TABLE",
+            modified=pd.Timestamp(self.modified[table_id], unit="ms", tz="UTC").to_pydatetime(),
+            schema=[
+                bigquery.SchemaField("id", "INTEGER", mode="REQUIRED"),
+                bigquery.SchemaField("name", "STRING", description="The name"),
+            ],
+        )
+
+    def query(self, query, job_config=None, timeout=None):
+        if "__TABLES__" in query:
+            return FakeMetadataQueryJob(
+                [
+                    {"table_id": table_id, "last_modified_time": modified}
+                    for table_id, modified in self.modified.items()
+                ]
+            )
+        seconds = next(
+            (seconds for table_id, seconds in self.sample_query_seconds.items() if f".{table_id}`" in query),
+            0,
+        )
+        job = FakeMetadataQueryJob([{"id": 1, "name": "a"}, {"id": 2, "name": "b"}], seconds=seconds)
+        self.sample_jobs.append(job)
+        return job
+
+
+class FakeMetadataQueryJob:
+    def __init__(self, rows, seconds: float = 0):
+        self.rows = rows
+        self.seconds = seconds
+        self.cancelled = False
+
+    def __iter__(self):
+        return iter(self.result())
+
+    def result(self, timeout=None):
+        if timeout is not None and self.seconds > timeout:
+            time.sleep(timeout)
+            raise concurrent.futures.TimeoutError()
+        time.sleep(self.seconds)
+        return self.rows
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+class FakeCollection:
+    """In-memory MongoDB collection, with the operators used by the API."""
+
+    def __init__(self):
+        self.documents: Dict[str, dict] = {}
+
+    @classmethod
+    def _matches(cls, document: dict, query: dict) -> bool:
+        for key, condition in query.items():
+            if key == "$or":
+                if not any(cls._matches(document, subquery) for subquery in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = document.get(key)
+                if "$lt" in condition and (value is None or not value < condition["$lt"]):
+                    return False
+                if "$in" in condition and value not in condition["$in"]:
+                    return False
+            elif document.get(key) != condition:
+                return False
+        return True
+
+    async def create_index(self, keys):
+        pass
+
+    async def insert_one(self, document: dict):
+        self.documents[document["_id"]] = copy.deepcopy(document)
+
+    async def find_one(self, query: dict) -> Optional[dict]:
+        for document in self.documents.values():
+            if self._matches(document, query):
+                return copy.deepcopy(document)
+        return None
+
+    async def count_documents(self, query: dict) -> int:
+        return sum(self._matches(document, query) for document in self.documents.values())
+
+    async def update_one(self, query: dict, update: dict):
+        document = await self.find_one_and_update(query, update)
+        matched_count = int(document is not None)
+        return SimpleNamespace(matched_count=matched_count, modified_count=matched_count)
+
+    async def find_one_and_update(self, query: dict, update: dict, sort=None, return_document=None):
+        documents = [document for document in self.documents.values() if self._matches(document, query)]
+        for key, direction in reversed(sort or []):
+            documents.sort(key=lambda document: document.get(key), reverse=direction < 0)
+        if not documents:
+            return None
+        document = documents[0]
+        document.update(copy.deepcopy(update.get("$set", {})))
+        for key, amount in update.get("$inc", {}).items():
+            document[key] = document.get(key, 0) + amount
+        return copy.deepcopy(document)
@@ -0,0 +1,141 @@
+import asyncio
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from api.connectors.bigquery import AsyncBigQueryExecutor
+from api.connectors.bigquery_storage import arrow_table_to_dataframe
+from api.tests.fakes import FakeBigQueryReadClient, FakeClient, create_synthetic_table
+
+
+def create_executor(client, **kwargs):
+    return AsyncBigQueryExecutor(
+        client,
+        poll_initial_delay=0.001,
+        poll_max_delay=0.01,
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_execute_polls_until_done():
+    client = FakeClient(polls_until_done=3)
+    executor = create_executor(client)
+    query_job, df = await executor.execute("SELECT 1")
+    assert query_job.state == "DONE"
+    assert query_job.reloads == 3
+    assert df["query"].tolist() == ["SELECT 1"]
+
+
+@pytest.mark.asyncio
+async def test_execute_raises_job_error():
+    client = FakeClient(error=ValueError("Syntax error"))
+    executor = create_executor(client)
+    with pytest.raises(ValueError, match="Syntax error"):
+        await executor.execute("SELECT")
+    assert not executor._key_semaphores
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limited_per_key():
+    client = FakeClient(polls_until_done=5)
+    executor = create_executor(client, max_concurrent_jobs_per_key=1)
+    running = 0
+    max_running = 0
+    original_wait_for_job = executor._wait_for_job
+
+    async def wait_for_job(query_job):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await original_wait_for_job(query_job)
+        running -= 1
+
+    executor._wait_for_job = wait_for_job
+    await asyncio.gather(*[executor.execute("SELECT 1", key="session") for _ in range(4)])
+    assert max_running == 1
+    assert not executor._key_semaphores
+
+    max_running = 0
+    await asyncio.gather(*[executor.execute("SELECT 1", key=str(i)) for i in range(4)])
+    assert max_running == 4
+
+
+
+@pytest.mark.asyncio
+async def test_cancelled_query_cancels_its_job():
+    client = FakeClient(polls_until_done=1000)
+    executor = create_executor(client)
+    task = asyncio.create_task(executor.execute("SELECT 1", key="session"))
+    while not client.jobs or not client.jobs[0].reloads:
+        await asyncio.sleep(0.001)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.05)
+    assert client.jobs[0].cancelled
+    assert not executor._key_semaphores
+    # Cancelled jobs do not shorten the average duration of jobs
+    assert executor.average_seconds("query") == 0
+
+
+@pytest.mark.asyncio
+async def test_job_submitted_after_cancellation_is_cancelled():
+    client = FakeClient(submit_seconds=0.1, polls_until_done=1000)
+    executor = create_executor(client)
+    task = asyncio.create_task(executor.execute("SELECT 1"))
+    await asyncio.sleep(0.02)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert not client.jobs
+    await asyncio.sleep(0.2)
+    assert client.jobs[0].cancelled and client.jobs[0].reloads == 0
+
+@pytest.mark.asyncio
+async def test_arrow_download_matches_rest_download():
+    table = create_synthetic_table(25_000)
+    client = FakeClient(table=table, polls_until_done=1)
+
+    rest_executor = create_executor(client, download_mode="rest")
+    _, rest_df = await rest_executor.execute("SELECT *")
+
+    arrow_executor = create_executor(
+        client,
+        download_mode="arrow",
+        bigquery_storage_client=FakeBigQueryReadClient(table, batch_size=1_000),
+    )
+    _, arrow_df = await arrow_executor.execute("SELECT *")
+
+    pd.testing.assert_frame_equal(
+        arrow_df, rest_df, check_dtype=False
+    )
+
+
+@pytest.mark.asyncio
+async def test_arrow_download_prunes_columns():
+    table = create_synthetic_table(100)
+    bigquery_storage_client = FakeBigQueryReadClient(table)
+    executor = create_executor(
+        FakeClient(table=table, polls_until_done=1),
+        bigquery_storage_client=bigquery_storage_client,
+    )
+    _, df = await executor.execute("SELECT *", columns=["protocol", "loan_count"])
+    assert list(df.columns) == ["protocol", "loan_count"]
+    assert bigquery_storage_client.sessions[0].selected_fields == ["protocol", "loan_count"]
+
+
+def test_arrow_table_to_dataframe_bigquery_dtypes():
+    df = arrow_table_to_dataframe(
+        pa.table(
+            {
+                "flag": pa.array([True, None]),
+                "count": pa.array([1, None], type=pa.int64()),
+                "value": pa.array([1.5, None]),
+            }
+        )
+    )
+    assert str(df["flag"].dtype) == "boolean"
+    assert str(df["count"].dtype) == "Int64"
+    assert str(df["value"].dtype) == "float64"
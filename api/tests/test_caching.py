@@ -0,0 +1,218 @@
+import datetime
+
+import db_dtypes
+import pandas as pd
+import pytest
+
+from api.caching import (
+    DiskCacheBackend,
+    LLMCompletionCache,
+    MemoryCacheBackend,
+    MemoryCompletionStore,
+    QueryResultCache,
+    SQLiteCompletionStore,
+    cache_misses,
+    completion_cache_tenant,
+)
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_least_recently_used():
+    backend = MemoryCacheBackend("test", max_size=10)
+    await backend.set("a", b"aaaa")
+    await backend.set("b", b"bbbb")
+    assert await backend.get("a") == b"aaaa"
+    await backend.set("c", b"cccc")
+    assert await backend.get("b") is None
+    assert await backend.get("a") == b"aaaa"
+    assert await backend.get("c") == b"cccc"
+    assert backend.size == 8
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_expires_entries():
+    backend = MemoryCacheBackend("test", max_size=10)
+    await backend.set("a", b"a", ttl=-1)
+    assert await backend.get("a") is None
+    assert backend.size == 0
+
+
+@pytest.mark.asyncio
+async def test_disk_cache(tmp_path):
+    # Each entry's file includes an 8 byte expiry timestamp
+    backend = DiskCacheBackend("test", max_size=30, directory=str(tmp_path))
+    await backend.set("a", b"aaaa")
+    await backend.set("b", b"bbbb", ttl=-1)
+    assert await backend.get("a") == b"aaaa"
+    assert await backend.get("b") is None
+    await backend.set("c", b"cccccccccccccccc")
+    assert await backend.get("a") is None
+    assert await backend.get("c") == b"cccccccccccccccc"
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_ignores_entries_being_written(tmp_path):
+    backend = DiskCacheBackend("test", max_size=30, directory=str(tmp_path))
+    # An entry being written by another worker
+    temporary_path = backend.directory / "entry.1234.tmp"
+    temporary_path.write_bytes(b"x" * 100)
+    await backend.set("a", b"aaaa")
+    await backend.set("b", b"bbbb")
+    assert await backend.get("a") == b"aaaa"
+    assert await backend.get("b") == b"bbbb"
+    assert temporary_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_scans_directory_only_when_it_could_be_full(tmp_path, monkeypatch):
+    backend = DiskCacheBackend("test", max_size=30, directory=str(tmp_path))
+    scans = []
+    evict = backend._evict
+    monkeypatch.setattr(backend, "_evict", lambda: scans.append(1) or evict())
+    await backend.set("a", b"a")
+    await backend.set("b", b"b")
+    assert len(scans) == 1
+    await backend.set("c", b"cccccccccccc")
+    assert len(scans) == 2
+
+
+@pytest.mark.asyncio
+async def test_query_result_cache():
+    cache = QueryResultCache(MemoryCacheBackend("test", max_size=1024 * 1024))
+    df = pd.DataFrame(
+        {
+            "count": pd.array([1, None], dtype="Int64"),
+            "date": db_dtypes.DateArray([datetime.date(2023, 1, 1), None]),
+            "protocol": ["nftfi", None],
+        }
+    )
+    await cache.set("SELECT * FROM `loans`;", "bigquery/project/dataset", "1", df)
+
+    cached_df = await cache.get(
+        "select *\nfrom `loans` -- All loans", "bigquery/project/dataset", "1"
+    )
+    pd.testing.assert_frame_equal(cached_df, df)
+
+    assert await cache.get("SELECT * FROM `loans`", "bigquery/project/dataset", "2") is None
+    assert await cache.get("SELECT * FROM `loans`", "bigquery/project/other", "1") is None
+    assert await cache.get("SELECT 1 FROM `loans`", "bigquery/project/dataset", "1") is None
+
+
+@pytest.mark.asyncio
+async def test_query_result_cache_drops_corrupt_entries():
+    backend = MemoryCacheBackend("test", max_size=1024)
+    cache = QueryResultCache(backend)
+    key = cache.key("SELECT 1", "bigquery/project/dataset", "1")
+    await backend.set(key, b"not an Arrow file")
+    misses = cache_misses.value(cache="test")
+
+    assert await cache.get("SELECT 1", "bigquery/project/dataset", "1") is None
+    assert cache_misses.value(cache="test") == misses + 1
+    assert await backend.get(key) is None
+
+
+def create_completion_request(content: str, temperature: float = 0.0) -> dict:
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": "Write a SQL query."},
+            {"role": "user", "content": content},
+        ],
+        "temperature": temperature,
+    }
+
+
+completion_response = {"choices": [{"message": {"role": "assistant", "content": "SELECT 1"}}]}
+
+
+@pytest.mark.asyncio
+async def test_llm_completion_cache():
+    cache = LLMCompletionCache(MemoryCompletionStore(max_entries=10))
+    request = create_completion_request("How many users?")
+    assert await cache.aget(request) is None
+    await cache.aset(request, completion_response, seconds=1.0)
+    response = await cache.aget(request)
+    assert response["choices"][0]["message"]["content"] == "SELECT 1"
+    assert await cache.aget(create_completion_request("How many orders?")) is None
+
+    # Sampled completions are not deterministic, so they are not cached
+    request = create_completion_request("How many users?", temperature=0.7)
+    cache.set(request, completion_response, seconds=1.0)
+    assert cache.get(request) is None
+
+
+def test_llm_completion_cache_per_tenant():
+    cache = LLMCompletionCache(MemoryCompletionStore(max_entries=10))
+    request = create_completion_request("How many users?")
+    token = completion_cache_tenant.set("a")
+    try:
+        cache.set(request, completion_response, seconds=1.0)
+        assert cache.get(request) is not None
+    finally:
+        completion_cache_tenant.reset(token)
+    assert cache.get(request) is None
+
+
+def test_memory_completion_store():
+    store = MemoryCompletionStore(max_entries=2)
+    store.set("a", b"a")
+    store.set("b", b"b", ttl=-1)
+    assert store.get("b") is None
+    store.set("c", b"c")
+    store.get("a")
+    store.set("d", b"d")
+    assert store.get("c") is None
+    assert store.get("a") == b"a"
+
+
+def test_sqlite_completion_store(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    store = SQLiteCompletionStore(path, max_entries=2)
+    store.set("a", b"a")
+    store.set("b", b"b", ttl=-1)
+    assert store.get("b") is None
+    store.set("c", b"c")
+    store.set("d", b"d")
+    assert store.get("a") is None
+
+    # Entries are kept across restarts
+    store = SQLiteCompletionStore(path, max_entries=2)
+    assert store.get("c") == b"c"
+    assert store.get("d") == b"d"
+
+
+def test_llm_completion_cache_semantic(monkeypatch):
+    embeddings = {
+        "How many users?": [1.0, 0.0],
+        "How many users are there?": [0.99, 0.05],
+        "What is the revenue?": [0.0, 1.0],
+    }
+    cache = LLMCompletionCache(
+        MemoryCompletionStore(max_entries=10), semantic=True, similarity_threshold=0.95
+    )
+    monkeypatch.setattr(cache, "embed", lambda text: cache._normalize(embeddings[text]))
+    cache.set(create_completion_request("How many users?"), completion_response, seconds=1.0)
+    assert cache.get(create_completion_request("How many users are there?")) is not None
+    assert cache.get(create_completion_request("What is the revenue?")) is None
+
+    # Only requests with the same context are similar
+    request = create_completion_request("How many users are there?")
+    request["messages"][0]["content"] = "Write Python code."
+    assert cache.get(request) is None
+
+
+@pytest.mark.asyncio
+async def test_llm_completion_cache_embeds_missed_request_once(monkeypatch):
+    embedded = []
+
+    async def aembed(text):
+        embedded.append(text)
+        return cache._normalize([1.0, 0.0])
+
+    cache = LLMCompletionCache(MemoryCompletionStore(max_entries=10), semantic=True)
+    monkeypatch.setattr(cache, "aembed", aembed)
+    request = create_completion_request("How many users?")
+    assert await cache.aget(request) is None
+    await cache.aset(request, completion_response, seconds=1.0)
+    assert embedded == ["How many users?"]
+    assert await cache.aget(create_completion_request("How many users are there?")) is not None
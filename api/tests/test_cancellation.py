@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from api.cancellation import requests_disconnected, run_until_disconnected
+from api.errors import ClientDisconnectedError
+
+
+def create_receive(disconnect_after: float):
+    async def receive():
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+@pytest.mark.asyncio
+async def test_work_is_returned_while_connected():
+    result = await run_until_disconnected(create_receive(10), asyncio.sleep(0.01, "result"), endpoint="test")
+    assert result == "result"
+
+
+@pytest.mark.asyncio
+async def test_work_is_cancelled_when_client_disconnects():
+    disconnected = requests_disconnected.value(endpoint="test")
+    work = asyncio.create_task(asyncio.sleep(10))
+    with pytest.raises(ClientDisconnectedError):
+        await run_until_disconnected(create_receive(0.01), work, endpoint="test")
+    assert work.cancelled()
+    assert requests_disconnected.value(endpoint="test") == disconnected + 1
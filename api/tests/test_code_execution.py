@@ -1,3 +1,6 @@
+import asyncio
+import concurrent.futures
+import io
 import json
 
 import pandas as pd
@@ -6,6 +9,7 @@ import pytest
 
 from api import utils
 from api.chartgpt import execute_python_code
+from api.execution import StdoutRouter, captured_stdout, get_base_namespace
 from api.prompts.templates import CODE_GENERATION_IMPORTS
 from api.types import (CodeGenerationConfig, accepted_output_types,
                        assert_matches_accepted_type)
@@ -289,3 +293,171 @@ answer_question(df)
         config=config,
     )
     assert not result.error
+
+
+@pytest.mark.asyncio
+async def test_code_cannot_modify_base_namespace():
+    code = """
+pd = None
+np = None
+
+def answer_question(df):
+    return 1
+"""
+    local_variables = {"df": pd.DataFrame()}
+    result = await execute_python_code(
+        code,
+        docstring="",
+        imports=CODE_GENERATION_IMPORTS,
+        local_variables=local_variables,
+        config=config,
+    )
+    assert result.error is None
+    assert local_variables.keys() == {"df"}
+    base_namespace = get_base_namespace(CODE_GENERATION_IMPORTS)
+    assert base_namespace["pd"] is pd
+    with pytest.raises(TypeError):
+        base_namespace["pd"] = None
+
+    result = await execute_python_code(
+        "def answer_question(df):\n    return int(np.int64(2))",
+        docstring="",
+        imports=CODE_GENERATION_IMPORTS,
+        local_variables=local_variables,
+        config=config,
+    )
+    assert result.result == 2
+    # The imports are executed once
+    assert get_base_namespace(CODE_GENERATION_IMPORTS) is base_namespace
+
+
+engine_parity_cases = [
+    'def answer_question(df):\n    print("Hello World!")\n    return 1 + 1',
+    'print("Hello")\nresult = 3',
+    "1 + 1",
+    'print("Before")\n\ndef answer_question(df):\n    return len(df)\n\nanswer_question(df)',
+    'def answer_question(df):\n    df["x"] = df["x"] * 2\n    return int(df["x"].sum())\n\nanswer_question(df)',
+    'def answer_question(df):\n    return px.bar(df, y="x")',
+    'def answer_question(df):\n    raise ValueError("Invalid")',
+    'def answer_question(df):\n    return {"a": 1}',
+    "def answer_question(df):\n    return None",
+    "def answer_question(df)\n    return 1",
+    'if __name__ == "__main__":\n    result = 4',
+]
+
+
+@pytest.mark.parametrize("code", engine_parity_cases)
+@pytest.mark.asyncio
+async def test_engines_have_parity(code):
+    df = pd.DataFrame({"x": [1, 2, 3]})
+    ipython_result, compiled_result = [
+        await execute_python_code(
+            code,
+            docstring="",
+            imports=CODE_GENERATION_IMPORTS,
+            local_variables={"df": df},
+            config=config,
+            engine=engine,
+        )
+        for engine in ("ipython", "compile")
+    ]
+    assert df["x"].tolist() == [1, 2, 3]
+    assert compiled_result.io == ipython_result.io
+    if ipython_result.error:
+        assert compiled_result.error.split(":")[0] == ipython_result.error.split(":")[0]
+    else:
+        assert compiled_result.error is None
+    if isinstance(ipython_result.result, go.Figure):
+        assert compiled_result.result.to_json() == ipython_result.result.to_json()
+    else:
+        assert compiled_result.result == ipython_result.result
+
+
+@pytest.mark.asyncio
+async def test_compiled_code_is_checked_on_its_syntax_tree(monkeypatch):
+    trees = []
+    monkeypatch.setattr("api.execution.assert_secure_code", trees.append)
+    result = await execute_python_code(
+        "def answer_question(df):\n    return 1",
+        docstring="",
+        imports=CODE_GENERATION_IMPORTS,
+        local_variables={"df": pd.DataFrame()},
+        config=config,
+        engine="compile",
+    )
+    assert result.result == 1
+    assert [type(tree).__name__ for tree in trees] == ["Module"]
+
+
+@pytest.mark.parametrize("engine", ["ipython", "compile"])
+@pytest.mark.asyncio
+async def test_concurrent_executions_capture_their_own_output(engine, monkeypatch):
+    shown = []
+    monkeypatch.setattr("api.execution._figure_show", lambda fig, *args, **kwargs: shown.append(fig))
+    code = """
+import time
+
+def answer_question(df):
+    for index in range(10):
+        print(f"{df['id'].iloc[0]}-{index}")
+        time.sleep(0.001)
+    px.bar(df, y="id").show()
+    return int(df["id"].iloc[0])
+"""
+
+    def execute(execution_id: int):
+        # Each in its own thread and event loop, as well as concurrently in the same loop
+        async def execute_twice():
+            return await asyncio.gather(
+                *(
+                    execute_python_code(
+                        code,
+                        docstring="",
+                        imports=CODE_GENERATION_IMPORTS,
+                        local_variables={"df": pd.DataFrame({"id": [execution_id * 2 + offset]})},
+                        config=config,
+                        engine=engine,
+                    )
+                    for offset in range(2)
+                )
+            )
+
+        return asyncio.run(execute_twice())
+
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ThreadPoolExecutor(25) as executor:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, execute, execution_id) for execution_id in range(25))
+        )
+
+    results = [result for pair in results for result in pair]
+    assert len(results) == 50
+    for execution_id, result in enumerate(results):
+        assert result.error is None
+        assert result.result == execution_id
+        assert result.io == "\n".join(f"{execution_id}-{index}" for index in range(10))
+    # Figures are only shown outside of executions
+    assert shown == []
+    go.Figure().show()
+    assert len(shown) == 1
+
+
+def test_stdout_router_forwards_to_original_stdout(tmp_path):
+    with open(tmp_path / "stdout.txt", "w", encoding="utf-8") as stdout:
+        router = StdoutRouter(stdout)
+        # Libraries that inspect `sys.stdout` see the original stdout
+        assert router.encoding == "utf-8"
+        assert router.errors == stdout.errors
+        assert router.fileno() == stdout.fileno()
+        assert router.isatty() is False
+        assert router.writable() is True
+        assert router.buffer is stdout.buffer
+
+        router.write("printed\n")
+        token = captured_stdout.set(captured := io.StringIO())
+        try:
+            router.write("captured\n")
+        finally:
+            captured_stdout.reset(token)
+    assert (tmp_path / "stdout.txt").read_text() == "printed\n"
+    assert captured.getvalue() == "captured\n"
@@ -0,0 +1,49 @@
+import os
+
+import toml
+
+from api.prompts.templates import Example, ExampleIndex
+
+DATA_SOURCE_URL = "bigquery/project/real_estate/listings"
+
+examples = [
+    Example(data_source_url="", query="What data is available?", sql="", code=""),
+    Example(data_source_url=DATA_SOURCE_URL, query="Average price of listings by city", sql="", code=""),
+    Example(data_source_url=DATA_SOURCE_URL, query="Number of bedrooms of listings", sql="", code=""),
+    Example(data_source_url="bigquery/project/aviation/flights", query="Delayed flights by airport", sql="", code=""),
+]
+
+
+def test_examples_partitioned_by_data_source():
+    index = ExampleIndex(examples)
+    relevant_examples = index.get_relevant_examples("Average price in each city", DATA_SOURCE_URL, k=5)
+    assert relevant_examples[0] == examples[1]
+    assert examples[3] not in relevant_examples
+    assert examples[0] in relevant_examples
+
+    # Unknown data sources use the default examples
+    assert index.get_relevant_examples("Flights", "bigquery/project/other") == [examples[0]]
+    # No data source uses all examples
+    assert index.get_relevant_examples("Delayed flights", k=1) == [examples[3]]
+
+
+def test_add_examples():
+    index = ExampleIndex(examples)
+    example = Example(data_source_url=DATA_SOURCE_URL, query="Listings with a pool by city", sql="", code="")
+    index.add_examples([example])
+    assert index.get_relevant_examples("Which listings have a pool?", DATA_SOURCE_URL, k=1) == [example]
+
+    example = Example(data_source_url="bigquery/project/new/table", query="Revenue", sql="", code="")
+    index.add_examples([example])
+    assert index.get_relevant_examples("Revenue", "bigquery/project/new/table", k=2) == [example, examples[0]]
+
+
+def test_index_rebuilt_when_file_changes(tmp_path):
+    path = tmp_path / "examples.toml"
+    path.write_text(toml.dumps({"examples": [examples[1].__dict__]}))
+    index = ExampleIndex(path=str(path))
+    assert index.get_relevant_examples("Pool", DATA_SOURCE_URL) == [examples[1]]
+
+    path.write_text(toml.dumps({"examples": [examples[1].__dict__, examples[2].__dict__]}))
+    os.utime(path, (0, os.stat(path).st_mtime + 1))
+    assert index.get_relevant_examples("Bedrooms", DATA_SOURCE_URL, k=1) == [examples[2]]
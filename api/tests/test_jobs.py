@@ -0,0 +1,401 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+from tenacity import wait_none
+
+from api import jobs
+from api.errors import InsecureRequestError, InsecureWebhookError, JobQueueFullError
+from api.jobs import (JobQueue, JobStore, accumulate_response, check_webhook_url, post_webhook,
+                      sign_webhook)
+from api.models import JobStatus, Message, Output, Request, Response, ResponseUsage
+from api.tests.fakes import FakeCollection
+
+request = Request(
+    messages=[Message(role="user", content="What is the total volume by day?")],
+    data_source_url="bigquery/project/dataset",
+    output_type="any",
+)
+
+
+def create_responses(session_id: str):
+    envelope = {
+        "session_id": session_id,
+        "created_at": 1,
+        "messages": request.messages,
+        "data_source_url": request.data_source_url,
+        "output_type": "any",
+    }
+    output = Output(index=0, created_at=2, description="Query", type="sql_query", value="SELECT 1")
+    return [
+        Response(**envelope, status="stream", attempts=[], outputs=[], errors=[]),
+        Response(**envelope, finished_at=2, status="stream", attempts=[], outputs=[output], errors=[]),
+        Response(
+            **envelope, finished_at=3, status="succeeded", attempts=[], outputs=[], errors=[],
+            usage=ResponseUsage(tokens=10, seconds=1.5),
+        ),
+    ]
+
+
+async def wait_for_status(store: JobStore, job_id: str, tenant: str, *statuses: JobStatus):
+    for _ in range(200):
+        job = await store.get(job_id, tenant)
+        if job.status in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is {job.status}")
+
+
+def create_queue(handler, **kwargs) -> JobQueue:
+    return JobQueue(JobStore(FakeCollection()), handler, poll_seconds=0.05, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_job_is_run_with_partial_outputs():
+    sent = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def handler(job, tenant):
+        responses = create_responses(job.id)
+        yield responses[0]
+        yield responses[1]
+        sent.set()
+        await finish.wait()
+        yield responses[2]
+
+    queue = create_queue(handler)
+    await queue.start()
+    try:
+        job = await queue.submit(request, "tenant")
+        assert job.status == JobStatus.QUEUED
+
+        await asyncio.wait_for(sent.wait(), 1)
+        running = await queue.store.get(job.id, "tenant")
+        assert running.status == JobStatus.RUNNING
+        assert [output.value for output in running.response.outputs] == ["SELECT 1"]
+        # Jobs are only visible to the tenant that created them
+        assert await queue.store.get(job.id, "other") is None
+
+        finish.set()
+        job = await wait_for_status(queue.store, job.id, "tenant", JobStatus.SUCCEEDED)
+        assert job.response.status == "succeeded"
+        assert job.response.usage.tokens == 10
+        assert job.finished_at >= job.started_at >= job.created_at
+        assert job.error is None
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_has_error():
+    async def handler(job, tenant):
+        yield create_responses(job.id)[0]
+        raise InsecureRequestError("The request is insecure.")
+
+    queue = create_queue(handler)
+    await queue.start()
+    try:
+        job = await queue.submit(request, "tenant")
+        job = await wait_for_status(queue.store, job.id, "tenant", JobStatus.FAILED)
+        assert job.error == "Could not complete analysis: insecure request"
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_of_stopped_worker_is_run_again():
+    runs = []
+
+    async def handler(job, tenant):
+        runs.append(job.id)
+        for response in create_responses(job.id):
+            yield response
+
+    store = JobStore(FakeCollection())
+    # A worker claimed the job, and stopped without releasing it
+    job = await JobQueue(store, handler).submit(request, "tenant")
+    assert (await store.claim(lease_seconds=0.1))[0].id == job.id
+    assert await store.claim(lease_seconds=0.1) is None
+
+    queue = JobQueue(store, handler, poll_seconds=0.05)
+    await queue.start()
+    try:
+        await asyncio.sleep(0.05)
+        # Its lease is still held
+        assert runs == []
+        job = await wait_for_status(store, job.id, "tenant", JobStatus.SUCCEEDED)
+        assert runs == [job.id]
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_interrupted_too_many_times_fails():
+    async def handler(job, tenant):
+        raise AssertionError("The job is not run again")
+        yield
+
+    store = JobStore(FakeCollection())
+    job = await JobQueue(store, handler).submit(request, "tenant")
+    for _ in range(2):
+        await store.claim(lease_seconds=0)
+
+    queue = JobQueue(store, handler, max_runs=2, poll_seconds=0.05)
+    await queue.start()
+    try:
+        job = await wait_for_status(store, job.id, "tenant", JobStatus.FAILED)
+        assert "interrupted" in job.error
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_store_errors():
+    class FlakyStore(JobStore):
+        failures = 1
+
+        async def update(self, job_id, runs, **fields):
+            # Fails to finish the first job, once
+            if "finished_at" in fields and self.failures:
+                self.failures -= 1
+                raise ConnectionError("MongoDB is unavailable")
+            return await super().update(job_id, runs, **fields)
+
+    async def handler(job, tenant):
+        for response in create_responses(job.id):
+            yield response
+
+    store = FlakyStore(FakeCollection())
+    queue = JobQueue(store, handler, workers=1, lease_seconds=0.3, poll_seconds=0.05)
+    await queue.start()
+    try:
+        first = await queue.submit(request, "tenant")
+        second = await queue.submit(request, "tenant")
+        await wait_for_status(store, second.id, "tenant", JobStatus.SUCCEEDED)
+        # The first job is run again once its lease expires
+        await wait_for_status(store, first.id, "tenant", JobStatus.SUCCEEDED)
+    finally:
+        await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_claimed_again_is_not_finished_by_its_first_worker(monkeypatch):
+    posted = []
+
+    async def post_webhook(url, body, headers, timeout):
+        posted.append(url)
+
+    monkeypatch.setattr(jobs, "post_webhook", post_webhook)
+    store = JobStore(FakeCollection())
+
+    async def handler(job, tenant):
+        responses = create_responses(job.id)
+        yield responses[0]
+        # Another worker claims the job meanwhile
+        await store.collection.update_one({"_id": job.id}, {"$inc": {"runs": 1}, "$set": {"response": None}})
+        yield responses[1]
+        yield responses[2]
+
+    queue = JobQueue(store, handler, poll_seconds=0.05)
+    await queue.start()
+    try:
+        job = await queue.submit(request, "tenant", webhook_url="https://example.com/hook")
+        for _ in range(100):
+            document = await store.collection.find_one({"_id": job.id})
+            if document["runs"] == 2:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+    finally:
+        await queue.stop()
+
+    job = await store.get(job.id, "tenant")
+    assert job.status == JobStatus.RUNNING
+    assert job.response is None
+    assert posted == []
+
+
+@pytest.mark.asyncio
+async def test_job_whose_lease_was_lost_is_stopped():
+    class UnavailableStore(JobStore):
+        available = False
+
+        async def renew(self, job_id, runs, lease_seconds):
+            if not self.available:
+                raise ConnectionError("MongoDB is unavailable")
+            return await super().renew(job_id, runs, lease_seconds)
+
+    started = asyncio.Event()
+    stopped = asyncio.Event()
+
+    async def handler(job, tenant):
+        yield create_responses(job.id)[0]
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.set()
+            raise
+        yield create_responses(job.id)[2]
+
+    store = UnavailableStore(FakeCollection())
+    queue = JobQueue(store, handler, workers=1, lease_seconds=0.3, poll_seconds=0.05)
+    await queue.start()
+    try:
+        job = await queue.submit(request, "tenant")
+        await asyncio.wait_for(started.wait(), 1)
+        # The lease expires while the store is unavailable, and another worker claims the job
+        await asyncio.sleep(0.4)
+        assert (await store.claim(lease_seconds=10))[0].id == job.id
+        store.available = True
+        await asyncio.wait_for(stopped.wait(), 1)
+
+        # The worker still runs other jobs
+        other = await queue.submit(request, "tenant")
+        await wait_for_status(store, other.id, "tenant", JobStatus.RUNNING)
+    finally:
+        await queue.stop()
+    assert (await store.get(job.id, "tenant")).status == JobStatus.RUNNING
+
+
+@pytest.mark.asyncio
+async def test_stopped_queue_releases_running_jobs():
+    started = asyncio.Event()
+
+    async def handler(job, tenant):
+        yield create_responses(job.id)[0]
+        started.set()
+        await asyncio.sleep(10)
+
+    queue = create_queue(handler)
+    await queue.start()
+    job = await queue.submit(request, "tenant")
+    await asyncio.wait_for(started.wait(), 1)
+    await queue.stop()
+
+    assert (await queue.store.get(job.id, "tenant")).status == JobStatus.QUEUED
+    _, _, runs = await queue.store.claim(lease_seconds=1)
+    # The interrupted run is not counted
+    assert runs == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_jobs():
+    async def handler(job, tenant):
+        yield create_responses(job.id)[-1]
+
+    # The queue is not started, so its jobs stay queued
+    queue = create_queue(handler, max_queued=2)
+    for _ in range(2):
+        await queue.submit(request, "tenant")
+    with pytest.raises(JobQueueFullError):
+        await queue.submit(request, "tenant")
+
+
+@pytest.mark.asyncio
+async def test_finished_job_is_posted_to_webhook(monkeypatch):
+    posted = asyncio.Queue()
+
+    async def post_webhook(url, body, headers, timeout):
+        await posted.put((url, body, headers))
+
+    monkeypatch.setattr(jobs, "post_webhook", post_webhook)
+
+    async def handler(job, tenant):
+        for response in create_responses(job.id):
+            yield response
+
+    queue = create_queue(handler, webhook_secret="secret")
+    await queue.start()
+    try:
+        job = await queue.submit(request, "tenant", webhook_url="https://example.com/hook")
+        url, body, headers = await asyncio.wait_for(posted.get(), 1)
+    finally:
+        await queue.stop()
+
+    assert url == "https://example.com/hook"
+    assert json.loads(body)["id"] == job.id
+    assert json.loads(body)["status"] == "succeeded"
+    assert headers["X-ChartGPT-Signature"] == sign_webhook(body, "secret")
+    assert jobs.job_webhooks.value(outcome="delivered") >= 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "url",
+    [
+        "ftp://example.com/hook",
+        "http://127.0.0.1/hook",
+        "http://169.254.169.254/latest/meta-data",
+        "http://10.0.0.1/hook",
+        "http://[::1]/hook",
+        "http://[::ffff:192.168.0.1]/hook",
+        "http://localhost/hook",
+    ],
+)
+async def test_private_webhook_url_is_rejected(url):
+    with pytest.raises(InsecureWebhookError):
+        await check_webhook_url(url, allowed_hosts=[])
+
+
+@pytest.mark.asyncio
+async def test_webhook_url_is_checked_against_allowed_hosts():
+    await check_webhook_url("https://93.184.216.34/hook", allowed_hosts=[])
+    await check_webhook_url("http://127.0.0.1/hook", allowed_hosts=["127.0.0.1"])
+    with pytest.raises(InsecureWebhookError):
+        await check_webhook_url("https://93.184.216.34/hook", allowed_hosts=["127.0.0.1"])
+
+
+@pytest.mark.asyncio
+async def test_webhook_is_not_redirected_or_retried_on_client_errors():
+    hits = []
+
+    async def handle(request):
+        hits.append(request.path)
+        if request.path == "/redirect":
+            raise web.HTTPFound("/hook")
+        if request.path == "/missing":
+            raise web.HTTPNotFound()
+        if request.path == "/error" and hits.count("/error") == 1:
+            raise web.HTTPInternalServerError()
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post("/{path}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    post = post_webhook.retry_with(wait=wait_none())
+    try:
+        # The local server is only reachable as an allowed host
+        with pytest.raises(InsecureWebhookError):
+            await post(f"http://localhost:{port}/hook", b"{}", {}, timeout=1, allowed_hosts=[])
+        assert hits == []
+
+        allowed_hosts = ["127.0.0.1"]
+        with pytest.raises(aiohttp.ClientResponseError) as error:
+            await post(f"http://127.0.0.1:{port}/redirect", b"{}", {}, timeout=1, allowed_hosts=allowed_hosts)
+        assert error.value.status == 302
+        with pytest.raises(aiohttp.ClientResponseError):
+            await post(f"http://127.0.0.1:{port}/missing", b"{}", {}, timeout=1, allowed_hosts=allowed_hosts)
+        await post(f"http://127.0.0.1:{port}/error", b"{}", {}, timeout=1, allowed_hosts=allowed_hosts)
+        assert hits == ["/redirect", "/missing", "/error", "/error"]
+    finally:
+        await runner.cleanup()
+
+
+def test_responses_are_accumulated():
+    responses = create_responses("session")
+    accumulated = None
+    for response in responses:
+        accumulated = accumulate_response(accumulated, response)
+    assert accumulated.status == "succeeded"
+    assert accumulated.finished_at == 3
+    assert [output.value for output in accumulated.outputs] == ["SELECT 1"]
+    assert accumulated.usage.tokens == 10
+    # The responses are left as they were
+    assert responses[0].outputs == []
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from api import log, tracing
+from api.metrics import Histogram
+from api.tracing import InMemorySpanExporter, JSONLinesSpanExporter, Tracer
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(tracing, "tracer", Tracer(exporter))
+    return exporter
+
+
+@pytest.fixture
+def calls():
+    calls = []
+
+    def pre(func):
+        calls.append(("pre", func.__name__))
+
+    def post(func, **kwargs):
+        calls.append(("post", func.__name__, kwargs))
+
+    return calls, log.wrap(pre, post)
+
+
+@pytest.mark.asyncio
+async def test_wrap_times_coroutines_until_they_return(exporter, calls):
+    calls, wrap = calls
+
+    @wrap
+    async def sleep():
+        """Sleeps"""
+        await asyncio.sleep(0.05)
+        return 1
+
+    assert sleep.__name__ == "sleep" and sleep.__doc__ == "Sleeps"
+    assert await sleep() == 1
+    assert calls[0] == ("pre", "sleep")
+    assert calls[1][2]["duration"] >= 0.05
+    assert log.function_seconds.count(function=sleep.__qualname__, kind="total") == 1
+    assert len(exporter.spans) == 1
+
+
+@pytest.mark.asyncio
+async def test_wrap_times_async_generators_to_first_item_and_total(exporter, calls):
+    calls, wrap = calls
+
+    @wrap
+    async def generate():
+        await asyncio.sleep(0.02)
+        yield 1
+        await asyncio.sleep(0.05)
+        yield 2
+
+    assert [item async for item in generate()] == [1, 2]
+    kwargs = calls[1][2]
+    assert 0.02 <= kwargs["first_item"] < kwargs["duration"]
+    assert kwargs["duration"] >= 0.07
+    assert log.function_seconds.count(function=generate.__qualname__, kind="first_item") == 1
+
+
+@pytest.mark.asyncio
+async def test_wrap_closes_async_generators_consumed_partially(exporter, calls):
+    calls, wrap = calls
+    closed = []
+
+    @wrap
+    async def generate():
+        try:
+            yield 1
+            yield 2
+        finally:
+            closed.append(True)
+
+    generator = generate()
+    assert await generator.__anext__() == 1
+    await generator.aclose()
+    assert closed == [True]
+    assert len(exporter.spans) == 1
+
+
+@pytest.mark.asyncio
+async def test_spans_are_nested_across_tasks(exporter, calls):
+    _, wrap = calls
+
+    @wrap
+    def child():
+        return None
+
+    @wrap
+    async def task():
+        await asyncio.to_thread(child)
+
+    @wrap
+    async def parent():
+        await asyncio.gather(task(), task())
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        await parent()
+
+    spans = {span.span_id: span for span in exporter.spans}
+    root = next(span for span in exporter.spans if not span.parent_span_id)
+    assert root.name.endswith("parent") and root.status_code == tracing.STATUS_ERROR
+    assert len({span.trace_id for span in exporter.spans}) == 1
+    children = [span for span in exporter.spans if span.name.endswith("child")]
+    assert len(children) == 2
+    for span in children:
+        assert spans[span.parent_span_id].name.endswith("task")
+        assert spans[spans[span.parent_span_id].parent_span_id] is root
+
+
+def test_unsampled_traces_are_only_recorded_in_histograms(monkeypatch, calls):
+    calls, wrap = calls
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(tracing, "tracer", Tracer(exporter, sample_rate=0.0))
+
+    @wrap
+    def child():
+        return None
+
+    @wrap
+    def parent():
+        child()
+
+    parent()
+    assert calls == [] and exporter.spans == []
+    assert log.function_seconds.count(function=child.__qualname__, kind="total") == 1
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("seconds", "Seconds.", buckets=(0.1, 1))
+    for value in [0.05, 0.5, 0.5, 5]:
+        histogram.observe(value, function="f")
+    assert histogram.render() == [
+        "# HELP seconds Seconds.",
+        "# TYPE seconds histogram",
+        'seconds_bucket{function="f",le="0.1"} 1',
+        'seconds_bucket{function="f",le="1"} 3',
+        'seconds_bucket{function="f",le="+Inf"} 4',
+        'seconds_sum{function="f"} 6.05',
+        'seconds_count{function="f"} 4',
+    ]
+
+
+def test_json_lines_exporter_writes_otlp_spans(tmp_path):
+    exporter = JSONLinesSpanExporter(str(tmp_path / "spans.jsonl"), batch_size=2)
+    tracer = Tracer(exporter)
+    span = tracer.start_span("f")
+    span.attributes["rows"] = 10
+    tracer.end_span(span)
+    exporter.flush()
+
+    [line] = (tmp_path / "spans.jsonl").read_text().splitlines()
+    item = json.loads(line)
+    assert len(item["traceId"]) == 32 and len(item["spanId"]) == 16
+    assert item["attributes"] == [{"key": "rows", "value": {"intValue": "10"}}]
+    assert int(item["endTimeUnixNano"]) >= int(item["startTimeUnixNano"])
+
+
+def test_json_lines_exporter_writes_batches_in_background(tmp_path, monkeypatch):
+    exporter = JSONLinesSpanExporter(str(tmp_path / "spans.jsonl"), batch_size=2)
+    threads = []
+    write = exporter._write
+    monkeypatch.setattr(
+        exporter, "_write", lambda spans: threads.append(threading.current_thread()) or write(spans)
+    )
+    tracer = Tracer(exporter)
+    for name in ["f", "g", "h"]:
+        tracer.end_span(tracer.start_span(name))
+    exporter.flush()
+
+    lines = (tmp_path / "spans.jsonl").read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["f", "g", "h"]
+    # The full batch is written by the exporter's thread, and the rest when flushed
+    assert threads[0] is not threading.current_thread()
+    assert threads[1] is threading.current_thread()
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+from api import chartgpt
+from api.models import Attempt, Message, OutputType, Request
+from api.pipeline import Pipeline
+from api.schema_catalog import SchemaCatalogEntry
+from api.types import PythonExecutionResult, QueryResult, SQLExecutionResult
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_overlap():
+    async def sleep(*args):
+        await asyncio.sleep(0.05)
+        return len(args)
+
+    pipeline = Pipeline()
+    pipeline.run("a", sleep)
+    pipeline.run("b", sleep)
+    pipeline.run("c", lambda a, b: a + b, "a", "b")
+    start_time = time.perf_counter()
+    assert await pipeline.result("c") == 0
+    assert time.perf_counter() - start_time < 0.09
+
+    timings = {timing.name: timing for timing in pipeline.get_timings()}
+    assert set(timings) == {"a", "b", "c"}
+    assert timings["c"].started >= timings["a"].started + timings["a"].seconds
+
+
+@pytest.mark.asyncio
+async def test_streamed_stage():
+    async def count(n):
+        for index in range(n):
+            yield index
+
+    pipeline = Pipeline()
+    pipeline.run("n", lambda: 3)
+    items = [item async for item in pipeline.stream("count", count, "n")]
+    assert items == [0, 1, 2]
+    # The result of a streamed stage is its last item
+    assert await pipeline.result("count") == 2
+
+
+@pytest.mark.asyncio
+async def test_streamed_stage_raises_dependency_error():
+    def fail():
+        raise ValueError("failed")
+
+    async def count(n):
+        yield n
+
+    pipeline = Pipeline()
+    pipeline.run("n", fail)
+    with pytest.raises(ValueError):
+        async for _ in pipeline.stream("count", count, "n"):
+            pass
+    pipeline.close()
+
+
+@pytest.mark.asyncio
+async def test_answer_user_query_reports_stage_timings(monkeypatch):
+    async def get_entry(data_source_url):
+        return SchemaCatalogEntry(data_source_url)
+
+    async def get_valid_sql_query(messages, config):
+        yield Attempt(index=0, created_at=0, outputs=[], errors=[])
+        yield SQLExecutionResult(
+            description="Count users",
+            query="SELECT 1 AS users",
+            dataframe=pd.DataFrame({"users": [1]}),
+            messages=messages,
+        )
+
+    async def generate_valid_python_code(messages, local_variables, config):
+        yield PythonExecutionResult(description="Show users", code="result_list = None")
+
+    monkeypatch.setattr(chartgpt.schema_catalog, "get_entry", get_entry)
+    monkeypatch.setattr(chartgpt, "get_valid_sql_query", get_valid_sql_query)
+    monkeypatch.setattr(chartgpt, "generate_valid_python_code", generate_valid_python_code)
+    monkeypatch.setattr(chartgpt, "get_relevant_examples", lambda **kwargs: [])
+
+    request = Request(
+        messages=[Message(role="user", content="How many users are there?")],
+        output_type=OutputType.ANY.value,
+    )
+    results = [result async for result in chartgpt.answer_user_query(request)]
+    assert len(results) == 1 and isinstance(results[0], QueryResult)
+    assert [output.index for output in results[0].outputs] == [0, 1, 2, 3]
+    stages = {timing.name for timing in results[0].stages}
+    assert stages == {
+        "schema",
+        "examples",
+        "code_generation_config",
+        "sql_generation",
+        "dataframe",
+        "dataframe_summary",
+        "sample_rows",
+        "code_generation",
+    }
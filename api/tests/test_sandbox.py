@@ -0,0 +1,139 @@
+import asyncio
+import os
+
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from api.errors import CodeExecutionBusyError
+from api.prompts.templates import CODE_GENERATION_IMPORTS
+from api.sandbox import CodeExecutionPool, ExecutionLimits
+from api.shared_frames import SharedDataFrame
+from api.types import CodeGenerationConfig, accepted_output_types
+
+config = CodeGenerationConfig(output_types=accepted_output_types, output_variable="result")
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = CodeExecutionPool(
+        size=1, max_executions=3, queue_size=1, limits=ExecutionLimits(cpu_seconds=2, timeout=5)
+    )
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+async def execute(pool, code, df=None):
+    return await pool.execute(
+        code,
+        docstring="",
+        imports=CODE_GENERATION_IMPORTS,
+        local_variables={"df": pd.DataFrame({"x": [1, 2, 3]}) if df is None else df},
+        config=config,
+    )
+
+
+@pytest.mark.asyncio
+async def test_executes_code_in_worker_process(pool):
+    result = await execute(
+        pool,
+        """
+import os
+
+def answer_question(df):
+    print("Hello World!")
+    return [os.getpid(), px.bar(df, y="x")]
+""",
+    )
+    assert result.error is None
+    assert result.io == "Hello World!"
+    pid, fig = result.result
+    assert pid != os.getpid()
+    assert isinstance(fig, go.Figure)
+    # The caller's local variables are not sent back
+    assert list(result.local_variables["df"].columns) == ["x"]
+
+
+@pytest.mark.asyncio
+async def test_worker_is_replaced_after_timeout(pool):
+    code = """
+import time
+
+def answer_question(df):
+    time.sleep(10)
+"""
+    result = await execute(pool, code)
+    assert result.error.startswith("TimeoutError")
+
+    result = await execute(pool, "def answer_question(df):\n    return len(df)")
+    assert result.error is None and result.result == 3
+
+
+@pytest.mark.asyncio
+async def test_cpu_time_is_limited(pool):
+    result = await execute(pool, "def answer_question(df):\n    while True:\n        pass")
+    assert result.error.startswith("CPUTimeLimitError")
+
+
+@pytest.mark.asyncio
+async def test_workers_are_recycled(pool):
+    code = "import os\n\ndef answer_question(df):\n    return os.getpid()"
+    pids = [(await execute(pool, code)).result for _ in range(pool.max_executions + 1)]
+    assert len(set(pids)) == 2
+
+
+@pytest.mark.asyncio
+async def test_unserializable_results_are_errors(pool):
+    result = await execute(pool, "def answer_question(df):\n    return lambda: 1")
+    assert result.result is None
+    assert result.error.startswith("TypeError")
+
+
+@pytest.mark.asyncio
+async def test_executions_are_rejected_when_queue_is_full(pool):
+    code = "import time\n\ndef answer_question(df):\n    time.sleep(0.5)\n    return 1"
+    results = await asyncio.gather(*(execute(pool, code) for _ in range(3)), return_exceptions=True)
+    assert sum(isinstance(result, CodeExecutionBusyError) for result in results) == 1
+    assert [result.result for result in results if not isinstance(result, Exception)] == [1, 1]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_executions_are_aborted(pool):
+    code = "import time\n\ndef answer_question(df):\n    time.sleep(4)\n    return 1"
+    running = asyncio.create_task(execute(pool, code))
+    # Waits for the worker, and is removed from the queue when cancelled
+    queued = asyncio.create_task(execute(pool, code))
+    await asyncio.sleep(0.5)
+    start_time = asyncio.get_running_loop().time()
+    for task in (queued, running):
+        task.cancel()
+    results = await asyncio.gather(running, queued, return_exceptions=True)
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    # Cancelled without waiting for the running execution to finish
+    assert asyncio.get_running_loop().time() - start_time < 1
+
+    # The worker was killed, and is replaced, which takes as long as starting a worker
+    result = await execute(pool, "def answer_question(df):\n    return len(df)")
+    assert result.error is None and result.result == 3
+    assert pool._pending == 0
+
+
+@pytest.mark.asyncio
+async def test_executes_code_with_shared_dataframe(pool):
+    df = pd.DataFrame({"x": [1, 2, 3], "s": ["a", "b", "c"]})
+    shared_df = SharedDataFrame.create(df)
+    code = """
+def answer_question(df):
+    df.loc[0, "x"] = 10
+    df["y"] = df["x"] * 2
+    return df
+"""
+    try:
+        results = [await execute(pool, code, df=shared_df) for _ in range(2)]
+    finally:
+        shared_df.unlink()
+    for result in results:
+        assert result.error is None
+        # Each attempt modifies its own copy of the shared DataFrame
+        assert result.result["y"].tolist() == [20, 4, 6]
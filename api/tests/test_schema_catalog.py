@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+from api.schema_catalog import MemorySchemaCatalogStore, SchemaCatalog
+from api.tests.fakes import FakeMetadataClient
+from api.utils import format_tables_summary, get_table_summaries, get_tables_summary
+
+EXPECTED_TABLE_SUMMARY = '''### dataset.loans
+```
+CREATE TABLE `test.dataset.loans` (
+"id" INTEGER NOT NULL, (Samples: 1, 2)
+"name" STRING, - The name (Samples: a, b)
+)
+```
+'''
+
+
+def test_get_tables_summary():
+    client = FakeMetadataClient(["loans", "users"])
+    tables_summary = get_tables_summary(client, "bigquery/test/dataset")
+    assert tables_summary.startswith("## Dataset: dataset\n" + EXPECTED_TABLE_SUMMARY)
+    assert "### dataset.users" in tables_summary
+
+    tables_summary = get_tables_summary(client, "bigquery/test/dataset/loans")
+    assert tables_summary == "## Dataset: dataset\n" + EXPECTED_TABLE_SUMMARY
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_fetch_once_and_persist():
+    client = FakeMetadataClient(["loans", "users"])
+    store = MemorySchemaCatalogStore()
+    catalog = SchemaCatalog(client, store)
+
+    summaries = await asyncio.gather(
+        *[catalog.get_tables_summary("bigquery/test/dataset") for _ in range(5)]
+    )
+    assert len(set(summaries)) == 1
+    assert client.get_table_calls == 2
+
+    # Another worker serves the stored summary without fetching the tables
+    other_client = FakeMetadataClient(["loans", "users"])
+    other_catalog = SchemaCatalog(other_client, store)
+    assert await other_catalog.get_tables_summary("bigquery/test/dataset") == summaries[0]
+    assert other_client.get_table_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_stale_summary_served_while_refreshing():
+    client = FakeMetadataClient(["loans"])
+    catalog = SchemaCatalog(client, MemorySchemaCatalogStore(), refresh_interval=60)
+    summary = await catalog.get_tables_summary("bigquery/test/dataset")
+
+    catalog._entries["bigquery/test/dataset"].refreshed_at = time.time() - 120
+    client.table_ids.append("users")
+    client.modified["users"] = 1_700_000_000_000
+    assert await catalog.get_tables_summary("bigquery/test/dataset") == summary
+
+    await asyncio.sleep(0.1)
+    assert "### dataset.users" in await catalog.get_tables_summary("bigquery/test/dataset")
+
+
+@pytest.mark.asyncio
+async def test_check_refreshes_modified_tables():
+    client = FakeMetadataClient(["loans"])
+    catalog = SchemaCatalog(client, MemorySchemaCatalogStore())
+    await catalog.get_tables_summary("bigquery/test/dataset")
+
+    await catalog.check()
+    assert client.get_table_calls == 1
+
+    client.modified["loans"] += 1000
+    await catalog.check()
+    assert client.get_table_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_check_refreshes_added_tables():
+    client = FakeMetadataClient(["loans"])
+    catalog = SchemaCatalog(client, MemorySchemaCatalogStore())
+    await catalog.get_tables_summary("bigquery/test/dataset")
+
+    client.table_ids.append("users")
+    client.modified["users"] = 1_700_000_000_000
+    await catalog.check()
+    assert "### dataset.users" in await catalog.get_tables_summary("bigquery/test/dataset")
+
+
+@pytest.mark.asyncio
+async def test_check_refreshes_added_datasets():
+    client = FakeMetadataClient(["loans"])
+    catalog = SchemaCatalog(client, MemorySchemaCatalogStore())
+    # The data source of every dataset in the client's project
+    await catalog.get_tables_summary("")
+    await catalog.check()
+    assert client.get_table_calls == 1
+
+    client.dataset_id = "other"
+    await catalog.check()
+    assert "## Dataset: other" in await catalog.get_tables_summary("")
+
+
+@pytest.mark.asyncio
+async def test_check_serves_summaries_refreshed_by_other_workers():
+    client = FakeMetadataClient(["loans"])
+    store = MemorySchemaCatalogStore()
+    catalog = SchemaCatalog(client, store)
+    other_catalog = SchemaCatalog(client, store)
+    await catalog.get_tables_summary("bigquery/test/dataset")
+
+    client.table_ids.append("users")
+    client.modified["users"] = 1_700_000_000_000
+    await other_catalog.refresh("bigquery/test/dataset")
+    get_table_calls = client.get_table_calls
+
+    # The newer summary is served, without fetching the tables again
+    await catalog.check()
+    assert "### dataset.users" in await catalog.get_tables_summary("bigquery/test/dataset")
+    assert client.get_table_calls == get_table_calls
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_checks():
+    catalog = SchemaCatalog(FakeMetadataClient(["loans"]), MemorySchemaCatalogStore())
+    catalog.start()
+    task = catalog._task
+    await catalog.stop()
+    assert task.done()
+
+
+def test_slow_sample_query_degrades_to_no_samples():
+    client = FakeMetadataClient(["loans", "slow_view"], sample_query_seconds={"slow_view": 5})
+    start_time = time.perf_counter()
+    table_summaries = get_table_summaries(client, "bigquery/test/dataset", max_workers=2, timeout=0.2)
+    assert time.perf_counter() - start_time < 2
+
+    loans, slow_view = table_summaries
+    assert loans.samples["id"] == ["1", "2"]
+    assert slow_view.samples == {"id": [], "name": []}
+    assert "(Samples: N/A)" in format_tables_summary([slow_view])
+    assert slow_view.fetch_seconds >= 0.2
+    # Its query is cancelled rather than left running
+    assert [job.cancelled for job in client.sample_jobs if job.seconds] == [True]
+
+
+def test_slow_table_metadata_keeps_table_without_samples():
+    client = FakeMetadataClient(["loans", "slow_table"], get_table_seconds={"slow_table": 0.3})
+    loans, slow_table = get_table_summaries(client, "bigquery/test/dataset", max_workers=2, timeout=0.2)
+    assert loans.samples["id"] == ["1", "2"]
+    assert slow_table.table_id == "slow_table"
+    assert slow_table.samples == {"id": [], "name": []}
+    # No sample query is started once the time is up
+    assert len(client.sample_jobs) == 1
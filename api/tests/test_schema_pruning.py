@@ -0,0 +1,53 @@
+from api.schema_pruning import SchemaIndex, count_tokens, tokenize
+from api.types import TableField, TableSummary
+from api.utils import format_tables_summary
+
+
+def create_table(table_id, field_names, field_type="STRING"):
+    return TableSummary(
+        project="test",
+        dataset_id="dataset",
+        table_id=table_id,
+        table_type="TABLE",
+        fields=[TableField(name=name, field_type=field_type) for name in field_names],
+    )
+
+
+tables = [
+    create_table("loans", ["borrower", "lender", "apr", "principal_usd"]),
+    create_table("airport_operations", ["airport", "delayed_flights", "passengers"]),
+    create_table("listings", ["city", "bed", "bath", "price"]),
+] + [
+    create_table(f"events_{index}", [f"event_{column}" for column in range(20)])
+    for index in range(10)
+]
+
+
+def test_tokenize():
+    assert tokenize("delayedFlights in cities") == ["delayed", "flight", "in", "city"]
+
+
+def test_selects_relevant_tables_within_budget():
+    index = SchemaIndex(tables)
+    tables_summary = index.get_tables_summary("Which airports had the most delayed flights?", max_tokens=300)
+    assert "### dataset.airport_operations" in tables_summary
+    assert "### dataset.loans" not in tables_summary
+    assert count_tokens(tables_summary) <= 300
+
+
+def test_falls_back_to_full_schema():
+    index = SchemaIndex(tables)
+    full_summary = format_tables_summary(tables)
+    assert index.get_tables_summary("Plot X", max_tokens=300) == full_summary
+    assert index.get_tables_summary("Plot the APR of loans", max_tokens=index.total_tokens) == full_summary
+
+
+def test_prunes_columns_of_wide_tables():
+    wide_table = create_table("listings", ["city", "price"] + [f"column_{index}" for index in range(100)])
+    wide_table.fields.append(TableField(name="list_date", field_type="DATE"))
+    index = SchemaIndex([wide_table])
+
+    tables_summary = index.get_tables_summary("Average price by city", max_tokens=200)
+    assert '"price"' in tables_summary and '"city"' in tables_summary
+    assert '"list_date"' in tables_summary
+    assert count_tokens(tables_summary) <= 200
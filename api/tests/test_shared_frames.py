@@ -0,0 +1,73 @@
+import datetime
+import errno
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from api.shared_frames import SharedDataFrame, share_dataframe
+
+
+@pytest.fixture
+def shared_df(tmp_path):
+    df = pd.DataFrame(
+        {
+            "x": np.arange(5),
+            "s": list("abcde"),
+            "d": pd.Series([datetime.date(2023, 1, day) for day in range(1, 6)], dtype="dbdate"),
+        }
+    ).sort_values("x", ascending=False)
+    return df, SharedDataFrame.create(df, directory=str(tmp_path))
+
+
+def test_shared_dataframe_is_loaded_without_copying(shared_df):
+    df, shared = shared_df
+    loaded = shared.load()
+    pd.testing.assert_frame_equal(loaded, df)
+    # Numeric columns are read-only views of the memory-mapped file
+    assert not loaded["x"].values.flags.writeable
+
+
+def test_shared_dataframe_is_copied_on_write(shared_df):
+    _, shared = shared_df
+    loaded = shared.load()
+    with pd.option_context("mode.copy_on_write", True):
+        copy = loaded.copy(deep=False)
+        copy.loc[0, "x"] = 10
+    assert copy.loc[0, "x"] == 10
+    assert loaded.loc[0, "x"] == 0
+
+
+def test_dataframes_with_nested_columns_are_not_shared():
+    assert share_dataframe(pd.DataFrame({"x": [[1, 2], [3]]})) is None
+
+
+def test_shared_dataframe_is_unlinked(shared_df):
+    _, shared = shared_df
+    shared.unlink()
+    with pytest.raises(OSError):
+        shared.load()
+    # Unlinking is idempotent
+    shared.unlink()
+
+
+def test_partially_written_dataframe_is_removed(monkeypatch, tmp_path):
+    class FullWriter:
+        def __init__(self, sink, schema):
+            self.sink = sink
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def write_table(self, table):
+            self.sink.write(b"partial")
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr("api.shared_frames.CODE_EXECUTION_SHARED_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(pa.ipc, "new_file", FullWriter)
+    assert share_dataframe(pd.DataFrame({"x": [1, 2, 3]})) is None
+    assert list(tmp_path.iterdir()) == []
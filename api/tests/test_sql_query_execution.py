@@ -0,0 +1,183 @@
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import BadRequest
+
+from api import chartgpt
+from api.caching import DryRunCache
+from api.connectors.bigquery import AsyncBigQueryExecutor
+from api.tests.fakes import FakeClient
+from api.types import SQLExecutionResult, SQLExecutionStats, SQLQueryGenerationConfig
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def create_client(**job_kwargs):
+        client = FakeClient(**{"polls_until_done": 1, **job_kwargs})
+        executor = AsyncBigQueryExecutor(client, poll_initial_delay=0.001)
+        monkeypatch.setattr(chartgpt, "bigquery_executor", executor)
+        monkeypatch.setattr(chartgpt, "dry_run_cache", DryRunCache(max_size=10, ttl=60))
+        return client
+
+    return create_client
+
+
+@pytest.mark.asyncio
+async def test_dry_run_skipped_when_query_validated_recently(client):
+    fake_client = client()
+    config = SQLQueryGenerationConfig(validation_mode="dry_run")
+
+    stats = SQLExecutionStats()
+    errors, df = await chartgpt.run_sql_query("SELECT 1", config=config, stats=stats)
+    assert not errors and len(df) == 1
+    assert (stats.jobs, stats.jobs_saved) == (2, 0)
+
+    stats = SQLExecutionStats()
+    errors, df = await chartgpt.run_sql_query("select  1;", config=config, stats=stats)
+    assert not errors and len(df) == 1
+    assert (stats.jobs, stats.jobs_saved) == (1, 1)
+    assert len(fake_client.jobs) == 3
+
+
+@pytest.mark.asyncio
+async def test_execute_mode_maps_execution_errors(client):
+    fake_client = client(
+        error=BadRequest("Syntax error", errors=[{"message": "Syntax error: Unexpected end of script"}])
+    )
+    config = SQLQueryGenerationConfig(validation_mode="execute")
+
+    stats = SQLExecutionStats()
+    errors, df = await chartgpt.run_sql_query("SELECT", config=config, stats=stats)
+    assert errors == ["Syntax error: Unexpected end of script"]
+    assert df.empty
+    assert (stats.jobs, stats.jobs_saved) == (1, 1)
+
+    # The invalid query is not submitted again
+    stats = SQLExecutionStats()
+    errors, _ = await chartgpt.run_sql_query("SELECT", config=config, stats=stats)
+    assert errors == ["Syntax error: Unexpected end of script"]
+    assert (stats.jobs, stats.jobs_saved) == (0, 1)
+    assert len(fake_client.jobs) == 1
+
+
+
+@pytest.mark.asyncio
+async def test_cancelled_query_records_bytes_saved(client):
+    fake_client = client(polls_until_done=1000)
+    config = SQLQueryGenerationConfig(validation_mode="dry_run")
+    bytes_saved = chartgpt.bigquery_bytes_saved.value(job_type="query", reason="cancelled")
+
+    task = asyncio.create_task(chartgpt.run_sql_query("SELECT 1", config=config))
+    while len(fake_client.jobs) < 2:
+        await asyncio.sleep(0.001)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    dry_run_job, query_job = fake_client.jobs
+    assert (
+        chartgpt.bigquery_bytes_saved.value(job_type="query", reason="cancelled")
+        == bytes_saved + dry_run_job.total_bytes_processed
+    )
+
+def create_correction_response(query: str):
+    return {
+        "choices": [
+            {
+                "finish_reason": "function_call",
+                "message": {
+                    "function_call": {
+                        "name": "validate_sql_query",
+                        "arguments": json.dumps({"description": "Corrected", "query": query}),
+                    }
+                },
+            }
+        ],
+        "usage": {"total_tokens": 100},
+    }
+
+
+@pytest.fixture
+def failing_queries(monkeypatch):
+    executed_queries = []
+
+    async def run_sql_query(query, config, stats=None):
+        executed_queries.append(query)
+        return ["Syntax error"], pd.DataFrame()
+
+    async def openai_chat_completion(model, messages, **kwargs):
+        return create_correction_response(f"SELECT {len(executed_queries)}")
+
+    monkeypatch.setattr(chartgpt, "run_sql_query", run_sql_query)
+    monkeypatch.setattr(chartgpt, "openai_chat_completion", openai_chat_completion)
+    return executed_queries
+
+
+async def generate(config: SQLQueryGenerationConfig):
+    messages = [{"role": "system", "content": "System"}]
+    return [
+        result
+        async for result in chartgpt.generate_valid_sql_query(
+            query="SELECT", description="Query", messages=messages, config=config
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_corrections_stop_at_max_attempts(failing_queries):
+    results = await generate(SQLQueryGenerationConfig(max_attempts=3))
+    *attempts, result = results
+    assert [attempt.index for attempt in attempts] == [0, 1, 2]
+    assert isinstance(result, SQLExecutionResult)
+    assert result.query == "SELECT 3"
+    assert result.stats.budget_exhausted == "attempts"
+    assert [attempt.llm_tokens for attempt in result.stats.attempts] == [100, 100, 100, 0]
+
+    # Attempts are not shared between requests
+    results = await generate(SQLQueryGenerationConfig(max_attempts=1))
+    assert [result.index for result in results[:-1]] == [0]
+
+
+@pytest.mark.asyncio
+async def test_corrections_stop_when_token_budget_exhausted(failing_queries):
+    results = await generate(SQLQueryGenerationConfig(max_attempts=10, max_tokens=2))
+    assert len(results) == 3
+    assert results[-1].stats.budget_exhausted == "tokens"
+    assert len(failing_queries) == 3
+
+
+@pytest.mark.asyncio
+async def test_corrections_stop_when_time_budget_exhausted(monkeypatch, failing_queries):
+    async def slow_openai_chat_completion(model, messages, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(chartgpt, "openai_chat_completion", slow_openai_chat_completion)
+    results = await generate(SQLQueryGenerationConfig(max_attempts=10, timeout=0.05))
+    assert len(results) == 1
+    assert results[-1].stats.budget_exhausted == "time"
+    assert results[-1].stats.attempts[0].correction_seconds < 1
+
+
+@pytest.mark.asyncio
+async def test_freshness_token_query_is_parameterized(monkeypatch):
+    queries = []
+
+    class Executor:
+        async def execute(self, query, job_config=None, key=None):
+            queries.append((query, job_config))
+            return None, pd.DataFrame({"last_modified_time": [1]})
+
+    monkeypatch.setattr(chartgpt, "bigquery_executor", Executor())
+    monkeypatch.setattr(chartgpt, "data_source_freshness_tokens", {})
+    table_id = "t' OR TRUE; DROP TABLE d.t; --"
+    monkeypatch.setattr(chartgpt.utils, "parse_data_source_url", lambda _: ("bigquery", "p", "d", table_id))
+    assert await chartgpt.get_data_source_freshness_token("bigquery/p/d/t") == "1"
+    query, job_config = queries[0]
+    assert table_id not in query and "@table_id" in query
+    assert job_config.query_parameters[0].value == table_id
+
+    # Project and dataset IDs, which cannot be passed as parameters, are validated instead
+    monkeypatch.setattr(chartgpt.utils, "parse_data_source_url", lambda _: ("bigquery", "p`; --", "d", None))
+    assert await chartgpt.get_data_source_freshness_token("bigquery/p/d2") is None
+    assert len(queries) == 1
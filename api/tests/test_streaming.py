@@ -0,0 +1,285 @@
+import asyncio
+import json
+import uuid
+
+import openai
+import pytest
+
+from api import chartgpt
+from api.caching import completion_cache_tenant
+from api.models import Attempt, Message, Output, Response, ResponseUsage
+from api.chartgpt import (extract_code_generation_response_data,
+                          extract_sql_query_generation_response_data, function_validate_sql_query)
+from api.streaming import (DELTA_PROTOCOL, KEEP_ALIVE_EVENT, SNAPSHOT_PROTOCOL, STREAM_END_EVENT,
+                           EventChannel, FunctionArgumentsDecoder, KeepAliveWheel, OutputDelta,
+                           ResponseEventEncoder, iter_events, output_delta_handler,
+                           stream_function_call)
+from api.tests.test_openai import invalid_function_call_response
+
+arguments = json.dumps({
+    "description": "Total volume by day, for \"all\" protocols\n",
+    "query": "SELECT date, SUM(volume) AS `volume` FROM t WHERE name = 'café 😀' GROUP BY 1",
+    "limit": 10,
+    "options": {"nested": "ignored", "list": ["a", "b"]},
+})
+
+
+def decode_in_chunks(arguments: str, size: int, replace_triple_quotes: bool = False) -> dict:
+    decoder = FunctionArgumentsDecoder(replace_triple_quotes=replace_triple_quotes)
+    values = {}
+    fragments = []
+    for start in range(0, len(arguments), size):
+        fragments += decoder.feed(arguments[start:start + size])
+    fragments += decoder.close()
+    for field, offset, value in fragments:
+        values[field] = values.get(field, "")[:offset] + value
+    assert values == decoder.values
+    return values
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_decodes_string_values_of_chunked_arguments(size):
+    # Escaped characters, e.g. `\\u00e9`, are split across chunks
+    for text in (arguments, json.dumps(json.loads(arguments), ensure_ascii=False)):
+        expected = {key: value for key, value in json.loads(text).items() if isinstance(value, str)}
+        assert decode_in_chunks(text, size) == expected
+
+
+@pytest.mark.parametrize("size", [1, 2, 5])
+def test_decodes_triple_quoted_code_like_code_generation(size):
+    function_call = invalid_function_call_response["choices"][0]["message"]["function_call"]
+    _, docstring, code = extract_code_generation_response_data(invalid_function_call_response)
+    values = decode_in_chunks(function_call["arguments"], size, replace_triple_quotes=True)
+    assert values == {"docstring": docstring, "code": code}
+
+
+def create_response(arguments: str) -> dict:
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1,
+        "model": "gpt-4",
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": "validate_sql_query", "arguments": arguments},
+            },
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30},
+    }
+
+
+async def stream_chunks(arguments: str, size: int = 5):
+    yield {"id": "chatcmpl-1", "created": 1, "model": "gpt-4", "choices": [{
+        "index": 0,
+        "delta": {"role": "assistant", "content": None, "function_call": {"name": "validate_sql_query", "arguments": ""}},
+        "finish_reason": None,
+    }]}
+    for start in range(0, len(arguments), size):
+        yield {"id": "chatcmpl-1", "created": 1, "model": "gpt-4", "choices": [{
+            "index": 0,
+            "delta": {"function_call": {"arguments": arguments[start:start + size]}},
+            "finish_reason": None,
+        }]}
+    yield {"id": "chatcmpl-1", "created": 1, "model": "gpt-4", "choices": [{
+        "index": 0, "delta": {}, "finish_reason": "stop"
+    }]}
+
+
+@pytest.mark.asyncio
+async def test_streamed_completion_is_assembled_like_complete_completion(monkeypatch):
+    async def acreate(stream=False, **kwargs):
+        return stream_chunks(arguments) if stream else create_response(arguments)
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    completion_cache_tenant.set(uuid.uuid4().hex)
+    messages = [{"role": "user", "content": "What is the total volume by day?"}]
+    kwargs = {"functions": [function_validate_sql_query], "function_call": {"name": "validate_sql_query"}}
+
+    deltas = []
+    cached_deltas = []
+
+    async def send_delta(delta):
+        deltas.append(delta)
+
+    async def send_cached_delta(delta):
+        cached_deltas.append(delta)
+
+    token = output_delta_handler.set(send_delta)
+    try:
+        streamed = await chartgpt.openai_chat_completion(
+            "gpt-4", messages, function_call_stream=stream_function_call("sql"), **kwargs
+        )
+        # Served from the cache, with the arguments sent at once
+        output_delta_handler.set(send_cached_delta)
+        await chartgpt.openai_chat_completion(
+            "gpt-4", messages, function_call_stream=stream_function_call("sql"), **kwargs
+        )
+    finally:
+        output_delta_handler.reset(token)
+    complete = create_response(arguments)
+
+    assert (
+        extract_sql_query_generation_response_data(streamed)
+        == extract_sql_query_generation_response_data(complete)
+    )
+    assert streamed["usage"]["completion_tokens"] > 0
+    for output_deltas in (deltas, cached_deltas):
+        values = {}
+        for delta in output_deltas:
+            assert (delta.type, delta.attempt) == ("sql", 0)
+            values[delta.field] = values.get(delta.field, "")[:delta.offset] + delta.value
+        _, description, query = extract_sql_query_generation_response_data(complete)
+        assert values == {"description": description, "query": query}
+    assert len(deltas) > len(cached_deltas) == 2
+
+
+def test_function_calls_are_not_streamed_without_handler():
+    assert stream_function_call("sql") is None
+
+
+def create_stream_responses():
+    envelope = {
+        "session_id": "session",
+        "created_at": 1,
+        "messages": [Message(role="user", content="What is the total volume by day?" * 100)],
+        "data_source_url": "bigquery/project/dataset",
+        "output_type": "any",
+    }
+    output = Output(index=0, created_at=2, description="Query", type="sql_query", value="SELECT 1")
+    attempt = Attempt(index=0, created_at=2, outputs=[output], errors=[])
+    return [
+        ("stream_start", Response(**envelope, status="stream", attempts=[], outputs=[], errors=[])),
+        ("attempt", Response(**envelope, finished_at=2, status="stream", attempts=[attempt], outputs=[], errors=[])),
+        ("output", Response(**envelope, finished_at=3, status="stream", attempts=[], outputs=[output], errors=[])),
+        ("usage", Response(
+            **envelope, finished_at=4, status="succeeded", attempts=[], outputs=[], errors=[],
+            usage=ResponseUsage(tokens=10, seconds=1.5),
+        )),
+    ]
+
+
+ENVELOPE_FIELDS = ("session_id", "created_at", "messages", "data_source_url", "output_type")
+
+
+def parse_event(text: str):
+    event, data = text.rstrip("\n").split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+def test_delta_protocol_events_reassemble_snapshots():
+    responses = create_stream_responses()
+    snapshot = ResponseEventEncoder("session", protocol=SNAPSHOT_PROTOCOL)
+    delta = ResponseEventEncoder("session", protocol=DELTA_PROTOCOL)
+    snapshot_events = [snapshot.encode_response(event, response) for event, response in responses]
+    delta_events = [delta.encode_response(event, response) for event, response in responses]
+    # The request's messages are only sent with the first event
+    assert sum(map(len, delta_events[1:])) * 5 < sum(map(len, snapshot_events[1:]))
+
+    envelope = None
+    for seq, (snapshot_event, delta_event) in enumerate(zip(snapshot_events, delta_events)):
+        event, expected = parse_event(snapshot_event)
+        delta_event_type, data = parse_event(delta_event)
+        assert delta_event_type == event
+        assert data.pop("seq") == seq
+        if envelope is None:
+            envelope = {name: data[name] for name in ENVELOPE_FIELDS}
+        else:
+            data = {**envelope, "attempts": [], "outputs": [], "errors": [], **data}
+        assert data == expected
+
+
+def test_output_deltas_are_sequenced_with_responses():
+    encoder = ResponseEventEncoder("session", protocol=DELTA_PROTOCOL)
+    _, response = create_stream_responses()[0]
+    encoder.encode_response("stream_start", response)
+    event, data = parse_event(
+        encoder.encode_output_delta(OutputDelta(type="sql", attempt=0, field="query", offset=0, value="SELECT"))
+    )
+    assert event == "sql_delta"
+    assert data == {"seq": 1, "type": "sql", "attempt": 0, "field": "query", "offset": 0, "value": "SELECT"}
+
+    event, data = parse_event(
+        ResponseEventEncoder("session").encode_output_delta(
+            OutputDelta(type="code", attempt=1, field="code", offset=3, value="x")
+        )
+    )
+    assert event == "code_delta"
+    assert data["session_id"] == "session" and "seq" not in data
+
+
+def test_invalid_stream_protocol():
+    with pytest.raises(ValueError):
+        ResponseEventEncoder("session", protocol="gzip")
+
+
+@pytest.mark.asyncio
+async def test_event_channel_applies_backpressure_in_order():
+    channel = EventChannel(ResponseEventEncoder("session", protocol=DELTA_PROTOCOL), maxsize=2)
+    _, response = create_stream_responses()[0]
+    await channel.send_response("stream_start", response)
+    delta = OutputDelta(type="sql", attempt=0, field="query", offset=0, value="SELECT")
+    # Producers wait for the client once the channel is full, and are sent in order
+    producers = [asyncio.create_task(channel.send_output_delta(delta)) for _ in range(5)]
+    await asyncio.sleep(0)
+    assert len(channel) == 2
+    assert sum(producer.done() for producer in producers) == 1
+    assert not channel.send_keep_alive()
+
+    events = []
+    while len(events) < 6:
+        events.append(await channel.get())
+    await asyncio.gather(*producers)
+    assert [parse_event(event)[1]["seq"] for event in events] == list(range(6))
+
+    # Events left are received once closed, and further events are dropped
+    await channel.send_output_delta(delta)
+    channel.close()
+    await channel.send_output_delta(delta)
+    assert parse_event(await channel.get())[1]["seq"] == 6
+    assert await channel.get() is None
+
+
+@pytest.mark.asyncio
+async def test_closing_channel_releases_waiting_producers():
+    channel = EventChannel(ResponseEventEncoder("session"), maxsize=1)
+    _, response = create_stream_responses()[0]
+    await channel.send_response("stream_start", response)
+    producer = asyncio.create_task(channel.send_response("output", response))
+    await asyncio.sleep(0)
+    assert not producer.done()
+    channel.close()
+    await asyncio.wait_for(producer, 1)
+
+
+@pytest.mark.asyncio
+async def test_keep_alive_wheel_sends_keep_alives_to_idle_channels(monkeypatch):
+    wheel = KeepAliveWheel(interval=0.1, slots=5)
+    monkeypatch.setattr("api.streaming.keep_alive_wheel", wheel)
+    idle = EventChannel(ResponseEventEncoder("idle"))
+    busy = EventChannel(ResponseEventEncoder("busy"))
+    _, response = create_stream_responses()[0]
+    streams = [iter_events(channel) for channel in (idle, busy)]
+    receivers = [asyncio.create_task(stream.__anext__()) for stream in streams]
+    await asyncio.sleep(0)
+    assert len(wheel) == 2
+
+    for _ in range(6):
+        await busy.send_response("output", response)
+        await busy.get()
+        await asyncio.sleep(0.025)
+    assert await asyncio.wait_for(receivers[0], 1) == KEEP_ALIVE_EVENT
+    # Events were sent to the busy channel more often than the interval
+    assert not receivers[1].done()
+
+    idle.close()
+    assert await streams[0].__anext__() == STREAM_END_EVENT
+    with pytest.raises(StopAsyncIteration):
+        await streams[0].__anext__()
+    assert len(wheel) == 1
+    receivers[1].cancel()
+    await asyncio.gather(receivers[1], return_exceptions=True)
+    assert len(wheel) == 0 and busy.closed
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from api.models import ResponseUsage, StageTiming
+from api.pipeline import Pipeline
+from api.usage import (record_attempt, record_bigquery_job, record_llm_usage, track_usage,
+                       usage_tracker)
+
+
+def create_response(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}}
+
+
+@pytest.mark.asyncio
+async def test_usage_is_attributed_to_stages():
+    async def generate():
+        record_llm_usage("gpt-4", create_response(100, 20))
+        # Cached completions use no tokens
+        record_llm_usage("gpt-4", create_response(100, 20), cached=True)
+        record_attempt("sql")
+
+    def execute(_):
+        record_bigquery_job("dry_run", bytes_processed=1000)
+        record_bigquery_job("query", bytes_processed=1000, bytes_billed=10_485_760)
+
+    async def run():
+        tracker = track_usage()
+        pipeline = Pipeline()
+        pipeline.run("generate", generate)
+        await pipeline.run("execute", execute, "generate")
+        record_llm_usage("gpt-3.5-turbo", create_response(10, 1))
+        return tracker
+
+    # Run in its own task, with a copy of the context, as each request is
+    tracker = await asyncio.create_task(run())
+    assert usage_tracker.get() is None
+
+    assert (tracker.total.tokens, tracker.total.llm_requests, tracker.total.cached_llm_requests) == (131, 3, 1)
+    assert (tracker.total.bigquery_jobs, tracker.total.bytes_processed) == (2, 1000)
+    assert tracker.total.bytes_billed == 10_485_760
+    assert tracker.attempts == {"sql": 1}
+    assert tracker.stages["generate"].tokens == 120
+    assert tracker.stages["execute"].tokens == 0
+    assert tracker.stages["execute"].bigquery_jobs == 2
+
+
+def test_usage_is_not_tracked_outside_requests():
+    # E.g. when the NDA guard is used by the bots
+    record_llm_usage("gpt-4", create_response(100, 20))
+    assert usage_tracker.get() is None
+
+
+def test_response_usage_round_trips():
+    usage = ResponseUsage(tokens=120, seconds=1.5, stages=[StageTiming(name="schema", started=0, seconds=0.5)])
+    assert ResponseUsage.from_dict(usage.to_dict()) == usage
@@ -71,3 +71,12 @@ def test_clean_jupyter_shell_output():
 count                          90     90.000000  9.000000e+01     90.000000  ...     90.000000  9.000000e+01               90      9.000000e+01
 """
     assert utils.clean_jupyter_shell_output(output, remove_final_result=True) == ""
+
+
+def test_normalize_sql_query():
+    assert utils.normalize_sql_query(
+        "select  a ,b\nFROM `t` -- Comment\n where x = 'A  b';"
+    ) == utils.normalize_sql_query("SELECT a, b FROM `t` WHERE x = 'A  b'")
+    assert utils.normalize_sql_query(
+        "SELECT a FROM `t` WHERE x = 'A  b'"
+    ) != utils.normalize_sql_query("SELECT a FROM `t` WHERE x = 'A b'")
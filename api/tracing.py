@@ -0,0 +1,196 @@
+"""
+Lightweight tracing of the functions wrapped with `log.wrap`, as spans compatible with the
+OpenTelemetry data model, exported as OTLP JSON lines by a local exporter.
+
+Whether a trace is sampled is decided when its root span starts, and inherited by its
+child spans, so that a trace is either recorded in full or not at all. The current span
+is held in a context variable, so that it is the parent of the spans started by the tasks
+and threads that copy the context.
+"""
+
+import atexit
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from api.config import INSTRUMENTATION_SAMPLE_RATE, TRACING_EXPORTER, TRACING_PATH
+
+# Not imported from `api.log`, which imports this module to wrap functions
+logger = logging.getLogger("chartgpt")
+
+STATUS_UNSET = "STATUS_CODE_UNSET"
+STATUS_ERROR = "STATUS_CODE_ERROR"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str = ""
+    span_id: str = ""
+    parent_span_id: str = ""
+    start_time_unix_nano: int = 0
+    end_time_unix_nano: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status_code: str = STATUS_UNSET
+    status_message: str = ""
+    sampled: bool = True
+
+    def set_error(self, exception: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(exception).__name__}: {exception}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The span in the OTLP JSON encoding."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_time_unix_nano),
+            "endTimeUnixNano": str(self.end_time_unix_nano),
+            "attributes": [
+                {"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# The root of the traces that are not sampled, and of all their descendants
+UNSAMPLED = Span(name="unsampled", sampled=False)
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class SpanExporter:
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps the finished spans in memory, e.g. for tests."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+
+class JSONLinesSpanExporter(SpanExporter):
+    """
+    Appends finished spans to a file as OTLP JSON lines, in batches, which an OpenTelemetry
+    collector can ingest with its file log receiver.
+
+    Batches are written by a background thread, in order, so that the requests that finish
+    spans, e.g. on the event loop, never wait for the file.
+    """
+
+    def __init__(self, path: str, batch_size: int = 64):
+        self.path = path
+        self.batch_size = batch_size
+        self._batch: List[Span] = []
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="span-exporter"
+        )
+        # The write of the last batch handed to the background thread
+        self._written: Optional[concurrent.futures.Future] = None
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._batch.append(span)
+            if len(self._batch) < self.batch_size:
+                return
+            spans, self._batch = self._batch, []
+            self._written = self._executor.submit(self._write, spans)
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._batch = self._batch, []
+            written = self._written
+        # Written in this thread, as the background thread is stopped when the worker exits
+        if written is not None:
+            concurrent.futures.wait([written])
+        if spans:
+            self._write(spans)
+
+    def _write(self, spans: List[Span]) -> None:
+        try:
+            lines = [json.dumps(span.to_dict()) for span in spans]
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write("\n".join(lines) + "\n")
+        except OSError:
+            logger.exception("Failed to export spans")
+
+
+def create_span_exporter(exporter: str, path: str = TRACING_PATH) -> Optional[SpanExporter]:
+    if exporter == "file":
+        span_exporter = JSONLinesSpanExporter(path)
+        # Export the last batch when the worker exits
+        atexit.register(span_exporter.flush)
+        return span_exporter
+    if exporter == "none":
+        return None
+    raise ValueError(f"Unknown tracing exporter: {exporter}")
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_span(self, name: str) -> Span:
+        """
+        Start a span as a child of the current span, or as the root of a new trace, which is
+        sampled with the tracer's sample rate. The span is not made current.
+        """
+        parent = current_span.get()
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return UNSAMPLED
+            trace_id = f"{random.getrandbits(128):032x}"
+            parent_span_id = ""
+        elif not parent.sampled:
+            return parent
+        else:
+            trace_id = parent.trace_id
+            parent_span_id = parent.span_id
+        return Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=f"{random.getrandbits(64):016x}",
+            parent_span_id=parent_span_id,
+            start_time_unix_nano=time.time_ns(),
+        )
+
+    def end_span(self, span: Span) -> None:
+        if not span.sampled:
+            return
+        span.end_time_unix_nano = time.time_ns()
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+
+tracer = Tracer(create_span_exporter(TRACING_EXPORTER), sample_rate=INSTRUMENTATION_SAMPLE_RATE)
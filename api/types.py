@@ -110,12 +110,29 @@ class SQLQueryGenerationConfig:
     def __init__(
         self,
         data_source_url: str = "",
+        session_id: Optional[str] = None,
         max_attempts=10,
+        max_tokens=None,
+        timeout=None,
         assert_results_not_empty=True,
+        validation_mode="dry_run",
+        guard=None,
     ):
         self.data_source_url = data_source_url
+        # Key used to limit concurrent BigQuery jobs per request
+        self.session_id = session_id
         self.max_attempts = max_attempts
+        # Token budget, where each LLM completion uses 1 token, or `None` for no limit
+        self.max_tokens = max_tokens
+        # Wall-clock budget in seconds, or `None` for no limit
+        self.timeout = timeout
         self.assert_results_not_empty = assert_results_not_empty
+        # "dry_run" to validate queries using a dry run before executing them,
+        # or "execute" to execute queries directly, using the maximum bytes billed as the guard
+        self.validation_mode = validation_mode
+        # Future resolving to whether the request is insecure, which runs concurrently with
+        # the initial SQL query generation and is awaited before any SQL query is run
+        self.guard = guard
 
 
 class CodeGenerationConfig:
@@ -130,12 +147,67 @@ class CodeGenerationConfig:
         self.output_variable = output_variable
 
 
+class SQLQueryGenerationStage(enum.Enum):
+    EXECUTE = "execute"
+    CORRECT = "correct"
+    DONE = "done"
+
+
+@dataclass
+class SQLAttemptStats:
+    """Where time was spent in an attempt to generate a valid SQL query."""
+    index: int
+    execution_seconds: float = 0.0
+    correction_seconds: float = 0.0
+    llm_tokens: int = 0
+
+
+@dataclass
+class SQLExecutionStats:
+    """BigQuery jobs run, and jobs saved by caching, while generating a valid SQL query."""
+    jobs: int = 0
+    jobs_saved: int = 0
+    seconds_saved: float = 0.0
+    attempts: List[SQLAttemptStats] = field(default_factory=list)
+    # The budget that ended the corrections before a valid query was found, if any
+    budget_exhausted: Optional[str] = None
+
+
 @dataclass
 class SQLExecutionResult:
     description: str
     query: str
     dataframe: pd.DataFrame
     messages: List[Message]
+    stats: SQLExecutionStats = field(default_factory=SQLExecutionStats)
+
+
+@dataclass
+class TableField:
+    name: str
+    field_type: str
+    mode: Optional[str] = None
+    description: Optional[str] = None
+
+
+@dataclass
+class TableSummary:
+    """The schema, field descriptions, and sample values of a table, used in LLM prompts."""
+    project: str
+    dataset_id: str
+    table_id: str
+    table_type: str
+    # Last modified time in milliseconds since the epoch
+    modified: Optional[int] = None
+    fields: List[TableField] = field(default_factory=list)
+    # Field name to sample values
+    samples: Dict[str, List[str]] = field(default_factory=dict)
+    # How long fetching the summary took, to find slow tables and views
+    fetch_seconds: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> "TableSummary":
+        return cls(**{**obj, "fields": [TableField(**f) for f in obj.get("fields", [])]})
 
 
 @dataclass
@@ -205,6 +277,14 @@ class Response:
     usage: Usage
 
 
+@dataclass
+class StageTiming:
+    name: str
+    # Seconds since the start of the request
+    started: float
+    seconds: float
+
+
 @dataclass
 class QueryResult:
     data_source: str
@@ -212,3 +292,4 @@ class QueryResult:
     attempts: List[Attempt]
     outputs: List[Output]
     errors: List[Error]
+    stages: List[StageTiming] = field(default_factory=list)
@@ -0,0 +1,141 @@
+"""
+Accounting of the resources used to answer a request: LLM tokens, BigQuery bytes, and
+attempts, in total and per pipeline stage, exported as metrics.
+
+The tracker of the current request is held in a context variable, so that it is shared by
+the tasks and threads started for the request, which copy the context.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from api.metrics import registry
+
+llm_requests = registry.counter(
+    "chartgpt_llm_requests_total", "LLM completion requests, by model and whether served from cache."
+)
+llm_tokens = registry.counter(
+    "chartgpt_llm_tokens_total", "LLM tokens used, by model and type: prompt or completion."
+)
+bigquery_bytes = registry.counter(
+    "chartgpt_bigquery_bytes_total", "BigQuery bytes used by queries, by type: processed or billed."
+)
+attempts = registry.counter("chartgpt_attempts_total", "Output generation attempts, by type: sql or code.")
+stage_seconds = registry.counter(
+    "chartgpt_stage_seconds_total", "Time spent in each pipeline stage, in seconds."
+)
+stage_runs = registry.counter("chartgpt_stage_runs_total", "Pipeline stages run, by stage.")
+
+
+@dataclass
+class ResourceUsage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_requests: int = 0
+    cached_llm_requests: int = 0
+    bigquery_jobs: int = 0
+    bytes_processed: int = 0
+    bytes_billed: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@dataclass
+class UsageTracker:
+    """Resources used by a request, in total and per pipeline stage."""
+
+    total: ResourceUsage = field(default_factory=ResourceUsage)
+    stages: Dict[str, ResourceUsage] = field(default_factory=dict)
+    attempts: Dict[str, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def _usages(self):
+        stage = current_stage.get()
+        if stage is None:
+            return [self.total]
+        return [self.total, self.stages.setdefault(stage, ResourceUsage())]
+
+
+usage_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("usage_tracker", default=None)
+# The pipeline stage that the current task is running, if any
+current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+
+def track_usage() -> UsageTracker:
+    """Start tracking the usage of the current request, in the current context."""
+    tracker = UsageTracker()
+    usage_tracker.set(tracker)
+    return tracker
+
+
+async def run_in_stage(name: str, awaitable):
+    """Attribute the usage of an awaitable to a stage, when run as its own task."""
+    current_stage.set(name)
+    return await awaitable
+
+
+def record_llm_usage(model: str, response, cached: bool = False) -> None:
+    """Record the tokens used by an LLM completion, from the response's usage."""
+    usage = response.get("usage") or {}
+    prompt_tokens = 0 if cached else usage.get("prompt_tokens", 0)
+    completion_tokens = 0 if cached else usage.get("completion_tokens", 0)
+    llm_requests.inc(model=model, cached=cached)
+    llm_tokens.inc(prompt_tokens, model=model, type="prompt")
+    llm_tokens.inc(completion_tokens, model=model, type="completion")
+
+    tracker = usage_tracker.get()
+    if tracker is None:
+        return
+    with tracker._lock:
+        for resource_usage in tracker._usages():
+            resource_usage.llm_requests += 1
+            resource_usage.cached_llm_requests += cached
+            resource_usage.prompt_tokens += prompt_tokens
+            resource_usage.completion_tokens += completion_tokens
+
+
+def record_bigquery_job(
+    job_type: str, bytes_processed: Optional[int] = None, bytes_billed: Optional[int] = None
+) -> None:
+    """Record a BigQuery job, and the bytes processed and billed by queries."""
+    bytes_processed = bytes_processed or 0
+    bytes_billed = bytes_billed or 0
+    # Jobs are counted by the BigQuery executor's metrics
+    if job_type == "query":
+        # Dry runs only estimate the bytes a query would process
+        bigquery_bytes.inc(bytes_processed, type="processed")
+        bigquery_bytes.inc(bytes_billed, type="billed")
+
+    tracker = usage_tracker.get()
+    if tracker is None:
+        return
+    with tracker._lock:
+        for resource_usage in tracker._usages():
+            resource_usage.bigquery_jobs += 1
+            if job_type == "query":
+                resource_usage.bytes_processed += bytes_processed
+                resource_usage.bytes_billed += bytes_billed
+
+
+def record_attempt(attempt_type: str) -> None:
+    attempts.inc(type=attempt_type)
+    tracker = usage_tracker.get()
+    if tracker is None:
+        return
+    with tracker._lock:
+        tracker.attempts[attempt_type] = tracker.attempts.get(attempt_type, 0) + 1
+
+
+def record_stage(name: str, seconds: float) -> None:
+    stage_runs.inc(stage=name)
+    stage_seconds.inc(seconds, stage=name)
@@ -1,16 +1,19 @@
 import base64
+import concurrent.futures
 import hashlib
 import re
 import time
 import uuid
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
-from cachetools import cached
-from cachetools.keys import hashkey
+import sqlparse
 from google.cloud import bigquery
 from plotly.utils import PlotlyJSONEncoder
 
+from api.log import logger
+from api.types import TableField, TableSummary
+
 
 def create_type_string(types: List[type]) -> str:
     def get_qualified_name(t):
@@ -141,13 +144,11 @@ def parse_data_source_url(data_source_url) -> tuple[str, str, str, Optional[str]
 #         return True
 
 
-@cached(cache={}, key=lambda client, data_source_url: hashkey(data_source_url))
-def get_tables_summary(
+def list_data_source_tables(
     client: bigquery.Client,
     data_source_url: str = "",
-) -> str:
-    markdown_summary = ""
-
+) -> List[Tuple[str, str, str]]:
+    """Returns the project, dataset ID, and table ID of each table in a data source."""
     if data_source_url:
         _data_source, project, dataset_id, table_id = parse_data_source_url(
             data_source_url
@@ -170,72 +171,208 @@ def get_tables_summary(
     else:
         datasets = list(client.list_datasets(project))
 
-    table_ids = [table_id] if table_id else None
+    return [
+        (project, dataset.dataset_id, table.table_id)
+        for dataset in datasets
+        for table in client.list_tables(dataset)
+        # Filter bigquery.Table objects by table_id
+        if not table_id or table.table_id == table_id
+    ]
+
+
+def get_table_summary(
+    client: bigquery.Client,
+    project: str,
+    dataset_id: str,
+    table_id: str,
+    timeout: Optional[float] = None,
+) -> TableSummary:
+    """
+    Fetches the schema and sample values of a table.
+
+    If the sample values cannot be fetched within `timeout` seconds of starting,
+    e.g. for a slow view, the summary is returned without them, and their query is cancelled.
+    """
+    start_time = time.perf_counter()
+    # Not bounded by the timeout, which only degrades the summary to one without samples
+    table = client.get_table(f"{project}.{dataset_id}.{table_id}")
+
+    # Fetch 3 random records for sample data
+    if "VIEW" in table.table_type:
+        sample_query = f"""
+        SELECT * FROM `{project}.{dataset_id}.{table_id}`
+        WHERE rand() < 0.1
+        LIMIT 3
+        """
+    else:
+        sample_query = f"""
+        SELECT * FROM `{project}.{dataset_id}.{table_id}` TABLESAMPLE SYSTEM (20 PERCENT)
+        WHERE RAND() < 0.02
+        LIMIT 3
+        """
+
+    query_job = None
+    try:
+        remaining = timeout - (time.perf_counter() - start_time) if timeout else None
+        if remaining is not None and remaining <= 0:
+            raise concurrent.futures.TimeoutError("No time left to fetch sample values")
+        query_job = client.query(sample_query, timeout=remaining)
+        remaining = timeout - (time.perf_counter() - start_time) if timeout else None
+        sample_records = [row for row in query_job.result(timeout=remaining)]
+    except Exception as e:
+        logger.warning(
+            "Failed to fetch sample values of table %s.%s.%s: %r", project, dataset_id, table_id, e
+        )
+        sample_records = []
+        if query_job is not None:
+            # Otherwise the query keeps running, and is billed, after the timeout
+            try:
+                query_job.cancel()
+            except Exception:
+                logger.exception("Failed to cancel sample query of table %s.%s.%s", project, dataset_id, table_id)
+
+    return TableSummary(
+        project=project,
+        dataset_id=dataset_id,
+        table_id=table_id,
+        table_type=table.table_type,
+        modified=round(table.modified.timestamp() * 1000) if table.modified else None,
+        fields=[
+            TableField(
+                name=field.name,
+                field_type=field.field_type,
+                mode=field.mode,
+                description=field.description,
+            )
+            for field in table.schema
+        ],
+        samples={
+            field.name: [str(record[field.name]) for record in sample_records]
+            for field in table.schema
+        },
+        fetch_seconds=time.perf_counter() - start_time,
+    )
+
+
+def get_table_summaries(
+    client: bigquery.Client,
+    data_source_url: str = "",
+    max_workers: int = 8,
+    timeout: Optional[float] = None,
+) -> List[TableSummary]:
+    """
+    Fetches the summaries of the tables in a data source, at most `max_workers` at a time.
+
+    Tables whose schema cannot be fetched are left out of the summaries.
+    """
+    tables = list_data_source_tables(client, data_source_url)
+    if not tables:
+        return []
+
+    def get_summary(table: Tuple[str, str, str]) -> Optional[TableSummary]:
+        try:
+            return get_table_summary(client, *table, timeout=timeout)
+        except Exception as e:
+            logger.error("Failed to fetch schema of table %s: %r", ".".join(table), e)
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        table_summaries = [
+            table_summary
+            for table_summary in executor.map(get_summary, tables)
+            if table_summary is not None
+        ]
+
+    for table_summary in sorted(
+        table_summaries, key=lambda table_summary: table_summary.fetch_seconds, reverse=True
+    )[:5]:
+        logger.info(
+            "Fetched summary of table %s.%s.%s in %.2f seconds",
+            table_summary.project,
+            table_summary.dataset_id,
+            table_summary.table_id,
+            table_summary.fetch_seconds,
+        )
+    return table_summaries
+
+
+def get_tables_last_modified(
+    client: bigquery.Client, project: str, dataset_id: str
+) -> Dict[str, int]:
+    """
+    Returns the last modified time of each table in a dataset, in milliseconds since the epoch.
+
+    Uses the dataset's `__TABLES__` metadata, which does not scan any table data.
+    """
+    query = f"SELECT table_id, last_modified_time FROM `{project}.{dataset_id}.__TABLES__`"
+    return {row["table_id"]: row["last_modified_time"] for row in client.query(query)}
+
 
-    for dataset in datasets:
-        dataset_id = dataset.dataset_id
-        markdown_summary += f"## Dataset: {dataset_id}\n"
+def format_table_summary(table_summary: TableSummary) -> str:
+    project = table_summary.project
+    dataset_id = table_summary.dataset_id
+    table_id = table_summary.table_id
 
-        # Filter bigquery.Table objects by table_ids
-        if table_ids:
-            tables = [
-                table
-                for table in list(client.list_tables(dataset))
-                if table.table_id in table_ids
-            ]
+    # SQL-like CREATE TABLE statement
+    create_table_statement = f"CREATE TABLE `{project}.{dataset_id}.{table_id}` (\n"
+
+    for field in table_summary.fields:
+        samples = table_summary.samples.get(field.name, [])
+        samples_text = ', '.join(samples) if samples else "N/A"
+
+        create_table_statement += f'"{field.name}" {field.field_type}'
+
+        if field.mode == "REQUIRED":
+            create_table_statement += " NOT NULL"
+
+        create_table_statement += ","
+        if field.description:
+            create_table_statement += f" - {field.description} (Samples: {samples_text})"
         else:
-            tables = list(client.list_tables(dataset))
-
-        for table in tables:
-            table_id = table.table_id
-            table_ref = client.dataset(dataset_id, project=project).table(table_id)
-            table = client.get_table(table_ref)
-
-            # Fetch 3 random records for sample data
-            if "VIEW" in table.table_type:
-                sample_query = f"""
-                SELECT * FROM `{project}.{dataset_id}.{table_id}`
-                WHERE rand() < 0.1
-                LIMIT 3
-                """
-            else:
-                sample_query = f"""
-                SELECT * FROM `{project}.{dataset_id}.{table_id}` TABLESAMPLE SYSTEM (20 PERCENT)
-                WHERE RAND() < 0.02
-                LIMIT 3
-                """
-
-            query_job = client.query(sample_query)
-            sample_records = [row for row in query_job]
-
-            # SQL-like CREATE TABLE statement
-            create_table_statement = f"CREATE TABLE `{project}.{dataset_id}.{table_id}` (\n"
-
-            for field in table.schema:
-                samples = [str(record[field.name]) for record in sample_records]
-                samples_text = ', '.join(samples) if samples else "N/A"
-                
-                create_table_statement += f'"{field.name}" {field.field_type}'
-
-                if field.mode == "REQUIRED":
-                    create_table_statement += " NOT NULL"
-
-                create_table_statement += ","
-                if field.description:
-                    create_table_statement += f" - {field.description} (Samples: {samples_text})"
-                else:
-                    create_table_statement += f" (Samples: {samples_text})"
-                create_table_statement += "\n"
-
-            # Here we are not adding primary and foreign keys, but they can be added based on the dataset schema.
-            create_table_statement = create_table_statement.rstrip(",\n") + "\n)"
-
-            markdown_summary += f"### {dataset_id}.{table_id}\n"
-            markdown_summary += f"```\n{create_table_statement}\n```\n"
+            create_table_statement += f" (Samples: {samples_text})"
+        create_table_statement += "\n"
+
+    # Here we are not adding primary and foreign keys, but they can be added based on the dataset schema.
+    create_table_statement = create_table_statement.rstrip(",\n") + "\n)"
+
+    return f"### {dataset_id}.{table_id}\n```\n{create_table_statement}\n```\n"
 
+
+def format_tables_summary(table_summaries: List[TableSummary]) -> str:
+    markdown_summary = ""
+    dataset_id = None
+    for table_summary in table_summaries:
+        if table_summary.dataset_id != dataset_id:
+            dataset_id = table_summary.dataset_id
+            markdown_summary += f"## Dataset: {dataset_id}\n"
+        markdown_summary += format_table_summary(table_summary)
     return markdown_summary
 
 
+def get_tables_summary(
+    client: bigquery.Client,
+    data_source_url: str = "",
+) -> str:
+    return format_tables_summary(get_table_summaries(client, data_source_url))
+
+
+def normalize_sql_query(query: str) -> str:
+    """
+    Normalizes a SQL query so that queries which only differ in whitespace, comments,
+    keyword case, or a trailing semicolon are equal, e.g. for use as a cache key.
+    String literals and identifiers are preserved.
+    """
+    tokens = []
+    for statement in sqlparse.parse(str(query)):
+        for token in statement.flatten():
+            if token.is_whitespace or token.ttype in sqlparse.tokens.Comment:
+                continue
+            if token.ttype in sqlparse.tokens.Punctuation and token.value == ";":
+                continue
+            tokens.append(token.value.upper() if token.is_keyword else token.value)
+    return " ".join(tokens)
+
+
 def apply_lower_to_where(sql):
     """
     Applies the LOWER function to all string comparisons in the WHERE clause of a SQL query.
@@ -19,6 +19,7 @@ __version__ = "1.0.0"
 # import apis into sdk package
 from chartgpt_client.api.chat_api import ChatApi
 from chartgpt_client.api.health_api import HealthApi
+from chartgpt_client.api.jobs_api import JobsApi
 
 # import ApiClient
 from chartgpt_client.api_response import ApiResponse
@@ -35,6 +36,9 @@ from chartgpt_client.exceptions import ApiException
 from chartgpt_client.models.attempt import Attempt
 from chartgpt_client.models.error import Error
 from chartgpt_client.models.http_validation_error import HTTPValidationError
+from chartgpt_client.models.job import Job
+from chartgpt_client.models.job_request import JobRequest
+from chartgpt_client.models.job_status import JobStatus
 from chartgpt_client.models.location_inner import LocationInner
 from chartgpt_client.models.message import Message
 from chartgpt_client.models.output import Output
@@ -43,5 +47,6 @@ from chartgpt_client.models.request import Request
 from chartgpt_client.models.response import Response
 from chartgpt_client.models.response_usage import ResponseUsage
 from chartgpt_client.models.role import Role
+from chartgpt_client.models.stage_timing import StageTiming
 from chartgpt_client.models.status import Status
 from chartgpt_client.models.validation_error import ValidationError
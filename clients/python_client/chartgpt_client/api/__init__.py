@@ -3,4 +3,5 @@
 # import apis into api package
 from chartgpt_client.api.chat_api import ChatApi
 from chartgpt_client.api.health_api import HealthApi
+from chartgpt_client.api.jobs_api import JobsApi
 
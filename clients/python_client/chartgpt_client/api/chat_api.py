@@ -19,6 +19,8 @@ import warnings
 from pydantic import validate_arguments, ValidationError
 from typing_extensions import Annotated
 
+from pydantic import Field, StrictStr
+
 from typing import Any, Optional
 
 from chartgpt_client.models.request import Request
@@ -45,18 +47,20 @@ class ChatApi(object):
         self.api_client = api_client
 
     @validate_arguments
-    def ask_chartgpt_stream_v1_ask_chartgpt_stream_post(self, request : Request, **kwargs) -> Response:  # noqa: E501
+    def ask_chartgpt_stream_v1_ask_chartgpt_stream_post(self, request : Request, protocol : Annotated[Optional[StrictStr], Field(description="The protocol of the stream: \"snapshot\" sends each response in full, and \"delta\" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.")] = None, **kwargs) -> Response:  # noqa: E501
         """Ask Chartgpt Stream  # noqa: E501
 
         Stream the response from the ChartGPT API.  # noqa: E501
         This method makes a synchronous HTTP request by default. To make an
         asynchronous HTTP request, please pass async_req=True
 
-        >>> thread = api.ask_chartgpt_stream_v1_ask_chartgpt_stream_post(request, async_req=True)
+        >>> thread = api.ask_chartgpt_stream_v1_ask_chartgpt_stream_post(request, protocol, async_req=True)
         >>> result = thread.get()
 
         :param request: (required)
         :type request: Request
+        :param protocol: The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+        :type protocol: str
         :param async_req: Whether to execute the request asynchronously.
         :type async_req: bool, optional
         :param _request_timeout: timeout setting for this request. If one
@@ -71,21 +75,23 @@ class ChatApi(object):
         kwargs['_return_http_data_only'] = True
         if '_preload_content' in kwargs:
             raise ValueError("Error! Please call the ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info method with `_preload_content` instead and obtain raw data from ApiResponse.raw_data")
-        return self.ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(request, **kwargs)  # noqa: E501
+        return self.ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(request, protocol, **kwargs)  # noqa: E501
 
     @validate_arguments
-    def ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(self, request : Request, **kwargs) -> ApiResponse:  # noqa: E501
+    def ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(self, request : Request, protocol : Annotated[Optional[StrictStr], Field(description="The protocol of the stream: \"snapshot\" sends each response in full, and \"delta\" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.")] = None, **kwargs) -> ApiResponse:  # noqa: E501
         """Ask Chartgpt Stream  # noqa: E501
 
         Stream the response from the ChartGPT API.  # noqa: E501
         This method makes a synchronous HTTP request by default. To make an
         asynchronous HTTP request, please pass async_req=True
 
-        >>> thread = api.ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(request, async_req=True)
+        >>> thread = api.ask_chartgpt_stream_v1_ask_chartgpt_stream_post_with_http_info(request, protocol, async_req=True)
         >>> result = thread.get()
 
         :param request: (required)
         :type request: Request
+        :param protocol: The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+        :type protocol: str
         :param async_req: Whether to execute the request asynchronously.
         :type async_req: bool, optional
         :param _preload_content: if False, the ApiResponse.data will
@@ -114,7 +120,8 @@ class ChatApi(object):
         _params = locals()
 
         _all_params = [
-            'request'
+            'request',
+            'protocol'
         ]
         _all_params.extend(
             [
@@ -145,6 +152,9 @@ class ChatApi(object):
 
         # process the query parameters
         _query_params = []
+        if _params.get('protocol') is not None:  # noqa: E501
+            _query_params.append(('protocol', _params['protocol']))
+
         # process the header parameters
         _header_params = dict(_params.get('_headers', {}))
         # process the form parameters
@@ -192,20 +202,22 @@ class ChatApi(object):
             _request_auth=_params.get('_request_auth'))
 
     @validate_arguments
-    def ask_chartgpt_v1_ask_chartgpt_post(self, request : Request, stream : Optional[Any] = None, **kwargs) -> Response:  # noqa: E501
+    def ask_chartgpt_v1_ask_chartgpt_post(self, request : Request, stream : Optional[Any] = None, protocol : Annotated[Optional[StrictStr], Field(description="The protocol of the stream: \"snapshot\" sends each response in full, and \"delta\" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.")] = None, **kwargs) -> Response:  # noqa: E501
         """Ask Chartgpt  # noqa: E501
 
         Answer a user query using the ChartGPT API.  # noqa: E501
         This method makes a synchronous HTTP request by default. To make an
         asynchronous HTTP request, please pass async_req=True
 
-        >>> thread = api.ask_chartgpt_v1_ask_chartgpt_post(request, stream, async_req=True)
+        >>> thread = api.ask_chartgpt_v1_ask_chartgpt_post(request, stream, protocol, async_req=True)
         >>> result = thread.get()
 
         :param request: (required)
         :type request: Request
         :param stream:
         :type stream: object
+        :param protocol: The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+        :type protocol: str
         :param async_req: Whether to execute the request asynchronously.
         :type async_req: bool, optional
         :param _request_timeout: timeout setting for this request. If one
@@ -220,23 +232,25 @@ class ChatApi(object):
         kwargs['_return_http_data_only'] = True
         if '_preload_content' in kwargs:
             raise ValueError("Error! Please call the ask_chartgpt_v1_ask_chartgpt_post_with_http_info method with `_preload_content` instead and obtain raw data from ApiResponse.raw_data")
-        return self.ask_chartgpt_v1_ask_chartgpt_post_with_http_info(request, stream, **kwargs)  # noqa: E501
+        return self.ask_chartgpt_v1_ask_chartgpt_post_with_http_info(request, stream, protocol, **kwargs)  # noqa: E501
 
     @validate_arguments
-    def ask_chartgpt_v1_ask_chartgpt_post_with_http_info(self, request : Request, stream : Optional[Any] = None, **kwargs) -> ApiResponse:  # noqa: E501
+    def ask_chartgpt_v1_ask_chartgpt_post_with_http_info(self, request : Request, stream : Optional[Any] = None, protocol : Annotated[Optional[StrictStr], Field(description="The protocol of the stream: \"snapshot\" sends each response in full, and \"delta\" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.")] = None, **kwargs) -> ApiResponse:  # noqa: E501
         """Ask Chartgpt  # noqa: E501
 
         Answer a user query using the ChartGPT API.  # noqa: E501
         This method makes a synchronous HTTP request by default. To make an
         asynchronous HTTP request, please pass async_req=True
 
-        >>> thread = api.ask_chartgpt_v1_ask_chartgpt_post_with_http_info(request, stream, async_req=True)
+        >>> thread = api.ask_chartgpt_v1_ask_chartgpt_post_with_http_info(request, stream, protocol, async_req=True)
         >>> result = thread.get()
 
         :param request: (required)
         :type request: Request
         :param stream:
         :type stream: object
+        :param protocol: The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+        :type protocol: str
         :param async_req: Whether to execute the request asynchronously.
         :type async_req: bool, optional
         :param _preload_content: if False, the ApiResponse.data will
@@ -266,7 +280,8 @@ class ChatApi(object):
 
         _all_params = [
             'request',
-            'stream'
+            'stream',
+            'protocol'
         ]
         _all_params.extend(
             [
@@ -300,6 +315,9 @@ class ChatApi(object):
         if _params.get('stream') is not None:  # noqa: E501
             _query_params.append(('stream', _params['stream']))
 
+        if _params.get('protocol') is not None:  # noqa: E501
+            _query_params.append(('protocol', _params['protocol']))
+
         # process the header parameters
         _header_params = dict(_params.get('_headers', {}))
         # process the form parameters
@@ -17,6 +17,9 @@
 from chartgpt_client.models.attempt import Attempt
 from chartgpt_client.models.error import Error
 from chartgpt_client.models.http_validation_error import HTTPValidationError
+from chartgpt_client.models.job import Job
+from chartgpt_client.models.job_request import JobRequest
+from chartgpt_client.models.job_status import JobStatus
 from chartgpt_client.models.location_inner import LocationInner
 from chartgpt_client.models.message import Message
 from chartgpt_client.models.output import Output
@@ -25,5 +28,6 @@ from chartgpt_client.models.request import Request
 from chartgpt_client.models.response import Response
 from chartgpt_client.models.response_usage import ResponseUsage
 from chartgpt_client.models.role import Role
+from chartgpt_client.models.stage_timing import StageTiming
 from chartgpt_client.models.status import Status
 from chartgpt_client.models.validation_error import ValidationError
@@ -0,0 +1,96 @@
+# coding: utf-8
+
+"""
+    ChartGPT API
+
+    The ChartGPT API is a REST API that generates insights from data based on natural language questions.
+
+    The version of the OpenAPI document: 0.1.0
+    Generated by OpenAPI Generator (https://openapi-generator.tech)
+
+    Do not edit the class manually.
+"""  # noqa: E501
+
+
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+import json
+
+
+from typing import Optional
+from pydantic import BaseModel, Field, StrictInt, StrictStr
+from chartgpt_client.models.job_status import JobStatus
+from chartgpt_client.models.request import Request
+from chartgpt_client.models.response import Response
+
+class Job(BaseModel):
+    """
+    A request answered in the background, whose response is polled or posted to a webhook.
+    """
+    created_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job was created.")
+    error: Optional[StrictStr] = Field(None, description="The reason why the job failed, if it did.")
+    finished_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job was finished.")
+    id: Optional[StrictStr] = Field(None, description="The ID of the job, which is also the session ID of its response.")
+    request: Optional[Request] = None
+    response: Optional[Response] = None
+    started_at: Optional[StrictInt] = Field(None, description="The timestamp of when the job last started running.")
+    status: Optional[JobStatus] = None
+    webhook_url: Optional[StrictStr] = Field(None, description="The URL to which the job is posted once it is finished, if any.")
+    __properties = ["created_at", "error", "finished_at", "id", "request", "response", "started_at", "status", "webhook_url"]
+
+    class Config:
+        """Pydantic configuration"""
+        allow_population_by_field_name = True
+        validate_assignment = True
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.dict(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, json_str: str) -> Job:
+        """Create an instance of Job from a JSON string"""
+        return cls.from_dict(json.loads(json_str))
+
+    def to_dict(self):
+        """Returns the dictionary representation of the model using alias"""
+        _dict = self.dict(by_alias=True,
+                          exclude={
+                          },
+                          exclude_none=True)
+        # override the default output from pydantic by calling `to_dict()` of request
+        if self.request:
+            _dict['request'] = self.request.to_dict()
+        # override the default output from pydantic by calling `to_dict()` of response
+        if self.response:
+            _dict['response'] = self.response.to_dict()
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> Job:
+        """Create an instance of Job from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return Job.parse_obj(obj)
+
+        _obj = Job.parse_obj({
+            "created_at": obj.get("created_at"),
+            "error": obj.get("error"),
+            "finished_at": obj.get("finished_at"),
+            "id": obj.get("id"),
+            "request": Request.from_dict(obj.get("request")) if obj.get("request") is not None else None,
+            "response": Response.from_dict(obj.get("response")) if obj.get("response") is not None else None,
+            "started_at": obj.get("started_at"),
+            "status": obj.get("status"),
+            "webhook_url": obj.get("webhook_url")
+        })
+        return _obj
+
+
@@ -0,0 +1,77 @@
+# coding: utf-8
+
+"""
+    ChartGPT API
+
+    The ChartGPT API is a REST API that generates insights from data based on natural language questions.
+
+    The version of the OpenAPI document: 0.1.0
+    Generated by OpenAPI Generator (https://openapi-generator.tech)
+
+    Do not edit the class manually.
+"""  # noqa: E501
+
+
+from __future__ import annotations
+import pprint
+import re  # noqa: F401
+import json
+
+
+from typing import Optional, Union
+from pydantic import BaseModel, Field, StrictFloat, StrictInt, StrictStr
+
+class StageTiming(BaseModel):
+    """
+    The timing of a stage of the request.
+    """
+    name: Optional[StrictStr] = Field(None, description="The name of the stage.")
+    started: Optional[Union[StrictFloat, StrictInt]] = Field(None, description="The number of seconds since the start of the request when the stage started.")
+    seconds: Optional[Union[StrictFloat, StrictInt]] = Field(None, description="The number of seconds the stage took.")
+    tokens: Optional[StrictInt] = Field(None, description="The number of LLM tokens used in the stage.")
+    bytes_processed: Optional[StrictInt] = Field(None, description="The number of bytes processed by BigQuery queries in the stage.")
+    __properties = ["name", "started", "seconds", "tokens", "bytes_processed"]
+
+    class Config:
+        """Pydantic configuration"""
+        allow_population_by_field_name = True
+        validate_assignment = True
+
+    def to_str(self) -> str:
+        """Returns the string representation of the model using alias"""
+        return pprint.pformat(self.dict(by_alias=True))
+
+    def to_json(self) -> str:
+        """Returns the JSON representation of the model using alias"""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, json_str: str) -> StageTiming:
+        """Create an instance of StageTiming from a JSON string"""
+        return cls.from_dict(json.loads(json_str))
+
+    def to_dict(self):
+        """Returns the dictionary representation of the model using alias"""
+        _dict = self.dict(by_alias=True,
+                          exclude={
+                          },
+                          exclude_none=True)
+        return _dict
+
+    @classmethod
+    def from_dict(cls, obj: dict) -> StageTiming:
+        """Create an instance of StageTiming from a dict"""
+        if obj is None:
+            return None
+
+        if not isinstance(obj, dict):
+            return StageTiming.parse_obj(obj)
+
+        _obj = StageTiming.parse_obj({
+            "name": obj.get("name"),
+            "started": obj.get("started"),
+            "seconds": obj.get("seconds"),
+            "tokens": obj.get("tokens"),
+            "bytes_processed": obj.get("bytes_processed")
+        })
+        return _obj
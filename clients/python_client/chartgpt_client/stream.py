@@ -0,0 +1,123 @@
+# coding: utf-8
+
+"""
+    ChartGPT API
+
+    Reassembly of the responses streamed by `/v1/ask_chartgpt/stream` from its server-sent
+    events, in either protocol of the stream: "snapshot", where each event is a complete
+    response, or "delta", where the first event is a complete response, and the others only
+    carry the fields that differ from it, with a sequence number.
+
+    >>> stream = ResponseStream()
+    >>> for event, data in parse_events(lines):
+    ...     response = stream.feed(event, data)
+
+    Not generated by OpenAPI Generator.
+"""  # noqa: E501
+
+
+import json
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from chartgpt_client.models.response import Response
+
+# Fields of a stream's responses that are only sent with its first response, in the delta protocol
+ENVELOPE_FIELDS = ("session_id", "created_at", "messages", "data_source_url", "output_type")
+OUTPUT_DELTA_EVENTS = ("sql_delta", "code_delta")
+
+
+def parse_events(lines: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Parse the lines of a stream into tuples of the type and data of its events."""
+    event, data = "message", []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            name, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if name == "event":
+                event = value
+            elif name == "data":
+                data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class ResponseStream(object):
+    """
+    Reassembles the responses of a stream, as sent by the snapshot protocol, and accumulates
+    them into the `response` of the whole stream.
+
+    The SQL queries and code being generated, sent by `sql_delta` and `code_delta` events,
+    are assembled into `generating`, by output type, attempt and field.
+    """
+
+    def __init__(self):
+        self.envelope: Optional[dict] = None
+        self.response: Optional[Response] = None
+        self.generating: Dict[Tuple[str, int, str], str] = {}
+        self._seq = -1
+
+    def _check_seq(self, data: dict) -> None:
+        seq = data.pop("seq", None)
+        if seq is None:
+            return
+        if seq != self._seq + 1:
+            raise ValueError("Expected event %d of the stream, got %d" % (self._seq + 1, seq))
+        self._seq = seq
+
+    def feed(self, event: str, data: str) -> Optional[Response]:
+        """Feed an event, returning its response, if it is one."""
+        if event == "keep-alive" or data == "[DONE]":
+            return None
+        obj = json.loads(data)
+        self._check_seq(obj)
+        if event in OUTPUT_DELTA_EVENTS:
+            key = (obj["type"], obj["attempt"], obj["field"])
+            self.generating[key] = self.generating.get(key, "")[:obj["offset"]] + obj["value"]
+            return None
+
+        if self.envelope is None:
+            self.envelope = {name: obj.get(name) for name in ENVELOPE_FIELDS}
+        elif self._seq > 0:
+            # Delta protocol
+            obj = {
+                **self.envelope,
+                "attempts": [],
+                "outputs": [],
+                "errors": [],
+                **obj,
+            }
+        response = Response.from_dict(obj)
+        self._accumulate(response)
+        return response
+
+    def _accumulate(self, response: Response) -> None:
+        if self.response is None:
+            self.response = Response.from_dict(response.to_dict())
+            return
+        for name in ("attempts", "outputs", "errors"):
+            items = getattr(response, name)
+            if items:
+                setattr(self.response, name, (getattr(self.response, name) or []) + items)
+        self.response.status = response.status
+        if response.finished_at is not None:
+            self.response.finished_at = response.finished_at
+        if response.usage is not None:
+            self.response.usage = response.usage
+
+
+def iter_responses(lines: Iterable[str]) -> Iterator[Response]:
+    """Iterate over the responses of a stream, from its lines, in either protocol."""
+    stream = ResponseStream()
+    for event, data in parse_events(lines):
+        response = stream.feed(event, data)
+        if response is not None:
+            yield response
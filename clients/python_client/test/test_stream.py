@@ -0,0 +1,81 @@
+# coding: utf-8
+
+"""
+    ChartGPT API
+
+    Tests of the reassembly of streamed responses.
+
+    Not generated by OpenAPI Generator.
+"""  # noqa: E501
+
+
+import json
+import unittest
+
+from chartgpt_client.stream import ResponseStream, iter_responses, parse_events
+
+ENVELOPE = {
+    "session_id": "session",
+    "created_at": 1,
+    "messages": [{"role": "user", "content": "What is the total volume by day?"}],
+    "data_source_url": "bigquery/project/dataset",
+    "output_type": "any",
+}
+OUTPUT = {"index": 0, "created_at": 2, "description": "Query", "type": "sql_query", "value": "SELECT 1"}
+SNAPSHOTS = [
+    ("stream_start", {**ENVELOPE, "status": "stream", "attempts": [], "outputs": [], "errors": []}),
+    ("output", {**ENVELOPE, "finished_at": 3, "status": "stream", "attempts": [], "outputs": [OUTPUT], "errors": []}),
+    ("usage", {
+        **ENVELOPE, "finished_at": 4, "status": "succeeded", "attempts": [], "outputs": [], "errors": [],
+        "usage": {"tokens": 10},
+    }),
+]
+DELTAS = [
+    ("stream_start", {"seq": 0, **SNAPSHOTS[0][1]}),
+    ("sql_delta", {"seq": 1, "type": "sql", "attempt": 0, "field": "query", "offset": 0, "value": "SELECT"}),
+    ("sql_delta", {"seq": 2, "type": "sql", "attempt": 0, "field": "query", "offset": 6, "value": " 1"}),
+    ("output", {"seq": 3, "status": "stream", "finished_at": 3, "outputs": [OUTPUT]}),
+    ("keep-alive", {}),
+    ("usage", {"seq": 4, "status": "succeeded", "finished_at": 4, "usage": {"tokens": 10}}),
+]
+
+
+def create_lines(events):
+    lines = []
+    for event, data in events:
+        lines += ["event: %s" % event, "data: %s" % json.dumps(data), ""]
+    return lines + ["event: stream_end", "data: [DONE]", ""]
+
+
+class TestStream(unittest.TestCase):
+    """Reassembly of streamed responses"""
+
+    def test_parse_events(self):
+        lines = [b"event: output\r\n", b"data: {}\r\n", b"\r\n", ": comment", "data: a", "data: b", ""]
+        self.assertEqual(list(parse_events(lines)), [("output", "{}"), ("message", "a\nb")])
+
+    def test_delta_protocol_is_reassembled_like_snapshots(self):
+        snapshots = [response.to_dict() for response in iter_responses(create_lines(SNAPSHOTS))]
+        deltas = [response.to_dict() for response in iter_responses(create_lines(DELTAS))]
+        self.assertEqual(snapshots, [data for _, data in SNAPSHOTS])
+        self.assertEqual(deltas, snapshots)
+
+    def test_stream_response_accumulates_responses(self):
+        stream = ResponseStream()
+        for event, data in parse_events(create_lines(DELTAS)):
+            stream.feed(event, data)
+        self.assertEqual(stream.response.outputs[0].value, "SELECT 1")
+        self.assertEqual(stream.response.status, "succeeded")
+        self.assertEqual(stream.response.usage.tokens, 10)
+        self.assertEqual(stream.response.messages[0].content, ENVELOPE["messages"][0]["content"])
+        self.assertEqual(stream.generating, {("sql", 0, "query"): "SELECT 1"})
+
+    def test_missing_events_are_detected(self):
+        stream = ResponseStream()
+        stream.feed(*DELTAS[0][:1], json.dumps(DELTAS[0][1]))
+        with self.assertRaises(ValueError):
+            stream.feed(DELTAS[2][0], json.dumps(DELTAS[2][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
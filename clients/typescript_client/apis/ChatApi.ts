@@ -21,8 +21,9 @@ export class ChatApiRequestFactory extends BaseAPIRequestFactory {
      * Stream the response from the ChartGPT API.
      * Ask Chartgpt Stream
      * @param request 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public async askChartgptStreamV1AskChartgptStreamPost(request: Request, _options?: Configuration): Promise<RequestContext> {
+    public async askChartgptStreamV1AskChartgptStreamPost(request: Request, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<RequestContext> {
         let _config = _options || this.configuration;
 
         // verify required parameter 'request' is not null or undefined
@@ -31,6 +32,7 @@ export class ChatApiRequestFactory extends BaseAPIRequestFactory {
         }
 
 
+
         // Path Params
         const localVarPath = '/v1/ask_chartgpt/stream';
 
@@ -38,6 +40,11 @@ export class ChatApiRequestFactory extends BaseAPIRequestFactory {
         const requestContext = _config.baseServer.makeRequestContext(localVarPath, HttpMethod.POST);
         requestContext.setHeaderParam("Accept", "application/json, */*;q=0.8")
 
+        // Query Params
+        if (protocol !== undefined) {
+            requestContext.setQueryParam("protocol", ObjectSerializer.serialize(protocol, "'snapshot' | 'delta'", ""));
+        }
+
 
         // Body Params
         const contentType = ObjectSerializer.getPreferredMediaType([
@@ -70,8 +77,9 @@ export class ChatApiRequestFactory extends BaseAPIRequestFactory {
      * Ask Chartgpt
      * @param request 
      * @param stream 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public async askChartgptV1AskChartgptPost(request: Request, stream?: any, _options?: Configuration): Promise<RequestContext> {
+    public async askChartgptV1AskChartgptPost(request: Request, stream?: any, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<RequestContext> {
         let _config = _options || this.configuration;
 
         // verify required parameter 'request' is not null or undefined
@@ -93,6 +101,11 @@ export class ChatApiRequestFactory extends BaseAPIRequestFactory {
             requestContext.setQueryParam("stream", ObjectSerializer.serialize(stream, "any", ""));
         }
 
+        // Query Params
+        if (protocol !== undefined) {
+            requestContext.setQueryParam("protocol", ObjectSerializer.serialize(protocol, "'snapshot' | 'delta'", ""));
+        }
+
 
         // Body Params
         const contentType = ObjectSerializer.getPreferredMediaType([
@@ -8,5 +8,5 @@ export * from "./servers";
 export { RequiredError } from "./apis/baseapi";
 
 export { PromiseMiddleware as Middleware } from './middleware';
-export { PromiseChatApi as ChatApi,  PromiseHealthApi as HealthApi } from './types/PromiseAPI';
+export { PromiseChatApi as ChatApi,  PromiseHealthApi as HealthApi,  PromiseJobsApi as JobsApi } from './types/PromiseAPI';
 
@@ -0,0 +1,117 @@
+/**
+ * ChartGPT API
+ * The ChartGPT API is a REST API that generates insights from data based on natural language questions.
+ *
+ * OpenAPI spec version: 0.1.0
+ * 
+ *
+ * NOTE: This class is auto generated by OpenAPI Generator (https://openapi-generator.tech).
+ * https://openapi-generator.tech
+ * Do not edit the class manually.
+ */
+
+import { JobStatus } from '../models/JobStatus';
+import { Request } from '../models/Request';
+import { Response } from '../models/Response';
+import { HttpFile } from '../http/http';
+
+/**
+* A request answered in the background, whose response is polled or posted to a webhook.
+*/
+export class Job {
+    /**
+    * The timestamp of when the job was created.
+    */
+    'createdAt'?: number;
+    /**
+    * The reason why the job failed, if it did.
+    */
+    'error'?: string;
+    /**
+    * The timestamp of when the job was finished.
+    */
+    'finishedAt'?: number;
+    /**
+    * The ID of the job, which is also the session ID of its response.
+    */
+    'id'?: string;
+    'request'?: Request;
+    'response'?: Response;
+    /**
+    * The timestamp of when the job last started running.
+    */
+    'startedAt'?: number;
+    'status'?: JobStatus;
+    /**
+    * The URL to which the job is posted once it is finished, if any.
+    */
+    'webhookUrl'?: string;
+
+    static readonly discriminator: string | undefined = undefined;
+
+    static readonly attributeTypeMap: Array<{name: string, baseName: string, type: string, format: string}> = [
+        {
+            "name": "createdAt",
+            "baseName": "created_at",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "error",
+            "baseName": "error",
+            "type": "string",
+            "format": ""
+        },
+        {
+            "name": "finishedAt",
+            "baseName": "finished_at",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "id",
+            "baseName": "id",
+            "type": "string",
+            "format": ""
+        },
+        {
+            "name": "request",
+            "baseName": "request",
+            "type": "Request",
+            "format": ""
+        },
+        {
+            "name": "response",
+            "baseName": "response",
+            "type": "Response",
+            "format": ""
+        },
+        {
+            "name": "startedAt",
+            "baseName": "started_at",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "status",
+            "baseName": "status",
+            "type": "JobStatus",
+            "format": ""
+        },
+        {
+            "name": "webhookUrl",
+            "baseName": "webhook_url",
+            "type": "string",
+            "format": ""
+        }    ];
+
+    static getAttributeTypeMap() {
+        return Job.attributeTypeMap;
+    }
+
+    public constructor() {
+    }
+}
+
+
+
@@ -0,0 +1,51 @@
+/**
+ * ChartGPT API
+ * The ChartGPT API is a REST API that generates insights from data based on natural language questions.
+ *
+ * OpenAPI spec version: 0.1.0
+ * 
+ *
+ * NOTE: This class is auto generated by OpenAPI Generator (https://openapi-generator.tech).
+ * https://openapi-generator.tech
+ * Do not edit the class manually.
+ */
+
+import { Request } from '../models/Request';
+import { HttpFile } from '../http/http';
+
+/**
+* The request of a job, and where to send the job once it is finished.
+*/
+export class JobRequest {
+    'request': Request;
+    /**
+    * The URL to which the job is posted once it is finished, if any.
+    */
+    'webhookUrl'?: string;
+
+    static readonly discriminator: string | undefined = undefined;
+
+    static readonly attributeTypeMap: Array<{name: string, baseName: string, type: string, format: string}> = [
+        {
+            "name": "request",
+            "baseName": "request",
+            "type": "Request",
+            "format": ""
+        },
+        {
+            "name": "webhookUrl",
+            "baseName": "webhook_url",
+            "type": "string",
+            "format": ""
+        }    ];
+
+    static getAttributeTypeMap() {
+        return JobRequest.attributeTypeMap;
+    }
+
+    public constructor() {
+    }
+}
+
+
+
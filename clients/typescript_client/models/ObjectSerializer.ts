@@ -1,5 +1,8 @@
 export * from '../models/Attempt';
 export * from '../models/HTTPValidationError';
+export * from '../models/Job';
+export * from '../models/JobRequest';
+export * from '../models/JobStatus';
 export * from '../models/LocationInner';
 export * from '../models/Message';
 export * from '../models/ModelError';
@@ -9,11 +12,15 @@ export * from '../models/Request';
 export * from '../models/Response';
 export * from '../models/ResponseUsage';
 export * from '../models/Role';
+export * from '../models/StageTiming';
 export * from '../models/Status';
 export * from '../models/ValidationError';
 
 import { Attempt } from '../models/Attempt';
 import { HTTPValidationError } from '../models/HTTPValidationError';
+import { Job } from '../models/Job';
+import { JobRequest } from '../models/JobRequest';
+import { JobStatus } from '../models/JobStatus';
 import { LocationInner } from '../models/LocationInner';
 import { Message     } from '../models/Message';
 import { ModelError } from '../models/ModelError';
@@ -23,6 +30,7 @@ import { Request        } from '../models/Request';
 import { Response            } from '../models/Response';
 import { ResponseUsage } from '../models/ResponseUsage';
 import { Role } from '../models/Role';
+import { StageTiming } from '../models/StageTiming';
 import { Status } from '../models/Status';
 import { ValidationError } from '../models/ValidationError';
 
@@ -49,6 +57,7 @@ const supportedMediaTypes: { [mediaType: string]: number } = {
 
 
 let enumsMap: Set<string> = new Set<string>([
+    "JobStatus",
     "OutputType",
     "Role",
     "Status",
@@ -57,6 +66,8 @@ let enumsMap: Set<string> = new Set<string>([
 let typeMap: {[index: string]: any} = {
     "Attempt": Attempt,
     "HTTPValidationError": HTTPValidationError,
+    "Job": Job,
+    "JobRequest": JobRequest,
     "LocationInner": LocationInner,
     "Message": Message,
     "ModelError": ModelError,
@@ -64,6 +75,7 @@ let typeMap: {[index: string]: any} = {
     "Request": Request,
     "Response": Response,
     "ResponseUsage": ResponseUsage,
+    "StageTiming": StageTiming,
     "ValidationError": ValidationError,
 }
 
@@ -10,6 +10,7 @@
  * Do not edit the class manually.
  */
 
+import { StageTiming } from '../models/StageTiming';
 import { HttpFile } from '../http/http';
 
 /**
@@ -17,13 +18,123 @@ import { HttpFile } from '../http/http';
 */
 export class ResponseUsage {
     /**
-    * The number of tokens used for the request.
+    * The number of BigQuery jobs run for the request.
+    */
+    'bigqueryJobs'?: number;
+    /**
+    * The number of bytes billed for BigQuery queries for the request.
+    */
+    'bytesBilled'?: number;
+    /**
+    * The number of bytes processed by BigQuery queries for the request.
+    */
+    'bytesProcessed'?: number;
+    /**
+    * The number of LLM completion requests served from cache.
+    */
+    'cachedLlmRequests'?: number;
+    /**
+    * The number of attempts to generate valid Python code.
+    */
+    'codeAttempts'?: number;
+    /**
+    * The number of LLM completion tokens used for the request.
+    */
+    'completionTokens'?: number;
+    /**
+    * The number of LLM completion requests made for the request.
+    */
+    'llmRequests'?: number;
+    /**
+    * The number of LLM prompt tokens used for the request.
+    */
+    'promptTokens'?: number;
+    /**
+    * The number of seconds taken to answer the request.
+    */
+    'seconds'?: number;
+    /**
+    * The number of attempts to generate a valid SQL query.
+    */
+    'sqlAttempts'?: number;
+    /**
+    * The timings of the stages of the request.
+    */
+    'stages'?: Array<StageTiming>;
+    /**
+    * The number of LLM tokens used for the request.
     */
     'tokens'?: number;
 
     static readonly discriminator: string | undefined = undefined;
 
     static readonly attributeTypeMap: Array<{name: string, baseName: string, type: string, format: string}> = [
+        {
+            "name": "bigqueryJobs",
+            "baseName": "bigquery_jobs",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "bytesBilled",
+            "baseName": "bytes_billed",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "bytesProcessed",
+            "baseName": "bytes_processed",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "cachedLlmRequests",
+            "baseName": "cached_llm_requests",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "codeAttempts",
+            "baseName": "code_attempts",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "completionTokens",
+            "baseName": "completion_tokens",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "llmRequests",
+            "baseName": "llm_requests",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "promptTokens",
+            "baseName": "prompt_tokens",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "seconds",
+            "baseName": "seconds",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "sqlAttempts",
+            "baseName": "sql_attempts",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "stages",
+            "baseName": "stages",
+            "type": "Array<StageTiming>",
+            "format": ""
+        },
         {
             "name": "tokens",
             "baseName": "tokens",
@@ -0,0 +1,81 @@
+/**
+ * ChartGPT API
+ * The ChartGPT API is a REST API that generates insights from data based on natural language questions.
+ *
+ * OpenAPI spec version: 0.1.0
+ * 
+ *
+ * NOTE: This class is auto generated by OpenAPI Generator (https://openapi-generator.tech).
+ * https://openapi-generator.tech
+ * Do not edit the class manually.
+ */
+
+import { HttpFile } from '../http/http';
+
+/**
+* The timing of a stage of the request.
+*/
+export class StageTiming {
+    /**
+    * The number of bytes processed by BigQuery queries in the stage.
+    */
+    'bytesProcessed'?: number;
+    /**
+    * The name of the stage.
+    */
+    'name'?: string;
+    /**
+    * The number of seconds the stage took.
+    */
+    'seconds'?: number;
+    /**
+    * The number of seconds since the start of the request when the stage started.
+    */
+    'started'?: number;
+    /**
+    * The number of LLM tokens used in the stage.
+    */
+    'tokens'?: number;
+
+    static readonly discriminator: string | undefined = undefined;
+
+    static readonly attributeTypeMap: Array<{name: string, baseName: string, type: string, format: string}> = [
+        {
+            "name": "bytesProcessed",
+            "baseName": "bytes_processed",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "name",
+            "baseName": "name",
+            "type": "string",
+            "format": ""
+        },
+        {
+            "name": "seconds",
+            "baseName": "seconds",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "started",
+            "baseName": "started",
+            "type": "number",
+            "format": ""
+        },
+        {
+            "name": "tokens",
+            "baseName": "tokens",
+            "type": "number",
+            "format": ""
+        }    ];
+
+    static getAttributeTypeMap() {
+        return StageTiming.attributeTypeMap;
+    }
+
+    public constructor() {
+    }
+}
+
@@ -1,5 +1,8 @@
 export * from '../models/Attempt'
 export * from '../models/HTTPValidationError'
+export * from '../models/Job'
+export * from '../models/JobRequest'
+export * from '../models/JobStatus'
 export * from '../models/LocationInner'
 export * from '../models/Message'
 export * from '../models/ModelError'
@@ -9,5 +12,6 @@ export * from '../models/Request'
 export * from '../models/Response'
 export * from '../models/ResponseUsage'
 export * from '../models/Role'
+export * from '../models/StageTiming'
 export * from '../models/Status'
 export * from '../models/ValidationError'
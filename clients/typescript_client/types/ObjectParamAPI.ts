@@ -3,6 +3,9 @@ import { Configuration} from '../configuration'
 
 import { Attempt } from '../models/Attempt';
 import { HTTPValidationError } from '../models/HTTPValidationError';
+import { Job } from '../models/Job';
+import { JobRequest } from '../models/JobRequest';
+import { JobStatus } from '../models/JobStatus';
 import { LocationInner } from '../models/LocationInner';
 import { Message } from '../models/Message';
 import { ModelError } from '../models/ModelError';
@@ -25,6 +28,12 @@ export interface ChatApiAskChartgptStreamV1AskChartgptStreamPostRequest {
      * @memberof ChatApiaskChartgptStreamV1AskChartgptStreamPost
      */
     request: Request
+    /**
+     * The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+     * @type 'snapshot' | 'delta'
+     * @memberof ChatApiaskChartgptStreamV1AskChartgptStreamPost
+     */
+    protocol?: 'snapshot' | 'delta'
 }
 
 export interface ChatApiAskChartgptV1AskChartgptPostRequest {
@@ -40,6 +49,12 @@ export interface ChatApiAskChartgptV1AskChartgptPostRequest {
      * @memberof ChatApiaskChartgptV1AskChartgptPost
      */
     stream?: any
+    /**
+     * The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
+     * @type 'snapshot' | 'delta'
+     * @memberof ChatApiaskChartgptV1AskChartgptPost
+     */
+    protocol?: 'snapshot' | 'delta'
 }
 
 export class ObjectChatApi {
@@ -55,7 +70,7 @@ export class ObjectChatApi {
      * @param param the request object
      */
     public askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(param: ChatApiAskChartgptStreamV1AskChartgptStreamPostRequest, options?: Configuration): Promise<HttpInfo<Response>> {
-        return this.api.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(param.request,  options).toPromise();
+        return this.api.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(param.request, param.protocol,  options).toPromise();
     }
 
     /**
@@ -64,7 +79,7 @@ export class ObjectChatApi {
      * @param param the request object
      */
     public askChartgptStreamV1AskChartgptStreamPost(param: ChatApiAskChartgptStreamV1AskChartgptStreamPostRequest, options?: Configuration): Promise<Response> {
-        return this.api.askChartgptStreamV1AskChartgptStreamPost(param.request,  options).toPromise();
+        return this.api.askChartgptStreamV1AskChartgptStreamPost(param.request, param.protocol,  options).toPromise();
     }
 
     /**
@@ -73,7 +88,7 @@ export class ObjectChatApi {
      * @param param the request object
      */
     public askChartgptV1AskChartgptPostWithHttpInfo(param: ChatApiAskChartgptV1AskChartgptPostRequest, options?: Configuration): Promise<HttpInfo<Response>> {
-        return this.api.askChartgptV1AskChartgptPostWithHttpInfo(param.request, param.stream,  options).toPromise();
+        return this.api.askChartgptV1AskChartgptPostWithHttpInfo(param.request, param.stream, param.protocol,  options).toPromise();
     }
 
     /**
@@ -82,7 +97,7 @@ export class ObjectChatApi {
      * @param param the request object
      */
     public askChartgptV1AskChartgptPost(param: ChatApiAskChartgptV1AskChartgptPostRequest, options?: Configuration): Promise<Response> {
-        return this.api.askChartgptV1AskChartgptPost(param.request, param.stream,  options).toPromise();
+        return this.api.askChartgptV1AskChartgptPost(param.request, param.stream, param.protocol,  options).toPromise();
     }
 
 }
@@ -119,3 +134,69 @@ export class ObjectHealthApi {
     }
 
 }
+
+import { ObservableJobsApi } from "./ObservableAPI";
+import { JobsApiRequestFactory, JobsApiResponseProcessor} from "../apis/JobsApi";
+
+export interface JobsApiCreateJobV1JobsPostRequest {
+    /**
+     * 
+     * @type JobRequest
+     * @memberof JobsApicreateJobV1JobsPost
+     */
+    jobRequest: JobRequest
+}
+
+export interface JobsApiGetJobV1JobsJobIdGetRequest {
+    /**
+     * 
+     * @type string
+     * @memberof JobsApigetJobV1JobsJobIdGet
+     */
+    jobId: string
+}
+
+export class ObjectJobsApi {
+    private api: ObservableJobsApi
+
+    public constructor(configuration: Configuration, requestFactory?: JobsApiRequestFactory, responseProcessor?: JobsApiResponseProcessor) {
+        this.api = new ObservableJobsApi(configuration, requestFactory, responseProcessor);
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param param the request object
+     */
+    public createJobV1JobsPostWithHttpInfo(param: JobsApiCreateJobV1JobsPostRequest, options?: Configuration): Promise<HttpInfo<Job>> {
+        return this.api.createJobV1JobsPostWithHttpInfo(param.jobRequest,  options).toPromise();
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param param the request object
+     */
+    public createJobV1JobsPost(param: JobsApiCreateJobV1JobsPostRequest, options?: Configuration): Promise<Job> {
+        return this.api.createJobV1JobsPost(param.jobRequest,  options).toPromise();
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param param the request object
+     */
+    public getJobV1JobsJobIdGetWithHttpInfo(param: JobsApiGetJobV1JobsJobIdGetRequest, options?: Configuration): Promise<HttpInfo<Job>> {
+        return this.api.getJobV1JobsJobIdGetWithHttpInfo(param.jobId,  options).toPromise();
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param param the request object
+     */
+    public getJobV1JobsJobIdGet(param: JobsApiGetJobV1JobsJobIdGetRequest, options?: Configuration): Promise<Job> {
+        return this.api.getJobV1JobsJobIdGet(param.jobId,  options).toPromise();
+    }
+
+}
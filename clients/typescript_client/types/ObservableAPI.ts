@@ -4,6 +4,9 @@ import { Observable, of, from } from '../rxjsStub';
 import {mergeMap, map} from  '../rxjsStub';
 import { Attempt } from '../models/Attempt';
 import { HTTPValidationError } from '../models/HTTPValidationError';
+import { Job } from '../models/Job';
+import { JobRequest } from '../models/JobRequest';
+import { JobStatus } from '../models/JobStatus';
 import { LocationInner } from '../models/LocationInner';
 import { Message } from '../models/Message';
 import { ModelError } from '../models/ModelError';
@@ -36,9 +39,10 @@ export class ObservableChatApi {
      * Stream the response from the ChartGPT API.
      * Ask Chartgpt Stream
      * @param request 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request: Request, _options?: Configuration): Observable<HttpInfo<Response>> {
-        const requestContextPromise = this.requestFactory.askChartgptStreamV1AskChartgptStreamPost(request, _options);
+    public askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request: Request, protocol?: 'snapshot' | 'delta', _options?: Configuration): Observable<HttpInfo<Response>> {
+        const requestContextPromise = this.requestFactory.askChartgptStreamV1AskChartgptStreamPost(request, protocol, _options);
 
         // build promise chain
         let middlewarePreObservable = from<RequestContext>(requestContextPromise);
@@ -60,9 +64,10 @@ export class ObservableChatApi {
      * Stream the response from the ChartGPT API.
      * Ask Chartgpt Stream
      * @param request 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptStreamV1AskChartgptStreamPost(request: Request, _options?: Configuration): Observable<Response> {
-        return this.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request, _options).pipe(map((apiResponse: HttpInfo<Response>) => apiResponse.data));
+    public askChartgptStreamV1AskChartgptStreamPost(request: Request, protocol?: 'snapshot' | 'delta', _options?: Configuration): Observable<Response> {
+        return this.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request, protocol, _options).pipe(map((apiResponse: HttpInfo<Response>) => apiResponse.data));
     }
 
     /**
@@ -70,9 +75,10 @@ export class ObservableChatApi {
      * Ask Chartgpt
      * @param request 
      * @param stream 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptV1AskChartgptPostWithHttpInfo(request: Request, stream?: any, _options?: Configuration): Observable<HttpInfo<Response>> {
-        const requestContextPromise = this.requestFactory.askChartgptV1AskChartgptPost(request, stream, _options);
+    public askChartgptV1AskChartgptPostWithHttpInfo(request: Request, stream?: any, protocol?: 'snapshot' | 'delta', _options?: Configuration): Observable<HttpInfo<Response>> {
+        const requestContextPromise = this.requestFactory.askChartgptV1AskChartgptPost(request, stream, protocol, _options);
 
         // build promise chain
         let middlewarePreObservable = from<RequestContext>(requestContextPromise);
@@ -95,9 +101,10 @@ export class ObservableChatApi {
      * Ask Chartgpt
      * @param request 
      * @param stream 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptV1AskChartgptPost(request: Request, stream?: any, _options?: Configuration): Observable<Response> {
-        return this.askChartgptV1AskChartgptPostWithHttpInfo(request, stream, _options).pipe(map((apiResponse: HttpInfo<Response>) => apiResponse.data));
+    public askChartgptV1AskChartgptPost(request: Request, stream?: any, protocol?: 'snapshot' | 'delta', _options?: Configuration): Observable<Response> {
+        return this.askChartgptV1AskChartgptPostWithHttpInfo(request, stream, protocol, _options).pipe(map((apiResponse: HttpInfo<Response>) => apiResponse.data));
     }
 
 }
@@ -150,3 +157,87 @@ export class ObservableHealthApi {
     }
 
 }
+
+import { JobsApiRequestFactory, JobsApiResponseProcessor} from "../apis/JobsApi";
+export class ObservableJobsApi {
+    private requestFactory: JobsApiRequestFactory;
+    private responseProcessor: JobsApiResponseProcessor;
+    private configuration: Configuration;
+
+    public constructor(
+        configuration: Configuration,
+        requestFactory?: JobsApiRequestFactory,
+        responseProcessor?: JobsApiResponseProcessor
+    ) {
+        this.configuration = configuration;
+        this.requestFactory = requestFactory || new JobsApiRequestFactory(configuration);
+        this.responseProcessor = responseProcessor || new JobsApiResponseProcessor();
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param jobRequest 
+     */
+    public createJobV1JobsPostWithHttpInfo(jobRequest: JobRequest, _options?: Configuration): Observable<HttpInfo<Job>> {
+        const requestContextPromise = this.requestFactory.createJobV1JobsPost(jobRequest, _options);
+
+        // build promise chain
+        let middlewarePreObservable = from<RequestContext>(requestContextPromise);
+        for (let middleware of this.configuration.middleware) {
+            middlewarePreObservable = middlewarePreObservable.pipe(mergeMap((ctx: RequestContext) => middleware.pre(ctx)));
+        }
+
+        return middlewarePreObservable.pipe(mergeMap((ctx: RequestContext) => this.configuration.httpApi.send(ctx))).
+            pipe(mergeMap((response: ResponseContext) => {
+                let middlewarePostObservable = of(response);
+                for (let middleware of this.configuration.middleware) {
+                    middlewarePostObservable = middlewarePostObservable.pipe(mergeMap((rsp: ResponseContext) => middleware.post(rsp)));
+                }
+                return middlewarePostObservable.pipe(map((rsp: ResponseContext) => this.responseProcessor.createJobV1JobsPostWithHttpInfo(rsp)));
+            }));
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param jobRequest 
+     */
+    public createJobV1JobsPost(jobRequest: JobRequest, _options?: Configuration): Observable<Job> {
+        return this.createJobV1JobsPostWithHttpInfo(jobRequest, _options).pipe(map((apiResponse: HttpInfo<Job>) => apiResponse.data));
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param jobId 
+     */
+    public getJobV1JobsJobIdGetWithHttpInfo(jobId: string, _options?: Configuration): Observable<HttpInfo<Job>> {
+        const requestContextPromise = this.requestFactory.getJobV1JobsJobIdGet(jobId, _options);
+
+        // build promise chain
+        let middlewarePreObservable = from<RequestContext>(requestContextPromise);
+        for (let middleware of this.configuration.middleware) {
+            middlewarePreObservable = middlewarePreObservable.pipe(mergeMap((ctx: RequestContext) => middleware.pre(ctx)));
+        }
+
+        return middlewarePreObservable.pipe(mergeMap((ctx: RequestContext) => this.configuration.httpApi.send(ctx))).
+            pipe(mergeMap((response: ResponseContext) => {
+                let middlewarePostObservable = of(response);
+                for (let middleware of this.configuration.middleware) {
+                    middlewarePostObservable = middlewarePostObservable.pipe(mergeMap((rsp: ResponseContext) => middleware.post(rsp)));
+                }
+                return middlewarePostObservable.pipe(map((rsp: ResponseContext) => this.responseProcessor.getJobV1JobsJobIdGetWithHttpInfo(rsp)));
+            }));
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param jobId 
+     */
+    public getJobV1JobsJobIdGet(jobId: string, _options?: Configuration): Observable<Job> {
+        return this.getJobV1JobsJobIdGetWithHttpInfo(jobId, _options).pipe(map((apiResponse: HttpInfo<Job>) => apiResponse.data));
+    }
+
+}
@@ -3,6 +3,9 @@ import { Configuration} from '../configuration'
 
 import { Attempt } from '../models/Attempt';
 import { HTTPValidationError } from '../models/HTTPValidationError';
+import { Job } from '../models/Job';
+import { JobRequest } from '../models/JobRequest';
+import { JobStatus } from '../models/JobStatus';
 import { LocationInner } from '../models/LocationInner';
 import { Message } from '../models/Message';
 import { ModelError } from '../models/ModelError';
@@ -32,9 +35,10 @@ export class PromiseChatApi {
      * Stream the response from the ChartGPT API.
      * Ask Chartgpt Stream
      * @param request 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request: Request, _options?: Configuration): Promise<HttpInfo<Response>> {
-        const result = this.api.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request, _options);
+    public askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request: Request, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<HttpInfo<Response>> {
+        const result = this.api.askChartgptStreamV1AskChartgptStreamPostWithHttpInfo(request, protocol, _options);
         return result.toPromise();
     }
 
@@ -42,9 +46,10 @@ export class PromiseChatApi {
      * Stream the response from the ChartGPT API.
      * Ask Chartgpt Stream
      * @param request 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptStreamV1AskChartgptStreamPost(request: Request, _options?: Configuration): Promise<Response> {
-        const result = this.api.askChartgptStreamV1AskChartgptStreamPost(request, _options);
+    public askChartgptStreamV1AskChartgptStreamPost(request: Request, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<Response> {
+        const result = this.api.askChartgptStreamV1AskChartgptStreamPost(request, protocol, _options);
         return result.toPromise();
     }
 
@@ -53,9 +58,10 @@ export class PromiseChatApi {
      * Ask Chartgpt
      * @param request 
      * @param stream 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptV1AskChartgptPostWithHttpInfo(request: Request, stream?: any, _options?: Configuration): Promise<HttpInfo<Response>> {
-        const result = this.api.askChartgptV1AskChartgptPostWithHttpInfo(request, stream, _options);
+    public askChartgptV1AskChartgptPostWithHttpInfo(request: Request, stream?: any, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<HttpInfo<Response>> {
+        const result = this.api.askChartgptV1AskChartgptPostWithHttpInfo(request, stream, protocol, _options);
         return result.toPromise();
     }
 
@@ -64,9 +70,10 @@ export class PromiseChatApi {
      * Ask Chartgpt
      * @param request 
      * @param stream 
+     * @param protocol The protocol of the stream: "snapshot" sends each response in full, and "delta" sends the first response in full, and then only the fields of each response that differ from it, with a sequence number.
      */
-    public askChartgptV1AskChartgptPost(request: Request, stream?: any, _options?: Configuration): Promise<Response> {
-        const result = this.api.askChartgptV1AskChartgptPost(request, stream, _options);
+    public askChartgptV1AskChartgptPost(request: Request, stream?: any, protocol?: 'snapshot' | 'delta', _options?: Configuration): Promise<Response> {
+        const result = this.api.askChartgptV1AskChartgptPost(request, stream, protocol, _options);
         return result.toPromise();
     }
 
@@ -112,3 +119,62 @@ export class PromiseHealthApi {
 
 
 
+import { ObservableJobsApi } from './ObservableAPI';
+
+import { JobsApiRequestFactory, JobsApiResponseProcessor} from "../apis/JobsApi";
+export class PromiseJobsApi {
+    private api: ObservableJobsApi
+
+    public constructor(
+        configuration: Configuration,
+        requestFactory?: JobsApiRequestFactory,
+        responseProcessor?: JobsApiResponseProcessor
+    ) {
+        this.api = new ObservableJobsApi(configuration, requestFactory, responseProcessor);
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param jobRequest 
+     */
+    public createJobV1JobsPostWithHttpInfo(jobRequest: JobRequest, _options?: Configuration): Promise<HttpInfo<Job>> {
+        const result = this.api.createJobV1JobsPostWithHttpInfo(jobRequest, _options);
+        return result.toPromise();
+    }
+
+    /**
+     * Queue a job that answers a user query in the background, and return it immediately.
+     * Create Job
+     * @param jobRequest 
+     */
+    public createJobV1JobsPost(jobRequest: JobRequest, _options?: Configuration): Promise<Job> {
+        const result = this.api.createJobV1JobsPost(jobRequest, _options);
+        return result.toPromise();
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param jobId 
+     */
+    public getJobV1JobsJobIdGetWithHttpInfo(jobId: string, _options?: Configuration): Promise<HttpInfo<Job>> {
+        const result = this.api.getJobV1JobsJobIdGetWithHttpInfo(jobId, _options);
+        return result.toPromise();
+    }
+
+    /**
+     * Get the status of a job, with the outputs of its response so far.
+     * Get Job
+     * @param jobId 
+     */
+    public getJobV1JobsJobIdGet(jobId: string, _options?: Configuration): Promise<Job> {
+        const result = this.api.getJobV1JobsJobIdGet(jobId, _options);
+        return result.toPromise();
+    }
+
+
+}
+
+
+